@@ -0,0 +1,146 @@
+"""
+Benchmarks the write path's per-row CPU cost: building rows and binding them.
+
+Pages of synthetic student submissions, as the API returns them, are saved
+into an in-memory SQLite database three ways:
+
+*   dict rows: the previous write path, kept here as the baseline. Each item
+    becomes a dict built with get() calls and is upserted on its own,
+    SQLite binding the parameters by name;
+*   tuple rows: each item goes through the compiled normalizer and is
+    upserted on its own, bound by position (save_student_submission);
+*   pages: a page at a time through normalize_items() and one executemany()
+    (SQLiteBackend.save_page).
+
+Each is timed on an empty table (inserts) and again on the same items
+(unchanged rows, skipped by content hash, as in most nightly runs), and the
+row building alone is timed too. Times are the best of several runs.
+
+Usage:
+    python benchmarks/bench_normalize.py [--items N] [--page-size N] [--runs N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from src.database import initialize_database, save_rows, save_student_submission
+from src.normalize import NORMALIZERS, content_hash, normalize_items
+
+STATES = ('TURNED_IN', 'RETURNED', 'CREATED', 'NEW', 'RECLAIMED_BY_STUDENT')
+
+def make_items(count: int) -> list:
+    return [{
+        'id': f'sub{i}', 'courseWorkId': 'cw1', 'userId': f'u{i % 500}', 'state': STATES[i % len(STATES)],
+        'assignedGrade': i % 100 if i % 3 else None, 'creationTime': '2024-09-02T00:00:00.000Z',
+        'updateTime': '2024-09-03T00:00:00.000Z', 'late': i % 7 == 0,
+        'alternateLink': f'https://classroom.google.com/c/1/a/2/submissions/by-status/and-sort-last-name/student/{i}',
+        'courseWorkType': 'ASSIGNMENT', 'assignmentSubmission': {}, 'submissionHistory': [{}, {}],
+    } for i in range(count)]
+
+def dict_row(submission: dict) -> dict:
+    """The previous row builder, kept as the baseline."""
+    row = {
+        'id': submission['id'],
+        'courseWorkId': submission['courseWorkId'],
+        'userId': submission['userId'],
+        'state': submission.get('state'),
+        'assignedGrade': submission.get('assignedGrade'),
+        'draftGrade': submission.get('draftGrade'),
+        'creationTime': submission['creationTime'],
+        'updateTime': submission['updateTime'],
+        'late': 1 if submission.get('late') else 0
+    }
+    row['hash'] = content_hash(
+        row['state'], row['assignedGrade'], row['draftGrade'], row['updateTime'], *(('late',) if row['late'] else ())
+    )
+    return row
+
+DICT_UPSERT = """
+    INSERT INTO STDNT_SBMSSNS (ID, CRS_WRK_ID, USR_ID, STT, ASSGND_GRD, DRFT_GRD, CRTN_TM, UPDT_TM, CNTNT_HSH, LT)
+    VALUES (:id, :courseWorkId, :userId, :state, :assignedGrade, :draftGrade, :creationTime, :updateTime, :hash, :late)
+    ON CONFLICT(ID) DO UPDATE SET
+        STT=excluded.STT, ASSGND_GRD=excluded.ASSGND_GRD, DRFT_GRD=excluded.DRFT_GRD, UPDT_TM=excluded.UPDT_TM,
+        CNTNT_HSH=excluded.CNTNT_HSH, LT=excluded.LT
+    WHERE STDNT_SBMSSNS.CNTNT_HSH IS NOT excluded.CNTNT_HSH;
+"""
+
+def save_dict_rows(conn, pages):
+    for page in pages:
+        for item in page:
+            conn.cursor().execute(DICT_UPSERT, dict_row(item))
+
+def save_tuple_rows(conn, pages):
+    for page in pages:
+        for item in page:
+            save_student_submission(conn, item)
+
+def save_pages(conn, pages):
+    for page in pages:
+        rows, _ = normalize_items('STDNT_SBMSSNS', page)
+        save_rows(conn, 'STDNT_SBMSSNS', rows)
+
+def open_database():
+    conn = initialize_database(':memory:')
+    conn.executemany("INSERT INTO USRS (ID, NM, EML) VALUES (?, 'Student', ?);",
+                     ((f'u{i}', f'u{i}@example.org') for i in range(500)))
+    conn.execute("INSERT INTO CRSS (ID, NM) VALUES ('c1', 'Course');")
+    conn.execute("INSERT INTO CRS_WRK (ID, CRS_ID, TTL) VALUES ('cw1', 'c1', 'Work');")
+    conn.commit()
+    return conn
+
+def best_time(function, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+def bench_write(save, pages, runs: int) -> tuple:
+    """Returns the best times of saving the pages into an empty table, and again unchanged."""
+    inserts, unchanged = [], []
+    for _ in range(runs):
+        conn = open_database()
+        start = time.perf_counter()
+        save(conn, pages)
+        inserts.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        save(conn, pages)
+        unchanged.append(time.perf_counter() - start)
+        conn.close()
+    return min(inserts), min(unchanged)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--page-size', type=int, default=100, help="Items per API page")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    pages = [items[i:i + args.page_size] for i in range(0, len(items), args.page_size)]
+    normalize = NORMALIZERS['STDNT_SBMSSNS']
+    build = {
+        'dict rows': best_time(lambda: [dict_row(item) for item in items], args.runs),
+        'tuple rows': best_time(lambda: [normalize(item) for item in items], args.runs),
+    }
+    writes = {
+        'dict rows': bench_write(save_dict_rows, pages, args.runs),
+        'tuple rows': bench_write(save_tuple_rows, pages, args.runs),
+        'pages': bench_write(save_pages, pages, args.runs),
+    }
+
+    per_row = lambda seconds: seconds / args.items * 1e6
+    print(f"{args.items} submissions in pages of {args.page_size}, microseconds per row")
+    print(f"{'':<12} {'build':>8} {'insert':>8} {'unchanged':>10}")
+    for name, (inserted, unchanged) in writes.items():
+        built = f"{per_row(build[name]):>8.2f}" if name in build else f"{'':>8}"
+        print(f"{name:<12} {built} {per_row(inserted):>8.2f} {per_row(unchanged):>10.2f}")
+
+if __name__ == '__main__':
+    main()
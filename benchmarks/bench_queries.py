@@ -0,0 +1,108 @@
+"""
+Benchmarks the query service: a dashboard load answered by re-running the
+view queries, and from the service's result cache.
+
+The synthetic domain of bench_storage.py is loaded into SQLite and published
+as a snapshot. A dashboard load is one course's roster, grades and activity
+log (three queries of the analytics views). It is timed:
+
+*   direct: on one connection, each query executed again, as dashboards do today;
+*   uncached: through QueryService with its cache disabled;
+*   cached: through QueryService, the results cached after the first load;
+*   HTTP 304: over the local HTTP endpoint, revalidating with If-None-Match.
+
+Times are the median of several loads, each of a different course.
+
+Usage:
+    python benchmarks/bench_queries.py [--courses N] [--works N] [--students N] [--runs N]
+"""
+
+import argparse
+import http.client
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from bench_storage import load
+from src.publish import publish_snapshot
+from src.queries import QueryService, serve_http
+from src.storage import open_storage
+
+DASHBOARD = ('VW_ENRLLMNT_DTLS', 'VW_ASSGNMNT_GRDS', 'VW_CRS_ACTVTY_LG')
+
+def median_time(function, course_names: list) -> float:
+    samples = []
+    for name in course_names:
+        start = time.perf_counter()
+        function(name)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--courses', type=int, default=40)
+    parser.add_argument('--works', type=int, default=30)
+    parser.add_argument('--students', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=20, help="Dashboard loads timed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = open_storage(os.path.join(tmp, 'working.sqlite3'), 'sqlite')
+        load(storage, args.courses, args.works, args.students)
+        storage.create_views()
+        snapshot = os.path.join(tmp, 'published.sqlite3')
+        publish_snapshot(storage.conn, snapshot)
+        storage.close()
+
+        names = [f'Course {c % args.courses}' for c in range(args.runs)]
+        conn = sqlite3.connect(f'file:{snapshot}?mode=ro', uri=True)
+        uncached = QueryService(snapshot, cache_entries=0)
+        service = QueryService(snapshot)
+        server = serve_http(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+        etags = {}
+
+        def direct(name):
+            for view in DASHBOARD:
+                conn.execute(f"SELECT * FROM {view} WHERE CRS_NM = ?;", (name,)).fetchall()
+
+        def through(query_service):
+            return lambda name: [query_service.query(view, {'CRS_NM': name}) for view in DASHBOARD]
+
+        def revalidate(name):
+            for view in DASHBOARD:
+                path = f"/views/{view}?CRS_NM={name.replace(' ', '+')}"
+                client.request('GET', path, headers={'If-None-Match': etags.get(path, '')})
+                response = client.getresponse()
+                response.read()
+                etags[path] = response.getheader('ETag')
+
+        results = {'direct': median_time(direct, names), 'uncached': median_time(through(uncached), names)}
+        through(service)(names[0])
+        for name in names:
+            revalidate(name)
+        results['cached'] = median_time(through(service), names)
+        results['HTTP 304'] = median_time(revalidate, names)
+
+        server.shutdown()
+        server.server_close()
+        client.close()
+        conn.close()
+        uncached.close()
+        service.close()
+
+    print(f"{args.courses} courses x {args.works} course work items x {args.students} students, "
+          f"milliseconds per dashboard load of {len(DASHBOARD)} queries")
+    for name, seconds in results.items():
+        print(f"{name:<10} {seconds * 1000:>10.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmarks the storage backends: load time and aggregate queries over submissions.
+
+A synthetic domain (courses x course work items x students, one submission
+per student per item) is saved through each backend as the extractor would,
+then typical report queries are timed against the analytics views and base
+tables. Query times are the median of several runs.
+
+Usage:
+    python benchmarks/bench_storage.py [--courses N] [--works N] [--students N] [--runs N]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from src.storage import open_storage
+
+STATES = ('TURNED_IN', 'RETURNED', 'CREATED', 'NEW', 'RECLAIMED_BY_STUDENT')
+
+QUERIES = {
+    'grades per assignment': """
+        SELECT CRS_NM, ASSGNMNT_TTL, COUNT(*), AVG(ASSGND_GRD), SUM(SBMSSN_STS = 'SBMITD')
+        FROM VW_ASSGNMNT_GRDS
+        GROUP BY CRS_NM, ASSGNMNT_TTL
+    """,
+    'completion per course': """
+        SELECT w.CRS_ID, COUNT(*), AVG(CASE WHEN s.STT IN ('TURNED_IN', 'RETURNED') THEN 1.0 ELSE 0 END)
+        FROM STDNT_SBMSSNS s
+        JOIN CRS_WRK w ON w.ID = s.CRS_WRK_ID
+        GROUP BY w.CRS_ID
+    """,
+    'grade distribution': """
+        SELECT CAST(ASSGND_GRD / 10 AS INTEGER) AS BAND, COUNT(*)
+        FROM STDNT_SBMSSNS
+        WHERE ASSGND_GRD IS NOT NULL
+        GROUP BY BAND
+    """,
+}
+
+def load(storage, courses: int, works: int, students: int, seed: int = 1):
+    """Saves the synthetic domain through a storage backend, committing per course."""
+    rng = random.Random(seed)
+    for s in range(students * courses // 4):
+        storage.save_user({'id': f'u{s}', 'name': {'fullName': f'Student {s}'}, 'emailAddress': f'u{s}@example.org'})
+    for c in range(courses):
+        course_id = f'c{c}'
+        storage.save_course({'id': course_id, 'name': f'Course {c}', 'courseState': 'ACTIVE',
+                             'creationTime': '2024-08-01T00:00:00Z', 'updateTime': '2024-08-01T00:00:00Z'})
+        roster = rng.sample(range(students * courses // 4), students)
+        for s in roster:
+            storage.save_enrollment(course_id, f'u{s}', 'STUDENT')
+        for w in range(works):
+            work_id = f'{course_id}-w{w}'
+            storage.save_course_work({'id': work_id, 'courseId': course_id, 'title': f'Assignment {w}',
+                                      'maxPoints': 100, 'creationTime': '2024-09-01T00:00:00Z',
+                                      'updateTime': '2024-09-01T00:00:00Z'})
+            for s in roster:
+                state = rng.choice(STATES)
+                storage.save_student_submission({
+                    'id': f'{work_id}-{s}', 'courseWorkId': work_id, 'userId': f'u{s}', 'state': state,
+                    'assignedGrade': rng.randint(40, 100) if state == 'RETURNED' else None,
+                    'creationTime': '2024-09-02T00:00:00Z', 'updateTime': '2024-09-03T00:00:00Z',
+                })
+        storage.commit()
+    storage.create_views()
+
+def bench(backend: str, path: str, args) -> dict:
+    storage = open_storage(path, backend)
+    try:
+        start = time.perf_counter()
+        load(storage, args.courses, args.works, args.students)
+        results = {'load': time.perf_counter() - start}
+        for name, sql in QUERIES.items():
+            samples = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                storage.query(sql)
+                samples.append(time.perf_counter() - start)
+            results[name] = statistics.median(samples)
+        return results
+    finally:
+        storage.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--works', type=int, default=20)
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.courses * args.works * args.students} submissions "
+          f"({args.courses} courses x {args.works} items x {args.students} students)")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            'sqlite': bench('sqlite', os.path.join(tmp, 'bench.sqlite3'), args),
+            'duckdb': bench('duckdb', os.path.join(tmp, 'bench.duckdb'), args),
+        }
+    print(f"{'':<24} {'sqlite':>10} {'duckdb':>10} {'speedup':>8}")
+    for name in results['sqlite']:
+        sqlite_time, duckdb_time = results['sqlite'][name], results['duckdb'][name]
+        print(f"{name:<24} {sqlite_time:>9.3f}s {duckdb_time:>9.3f}s {sqlite_time / duckdb_time:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Benchmarks the HTTP transports of the Classroom service: per-request latency.
+
+A local HTTPS server (a self-signed certificate made with the openssl
+command, or plain HTTP with --no-tls) answers studentSubmissions.list with a
+page of 100 submissions, gzip-encoded when the client accepts it. Each run
+then fetches the pages of --jobs course work items on --workers threads,
+each worker leasing a service from a ServicePool as an extraction does, once
+with the client library's httplib2 transport (one per service) and once with
+the shared PooledHttp. Latency is measured around each request's execute(),
+so it includes connecting and the TLS handshake whenever a connection is
+opened. Every run starts with new services, like a new command.
+
+Usage:
+    python benchmarks/bench_transport.py [--jobs N] [--workers N] [--runs N] [--no-tls]
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+import httplib2
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build_from_document
+
+from src.auth import load_discovery_document
+from src.concurrency import ServicePool, fetch_concurrently
+from src.transport import PooledHttp
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    # A multiprocessing.Value shared with the benchmark process
+    connections = None
+
+    def setup(self):
+        super().setup()
+        with Handler.connections.get_lock():
+            Handler.connections.value += 1
+
+    def do_GET(self):
+        work_id = self.path.split('/')[-2]
+        body = {'studentSubmissions': [
+            {'id': f'{work_id}-{i}', 'courseWorkId': work_id, 'userId': f'u{i}', 'state': 'RETURNED',
+             'assignedGrade': 90, 'creationTime': '2024-09-02T00:00:00Z', 'updateTime': '2024-09-03T00:00:00Z'}
+            for i in range(100)
+        ]}
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+def make_certificate(directory: str) -> tuple:
+    """
+    Creates a self-signed certificate for 127.0.0.1, and a CA bundle of it
+    and the usual CAs, so that clients load as many as they normally do.
+
+    Returns:
+        The certificate, key and CA bundle paths.
+    """
+    cert, key, bundle = (os.path.join(directory, name) for name in ('cert.pem', 'key.pem', 'bundle.pem'))
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+        '-addext', 'subjectAltName=IP:127.0.0.1', '-keyout', key, '-out', cert
+    ], check=True, capture_output=True)
+    with open(bundle, 'w') as out:
+        for path in (httplib2.CA_CERTS, cert):
+            with open(path) as f:
+                out.write(f.read() + '\n')
+    return cert, key, bundle
+
+def serve(port, connections, cert: str, key: str):
+    """Runs the server, in its own process so that it does not compete with the client for the GIL."""
+    Handler.connections = connections
+    server = ThreadingHTTPServer(('127.0.0.1', port.value), Handler)
+    server.daemon_threads = True
+    if cert:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        # Handshake in the connection's thread, not one at a time in accept()
+        server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    port.value = server.server_port
+    server.serve_forever()
+
+def bench(transport: str, url: str, ca_certs: str, connections, args) -> dict:
+    latencies = []
+    opened = connections.value
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        shared = None
+        if transport == 'pooled':
+            shared = PooledHttp(AnonymousCredentials(), pool_size=args.workers, ca_certs=ca_certs)
+
+        def new_service():
+            http = shared or httplib2.Http(ca_certs=ca_certs, timeout=60)
+            return build_from_document(load_discovery_document(), http=http, client_options={'api_endpoint': url})
+
+        services = ServicePool(new_service)
+
+        def fetch(work_id):
+            with services.lease() as service:
+                request = service.courses().courseWork().studentSubmissions().list(courseId='c1', courseWorkId=work_id)
+                started = time.perf_counter()
+                response = request.execute()
+                latencies.append(time.perf_counter() - started)
+                yield response['studentSubmissions']
+
+        for _ in fetch_concurrently([f'w{i}' for i in range(args.jobs)], fetch, args.workers):
+            pass
+        if shared is not None:
+            shared.close()
+    return {
+        'wall': time.perf_counter() - start,
+        'median': statistics.median(latencies),
+        'p95': statistics.quantiles(latencies, n=20)[-1],
+        'connections': connections.value - opened,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--jobs', type=int, default=200, help="Listings fetched per run")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--no-tls', action='store_true', help="Serve plain HTTP")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key, ca_certs = (None, None, None) if args.no_tls else make_certificate(tmp)
+        port, connections = multiprocessing.Value('i', 0), multiprocessing.Value('i', 0)
+        server = multiprocessing.Process(target=serve, args=(port, connections, cert, key), daemon=True)
+        server.start()
+        while not port.value:
+            time.sleep(0.01)
+        url = f"{'http' if args.no_tls else 'https'}://127.0.0.1:{port.value}/"
+        try:
+            results = {transport: bench(transport, url, ca_certs, connections, args)
+                       for transport in ('httplib2', 'pooled')}
+        finally:
+            server.terminate()
+
+    print(f"{args.runs} runs x {args.jobs} requests on {args.workers} workers over "
+          f"{'HTTP' if args.no_tls else 'HTTPS'}")
+    print(f"{'':<10} {'median':>9} {'p95':>9} {'wall':>8} {'connections':>12}")
+    for transport, result in results.items():
+        print(f"{transport:<10} {result['median'] * 1000:>7.2f}ms {result['p95'] * 1000:>7.2f}ms "
+              f"{result['wall']:>7.2f}s {result['connections']:>12}")
+
+if __name__ == '__main__':
+    main()
@@ -2,134 +2,909 @@
 FairPlay Google Workspace Extract
 =================================
 This application extracts data from Google Classroom and stores it in a
-local SQLite database.
+local SQLite (or DuckDB) database.
 """
 
+import argparse
+import json
+import logging
+import os
+import sqlite3
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from sqlite3 import Connection
 
-from src.config import get_config, ConfigError
-from src.auth import get_classroom_service
-from src.database import (
-    initialize_database, save_course, save_user, save_enrollment,
-    save_announcement, save_course_work, save_student_submission,
-    create_views
-)
+from src.config import get_config, tenant_config, tenant_names, ConfigError
+from src.auth import get_authorized_http, get_classroom_service
+from src.database import initialize_database
+from src.storage import DEFAULT_BACKEND, SQLiteBackend, StorageBackend, open_storage
 from src.extractor import (
-    get_courses, get_teachers, get_students, get_announcements,
-    get_course_work, get_student_submissions
+    get_courses, get_teachers, get_students, iter_announcement_pages,
+    iter_course_work_pages, iter_student_submission_pages
 )
 from src.masking import mask_user_profile
+from src.normalize import listed_ids
+from src.compact import write_compact_copy
+from src.publish import publish_snapshot
+from src.search import initialize_search_index, search_text
+from src.export import EXPORT_FORMATS, ExportError, default_exports, export_many
+from src.estimate import DEFAULT_PROBE_PAGES, DEFAULT_SAMPLE, EstimateError, estimate_run, format_estimate
+from src.replay import replay_dead_letters
+from src.refresh import courses_for_user, refresh_courses
+from src.changes import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_KEEP_RUNS, ChangeLogError, begin_run, end_run, initialize_change_log, iter_changes
+)
+from src.rollups import initialize_rollups
+from src.queries import (
+    DEFAULT_CACHE_ENTRIES, DEFAULT_CONNECTIONS, DEFAULT_HOST, DEFAULT_PORT, QueryError, QueryService, serve_http
+)
+from src.memory import MemoryBudget
+from src.metrics import MetricsRecorder
+from src.profiling import NULL_PROFILER, StageProfiler
+from src.concurrency import (
+    DEFAULT_FLEET_REQUESTS, DEFAULT_MAX_CONCURRENCY, DEFAULT_PARALLEL_TENANTS,
+    AdaptiveLimiter, FairShare, ServicePool, fetch_concurrently
+)
+from src.progress import DEFAULT_INTERVAL, ProgressReporter, current_tenant, start_logging, stop_logging
 
-def main(db_conn_for_testing: Connection = None):
+logger = logging.getLogger(__name__)
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    Parses the command line options.
+
+    Args:
+        argv: The arguments to parse. Defaults to sys.argv[1:].
+
+    Returns:
+        The parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Extract Google Classroom data into a local SQLite database.")
+    parser.add_argument('--profile', action='store_true',
+                        help="Record wall and CPU time per pipeline stage and per course.")
+    parser.add_argument('--profile-dir', default='profile',
+                        help="Directory for the profiling outputs (default: %(default)s).")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="With --profile, also write a cProfile dump of the run (run.pstats).")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="With --profile, also trace allocations and write the top allocation sites.")
+    parser.add_argument('--log-format', choices=('text', 'json'), default='text',
+                        help="Write log lines as plain text or as one JSON object per line (default: %(default)s).")
+    parser.add_argument('--verbose', action='store_true',
+                        help="Also log each course, listing and course work item as it is processed.")
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_INTERVAL,
+                        help="Seconds between progress lines (default: %(default)s).")
+
+    # Without a command the extraction runs, as it always has
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    search = commands.add_parser('search', help="Full-text search of announcements and course work.")
+    search.add_argument('query', help="An FTS5 query, e.g. photosynthesis or '\"lab report\" NOT draft'.")
+    search.add_argument('--limit', type=int, default=20,
+                        help="Maximum number of hits to show (default: %(default)s).")
+    search.add_argument('--tenant', help="The tenant to search, when tenants are configured.")
+
+    export = commands.add_parser('export', help="Stream tables and views to CSV, JSON Lines, Parquet or Arrow files.")
+    export.add_argument('names', nargs='*', metavar='NAME',
+                        help="Tables or views to export (default: the four analytics views, "
+                             "plus the base tables for parquet and arrow).")
+    export.add_argument('--format', choices=EXPORT_FORMATS, default='csv',
+                        help="Output format (default: %(default)s).")
+    export.add_argument('--gzip', action='store_true', help="Compress the output files with gzip.")
+    export.add_argument('--output-dir', default='export',
+                        help="Directory for the exported files (default: %(default)s).")
+    export.add_argument('--chunk-size', type=int,
+                        help="Rows fetched from the database at a time, or per record batch "
+                             "for parquet and arrow (default: 5000, or 50000 for parquet and arrow).")
+    export.add_argument('--workers', type=int, default=4,
+                        help="Tables or views exported in parallel (default: %(default)s).")
+    export.add_argument('--tenant', help="The tenant to export, when tenants are configured.")
+
+    gradebook = commands.add_parser('gradebook', help="Compute grade statistics and gradebook matrices.")
+    gradebook.add_argument('--course', action='append', dest='course_ids', metavar='COURSE_ID',
+                           help="Only this course; can be repeated (default: all courses).")
+    gradebook.add_argument('--matrix-dir',
+                           help="Also write each course's students x assignments matrix as CSV to this directory.")
+    gradebook.add_argument('--tenant', help="The tenant to compute gradebooks for, when tenants are configured.")
+
+    estimate = commands.add_parser('estimate', help="Estimate the API calls, rows, size and time of a run, "
+                                                    "without writing anything.")
+    estimate.add_argument('--sample', type=int, default=DEFAULT_SAMPLE,
+                          help="Courses to probe; 0 probes every course (default: %(default)s).")
+    estimate.add_argument('--probe-pages', type=int, default=DEFAULT_PROBE_PAGES,
+                          help="Pages fetched per listing when probing (default: %(default)s).")
+    estimate.add_argument('--concurrency', type=int,
+                          help="Concurrent requests to project the run time for "
+                               "(default: MAX_CONCURRENT_REQUESTS).")
+    estimate.add_argument('--tenant', help="The tenant to estimate, when tenants are configured.")
+    estimate.add_argument('--json', action='store_true', help="Print the estimate as JSON.")
+
+    replay = commands.add_parser('replay', help="Re-issue the API requests that failed in earlier runs "
+                                                "and save their results.")
+    replay.add_argument('--tenant', help="The tenant to replay, when tenants are configured.")
+    replay.add_argument('--list', action='store_true', help="Only list the failed requests, without replaying.")
+
+    refresh = commands.add_parser('refresh', help="Re-extract only some courses, e.g. to check a reported "
+                                                  "grading issue without waiting for the next run.")
+    refresh.add_argument('--course', action='append', dest='course_ids', default=[], metavar='COURSE_ID',
+                         help="A course to refresh; can be repeated.")
+    refresh.add_argument('--user', action='append', dest='users', default=[], metavar='USER',
+                         help="Refresh every course this user (an ID or email address) is enrolled in; "
+                              "can be repeated.")
+    refresh.add_argument('--tenant', help="The tenant to refresh, when tenants are configured.")
+
+    changes = commands.add_parser('changes', help="Print the inserts, updates and deletes logged after a cursor, "
+                                                  "as JSON Lines.")
+    changes.add_argument('--since', type=int, default=0,
+                         help="The last change already processed (default: %(default)s, every change logged).")
+    changes.add_argument('--table', action='append', dest='tables', metavar='TABLE',
+                         help="Only changes to this table; can be repeated (default: all tables).")
+    changes.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                         help="Changes read from the database at a time (default: %(default)s).")
+    changes.add_argument('--tenant', help="The tenant whose changes to print, when tenants are configured.")
+
+    serve = commands.add_parser('serve', help="Answer dashboard queries of the analytics views over local HTTP, "
+                                              "caching results until the next run.")
+    serve.add_argument('--host', default=DEFAULT_HOST, help="The address to listen on (default: %(default)s).")
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help="The port to listen on (default: %(default)s).")
+    serve.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                       help="Read-only database connections (default: %(default)s).")
+    serve.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                       help="Query results kept in the cache; 0 disables it (default: %(default)s).")
+    serve.add_argument('--tenant', help="The tenant whose database to serve, when tenants are configured.")
+    return parser.parse_args(argv)
+
+def _create_profiler(options: argparse.Namespace, tenant: str = None):
+    """
+    Returns a StageProfiler if profiling was requested, otherwise the no-op profiler.
+
+    A tenant's profile goes to its own subdirectory. cProfile and tracemalloc
+    are process-wide, so they are only used for single-tenant runs.
+    """
+    if not options.profile:
+        return NULL_PROFILER
+    if tenant is not None:
+        return StageProfiler(os.path.join(options.profile_dir, tenant))
+    return StageProfiler(options.profile_dir, options.cprofile, options.tracemalloc)
+
+def main(db_conn_for_testing: Connection = None, options: argparse.Namespace = None):
     """
     Main function to run the data extraction process.
 
+    If the configuration defines tenants, every tenant is extracted, each
+    into its own database. Exits with status 1 if the extraction (or any
+    tenant's) failed.
+
     Args:
         db_conn_for_testing: An optional database connection object.
                              If provided, it will be used for the operations.
                              If None, a new connection will be created based on config.
                              This is primarily for testing purposes.
+        options: Parsed command line options. Defaults to no options given.
+    """
+    logger.info("Starting FairPlay Google Workspace Extract...")
+
+    if options is None:
+        options = parse_args([])
+
+    try:
+        logger.info("Loading configuration...")
+        config = get_config()
+    except ConfigError as e:
+        logger.error(f"Configuration Error: {e}")
+        sys.exit(1)
+
+    if db_conn_for_testing is None and tenant_names(config):
+        succeeded = extract_tenants(config, options)
+    else:
+        succeeded = extract(config, options, db_conn_for_testing)
+    if not succeeded:
+        sys.exit(1)
+
+def extract(config, options: argparse.Namespace, db_conn_for_testing: Connection = None,
+            share: FairShare = None, tenant: str = None) -> bool:
     """
-    print("Starting FairPlay Google Workspace Extract...")
+    Extracts one Workspace domain into its database.
+
+    Args:
+        config: The (single-tenant) configuration.
+        options: Parsed command line options.
+        db_conn_for_testing: An optional database connection to use instead
+                             of opening the configured database.
+        share: An optional FairShare of request slots shared with other tenants.
+        tenant: The tenant name, when extracting one of several tenants.
 
-    conn = None  # Ensure conn is defined in the outer scope
+    Returns:
+        True if the extraction completed, False if it failed.
+    """
+    storage = None  # Ensure storage is defined in the outer scope
+    metrics = MetricsRecorder()
+    profiler = _create_profiler(options, tenant)
+    profiler.start()
     try:
-        # If a connection is provided for testing, use it. Otherwise, create one.
+        # If a connection is provided for testing, use it. Otherwise, open the
+        # configured database. Every row written is reported to the run
+        # metrics under its table.
         if db_conn_for_testing:
-            conn = db_conn_for_testing
+            storage = SQLiteBackend(db_conn_for_testing, metrics)
         else:
-            # 1. Load Configuration
-            print("Loading configuration...")
-            config = get_config()
             db_path = config.get('DATABASE', 'PATH')
+            backend = (config.get('DATABASE', 'BACKEND', fallback=DEFAULT_BACKEND) or DEFAULT_BACKEND).lower()
+            logger.info(f"Initializing {backend} database at '{db_path}'...")
+            storage = open_storage(db_path, backend, metrics)
 
-            # 2. Initialize Database
-            print(f"Initializing database at '{db_path}'...")
-            conn = initialize_database(db_path)
+        # Full-text search, the compact copy and snapshots are SQLite features
+        conn = storage.conn if isinstance(storage, SQLiteBackend) else None
+        run_id = None
+        if conn is not None:
+            initialize_search_index(conn)
+            _initialize_rollups(config, conn)
+            run_id = _begin_change_log_run(config, conn)
 
-        # Load configuration
-        config = get_config()
         masking_level = config.get('SETTINGS', 'PII_MASKING_LEVEL', fallback='none').lower()
+        purge_deleted = config.get('SETTINGS', 'PURGE_DELETED', fallback='true').lower() == 'true'
+        if purge_deleted:
+            storage.begin_seen_tracking()
+
+        # Bound memory use: commit early once MAX_BUFFERED_ROWS rows are
+        # pending, and flush whenever RSS nears MEMORY_BUDGET_MB
+        memory = MemoryBudget(
+            int(config.get('SETTINGS', 'MEMORY_BUDGET_MB', fallback='0') or 0),
+            int(config.get('SETTINGS', 'MAX_BUFFERED_ROWS', fallback='0') or 0),
+            metrics
+        )
+
+        def flush():
+            with metrics.time_flush():
+                storage.commit()
+            memory.flushed()
 
         # 3. Authenticate and get Google Classroom Service
-        print("Authenticating with Google Workspace...")
-        service = get_classroom_service(config)
+        logger.info("Authenticating with Google Workspace...")
+        http = get_authorized_http(config)
+        service = get_classroom_service(config, http)
+
+        # Requests in flight adapt to throttling, up to MAX_CONCURRENT_REQUESTS.
+        # Concurrent listings each use their own service from the pool, all
+        # sending their requests through the one pooled transport.
+        limiter = _create_limiter(config, metrics, share, tenant)
+        services = ServicePool(lambda: get_classroom_service(config, http))
 
         # 4. Extract and Save Data
-        print("Fetching courses...")
-        courses = get_courses(service)
+        with profiler.stage('courses'):
+            logger.info("Fetching courses...")
+            failures = []
+            courses = get_courses(service, metrics, failures, limiter)
+            _record_listing(storage, purge_deleted, 'CRSS', '', listed_ids(courses), failures)
 
         if not courses:
-            print("No courses found or user does not have permission to view them.")
-            return
+            logger.info("No courses found or user does not have permission to view them.")
+            return True
+
+        # Progress is logged at most once per interval rather than per item
+        progress = ProgressReporter(len(courses), metrics, options.progress_interval)
+
+        def page_done(rows: int):
+            memory.rows_written(rows, flush)
+            progress.maybe_report()
 
         for course in courses:
-            print(f"\nProcessing course: {course['name']} ({course['id']})")
-            save_course(conn, course)
+            if storage.save_course(course) is None:
+                # A quarantined course has no row for its rosters and content to refer to
+                progress.course_done()
+                continue
+            logger.debug(f"Processing course: {course['name']} ({course['id']})")
 
             # Process teachers
-            print(f"  Fetching teachers for {course['name']}...")
-            teachers = get_teachers(service, course['id'])
-            for teacher in teachers:
+            with profiler.stage('teachers', course['id']), memory.stage('teachers'):
+                logger.debug(f"Fetching teachers for {course['name']}...")
+                failures = []
+                teachers = get_teachers(service, course['id'], metrics, failures, limiter)
                 # Mask PII if required, then save
-                masked_profile = mask_user_profile(teacher['profile'], 'TEACHER', masking_level)
-                save_user(conn, masked_profile)
-                save_enrollment(conn, course['id'], masked_profile['id'], 'TEACHER')
-            print(f"  Found and processed {len(teachers)} teachers.")
+                profiles = [mask_user_profile(teacher['profile'], 'TEACHER', masking_level) for teacher in teachers]
+                for teacher_id in storage.save_page('USRS', profiles):
+                    storage.save_enrollment(course['id'], teacher_id, 'TEACHER')
+                _record_listing(storage, purge_deleted, 'TEACHERS', course['id'], listed_ids(profiles), failures)
+                page_done(len(profiles))
+                logger.debug(f"Found and processed {len(teachers)} teachers.")
 
             # Process students
-            print(f"  Fetching students for {course['name']}...")
-            students = get_students(service, course['id'])
-            for student in students:
-                # Some student profiles might be incomplete if they have been deleted
-                if 'name' in student['profile'] and 'emailAddress' in student['profile']:
-                    # Mask PII if required, then save
-                    masked_profile = mask_user_profile(student['profile'], 'STUDENT', masking_level)
-                    save_user(conn, masked_profile)
-                    save_enrollment(conn, course['id'], masked_profile['id'], 'STUDENT')
-                else:
-                    print(f"  Skipping student with incomplete profile: {student['profile'].get('id')}")
-            print(f"  Found and processed {len(students)} students.")
-
-            # Process announcements
-            print(f"  Fetching announcements for {course['name']}...")
-            announcements = get_announcements(service, course['id'])
-            for announcement in announcements:
-                save_announcement(conn, announcement)
-            print(f"  Found and processed {len(announcements)} announcements.")
-
-            # Process course work and submissions
-            print(f"  Fetching course work for {course['name']}...")
-            course_works = get_course_work(service, course['id'])
-            for work_item in course_works:
-                save_course_work(conn, work_item)
-                print(f"    Processing submissions for assignment: {work_item.get('title')} ({work_item['id']})")
-                submissions = get_student_submissions(service, course['id'], work_item['id'])
-                for submission in submissions:
-                    save_student_submission(conn, submission)
-            print(f"  Found and processed {len(course_works)} course work items and their submissions.")
-
-            conn.commit() # Commit after each course is fully processed
+            with profiler.stage('students', course['id']), memory.stage('students'):
+                logger.debug(f"Fetching students for {course['name']}...")
+                failures = []
+                students = get_students(service, course['id'], metrics, failures, limiter)
+                profiles = []
+                for student in students:
+                    # Some student profiles might be incomplete if they have been deleted
+                    if 'name' in student['profile'] and 'emailAddress' in student['profile']:
+                        # Mask PII if required, then save
+                        profiles.append(mask_user_profile(student['profile'], 'STUDENT', masking_level))
+                    else:
+                        logger.debug(f"Skipping student with incomplete profile: {student['profile'].get('id')}")
+                for student_id in storage.save_page('USRS', profiles):
+                    storage.save_enrollment(course['id'], student_id, 'STUDENT')
+                _record_listing(storage, purge_deleted, 'STUDENTS', course['id'], listed_ids(profiles), failures)
+                page_done(len(profiles))
+                logger.debug(f"Found and processed {len(students)} students.")
+
+            # Process announcements, a page at a time
+            with profiler.stage('announcements', course['id']), memory.stage('announcements'):
+                logger.debug(f"Fetching announcements for {course['name']}...")
+                failures = []
+                announcement_ids = []
+                for page in iter_announcement_pages(service, course['id'], metrics, failures, limiter):
+                    storage.save_page('ANNCMNTS', page)
+                    announcement_ids.extend(listed_ids(page))
+                    page_done(len(page))
+                _record_listing(storage, purge_deleted, 'ANNCMNTS', course['id'], announcement_ids, failures)
+                logger.debug(f"Found and processed {len(announcement_ids)} announcements.")
+
+            # Process course work, keeping only what the submissions need
+            with profiler.stage('course_work', course['id']), memory.stage('course_work'):
+                logger.debug(f"Fetching course work for {course['name']}...")
+                failures = []
+                course_works, course_work_ids = [], []
+                for page in iter_course_work_pages(service, course['id'], metrics, failures, limiter):
+                    # Submissions are listed for the items saved, not those quarantined
+                    saved = set(storage.save_page('CRS_WRK', page))
+                    course_works.extend((item['id'], item['title']) for item in page if item.get('id') in saved)
+                    course_work_ids.extend(listed_ids(page))
+                    page_done(len(page))
+                _record_listing(storage, purge_deleted, 'CRS_WRK', course['id'], course_work_ids, failures)
+
+            # Process submissions, listing several course work items at once
+            with profiler.stage('submissions', course['id']), memory.stage('submissions'):
+                titles = dict(course_works)
+                failures = {work_id: [] for work_id in titles}
+                submission_ids = {work_id: [] for work_id in titles}
+
+                def submission_pages(work_id, course_id=course['id']):
+                    with profiler.worker(), services.lease() as worker_service:
+                        yield from iter_student_submission_pages(
+                            worker_service, course_id, work_id, metrics, failures[work_id], limiter
+                        )
+
+                for work_id, page in fetch_concurrently(titles, submission_pages, limiter.maximum):
+                    if page is None:
+                        logger.debug(f"Processed {len(submission_ids[work_id])} submissions for "
+                                     f"assignment: {titles[work_id]} ({work_id})")
+                        _record_listing(storage, purge_deleted, 'STDNT_SBMSSNS', work_id,
+                                        submission_ids.pop(work_id), failures.pop(work_id))
+                        continue
+                    storage.save_page('STDNT_SBMSSNS', page)
+                    submission_ids[work_id].extend(listed_ids(page))
+                    page_done(len(page))
+            logger.debug(f"Found and processed {len(course_works)} course work items and their submissions.")
+
+            flush() # Commit after each course is fully processed
+            progress.course_done()
+
+        # Remove what has been deleted in Classroom since the last run
+        if purge_deleted:
+            deleted = storage.purge_unseen()
+            flush()
+            if any(deleted.values()):
+                logger.info("Removed rows deleted in Classroom: " + ", ".join(
+                    f"{collection}={count}" for collection, count in deleted.items() if count
+                ))
+
+        if run_id is not None:
+            _end_change_log_run(config, conn, run_id)
 
         # 5. Create analytics views
-        print("\nCreating database views for analytics...")
-        create_views(conn)
+        with profiler.stage('views'):
+            logger.info("Creating database views for analytics...")
+            storage.create_views()
+
+        # 6. Optionally write the compact copy for readers
+        compact_path = config.get('DATABASE', 'COMPACT_PATH', fallback='')
+        if compact_path:
+            with profiler.stage('compact'):
+                logger.info(f"Writing compact copy to '{compact_path}'...")
+                write_compact_copy(conn, compact_path)
+
+        # 7. Optionally publish a consistent snapshot for readers
+        publish_path = config.get('DATABASE', 'PUBLISH_PATH', fallback='')
+        if publish_path:
+            with profiler.stage('publish'):
+                logger.info(f"Publishing snapshot to '{publish_path}'...")
+                publish_snapshot(conn, publish_path)
+
+        progress.report(final=True)
+        written, skipped, quarantined = metrics.write_totals()
+        logger.info(f"Rows written: {written}, unchanged rows skipped: {skipped}, "
+                    f"malformed items quarantined: {quarantined}.")
+        if memory.limit or memory.max_buffered_rows:
+            memory.report()
+        logger.info("Data extraction process completed successfully.")
+        return True
+
+    except ConfigError as e:
+        logger.error(f"Configuration Error: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
+        return False
+    finally:
+        profiler.stop()
+        _write_metrics(config, metrics)
+
+        # Only close the database if it was opened by this function
+        if db_conn_for_testing is None and storage is not None:
+            storage.close()
+            logger.info("Database connection closed.")
+
+
+def extract_tenants(config, options: argparse.Namespace) -> bool:
+    """
+    Extracts every tenant in the configuration, several at a time.
+
+    Up to MAX_PARALLEL_TENANTS tenants run at once, each on its own thread
+    writing to its own database and with its own adaptive limiter. Their
+    requests share MAX_FLEET_REQUESTS slots, handed out fairly. Tenants with
+    the largest databases start first, so the longest extractions do not end
+    up running alone at the end.
+
+    Returns:
+        True if every tenant's extraction completed.
+    """
+    names = tenant_names(config)
+    configs = {name: tenant_config(config, name) for name in names}
+    parallel = int(config.get('SETTINGS', 'MAX_PARALLEL_TENANTS',
+                              fallback=str(DEFAULT_PARALLEL_TENANTS)) or DEFAULT_PARALLEL_TENANTS)
+    share = FairShare(int(config.get('SETTINGS', 'MAX_FLEET_REQUESTS',
+                                     fallback=str(DEFAULT_FLEET_REQUESTS)) or DEFAULT_FLEET_REQUESTS))
+
+    def database_size(name: str) -> int:
+        path = configs[name].get('DATABASE', 'PATH')
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def run_tenant(name: str) -> bool:
+        token = current_tenant.set(name)
+        try:
+            return extract(configs[name], options, share=share, tenant=name)
+        finally:
+            current_tenant.reset(token)
+
+    order = sorted(names, key=database_size, reverse=True)
+    logger.info(f"Extracting {len(names)} tenants, {min(parallel, len(names))} at a time...")
+    with ThreadPoolExecutor(max_workers=min(parallel, len(names)), thread_name_prefix='tenant') as pool:
+        results = dict(zip(order, pool.map(run_tenant, order)))
+
+    failed = [name for name in names if not results[name]]
+    if failed:
+        logger.error(f"Extraction failed for tenants: {', '.join(failed)}.")
+    logger.info(f"Extracted {len(names) - len(failed)} of {len(names)} tenants.")
+    return not failed
+
+
+def _record_listing(storage: StorageBackend, enabled: bool, collection: str, parent_id: str,
+                    items: list, failures: list):
+    """
+    Records a listing for deletion detection, if enabled and the listing
+    completed. A listing that failed is recorded in the dead-letter table
+    instead, for the 'replay' command.
+
+    Args:
+        items: The saved items, either API objects with an 'id' or plain IDs.
+    """
+    if failures:
+        storage.record_dead_letters(failures)
+    elif enabled:
+        ids = [item['id'] if isinstance(item, dict) else item for item in items]
+        storage.record_listing(collection, parent_id, ids)
+
+def _create_limiter(config, metrics: MetricsRecorder, share: FairShare = None, tenant: str = None) -> AdaptiveLimiter:
+    """Returns an adaptive limiter of up to MAX_CONCURRENT_REQUESTS requests in flight."""
+    return AdaptiveLimiter(
+        int(config.get('SETTINGS', 'MAX_CONCURRENT_REQUESTS',
+                       fallback=str(DEFAULT_MAX_CONCURRENCY)) or DEFAULT_MAX_CONCURRENCY),
+        metrics=metrics, share=share, tenant=tenant
+    )
+
+def _begin_change_log_run(config, conn: Connection):
+    """
+    Turns the change log on or off as configured (CHANGE_LOG) and, if on,
+    starts a run for the changes to be logged under.
+
+    Returns:
+        The run ID, or None if changes are not logged.
+    """
+    enabled = (config.get('DATABASE', 'CHANGE_LOG', fallback='false') or 'false').lower() == 'true'
+    initialize_change_log(conn, enabled)
+    return begin_run(conn) if enabled else None
 
-        print("\nData extraction process completed successfully.")
+def _initialize_rollups(config, conn: Connection):
+    """Turns the trigger-maintained engagement rollups on (the default) or off, as configured (ROLLUPS)."""
+    initialize_rollups(conn, (config.get('DATABASE', 'ROLLUPS', fallback='true') or 'true').lower() == 'true')
 
+def _end_change_log_run(config, conn: Connection, run_id: int):
+    """Ends a change log run, keeping the changes of the last CHANGE_LOG_RUNS runs."""
+    keep_runs = int(config.get('DATABASE', 'CHANGE_LOG_RUNS', fallback=str(DEFAULT_KEEP_RUNS)) or DEFAULT_KEEP_RUNS)
+    end_run(conn, run_id, keep_runs)
+
+def _select_tenant(config, tenant: str, command: str):
+    """Returns the configuration of the tenant a command runs for, if tenants are configured."""
+    tenants = tenant_names(config)
+    if tenant:
+        if tenant not in tenants:
+            raise ConfigError(f"No tenant named '{tenant}'.")
+        return tenant_config(config, tenant)
+    if tenants:
+        raise ConfigError(f"Choose a tenant to {command} with --tenant: {', '.join(tenants)}.")
+    return config
+
+def _sqlite_path(config, command: str) -> str:
+    """Returns the database path for a command that reads SQLite databases only."""
+    backend = (config.get('DATABASE', 'BACKEND', fallback=DEFAULT_BACKEND) or DEFAULT_BACKEND).lower()
+    if backend != 'sqlite':
+        raise ConfigError(f"The '{command}' command needs the sqlite backend, but BACKEND is '{backend}'.")
+    return config.get('DATABASE', 'PATH')
+
+def _write_metrics(config, metrics: MetricsRecorder):
+    """Writes the run metrics to the outputs configured in the [METRICS] section."""
+    textfile = config.get('METRICS', 'PROMETHEUS_TEXTFILE', fallback='')
+    summary = config.get('METRICS', 'JSON_SUMMARY', fallback='')
+    try:
+        if textfile:
+            metrics.write_prometheus_textfile(textfile)
+            logger.info(f"Metrics written to '{textfile}'.")
+        if summary:
+            metrics.write_json_summary(summary)
+            logger.info(f"Run summary written to '{summary}'.")
+    except OSError as e:
+        logger.error(f"Could not write run metrics: {e}")
+
+def search(options: argparse.Namespace, db_conn_for_testing: Connection = None):
+    """
+    Runs a full-text search against the database and prints the ranked hits.
+
+    Args:
+        options: Parsed command line options for the 'search' command.
+        db_conn_for_testing: An optional database connection, as for main().
+    """
+    conn = db_conn_for_testing
+    try:
+        if conn is None:
+            config = _select_tenant(get_config(), options.tenant, 'search')
+            conn = initialize_database(_sqlite_path(config, 'search'))
+        if not initialize_search_index(conn):
+            sys.exit(1)
+
+        hits = search_text(conn, options.query, options.limit)
+        if not hits:
+            print("No matches found.")
+        for hit in hits:
+            course = hit['course_name'] + (f" ({hit['course_section']})" if hit['course_section'] else '')
+            print(f"{hit['type']} {hit['id']} in {course} [{hit['course_id']}]")
+            print(f"  {hit['title']}")
+            print(f"  {hit['snippet']}")
     except ConfigError as e:
         print(f"Configuration Error: {e}", file=sys.stderr)
         sys.exit(1)
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}", file=sys.stderr)
+    except sqlite3.OperationalError as e:
+        print(f"Search failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if db_conn_for_testing is None and isinstance(conn, Connection):
+            conn.close()
+
+def export(options: argparse.Namespace):
+    """
+    Exports tables and views from the configured database to files.
+
+    Args:
+        options: Parsed command line options for the 'export' command.
+    """
+    try:
+        config = _select_tenant(get_config(), options.tenant, 'export')
+        names = options.names or list(default_exports(options.format))
+        results = export_many(
+            _sqlite_path(config, 'export'), names, options.output_dir, options.format,
+            options.gzip, options.chunk_size, options.workers
+        )
+        for name, (path, rows) in results.items():
+            print(f"Exported {rows} rows from {name} to '{path}'.")
+    except ConfigError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except (ExportError, sqlite3.Error, OSError) as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def gradebook(options: argparse.Namespace, db_conn_for_testing: Connection = None):
+    """
+    Computes grade statistics into the summary tables and, optionally,
+    writes per-course gradebook matrices.
+
+    Args:
+        options: Parsed command line options for the 'gradebook' command.
+        db_conn_for_testing: An optional database connection, as for main().
+    """
+    # numpy is only needed for this command
+    try:
+        from src.gradebook import compute_grade_statistics, course_gradebooks, write_matrix_csv
+    except ImportError:
+        print("The gradebook command requires numpy: pip install numpy", file=sys.stderr)
+        sys.exit(1)
+
+    conn = db_conn_for_testing
+    try:
+        if conn is None:
+            config = _select_tenant(get_config(), options.tenant, 'compute gradebooks for')
+            conn = initialize_database(_sqlite_path(config, 'gradebook'))
+
+        data = compute_grade_statistics(conn, options.course_ids)
+        print(f"Computed grade statistics for {len(data.course_ids)} courses, "
+              f"{len(data.assignment_ids)} assignments and {len(data.score)} submissions.")
+
+        if options.matrix_dir:
+            os.makedirs(options.matrix_dir, exist_ok=True)
+            for course in course_gradebooks(data):
+                write_matrix_csv(conn, course, os.path.join(options.matrix_dir, f"{course.course_id}.csv"))
+            print(f"Gradebook matrices written to '{options.matrix_dir}'.")
+    except ConfigError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if db_conn_for_testing is None and isinstance(conn, Connection):
+            conn.close()
+
+def estimate(options: argparse.Namespace):
+    """
+    Prints a dry-run estimate of a full extraction. Only reads from the API.
+
+    Args:
+        options: Parsed command line options for the 'estimate' command.
+    """
+    try:
+        config = _select_tenant(get_config(), options.tenant, 'estimate')
+
+        concurrency = options.concurrency or int(config.get(
+            'SETTINGS', 'MAX_CONCURRENT_REQUESTS', fallback=str(DEFAULT_MAX_CONCURRENCY)
+        ) or DEFAULT_MAX_CONCURRENCY)
+        service = get_classroom_service(config)
+        limiter = AdaptiveLimiter(concurrency)
+        result = estimate_run(service, concurrency, options.sample, options.probe_pages, limiter=limiter)
+    except ConfigError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except EstimateError as e:
+        print(f"Estimate failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2) if options.json else format_estimate(result))
+
+def replay(options: argparse.Namespace):
+    """
+    Re-issues the failed requests recorded in the dead-letter table and saves
+    their results. Exits with status 1 if any of them still fail.
+
+    Args:
+        options: Parsed command line options for the 'replay' command.
+    """
+    storage = None
+    try:
+        config = _select_tenant(get_config(), options.tenant, 'replay')
+        backend = (config.get('DATABASE', 'BACKEND', fallback=DEFAULT_BACKEND) or DEFAULT_BACKEND).lower()
+        storage = open_storage(config.get('DATABASE', 'PATH'), backend)
+        letters = storage.dead_letters()
+        if options.list or not letters:
+            if not letters:
+                print("No failed requests to replay.")
+            for letter in letters:
+                print(f"{letter.endpoint} {json.dumps(letter.params, sort_keys=True)} "
+                      f"page={letter.page_token or 'first'} status={letter.status} "
+                      f"attempts={letter.attempts} last_failed={letter.last_failed}")
+            return
+
+        metrics = MetricsRecorder()
+        service = get_classroom_service(config)
+        limiter = _create_limiter(config, metrics)
+        masking_level = config.get('SETTINGS', 'PII_MASKING_LEVEL', fallback='none').lower()
+        conn = storage.conn if isinstance(storage, SQLiteBackend) else None
+        if conn is not None:
+            _initialize_rollups(config, conn)
+        run_id = _begin_change_log_run(config, conn) if conn is not None else None
+        result = replay_dead_letters(storage, service, masking_level, metrics, limiter)
+        if run_id is not None:
+            _end_change_log_run(config, conn, run_id)
+        storage.create_views()
+
+        # Readers see the recovered rows in the next snapshot
+        publish_path = config.get('DATABASE', 'PUBLISH_PATH', fallback='')
+        if publish_path:
+            publish_snapshot(storage.conn, publish_path)
+    except ConfigError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if storage is not None:
+            storage.close()
+
+    print(f"Replayed {result['replayed']} failed requests in {result['api_calls']} API calls: "
+          f"{result['recovered']} recovered, {result['still_failing']} still failing, "
+          f"{result['new_failures']} new failures; {result['items']} items in {result['pages']} pages saved.")
+    if result['still_failing'] or result['new_failures']:
+        sys.exit(1)
+
+def refresh(options: argparse.Namespace, db_conn_for_testing: Connection = None):
+    """
+    Re-extracts the given courses, or every course of the given users, and
+    prints what was refreshed. Exits with status 1 if a course was not found
+    or a listing failed.
+
+    Args:
+        options: Parsed command line options for the 'refresh' command.
+        db_conn_for_testing: An optional database connection, as for main().
+    """
+    storage = None
+    try:
+        config = _select_tenant(get_config(), options.tenant, 'refresh')
+        if db_conn_for_testing is not None:
+            storage = SQLiteBackend(db_conn_for_testing)
+        else:
+            backend = (config.get('DATABASE', 'BACKEND', fallback=DEFAULT_BACKEND) or DEFAULT_BACKEND).lower()
+            storage = open_storage(config.get('DATABASE', 'PATH'), backend)
+
+        course_ids = list(options.course_ids)
+        for user in options.users:
+            user_courses = courses_for_user(storage, user)
+            if not user_courses:
+                raise ConfigError(f"No enrollments found for user '{user}'.")
+            course_ids.extend(user_courses)
+        if not course_ids:
+            raise ConfigError("Give the courses to refresh with --course or --user.")
+
+        metrics = MetricsRecorder()
+        limiter = _create_limiter(config, metrics)
+        http = get_authorized_http(config)
+        services = ServicePool(lambda: get_classroom_service(config, http))
+        masking_level = config.get('SETTINGS', 'PII_MASKING_LEVEL', fallback='none').lower()
+        purge_deleted = config.get('SETTINGS', 'PURGE_DELETED', fallback='true').lower() == 'true'
+
+        conn = storage.conn if isinstance(storage, SQLiteBackend) else None
+        if conn is not None:
+            _initialize_rollups(config, conn)
+        run_id = _begin_change_log_run(config, conn) if conn is not None else None
+        result = refresh_courses(storage, services, course_ids, masking_level, purge_deleted,
+                                 metrics, limiter, limiter.maximum)
+        if run_id is not None:
+            _end_change_log_run(config, conn, run_id)
+        storage.create_views()
+
+        if conn is not None:
+            _refresh_grade_statistics(conn, result['courses'])
+            publish_path = config.get('DATABASE', 'PUBLISH_PATH', fallback='')
+            if publish_path:
+                publish_snapshot(conn, publish_path)
+    except ConfigError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if db_conn_for_testing is None and storage is not None:
+            storage.close()
+
+    print(f"Refreshed {len(result['courses'])} courses in {result['api_calls']} API calls: "
+          f"{result['items']} items in {result['pages']} pages.")
+    if result['deleted']:
+        print("Removed rows deleted in Classroom: " + ", ".join(
+            f"{collection}={count}" for collection, count in result['deleted'].items()
+        ))
+    if result['missing']:
+        print(f"Courses not found in Classroom: {', '.join(result['missing'])}", file=sys.stderr)
+    if result['quarantined']:
+        print(f"Courses quarantined as malformed: {', '.join(result['quarantined'])}", file=sys.stderr)
+    if result['failed_listings']:
+        print(f"{result['failed_listings']} listings failed; run 'replay' to retry them.", file=sys.stderr)
+    if result['missing'] or result['failed_listings']:
+        sys.exit(1)
+
+def _refresh_grade_statistics(conn: Connection, course_ids: list):
+    """Recomputes the grade statistics of the given courses, if the gradebook command has stored any."""
+    if not course_ids or not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'CRS_GRD_STTS';"
+    ).fetchone():
+        return
+    try:
+        from src.gradebook import compute_grade_statistics
+    except ImportError:
+        logger.warning("numpy is not installed; the grade statistics of the refreshed courses were not updated.")
+        return
+    compute_grade_statistics(conn, course_ids)
+
+def changes(options: argparse.Namespace, db_conn_for_testing: Connection = None):
+    """
+    Prints the changes logged after a cursor, one JSON object per line, so
+    downstream readers can process only what changed since their last read.
+
+    Args:
+        options: Parsed command line options for the 'changes' command.
+        db_conn_for_testing: An optional database connection, as for main().
+    """
+    conn = db_conn_for_testing
+    try:
+        if conn is None:
+            config = _select_tenant(get_config(), options.tenant, 'read changes for')
+            conn = initialize_database(_sqlite_path(config, 'changes'))
+        logged = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'CHNG_LG';").fetchone()
+        if not logged:
+            raise ChangeLogError("No changes have been logged. Set CHANGE_LOG = true in [DATABASE] to log them.")
+
+        for chunk in iter_changes(conn, options.since, options.tables, options.chunk_size):
+            for change in chunk:
+                print(json.dumps({
+                    'seq': change.seq, 'run': change.run_id, 'table': change.table, 'key': change.key,
+                    'op': change.operation, 'columns': list(change.columns) if change.columns else None,
+                }))
+    except ConfigError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except ChangeLogError as e:
+        print(f"Changes unavailable: {e}", file=sys.stderr)
         sys.exit(1)
     finally:
-        # Only close the connection if it was created by this function
-        if db_conn_for_testing is None and 'conn' in locals() and isinstance(conn, Connection):
+        if db_conn_for_testing is None and isinstance(conn, Connection):
             conn.close()
-            print("Database connection closed.")
+
+def serve(options: argparse.Namespace):
+    """
+    Serves queries of the analytics views over HTTP until interrupted, from
+    the published snapshot if there is one, otherwise the working database.
+
+    Args:
+        options: Parsed command line options for the 'serve' command.
+    """
+    service = None
+    try:
+        config = _select_tenant(get_config(), options.tenant, 'serve')
+        path = config.get('DATABASE', 'PUBLISH_PATH', fallback='') or _sqlite_path(config, 'serve')
+        service = QueryService(path, options.connections, options.cache_entries)
+        server = serve_http(service, options.host, options.port)
+    except ConfigError as e:
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except (QueryError, sqlite3.Error, OSError) as e:
+        print(f"Cannot serve queries: {e}", file=sys.stderr)
+        if service is not None:
+            service.close()
+        sys.exit(1)
+
+    host, port = server.server_address[:2]
+    logger.info(f"Serving queries of '{path}' at http://{host}:{port}/views")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+def run(argv: list = None):
+    """Parses the command line and runs the requested command."""
+    options = parse_args(argv)
+    listener = start_logging(options.log_format, options.verbose)
+    try:
+        if options.command == 'search':
+            search(options)
+        elif options.command == 'export':
+            export(options)
+        elif options.command == 'gradebook':
+            gradebook(options)
+        elif options.command == 'estimate':
+            estimate(options)
+        elif options.command == 'replay':
+            replay(options)
+        elif options.command == 'refresh':
+            refresh(options)
+        elif options.command == 'changes':
+            changes(options)
+        elif options.command == 'serve':
+            serve(options)
+        else:
+            main(options=options)
+    finally:
+        stop_logging(listener)
 
 
 if __name__ == "__main__":
-    main()
+    run()
@@ -1,10 +1,23 @@
 """
 Handles Google API authentication and service creation.
+
+The Google client libraries are imported on first use rather than at module
+import, so commands that never talk to Google do not pay for them, and the
+Classroom service is built from a packaged copy of the API's discovery
+document instead of fetching and parsing it on every run.
 """
 
+import json
+import logging
+import os
 from configparser import ConfigParser
-import google.oauth2.service_account
-from googleapiclient.discovery import build, Resource
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+
+logger = logging.getLogger(__name__)
 
 # Define the scopes required for the application. These are all read-only.
 SCOPES = [
@@ -18,7 +31,89 @@ SCOPES = [
     'https://www.googleapis.com/auth/classroom.profile.photos',
 ]
 
-def get_classroom_service(config: ConfigParser) -> Resource:
+# Packaged Classroom v1 discovery document. Refresh it with
+# tools/update_discovery_document.py when the API gains features we need.
+DISCOVERY_DOCUMENT_PATH = os.path.join(os.path.dirname(__file__), 'discovery', 'classroom.v1.json')
+
+@lru_cache(maxsize=None)
+def load_discovery_document() -> dict:
+    """
+    Loads the packaged Classroom discovery document.
+
+    The parsed document is cached, so services built later in the same
+    process (e.g. one per worker) skip reading and parsing it again.
+
+    Returns:
+        The parsed discovery document.
+    """
+    with open(DISCOVERY_DOCUMENT_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+def get_delegated_credentials(config: ConfigParser):
+    """
+    Returns the service account credentials, impersonating the admin user.
+
+    The credentials share their access tokens with other runs and workers
+    through the token cache, if TOKEN_CACHE_FILE is set.
+
+    Args:
+        config: The application configuration.
+
+    Raises:
+        FileNotFoundError: If the service account credentials file is not found.
+    """
+    from google.oauth2 import service_account
+
+    service_account_file = config.get('GOOGLE', 'SERVICE_ACCOUNT_FILE')
+    admin_user_email = config.get('GOOGLE', 'ADMIN_USER_EMAIL')
+
+    creds = service_account.Credentials.from_service_account_file(
+        service_account_file, scopes=SCOPES
+    )
+
+    # Impersonate the admin user to get domain-wide access
+    delegated_creds = creds.with_subject(admin_user_email)
+
+    # Share access tokens with other runs and workers through the token cache
+    token_cache_file = config.get('GOOGLE', 'TOKEN_CACHE_FILE', fallback='')
+    if token_cache_file:
+        from src.token_cache import SharedCacheCredentials, get_token_cache
+        delegated_creds = SharedCacheCredentials(delegated_creds, get_token_cache(token_cache_file))
+    return delegated_creds
+
+def get_authorized_http(config: ConfigParser, credentials=None):
+    """
+    Returns a pooled HTTP transport that services can share, or None if
+    HTTP_TRANSPORT is 'httplib2'.
+
+    The pool keeps up to MAX_CONCURRENT_REQUESTS connections alive, one per
+    request in flight.
+
+    Args:
+        config: The application configuration.
+        credentials: The credentials to authorize requests with. Default:
+                     those of get_delegated_credentials().
+
+    Returns:
+        A PooledHttp, or None.
+    """
+    from src.concurrency import DEFAULT_MAX_CONCURRENCY
+    from src.transport import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, PooledHttp
+
+    transport = (config.get('GOOGLE', 'HTTP_TRANSPORT', fallback='pooled') or 'pooled').lower()
+    if transport == 'httplib2':
+        return None
+    return PooledHttp(
+        credentials or get_delegated_credentials(config),
+        pool_size=int(config.get('SETTINGS', 'MAX_CONCURRENT_REQUESTS',
+                                 fallback=str(DEFAULT_MAX_CONCURRENCY)) or DEFAULT_MAX_CONCURRENCY),
+        connect_timeout=float(config.get('GOOGLE', 'HTTP_CONNECT_TIMEOUT',
+                                         fallback=str(DEFAULT_CONNECT_TIMEOUT)) or DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=float(config.get('GOOGLE', 'HTTP_READ_TIMEOUT',
+                                      fallback=str(DEFAULT_READ_TIMEOUT)) or DEFAULT_READ_TIMEOUT),
+    )
+
+def get_classroom_service(config: ConfigParser, http=None) -> 'Resource':
     """
     Creates and returns an authenticated Google Classroom API service object.
 
@@ -28,6 +123,9 @@ def get_classroom_service(config: ConfigParser) -> Resource:
     Args:
         config: A ConfigParser object containing the application configuration,
                 including the service account file path and the admin user's email.
+        http: A transport from get_authorized_http() to send the requests
+              through, e.g. one shared by the services of all workers.
+              Default: a new one, as configured by HTTP_TRANSPORT.
 
     Returns:
         An authorized Google Classroom API service resource object.
@@ -36,22 +134,24 @@ def get_classroom_service(config: ConfigParser) -> Resource:
         FileNotFoundError: If the service account credentials file is not found.
         Exception: For other potential errors during authentication.
     """
-    service_account_file = config.get('GOOGLE', 'SERVICE_ACCOUNT_FILE')
-    admin_user_email = config.get('GOOGLE', 'ADMIN_USER_EMAIL')
+    # Deferred import: the client library takes a few hundred milliseconds to load.
+    from googleapiclient.discovery import build_from_document
 
-    creds = google.oauth2.service_account.Credentials.from_service_account_file(
-        service_account_file, scopes=SCOPES
-    )
-
-    # Impersonate the admin user to get domain-wide access
-    delegated_creds = creds.with_subject(admin_user_email)
+    delegated_creds = None
+    if http is None:
+        delegated_creds = get_delegated_credentials(config)
+        http = get_authorized_http(config, delegated_creds)
 
     try:
-        service = build('classroom', 'v1', credentials=delegated_creds)
+        if http is None:
+            # httplib2, authorized by the client library
+            service = build_from_document(load_discovery_document(), credentials=delegated_creds)
+        else:
+            service = build_from_document(load_discovery_document(), http=http)
         return service
     except Exception as e:
-        print(f"An error occurred while building the Google Classroom service: {e}")
-        print(
+        logger.error(f"An error occurred while building the Google Classroom service: {e}")
+        logger.error(
             "Please ensure the Google Classroom API is enabled in your Google Cloud project "
             "and that the service account has the necessary permissions."
         )
@@ -0,0 +1,209 @@
+"""
+Change log (change data capture) for downstream incremental readers.
+
+With DATABASE.CHANGE_LOG enabled, triggers append a row to CHNG_LG for every
+insert, update and delete in the base tables, including the deletions of the
+purge and their cascades. Unchanged rows are not rewritten (their content
+hash matches), so they are not logged either. Each change records:
+
+*   SEQ, a sequence number that only ever increases: a reader's cursor;
+*   RN_ID, the extraction run (in RNS) that made the change;
+*   TBL and KY, the table and the row's primary key. For ENRLLMNTS, whose ID
+    is internal to the database, the key is '<course ID>:<user ID>';
+*   OP, 'INSERT', 'UPDATE' or 'DELETE';
+*   CHNGD_CLMNS, for an update, the comma-separated columns that changed.
+
+A downstream reader (an SIS sync, a warehouse load) keeps the SEQ of the last
+change it processed and asks for the changes after it with iter_changes(),
+which streams them in chunks, then reads the current rows for those keys.
+The log keeps the changes of the last CHANGE_LOG_RUNS runs; a reader whose
+cursor is older than that has to re-read the tables in full.
+"""
+
+import logging
+from collections import namedtuple
+from sqlite3 import Connection
+
+from src.database import utc_now
+
+logger = logging.getLogger(__name__)
+
+class ChangeLogError(Exception):
+    """Custom exception for change log errors."""
+    pass
+
+# Runs whose changes are kept, unless configured otherwise. 0 keeps all.
+DEFAULT_KEEP_RUNS = 30
+
+# Changes fetched from the database at a time
+DEFAULT_CHUNK_SIZE = 5000
+
+# Logged table -> (primary key expression over a row, columns compared on update).
+# Content hashes and the enrollments' internal ID are left out.
+CHANGE_TABLES = {
+    'USRS': ("{row}.ID", ('NM', 'EML', 'PHT_URL')),
+    'CRSS': ("{row}.ID", ('NM', 'SCTN', 'DSCRPTN', 'CRTN_TM', 'UPDT_TM', 'CRS_STT')),
+    'ENRLLMNTS': ("{row}.CRS_ID || ':' || {row}.USR_ID", ('CRS_ID', 'USR_ID', 'RL')),
+    'ANNCMNTS': ("{row}.ID", ('CRS_ID', 'CRTR_USR_ID', 'TXT', 'STT', 'CRTN_TM', 'UPDT_TM')),
+    'CRS_WRK': ("{row}.ID", ('CRS_ID', 'TTL', 'DSCRPTN', 'WRK_TYP', 'MX_PNTS', 'CRTN_TM', 'UPDT_TM', 'CRTR_USR_ID')),
+    'STDNT_SBMSSNS': ("{row}.ID", ('CRS_WRK_ID', 'USR_ID', 'STT', 'ASSGND_GRD', 'DRFT_GRD', 'CRTN_TM', 'UPDT_TM',
+                                    'LT')),
+}
+
+# One change. columns is a tuple of the changed columns for an update, otherwise None.
+Change = namedtuple('Change', ['seq', 'run_id', 'table', 'key', 'operation', 'columns'])
+
+def _triggers(table: str) -> dict:
+    """Returns the change log triggers of a table, by name."""
+    key, columns = CHANGE_TABLES[table]
+    run = "(SELECT MAX(ID) FROM RNS)"
+    changed = ' || '.join(
+        f"CASE WHEN old.{column} IS NOT new.{column} THEN '{column},' ELSE '' END" for column in columns
+    )
+    return {
+        f"{table}_CHNG_AI": f"""
+            CREATE TRIGGER {table}_CHNG_AI AFTER INSERT ON {table} BEGIN
+                INSERT INTO CHNG_LG (RN_ID, TBL, KY, OP) VALUES ({run}, '{table}', {key.format(row='new')}, 'INSERT');
+            END;
+        """,
+        f"{table}_CHNG_AU": f"""
+            CREATE TRIGGER {table}_CHNG_AU AFTER UPDATE ON {table} BEGIN
+                INSERT INTO CHNG_LG (RN_ID, TBL, KY, OP, CHNGD_CLMNS)
+                SELECT {run}, '{table}', {key.format(row='new')}, 'UPDATE', rtrim({changed}, ',') AS CLMNS
+                WHERE CLMNS <> '';
+            END;
+        """,
+        f"{table}_CHNG_AD": f"""
+            CREATE TRIGGER {table}_CHNG_AD AFTER DELETE ON {table} BEGIN
+                INSERT INTO CHNG_LG (RN_ID, TBL, KY, OP) VALUES ({run}, '{table}', {key.format(row='old')}, 'DELETE');
+            END;
+        """,
+    }
+
+def initialize_change_log(conn: Connection, enabled: bool = True):
+    """
+    Creates the change log and its triggers, or drops the triggers.
+
+    The CHNG_LG and RNS tables are kept when the log is disabled, so readers
+    can still consume the changes logged before.
+
+    Args:
+        conn: The database connection.
+        enabled: Whether changes are logged from now on.
+    """
+    present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger';")}
+    if not enabled:
+        for table in CHANGE_TABLES:
+            for name in _triggers(table):
+                if name in present:
+                    conn.execute(f"DROP TRIGGER {name};")
+        conn.commit()
+        return
+
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS RNS (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            STRTD_TM TEXT NOT NULL,
+            FNSHD_TM TEXT,
+            LST_SEQ INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS CHNG_LG (
+            SEQ INTEGER PRIMARY KEY AUTOINCREMENT,
+            RN_ID INTEGER,
+            TBL TEXT NOT NULL,
+            KY TEXT NOT NULL,
+            OP TEXT NOT NULL CHECK(OP IN ('INSERT', 'UPDATE', 'DELETE')),
+            CHNGD_CLMNS TEXT
+        );
+        CREATE INDEX IF NOT EXISTS IDX_CHNG_LG_TBL ON CHNG_LG(TBL, SEQ);
+    """)
+    for table in CHANGE_TABLES:
+        for name, sql in _triggers(table).items():
+            if name not in present:
+                conn.execute(sql)
+    conn.commit()
+
+def begin_run(conn: Connection) -> int:
+    """Records the start of a run, whose ID the changes made from now on carry."""
+    run_id = conn.execute("INSERT INTO RNS (STRTD_TM) VALUES (?);", (utc_now(),)).lastrowid
+    conn.commit()
+    return run_id
+
+def end_run(conn: Connection, run_id: int, keep_runs: int = DEFAULT_KEEP_RUNS) -> int:
+    """
+    Records the end of a run, then drops the changes of runs older than the
+    last keep_runs.
+
+    Returns:
+        The number of changes dropped.
+    """
+    conn.execute("""
+        UPDATE RNS SET FNSHD_TM = ?, LST_SEQ = (SELECT MAX(SEQ) FROM CHNG_LG) WHERE ID = ?;
+    """, (utc_now(), run_id))
+    dropped = 0
+    if keep_runs:
+        # Runs end in order, so everything up to the last change of the
+        # newest run that is not kept can go
+        row = conn.execute("""
+            SELECT MAX(LST_SEQ) FROM (SELECT LST_SEQ FROM RNS ORDER BY ID DESC LIMIT -1 OFFSET ?);
+        """, (keep_runs,)).fetchone()
+        if row[0] is not None:
+            dropped = conn.execute("DELETE FROM CHNG_LG WHERE SEQ <= ?;", (row[0],)).rowcount
+    conn.commit()
+    if dropped:
+        logger.info(f"Dropped {dropped} changes older than the last {keep_runs} runs from the change log.")
+    return dropped
+
+def change_cursor(conn: Connection) -> int:
+    """Returns the SEQ of the latest change: the cursor of a reader that is up to date."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'CHNG_LG';").fetchone()
+    return row[0] if row else 0
+
+def iter_changes(conn: Connection, since: int = 0, tables=None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Streams the changes made after a cursor, oldest first, in chunks.
+
+    Args:
+        conn: The database connection.
+        since: The SEQ of the last change already processed; 0 for all.
+        tables: Only the changes to these tables. Default: all of them.
+        chunk_size: The most changes per chunk.
+
+    Yields:
+        Lists of up to chunk_size Changes. The seq of the last Change in the
+        last chunk is the reader's new cursor.
+
+    Raises:
+        ChangeLogError: If changes after the cursor have already been dropped
+                        from the log, or a table is not logged.
+    """
+    tables = tuple(tables or CHANGE_TABLES)
+    unknown = [table for table in tables if table not in CHANGE_TABLES]
+    if unknown:
+        raise ChangeLogError(f"No changes are logged for {', '.join(unknown)}.")
+
+    # Numbers are never reused, so a cursor below the oldest change still
+    # logged (or, if all were dropped, the latest) has missed changes
+    oldest = conn.execute("SELECT MIN(SEQ) FROM CHNG_LG;").fetchone()[0]
+    first_kept = oldest if oldest is not None else change_cursor(conn) + 1
+    if since < first_kept - 1:
+        raise ChangeLogError(
+            f"Changes after {since} are no longer in the change log (it starts after {first_kept - 1}). "
+            f"Re-read the tables in full, then continue from change {change_cursor(conn)}."
+        )
+
+    placeholders = ', '.join('?' for _ in tables)
+    while True:
+        rows = conn.execute(f"""
+            SELECT SEQ, RN_ID, TBL, KY, OP, CHNGD_CLMNS FROM CHNG_LG
+            WHERE SEQ > ? AND TBL IN ({placeholders})
+            ORDER BY SEQ
+            LIMIT ?;
+        """, (since, *tables, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield [
+            Change(seq, run_id, table, key, operation, tuple(columns.split(',')) if columns else None)
+            for seq, run_id, table, key, operation, columns in rows
+        ]
+        since = rows[-1][0]
@@ -0,0 +1,263 @@
+"""
+Writes tables and views as Parquet or Arrow IPC files for analytics tools.
+
+Rows are read from the SQLite cursor in chunks and written as Arrow record
+batches, so a table never has to fit in memory. State, role and type
+columns, which hold a handful of distinct values, are dictionary encoded.
+Submissions are partitioned by course into a Hive-style directory
+(STDNT_SBMSSNS/CRS_ID=<id>/part-0.parquet) that pandas, DuckDB, Spark and
+pyarrow.dataset read as one dataset, and can filter by course without
+reading the other partitions.
+
+Requires pyarrow, which is imported only when a columnar export runs.
+"""
+
+import os
+import shutil
+from sqlite3 import Connection
+from urllib.parse import quote
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+# File extension per format
+FILE_EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# The base tables, exported along with the analytics views by default
+BASE_TABLES = ('USRS', 'CRSS', 'ENRLLMNTS', 'ANNCMNTS', 'CRS_WRK', 'STDNT_SBMSSNS')
+
+# Low-cardinality columns stored dictionary encoded
+DICTIONARY_COLUMNS = {
+    'STT', 'CRS_STT', 'RL', 'USR_RL', 'WRK_TYP', 'SBMSSN_STT_RAW', 'SBMSSN_STS', 'ACTVTY_TYP',
+}
+
+# Tables written as a directory with one partition per value of a column.
+# Name -> (query, partition column); the query must be ordered by that column.
+PARTITIONED_EXPORTS = {
+    'STDNT_SBMSSNS': ("""
+        SELECT w.CRS_ID, s.*
+        FROM STDNT_SBMSSNS s
+        JOIN CRS_WRK w ON w.ID = s.CRS_WRK_ID
+        ORDER BY w.CRS_ID;
+    """, 'CRS_ID'),
+}
+
+DEFAULT_BATCH_SIZE = 50000
+
+def import_pyarrow():
+    """Imports pyarrow, with a clear message if it is not installed."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow exports require pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+def columnar_output_name(name: str, fmt: str) -> str:
+    """Returns the file (or, for partitioned tables, directory) name for an export."""
+    if name in PARTITIONED_EXPORTS:
+        return name
+    return f"{name}.{FILE_EXTENSIONS[fmt]}"
+
+def _declared_types(conn: Connection, name: str) -> dict:
+    """Returns the declared type of each column of a table or view, upper-cased."""
+    return {row[1]: (row[2] or '').upper() for row in conn.execute(f'PRAGMA table_xinfo("{name}");')}
+
+def _arrow_type(pa, declared: str, sample):
+    """
+    Maps a column to an Arrow type using SQLite's type affinity rules, falling
+    back to the first value seen for columns without a declared type (view
+    expressions).
+    """
+    if 'INT' in declared:
+        return pa.int64()
+    if any(word in declared for word in ('CHAR', 'CLOB', 'TEXT')):
+        return pa.string()
+    if any(word in declared for word in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    if isinstance(sample, bool) or isinstance(sample, int):
+        return pa.int64()
+    if isinstance(sample, float):
+        return pa.float64()
+    if isinstance(sample, bytes):
+        return pa.binary()
+    return pa.string()
+
+class _DictionaryEncoder:
+    """
+    Encodes a column against a dictionary that only ever grows, so each
+    batch's dictionary extends the previous one. Arrow IPC files accept
+    that as a dictionary delta.
+    """
+
+    def __init__(self, pa):
+        self.pa = pa
+        self.codes = {}
+        self.values = []
+
+    def encode(self, column: tuple):
+        indices = []
+        for value in column:
+            if value is None:
+                indices.append(None)
+                continue
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            indices.append(code)
+        return self.pa.DictionaryArray.from_arrays(
+            self.pa.array(indices, self.pa.int32()), self.pa.array(self.values, self.pa.string())
+        )
+
+class _BatchBuilder:
+    """Turns chunks of SQLite rows into Arrow record batches with a fixed schema."""
+
+    def __init__(self, pa, columns: list, declared: dict, first_chunk: list):
+        self.pa = pa
+        self.columns = columns
+        samples = {}
+        for index, column in enumerate(columns):
+            samples[column] = next((row[index] for row in first_chunk if row[index] is not None), None)
+        fields = []
+        self.encoders = {}
+        for column in columns:
+            if column in DICTIONARY_COLUMNS:
+                self.encoders[column] = _DictionaryEncoder(pa)
+                fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(column, _arrow_type(pa, declared.get(column, ''), samples[column])))
+        self.schema = pa.schema(fields)
+
+    def build(self, chunk: list):
+        arrays = []
+        for column, field, values in zip(self.columns, self.schema, zip(*chunk)):
+            encoder = self.encoders.get(column)
+            if encoder:
+                arrays.append(encoder.encode(values))
+            else:
+                arrays.append(self.pa.array(values, field.type))
+        return self.pa.record_batch(arrays, schema=self.schema)
+
+def _open_writer(pa, path: str, schema, fmt: str):
+    if fmt == 'parquet':
+        return pa.parquet.ParquetWriter(path, schema, compression='zstd')
+    sink = pa.OSFile(path, 'wb')
+    writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+    # Close the file along with the writer
+    close = writer.close
+    def close_both():
+        close()
+        sink.close()
+    writer.close = close_both
+    return writer
+
+def _write_file(pa, cursor, columns: list, declared: dict, path: str, fmt: str,
+                first_chunk: list, batch_size: int) -> int:
+    """Writes the cursor's remaining rows, starting with first_chunk, to one file."""
+    builder = _BatchBuilder(pa, columns, declared, first_chunk)
+    writer = _open_writer(pa, path, builder.schema, fmt)
+    rows = 0
+    try:
+        chunk = first_chunk
+        while chunk:
+            writer.write_batch(builder.build(chunk))
+            rows += len(chunk)
+            chunk = cursor.fetchmany(batch_size)
+    finally:
+        writer.close()
+    return rows
+
+def _replace_directory(source: str, destination: str):
+    """Moves a finished directory into place, replacing any previous one."""
+    previous = f"{destination}.old"
+    if os.path.exists(destination):
+        os.replace(destination, previous)
+    os.replace(source, destination)
+    shutil.rmtree(previous, ignore_errors=True)
+
+def export_columnar(conn: Connection, name: str, output_dir: str, fmt: str = 'parquet',
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> tuple:
+    """
+    Writes a table or view as Parquet or Arrow IPC, in record batches.
+
+    The caller is expected to have checked that the name is a table or view.
+    Output is written under a temporary name and moved into place when complete.
+
+    Args:
+        conn: The database connection.
+        name: The table or view to export.
+        output_dir: The directory the file or partition directory is written to.
+        fmt: 'parquet' (zstd-compressed) or 'arrow' (Arrow IPC file).
+        batch_size: The number of rows per record batch.
+
+    Returns:
+        A tuple of the output path and the number of rows exported.
+    """
+    pa = import_pyarrow()
+    path = os.path.join(output_dir, columnar_output_name(name, fmt))
+    temp_path = f"{path}.tmp"
+    declared = _declared_types(conn, name)
+
+    partitioned = PARTITIONED_EXPORTS.get(name)
+    if partitioned is None:
+        cursor = conn.execute(f'SELECT * FROM "{name}";')
+    else:
+        query, partition_column = partitioned
+        cursor = conn.execute(query)
+    columns = [column[0] for column in cursor.description]
+
+    try:
+        if partitioned is None:
+            rows = _write_file(pa, cursor, columns, declared, temp_path, fmt,
+                               cursor.fetchmany(batch_size), batch_size)
+            os.replace(temp_path, path)
+            return path, rows
+
+        # One file per partition value; the value is carried in the directory
+        # name, Hive style, rather than stored in the file
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        key_index = columns.index(partition_column)
+        file_columns = columns[:key_index] + columns[key_index + 1:]
+        rows = 0
+        writer = builder = sample = key = None
+        batch = []
+        try:
+            for chunk in iter(lambda: cursor.fetchmany(batch_size), []):
+                for row in chunk:
+                    if writer is None or row[key_index] != key:
+                        if writer is not None:
+                            if batch:
+                                writer.write_batch(builder.build(batch))
+                                batch = []
+                            writer.close()
+                        key = row[key_index]
+                        if sample is None:
+                            sample = [r[:key_index] + r[key_index + 1:] for r in chunk]
+                        # Every partition has the same schema but its own dictionaries
+                        builder = _BatchBuilder(pa, file_columns, declared, sample)
+                        partition_dir = os.path.join(temp_path, f"{partition_column}={quote(str(key), safe='')}")
+                        os.makedirs(partition_dir)
+                        writer = _open_writer(pa, os.path.join(partition_dir, f"part-0.{FILE_EXTENSIONS[fmt]}"),
+                                              builder.schema, fmt)
+                    batch.append(row[:key_index] + row[key_index + 1:])
+                    rows += 1
+                    if len(batch) >= batch_size:
+                        writer.write_batch(builder.build(batch))
+                        batch = []
+            if batch:
+                writer.write_batch(builder.build(batch))
+        finally:
+            if writer is not None:
+                writer.close()
+        _replace_directory(temp_path, path)
+        return path, rows
+    except BaseException:
+        if os.path.isdir(temp_path):
+            shutil.rmtree(temp_path, ignore_errors=True)
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,267 @@
+"""
+Writes a compact copy of the extraction database.
+
+The working database keeps the straightforward schema the extractor writes
+to: Google IDs as TEXT keys repeated in every foreign key, RFC 3339 timestamp
+strings and states stored as text. The compact copy stores the same data in
+less space:
+
+*   every entity gets an INTEGER surrogate key (K) and foreign keys refer to
+    it, so each long Google ID is stored once;
+*   states, work types and roles are small integer codes into ENM_CDS;
+*   timestamps are integer microseconds since the Unix epoch. A timestamp
+    is only converted if the view renders it back to the same text: with a
+    millisecond fraction ('.123Z', the Classroom API's form, '.000Z'
+    included), or a microsecond one not ending in 000. Any other form ('Z'
+    with no fraction, other fraction widths) is kept as text.
+
+The compact tables are prefixed with C_. Views named after the original
+tables (USRS, CRSS, ...) expose the original column names and formats, so
+the analytics views and existing queries run against the copy unchanged.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+from calendar import timegm
+from sqlite3 import Connection
+
+from src.database import create_views
+
+logger = logging.getLogger(__name__)
+
+_RFC3339 = re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,9}))?Z$')
+
+# Enum domains: (domain, source table, source column)
+ENUM_COLUMNS = (
+    ('CRS_STT', 'CRSS', 'CRS_STT'),
+    ('RL', 'ENRLLMNTS', 'RL'),
+    ('ANNCMNT_STT', 'ANNCMNTS', 'STT'),
+    ('WRK_TYP', 'CRS_WRK', 'WRK_TYP'),
+    ('SBMSSN_STT', 'STDNT_SBMSSNS', 'STT'),
+)
+
+_SCHEMA = """
+CREATE TABLE cmpct.ENM_CDS (
+    CD INTEGER PRIMARY KEY,
+    DMN TEXT NOT NULL,
+    VL TEXT NOT NULL,
+    UNIQUE (DMN, VL)
+);
+CREATE TABLE cmpct.C_USRS (
+    K INTEGER PRIMARY KEY,
+    ID TEXT NOT NULL UNIQUE,
+    NM TEXT NOT NULL,
+    EML TEXT NOT NULL,
+    PHT_URL TEXT
+);
+CREATE TABLE cmpct.C_CRSS (
+    K INTEGER PRIMARY KEY,
+    ID TEXT NOT NULL UNIQUE,
+    NM TEXT NOT NULL,
+    SCTN TEXT,
+    DSCRPTN TEXT,
+    CRTN_TM INTEGER,
+    UPDT_TM INTEGER,
+    CRS_STT_CD INTEGER
+);
+CREATE TABLE cmpct.C_ENRLLMNTS (
+    ENRLLMNT_ID INTEGER PRIMARY KEY,
+    CRS_K INTEGER NOT NULL REFERENCES C_CRSS(K),
+    USR_K INTEGER NOT NULL REFERENCES C_USRS(K),
+    RL_CD INTEGER NOT NULL,
+    UNIQUE (CRS_K, USR_K)
+);
+CREATE TABLE cmpct.C_ANNCMNTS (
+    K INTEGER PRIMARY KEY,
+    ID TEXT NOT NULL UNIQUE,
+    CRS_K INTEGER NOT NULL REFERENCES C_CRSS(K),
+    CRTR_USR_K INTEGER NOT NULL REFERENCES C_USRS(K),
+    TXT TEXT,
+    STT_CD INTEGER,
+    CRTN_TM INTEGER,
+    UPDT_TM INTEGER
+);
+CREATE TABLE cmpct.C_CRS_WRK (
+    K INTEGER PRIMARY KEY,
+    ID TEXT NOT NULL UNIQUE,
+    CRS_K INTEGER NOT NULL REFERENCES C_CRSS(K),
+    TTL TEXT NOT NULL,
+    DSCRPTN TEXT,
+    WRK_TYP_CD INTEGER,
+    MX_PNTS REAL,
+    CRTN_TM INTEGER,
+    UPDT_TM INTEGER,
+    -- The creator need not be on any roster, so this is not a key into C_USRS
+    CRTR_USR_ID TEXT
+);
+CREATE TABLE cmpct.C_STDNT_SBMSSNS (
+    K INTEGER PRIMARY KEY,
+    ID TEXT NOT NULL UNIQUE,
+    CRS_WRK_K INTEGER NOT NULL REFERENCES C_CRS_WRK(K),
+    USR_K INTEGER NOT NULL REFERENCES C_USRS(K),
+    STT_CD INTEGER,
+    ASSGND_GRD REAL,
+    DRFT_GRD REAL,
+    CRTN_TM INTEGER,
+    UPDT_TM INTEGER
+);
+CREATE INDEX cmpct.IDX_C_ANNCMNTS_CRS_K ON C_ANNCMNTS (CRS_K);
+CREATE INDEX cmpct.IDX_C_CRS_WRK_CRS_K ON C_CRS_WRK (CRS_K);
+CREATE INDEX cmpct.IDX_C_STDNT_SBMSSNS_CRS_WRK_K ON C_STDNT_SBMSSNS (CRS_WRK_K);
+CREATE INDEX cmpct.IDX_C_STDNT_SBMSSNS_USR_K ON C_STDNT_SBMSSNS (USR_K);
+"""
+
+def _enum(domain: str, column: str) -> str:
+    return f"(SELECT CD FROM cmpct.ENM_CDS WHERE DMN = '{domain}' AND VL = {column})"
+
+_COPY = f"""
+INSERT INTO cmpct.C_USRS (ID, NM, EML, PHT_URL)
+SELECT ID, NM, EML, PHT_URL FROM main.USRS ORDER BY ID;
+
+INSERT INTO cmpct.C_CRSS (ID, NM, SCTN, DSCRPTN, CRTN_TM, UPDT_TM, CRS_STT_CD)
+SELECT ID, NM, SCTN, DSCRPTN, EPOCH_US(CRTN_TM), EPOCH_US(UPDT_TM), {_enum('CRS_STT', 'CRS_STT')}
+FROM main.CRSS ORDER BY ID;
+
+INSERT INTO cmpct.C_ENRLLMNTS (ENRLLMNT_ID, CRS_K, USR_K, RL_CD)
+SELECT e.ENRLLMNT_ID, c.K, u.K, {_enum('RL', 'e.RL')}
+FROM main.ENRLLMNTS e
+JOIN cmpct.C_CRSS c ON c.ID = e.CRS_ID
+JOIN cmpct.C_USRS u ON u.ID = e.USR_ID;
+
+INSERT INTO cmpct.C_ANNCMNTS (ID, CRS_K, CRTR_USR_K, TXT, STT_CD, CRTN_TM, UPDT_TM)
+SELECT a.ID, c.K, u.K, a.TXT, {_enum('ANNCMNT_STT', 'a.STT')}, EPOCH_US(a.CRTN_TM), EPOCH_US(a.UPDT_TM)
+FROM main.ANNCMNTS a
+JOIN cmpct.C_CRSS c ON c.ID = a.CRS_ID
+JOIN cmpct.C_USRS u ON u.ID = a.CRTR_USR_ID
+ORDER BY c.K, a.ID;
+
+INSERT INTO cmpct.C_CRS_WRK (ID, CRS_K, TTL, DSCRPTN, WRK_TYP_CD, MX_PNTS, CRTN_TM, UPDT_TM, CRTR_USR_ID)
+SELECT w.ID, c.K, w.TTL, w.DSCRPTN, {_enum('WRK_TYP', 'w.WRK_TYP')}, w.MX_PNTS,
+       EPOCH_US(w.CRTN_TM), EPOCH_US(w.UPDT_TM), w.CRTR_USR_ID
+FROM main.CRS_WRK w
+JOIN cmpct.C_CRSS c ON c.ID = w.CRS_ID
+ORDER BY c.K, w.ID;
+
+INSERT INTO cmpct.C_STDNT_SBMSSNS (ID, CRS_WRK_K, USR_K, STT_CD, ASSGND_GRD, DRFT_GRD, CRTN_TM, UPDT_TM)
+SELECT s.ID, w.K, u.K, {_enum('SBMSSN_STT', 's.STT')}, s.ASSGND_GRD, s.DRFT_GRD,
+       EPOCH_US(s.CRTN_TM), EPOCH_US(s.UPDT_TM)
+FROM main.STDNT_SBMSSNS s
+JOIN cmpct.C_CRS_WRK w ON w.ID = s.CRS_WRK_ID
+JOIN cmpct.C_USRS u ON u.ID = s.USR_ID
+ORDER BY w.K, u.K;
+"""
+
+def _timestamp(column: str) -> str:
+    """SQL rendering an epoch-microsecond column back to RFC 3339 text."""
+    return (
+        f"CASE WHEN typeof({column}) = 'integer' THEN "
+        f"strftime('%Y-%m-%dT%H:%M:%S', {column} / 1000000, 'unixepoch') || "
+        f"CASE WHEN {column} % 1000 THEN printf('.%06d', {column} % 1000000) "
+        f"ELSE printf('.%03d', {column} % 1000000 / 1000) END || 'Z' "
+        f"ELSE {column} END"
+    )
+
+def _enum_value(column: str) -> str:
+    return f"(SELECT VL FROM ENM_CDS WHERE CD = {column})"
+
+# Compatibility views with the original table and column names
+_VIEWS = f"""
+CREATE VIEW USRS AS
+SELECT ID, NM, EML, PHT_URL FROM C_USRS;
+
+CREATE VIEW CRSS AS
+SELECT ID, NM, SCTN, DSCRPTN, {_timestamp('CRTN_TM')} AS CRTN_TM, {_timestamp('UPDT_TM')} AS UPDT_TM,
+       {_enum_value('CRS_STT_CD')} AS CRS_STT
+FROM C_CRSS;
+
+CREATE VIEW ENRLLMNTS AS
+SELECT e.ENRLLMNT_ID, c.ID AS CRS_ID, u.ID AS USR_ID, {_enum_value('e.RL_CD')} AS RL
+FROM C_ENRLLMNTS e
+JOIN C_CRSS c ON c.K = e.CRS_K
+JOIN C_USRS u ON u.K = e.USR_K;
+
+CREATE VIEW ANNCMNTS AS
+SELECT a.ID, c.ID AS CRS_ID, u.ID AS CRTR_USR_ID, a.TXT, {_enum_value('a.STT_CD')} AS STT,
+       {_timestamp('a.CRTN_TM')} AS CRTN_TM, {_timestamp('a.UPDT_TM')} AS UPDT_TM
+FROM C_ANNCMNTS a
+JOIN C_CRSS c ON c.K = a.CRS_K
+JOIN C_USRS u ON u.K = a.CRTR_USR_K;
+
+CREATE VIEW CRS_WRK AS
+SELECT w.ID, c.ID AS CRS_ID, w.TTL, w.DSCRPTN, {_enum_value('w.WRK_TYP_CD')} AS WRK_TYP, w.MX_PNTS,
+       {_timestamp('w.CRTN_TM')} AS CRTN_TM, {_timestamp('w.UPDT_TM')} AS UPDT_TM, w.CRTR_USR_ID
+FROM C_CRS_WRK w
+JOIN C_CRSS c ON c.K = w.CRS_K;
+
+CREATE VIEW STDNT_SBMSSNS AS
+SELECT s.ID, w.ID AS CRS_WRK_ID, u.ID AS USR_ID, {_enum_value('s.STT_CD')} AS STT,
+       s.ASSGND_GRD, s.DRFT_GRD, {_timestamp('s.CRTN_TM')} AS CRTN_TM, {_timestamp('s.UPDT_TM')} AS UPDT_TM
+FROM C_STDNT_SBMSSNS s
+JOIN C_CRS_WRK w ON w.K = s.CRS_WRK_K
+JOIN C_USRS u ON u.K = s.USR_K;
+"""
+
+def to_epoch_micros(value):
+    """
+    Converts an RFC 3339 UTC timestamp to integer microseconds since the epoch.
+
+    Only values the compatibility views render back to the same text are
+    converted: 'YYYY-MM-DDTHH:MM:SS.fffZ', or '.ffffffZ' unless it ends in
+    000, from 1970 on. Anything else is returned unchanged, so nothing is lost.
+    """
+    if not isinstance(value, str):
+        return value
+    match = _RFC3339.match(value)
+    if not match:
+        return value
+    year, month, day, hour, minute, second, fraction = match.groups()
+    if fraction is None or len(fraction) not in (3, 6) or (len(fraction) == 6 and fraction.endswith('000')):
+        return value
+    seconds = timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+    if seconds < 0:
+        return value
+    return seconds * 1000000 + int(fraction.ljust(6, '0'))
+
+def write_compact_copy(conn: Connection, dest_path: str):
+    """
+    Writes a compact copy of the database behind the given connection.
+
+    The copy is built in a temporary file beside dest_path and renamed into
+    place when complete, replacing any previous copy.
+
+    Args:
+        conn: A connection to the (standard layout) extraction database.
+        dest_path: The file path of the compact database.
+    """
+    temp_path = f"{dest_path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    conn.commit()
+    conn.create_function('EPOCH_US', 1, to_epoch_micros, deterministic=True)
+    conn.execute("ATTACH DATABASE ? AS cmpct;", (temp_path,))
+    try:
+        conn.executescript(_SCHEMA)
+        for domain, table, column in ENUM_COLUMNS:
+            conn.execute(f"""
+                INSERT INTO cmpct.ENM_CDS (DMN, VL)
+                SELECT DISTINCT '{domain}', {column} FROM main.{table}
+                WHERE {column} IS NOT NULL ORDER BY 2;
+            """)
+        conn.executescript(_COPY)
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE cmpct;")
+
+    compact = sqlite3.connect(temp_path)
+    try:
+        compact.executescript(_VIEWS)
+        create_views(compact)
+        compact.execute("ANALYZE;")
+        compact.commit()
+    finally:
+        compact.close()
+    os.replace(temp_path, dest_path)
+    logger.info(f"Compact copy written to '{dest_path}'.")
@@ -0,0 +1,349 @@
+"""
+Adaptive concurrency for Classroom API requests.
+
+The right number of requests in flight depends on what else is using the
+project's quota, so it is not fixed. An AdaptiveLimiter starts low and
+adjusts the limit with AIMD (additive increase, multiplicative decrease),
+the scheme TCP uses for its congestion window:
+
+*   every time a full window of requests (as many as the current limit)
+    succeeds with healthy latency, the limit grows by one;
+*   when Google answers 429 (rate limited) or a 5xx error, the limit is cut
+    by half. Requests that were already in flight when the cut happened do
+    not cut it again, so one burst of throttling counts once.
+
+Throttled requests are retried with exponential backoff and jitter,
+honouring any Retry-After header. Every decision is reported to the run
+metrics.
+
+fetch_concurrently() runs several listings at once on worker threads and
+hands their pages to the calling thread, which stays the only writer to
+the database. Each worker leases its own service object from a ServicePool.
+
+When several tenants are extracted in one process, each has its own
+limiter (its own quota), and all of them draw on one FairShare: a fixed
+number of request slots for the whole host, handed to the tenant holding
+the fewest whenever they are contended, so a large tenant cannot starve
+the others.
+"""
+
+import contextvars
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Statuses that mean Google wants us to slow down. They are retried.
+THROTTLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Upper bound on concurrent requests unless configured otherwise
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Tenants extracted at once, and requests in flight across all of them,
+# unless configured otherwise
+DEFAULT_PARALLEL_TENANTS = 4
+DEFAULT_FLEET_REQUESTS = 32
+
+# Retries of a throttled request before it is reported as failed
+DEFAULT_MAX_RETRIES = 5
+
+# Latency counts as healthy while its moving average stays within this
+# multiple of the lowest average seen in the run
+LATENCY_TOLERANCE = 2.0
+
+# Weight of the newest sample in the moving average of latency
+_EWMA_WEIGHT = 0.2
+
+
+class AdaptiveLimiter:
+    """
+    Limits requests in flight, adjusting the limit with AIMD.
+
+    Thread-safe; one limiter is shared by all workers of a run.
+
+    Args:
+        maximum: The highest the limit may grow to.
+        initial: The starting limit.
+        minimum: The lowest the limit may be cut to.
+        decrease: The factor the limit is multiplied by on throttling.
+        max_retries: Retries of a throttled request before it fails.
+        backoff: The first retry delay in seconds; it doubles on each retry.
+        max_backoff: The longest retry delay in seconds.
+        metrics: An optional MetricsRecorder the limit changes are reported to.
+        sleep: The sleep function, replaceable for testing.
+        share: An optional FairShare whose slots are shared with other tenants.
+        tenant: The tenant name this limiter's requests count against in the share.
+    """
+
+    def __init__(self, maximum: int = DEFAULT_MAX_CONCURRENCY, initial: int = 1, minimum: int = 1,
+                 decrease: float = 0.5, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff: float = 0.5, max_backoff: float = 30.0, metrics=None, sleep=time.sleep,
+                 share: 'FairShare' = None, tenant: str = None):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+        self.sleep = sleep
+        self.share = share
+        self.tenant = tenant
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._successes = 0
+        self._epoch = 0
+        self._latency = None
+        self._best_latency = None
+        self._condition = threading.Condition()
+        if metrics:
+            metrics.observe_concurrency(self.limit)
+
+    @contextmanager
+    def slot(self):
+        """
+        Context manager holding one request slot, waiting for one if needed.
+
+        Yields a ticket to pass to succeeded() or throttled(). With a
+        FairShare, a slot of the share is held too.
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            ticket = self._epoch
+        try:
+            if self.share is None:
+                yield ticket
+            else:
+                with self.share.slot(self.tenant):
+                    yield ticket
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def succeeded(self, ticket: int, seconds: float):
+        """Records a successful request and grows the limit after a healthy window."""
+        with self._condition:
+            if self._latency is None:
+                self._latency = seconds
+            else:
+                self._latency += _EWMA_WEIGHT * (seconds - self._latency)
+            if self._best_latency is None or self._latency < self._best_latency:
+                self._best_latency = self._latency
+            if ticket != self._epoch:
+                return  # Started before the last cut; says nothing about the new limit
+            if self._latency > LATENCY_TOLERANCE * self._best_latency:
+                self._successes = 0
+                return
+            self._successes += 1
+            if self._successes >= int(self.limit) and self.limit < self.maximum:
+                self._successes = 0
+                self.limit = min(self.limit + 1, self.maximum)
+                self.increases += 1
+                self._notify('increase')
+
+    def throttled(self, ticket: int):
+        """Records a throttled request and cuts the limit, once per window."""
+        with self._condition:
+            if ticket != self._epoch:
+                return  # The limit was already cut for this window
+            self._epoch += 1
+            self._successes = 0
+            self.limit = max(self.limit * self.decrease, self.minimum)
+            self.decreases += 1
+            self._notify('decrease')
+
+    def _notify(self, decision: str):
+        # Called with the condition held
+        if self.metrics:
+            self.metrics.observe_concurrency(self.limit, decision)
+        logger.debug(f"Concurrency limit {decision}d to {int(self.limit)}.")
+        self._condition.notify_all()
+
+    def retry_delay(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Returns the delay before retry number `attempt` (counting from 0).
+
+        A numeric Retry-After value from the response is used when it is longer.
+        """
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+        try:
+            delay = max(delay, min(float(retry_after), self.max_backoff))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+
+class FairShare:
+    """
+    A fixed number of request slots shared fairly between tenants.
+
+    A free slot goes to the waiting tenant that holds the fewest slots; among
+    those, to the one that has waited longest.
+
+    Args:
+        capacity: The number of slots, i.e. requests in flight across all tenants.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.held = {}
+        self.in_use = 0
+        self._waiting = []
+        self._condition = threading.Condition()
+
+    def _next_waiter(self):
+        return min(self._waiting, key=lambda waiter: self.held.get(waiter[0], 0))
+
+    @contextmanager
+    def slot(self, tenant: str):
+        """Context manager holding one slot for the tenant, waiting for its turn if needed."""
+        with self._condition:
+            waiter = (tenant, object())
+            self._waiting.append(waiter)
+            while self.in_use >= self.capacity or self._next_waiter() is not waiter:
+                self._condition.wait()
+            self._waiting.remove(waiter)
+            self.in_use += 1
+            self.held[tenant] = self.held.get(tenant, 0) + 1
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use -= 1
+                self.held[tenant] -= 1
+                self._condition.notify_all()
+
+
+_DONE = object()
+
+
+class _WorkerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def fetch_concurrently(jobs: list, fetch, workers: int, queue_size: int = None):
+    """
+    Runs fetch(job) for each job on worker threads and yields the pages in
+    the calling thread.
+
+    Pages pass through a bounded queue: when the caller falls behind, the
+    workers wait instead of piling pages up in memory. With one worker the
+    jobs simply run in turn in the calling thread.
+
+    Args:
+        jobs: The jobs, e.g. course work IDs.
+        fetch: Called with a job, returns an iterator of pages (lists of items).
+        workers: The number of worker threads.
+        queue_size: The most pages waiting for the caller. Defaults to twice
+                    the number of workers.
+
+    Yields:
+        (job, page) for every page, then (job, None) once the job's listing
+        has finished. Pages of different jobs may interleave.
+
+    Raises:
+        Any exception raised by fetch, in the calling thread.
+    """
+    jobs = list(jobs)
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            for page in fetch(job):
+                yield job, page
+            yield job, None
+        return
+
+    pending = queue.Queue()
+    for job in jobs:
+        pending.put(job)
+    results = queue.Queue(maxsize=queue_size or 2 * workers)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work():
+        while not stopped.is_set():
+            try:
+                job = pending.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                for page in fetch(job):
+                    if not put((job, page)):
+                        return
+                if not put((job, None)):
+                    return
+            except BaseException as e:
+                put((job, _WorkerError(e)))
+                return
+        put((None, _DONE))
+
+    # Workers run in a copy of the caller's context, e.g. its tenant for logging
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(work,), name=f"fetch-{i}", daemon=True)
+        for i in range(min(workers, len(jobs)))
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        running = len(threads)
+        while running:
+            job, page = results.get()
+            if page is _DONE:
+                running -= 1
+            elif isinstance(page, _WorkerError):
+                raise page.error
+            else:
+                yield job, page
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+
+class ServicePool:
+    """
+    Hands out API service objects so that no two threads share one.
+
+    The Google API client's default httplib2 transport is not thread-safe;
+    services built on a shared PooledHttp still get one each, as the client
+    makes no promises for its Resource objects. Services are built on demand
+    by the factory and returned to the pool after use, so a run builds at
+    most one per concurrent worker.
+
+    Args:
+        factory: Called with no arguments to build a new service.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._idle = queue.SimpleQueue()
+
+    @contextmanager
+    def lease(self):
+        """Context manager yielding a service for the current thread's sole use."""
+        try:
+            service = self._idle.get_nowait()
+        except queue.Empty:
+            service = self.factory()
+        try:
+            yield service
+        finally:
+            self._idle.put(service)
@@ -1,5 +1,12 @@
 """
 Handles loading and validation of the application configuration from a .ini file.
+
+A configuration may define several tenants (Workspace domains), one
+[TENANT:<name>] section each. A tenant section sets that tenant's
+SERVICE_ACCOUNT_FILE, ADMIN_USER_EMAIL, PATH and, optionally, any other
+[GOOGLE], [DATABASE], [SETTINGS] or [METRICS] key; anything it does not set
+is taken from those shared sections. tenant_config() turns a tenant into an
+ordinary single-tenant configuration.
 """
 
 import configparser
@@ -9,6 +16,23 @@ class ConfigError(Exception):
     """Custom exception for configuration errors."""
     pass
 
+# Prefix of the section names that define tenants
+TENANT_PREFIX = 'TENANT:'
+
+# The shared sections a tenant section can override, and their keys
+_TENANT_KEYS = {
+    'GOOGLE': ('SERVICE_ACCOUNT_FILE', 'ADMIN_USER_EMAIL', 'TOKEN_CACHE_FILE', 'HTTP_TRANSPORT', 'HTTP_CONNECT_TIMEOUT',
+               'HTTP_READ_TIMEOUT'),
+    'DATABASE': ('PATH', 'BACKEND', 'COMPACT_PATH', 'PUBLISH_PATH', 'CHANGE_LOG', 'CHANGE_LOG_RUNS', 'ROLLUPS'),
+    'SETTINGS': ('PII_MASKING_LEVEL', 'PURGE_DELETED', 'MEMORY_BUDGET_MB', 'MAX_BUFFERED_ROWS',
+                 'MAX_CONCURRENT_REQUESTS'),
+    'METRICS': ('PROMETHEUS_TEXTFILE', 'JSON_SUMMARY'),
+}
+
+# Output files that tenants would otherwise overwrite for one another
+_PER_TENANT_FILES = {('DATABASE', 'COMPACT_PATH'), ('DATABASE', 'PUBLISH_PATH'), ('METRICS', 'PROMETHEUS_TEXTFILE'),
+                     ('METRICS', 'JSON_SUMMARY')}
+
 def get_config(path: str = 'config.ini') -> configparser.ConfigParser:
     """
     Loads and validates the application configuration from the specified path.
@@ -32,6 +56,32 @@ def get_config(path: str = 'config.ini') -> configparser.ConfigParser:
     config = configparser.ConfigParser()
     config.read(path)
 
+    tenants = tenant_names(config)
+    if tenants:
+        paths = {}
+        for name in tenants:
+            resolved = tenant_config(config, name)
+            _validate(resolved, f"'{path}' (tenant '{name}')")
+            db_path = resolved['DATABASE']['PATH']
+            if db_path in paths:
+                raise ConfigError(
+                    f"Tenants '{paths[db_path]}' and '{name}' both use the database '{db_path}'. "
+                    f"Each tenant needs its own PATH."
+                )
+            paths[db_path] = name
+        _validate_fleet_settings(config)
+    else:
+        _validate(config, f"'{path}'")
+
+    return config
+
+def _validate(config: configparser.ConfigParser, where: str):
+    """
+    Validates one tenant's (or the only) configuration.
+
+    Raises:
+        ConfigError: If required keys are missing or values are invalid.
+    """
     # Validate required sections and keys
     required = {
         'GOOGLE': ['SERVICE_ACCOUNT_FILE', 'ADMIN_USER_EMAIL'],
@@ -40,13 +90,56 @@ def get_config(path: str = 'config.ini') -> configparser.ConfigParser:
 
     for section, keys in required.items():
         if section not in config:
-            raise ConfigError(f"Missing required section '[{section}]' in '{path}'.")
+            raise ConfigError(f"Missing required section '[{section}]' in {where}.")
         for key in keys:
             if key not in config[section] or not config[section][key]:
                 raise ConfigError(
-                    f"Missing or empty required key '{key}' in section '[{section}]' in '{path}'."
+                    f"Missing or empty required key '{key}' in section '[{section}]' in {where}."
                 )
 
+    transport = config['GOOGLE'].get('HTTP_TRANSPORT', 'pooled').lower()
+    if transport not in ('pooled', 'httplib2'):
+        raise ConfigError(
+            f"Invalid value for 'HTTP_TRANSPORT'. Must be one of ['pooled', 'httplib2'], but got '{transport}'."
+        )
+    for key in ('HTTP_CONNECT_TIMEOUT', 'HTTP_READ_TIMEOUT'):
+        value = config['GOOGLE'].get(key)
+        if value:
+            try:
+                valid = float(value) > 0
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ConfigError(f"Invalid value for '{key}'. Must be a number of seconds above 0, but got '{value}'.")
+
+    publish_path = config['DATABASE'].get('PUBLISH_PATH')
+    if publish_path and os.path.abspath(publish_path) == os.path.abspath(config['DATABASE']['PATH']):
+        raise ConfigError(
+            f"Invalid value for 'PUBLISH_PATH' in {where}. It must differ from PATH, the working database."
+        )
+
+    backend = config['DATABASE'].get('BACKEND', 'sqlite').lower()
+    if backend not in ('sqlite', 'duckdb'):
+        raise ConfigError(f"Invalid value for 'BACKEND'. Must be one of ['sqlite', 'duckdb'], but got '{backend}'.")
+    if backend != 'sqlite':
+        for key in ('COMPACT_PATH', 'PUBLISH_PATH'):
+            if config['DATABASE'].get(key):
+                raise ConfigError(f"'{key}' in {where} is only supported with the sqlite backend.")
+
+    change_log = config['DATABASE'].get('CHANGE_LOG', 'false').lower()
+    if change_log not in ('true', 'false'):
+        raise ConfigError(f"Invalid value for 'CHANGE_LOG'. Must be 'true' or 'false', but got '{change_log}'.")
+    if change_log == 'true' and backend != 'sqlite':
+        raise ConfigError(f"'CHANGE_LOG' in {where} is only supported with the sqlite backend.")
+    keep_runs = config['DATABASE'].get('CHANGE_LOG_RUNS')
+    if keep_runs and not keep_runs.isdigit():
+        raise ConfigError(
+            f"Invalid value for 'CHANGE_LOG_RUNS'. Must be a whole number (0 to keep all), but got '{keep_runs}'."
+        )
+    rollups = config['DATABASE'].get('ROLLUPS', 'true').lower()
+    if rollups not in ('true', 'false'):
+        raise ConfigError(f"Invalid value for 'ROLLUPS'. Must be 'true' or 'false', but got '{rollups}'.")
+
     # Validate optional settings if they exist
     if 'SETTINGS' in config and 'PII_MASKING_LEVEL' in config['SETTINGS']:
         level = config['SETTINGS']['PII_MASKING_LEVEL'].lower()
@@ -56,4 +149,74 @@ def get_config(path: str = 'config.ini') -> configparser.ConfigParser:
                 f"Invalid value for 'PII_MASKING_LEVEL'. Must be one of {allowed_levels}, but got '{level}'."
             )
 
-    return config
+    if 'SETTINGS' in config and 'PURGE_DELETED' in config['SETTINGS']:
+        value = config['SETTINGS']['PURGE_DELETED'].lower()
+        if value not in ('true', 'false'):
+            raise ConfigError(
+                f"Invalid value for 'PURGE_DELETED'. Must be 'true' or 'false', but got '{value}'."
+            )
+
+    for key in ('MEMORY_BUDGET_MB', 'MAX_BUFFERED_ROWS'):
+        if 'SETTINGS' in config and config['SETTINGS'].get(key):
+            value = config['SETTINGS'][key]
+            if not value.isdigit():
+                raise ConfigError(
+                    f"Invalid value for '{key}'. Must be a whole number (0 for no limit), but got '{value}'."
+                )
+
+    if 'SETTINGS' in config and config['SETTINGS'].get('MAX_CONCURRENT_REQUESTS'):
+        value = config['SETTINGS']['MAX_CONCURRENT_REQUESTS']
+        if not value.isdigit() or int(value) < 1:
+            raise ConfigError(
+                f"Invalid value for 'MAX_CONCURRENT_REQUESTS'. Must be a whole number of at least 1, but got '{value}'."
+            )
+
+def _validate_fleet_settings(config: configparser.ConfigParser):
+    """Validates the settings that apply to all tenants together."""
+    for key in ('MAX_PARALLEL_TENANTS', 'MAX_FLEET_REQUESTS'):
+        if 'SETTINGS' in config and config['SETTINGS'].get(key):
+            value = config['SETTINGS'][key]
+            if not value.isdigit() or int(value) < 1:
+                raise ConfigError(
+                    f"Invalid value for '{key}'. Must be a whole number of at least 1, but got '{value}'."
+                )
+
+def tenant_names(config: configparser.ConfigParser) -> list:
+    """Returns the names of the tenants defined in the configuration, in file order."""
+    return [
+        section[len(TENANT_PREFIX):].strip()
+        for section in config.sections()
+        if section.startswith(TENANT_PREFIX)
+    ]
+
+def tenant_config(config: configparser.ConfigParser, name: str) -> configparser.ConfigParser:
+    """
+    Returns a single-tenant configuration for the named tenant.
+
+    The tenant's keys override those of the shared sections. Unless the
+    tenant sets its own, the compact copy and metrics file names from the
+    shared sections get the tenant name inserted before their extension, so
+    tenants do not overwrite each other's files.
+
+    Args:
+        config: The multi-tenant configuration.
+        name: The tenant name, as in its [TENANT:<name>] section.
+
+    Returns:
+        A new ConfigParser with [GOOGLE], [DATABASE], [SETTINGS] and [METRICS]
+        sections for the tenant.
+    """
+    tenant = config[TENANT_PREFIX + name]
+    resolved = configparser.ConfigParser()
+    for section, keys in _TENANT_KEYS.items():
+        resolved.add_section(section)
+        if section in config:
+            for key, value in config.items(section, raw=True):
+                resolved[section][key] = value
+        for key in keys:
+            if key in tenant:
+                resolved[section][key] = tenant.get(key, raw=True)
+            elif (section, key) in _PER_TENANT_FILES and resolved[section].get(key):
+                root, ext = os.path.splitext(resolved[section][key])
+                resolved[section][key] = f"{root}.{name}{ext}"
+    return resolved
@@ -2,9 +2,29 @@
 Manages the SQLite database, including connection, schema creation, and data persistence.
 """
 
+import json
+import logging
 import sqlite3
+from collections import namedtuple
+from datetime import datetime, timezone
 from sqlite3 import Connection
 
+from src.normalize import NORMALIZERS, MalformedItemError, Rejected, quarantine_payload
+
+logger = logging.getLogger(__name__)
+
+# Tables whose rows carry a content hash (CNTNT_HSH) of the fields an upsert
+# writes. An upsert whose hash matches the stored one is skipped, so
+# unchanged rows are never rewritten.
+HASHED_TABLES = ('USRS', 'CRSS', 'ANNCMNTS', 'CRS_WRK', 'STDNT_SBMSSNS')
+
+def _add_missing_columns(cursor: sqlite3.Cursor, table: str, columns: dict):
+    """Adds columns introduced after a database was created."""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table});")}
+    for column, column_type in columns.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type};")
+
 def initialize_database(db_path: str) -> Connection:
     """
     Initializes the SQLite database.
@@ -33,7 +53,8 @@ def initialize_database(db_path: str) -> Connection:
             ID TEXT PRIMARY KEY,
             NM TEXT NOT NULL,
             EML TEXT NOT NULL UNIQUE,
-            PHT_URL TEXT
+            PHT_URL TEXT,
+            CNTNT_HSH INTEGER
         );
         """)
 
@@ -46,7 +67,8 @@ def initialize_database(db_path: str) -> Connection:
             DSCRPTN TEXT,
             CRTN_TM TEXT,
             UPDT_TM TEXT,
-            CRS_STT TEXT
+            CRS_STT TEXT,
+            CNTNT_HSH INTEGER
         );
         """)
 
@@ -73,6 +95,7 @@ def initialize_database(db_path: str) -> Connection:
             STT TEXT,
             CRTN_TM TEXT,
             UPDT_TM TEXT,
+            CNTNT_HSH INTEGER,
             FOREIGN KEY (CRS_ID) REFERENCES CRSS(ID) ON DELETE CASCADE,
             FOREIGN KEY (CRTR_USR_ID) REFERENCES USRS(ID) ON DELETE CASCADE
         );
@@ -89,6 +112,8 @@ def initialize_database(db_path: str) -> Connection:
             MX_PNTS REAL,
             CRTN_TM TEXT,
             UPDT_TM TEXT,
+            CNTNT_HSH INTEGER,
+            CRTR_USR_ID TEXT,
             FOREIGN KEY (CRS_ID) REFERENCES CRSS(ID) ON DELETE CASCADE
         );
         """)
@@ -104,143 +129,404 @@ def initialize_database(db_path: str) -> Connection:
             DRFT_GRD REAL,
             CRTN_TM TEXT,
             UPDT_TM TEXT,
+            CNTNT_HSH INTEGER,
+            LT INTEGER NOT NULL DEFAULT 0,
             FOREIGN KEY (CRS_WRK_ID) REFERENCES CRS_WRK(ID) ON DELETE CASCADE,
             FOREIGN KEY (USR_ID) REFERENCES USRS(ID) ON DELETE CASCADE
         );
         """)
 
+        # Dead letters: list requests that failed, kept until a replay succeeds.
+        # PG_TKN is '' for a listing's first page, so the key is unique.
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS DD_LTTRS (
+            ID INTEGER PRIMARY KEY,
+            ENDPNT TEXT NOT NULL,
+            PRMS TEXT NOT NULL,
+            PG_TKN TEXT NOT NULL DEFAULT '',
+            STTS INTEGER,
+            MSSG TEXT,
+            ATTMPTS INTEGER NOT NULL DEFAULT 1,
+            FRST_FLD_TM TEXT NOT NULL,
+            LST_FLD_TM TEXT NOT NULL,
+            UNIQUE (ENDPNT, PRMS, PG_TKN)
+        );
+        """)
+
+        # Quarantine: API items that could not be saved, e.g. lacking a
+        # required field. ITM_ID is '' for an item without an ID.
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS QRNTN (
+            ID INTEGER PRIMARY KEY,
+            TBL TEXT NOT NULL,
+            ITM_ID TEXT NOT NULL DEFAULT '',
+            RSN TEXT NOT NULL,
+            PYLD TEXT NOT NULL,
+            SN_CNT INTEGER NOT NULL DEFAULT 1,
+            FRST_SN_TM TEXT NOT NULL,
+            LST_SN_TM TEXT NOT NULL,
+            UNIQUE (TBL, ITM_ID, RSN)
+        );
+        """)
+
+        # Databases created before content hashing gain the column here
+        for table in HASHED_TABLES:
+            _add_missing_columns(cursor, table, {'CNTNT_HSH': 'INTEGER'})
+        _add_missing_columns(cursor, 'CRS_WRK', {'CRTR_USR_ID': 'TEXT'})
+        _add_missing_columns(cursor, 'STDNT_SBMSSNS', {'LT': 'INTEGER NOT NULL DEFAULT 0'})
+
+        # Indexes on the parent keys, used by cascading deletes and per-parent purges
+        cursor.execute("CREATE INDEX IF NOT EXISTS IDX_ANNCMNTS_CRS_ID ON ANNCMNTS (CRS_ID);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS IDX_CRS_WRK_CRS_ID ON CRS_WRK (CRS_ID);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS IDX_STDNT_SBMSSNS_CRS_WRK_ID ON STDNT_SBMSSNS (CRS_WRK_ID);")
+
         conn.commit()
-        print(f"Database initialized successfully at '{db_path}'.")
+        logger.info(f"Database initialized successfully at '{db_path}'.")
         return conn
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        logger.error(f"Database error: {e}")
         raise
 
-def save_user(conn: Connection, user_profile: dict):
-    """Saves a single user's profile to the database."""
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO USRS (ID, NM, EML, PHT_URL)
-        VALUES (:userId, :name, :emailAddress, :photoUrl)
+# The upsert of each table's rows, bound positionally in the column order of
+# src.normalize.COLUMNS. A row whose content hash matches the stored one is
+# left alone.
+UPSERT_SQL = {
+    'USRS': """
+        INSERT INTO USRS (ID, NM, EML, PHT_URL, CNTNT_HSH)
+        VALUES (?, ?, ?, ?, ?)
         ON CONFLICT(ID) DO UPDATE SET
             NM=excluded.NM,
             EML=excluded.EML,
-            PHT_URL=excluded.PHT_URL;
-    """, {
-        'userId': user_profile['id'],
-        'name': user_profile['name']['fullName'],
-        'emailAddress': user_profile['emailAddress'],
-        'photoUrl': user_profile.get('photoUrl')
-    })
-
-def save_course(conn: Connection, course: dict):
-    """Saves a single course to the database."""
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO CRSS (ID, NM, SCTN, DSCRPTN, CRTN_TM, UPDT_TM, CRS_STT)
-        VALUES (:id, :name, :section, :description, :creationTime, :updateTime, :courseState)
+            PHT_URL=excluded.PHT_URL,
+            CNTNT_HSH=excluded.CNTNT_HSH
+        WHERE USRS.CNTNT_HSH IS NOT excluded.CNTNT_HSH;
+    """,
+    'CRSS': """
+        INSERT INTO CRSS (ID, NM, SCTN, DSCRPTN, CRTN_TM, UPDT_TM, CRS_STT, CNTNT_HSH)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(ID) DO UPDATE SET
             NM=excluded.NM,
             SCTN=excluded.SCTN,
             DSCRPTN=excluded.DSCRPTN,
             UPDT_TM=excluded.UPDT_TM,
-            CRS_STT=excluded.CRS_STT;
-    """, {
-        'id': course['id'],
-        'name': course['name'],
-        'section': course.get('section'),
-        'description': course.get('description'),
-        'creationTime': course['creationTime'],
-        'updateTime': course['updateTime'],
-        'courseState': course['courseState']
-    })
-
-def save_enrollment(conn: Connection, course_id: str, user_id: str, role: str):
-    """Saves a single enrollment record to the database."""
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO ENRLLMNTS (CRS_ID, USR_ID, RL)
-        VALUES (?, ?, ?)
-        ON CONFLICT(CRS_ID, USR_ID) DO NOTHING;
-    """, (course_id, user_id, role))
-
-def save_announcement(conn: Connection, announcement: dict):
-    """Saves a single announcement to the database."""
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO ANNCMNTS (ID, CRS_ID, CRTR_USR_ID, TXT, STT, CRTN_TM, UPDT_TM)
-        VALUES (:id, :courseId, :creatorUserId, :text, :state, :creationTime, :updateTime)
+            CRS_STT=excluded.CRS_STT,
+            CNTNT_HSH=excluded.CNTNT_HSH
+        WHERE CRSS.CNTNT_HSH IS NOT excluded.CNTNT_HSH;
+    """,
+    'ANNCMNTS': """
+        INSERT INTO ANNCMNTS (ID, CRS_ID, CRTR_USR_ID, TXT, STT, CRTN_TM, UPDT_TM, CNTNT_HSH)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(ID) DO UPDATE SET
             TXT=excluded.TXT,
             STT=excluded.STT,
-            UPDT_TM=excluded.UPDT_TM;
-    """, {
-        'id': announcement['id'],
-        'courseId': announcement['courseId'],
-        'creatorUserId': announcement['creatorUserId'],
-        'text': announcement.get('text'),
-        'state': announcement.get('state'),
-        'creationTime': announcement['creationTime'],
-        'updateTime': announcement['updateTime']
-    })
-
-def save_course_work(conn: Connection, course_work_item: dict):
-    """Saves a single course work item to the database."""
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO CRS_WRK (ID, CRS_ID, TTL, DSCRPTN, WRK_TYP, MX_PNTS, CRTN_TM, UPDT_TM)
-        VALUES (:id, :courseId, :title, :description, :workType, :maxPoints, :creationTime, :updateTime)
+            UPDT_TM=excluded.UPDT_TM,
+            CNTNT_HSH=excluded.CNTNT_HSH
+        WHERE ANNCMNTS.CNTNT_HSH IS NOT excluded.CNTNT_HSH;
+    """,
+    'CRS_WRK': """
+        INSERT INTO CRS_WRK (ID, CRS_ID, TTL, DSCRPTN, WRK_TYP, MX_PNTS, CRTN_TM, UPDT_TM, CNTNT_HSH, CRTR_USR_ID)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(ID) DO UPDATE SET
             TTL=excluded.TTL,
             DSCRPTN=excluded.DSCRPTN,
             WRK_TYP=excluded.WRK_TYP,
             MX_PNTS=excluded.MX_PNTS,
-            UPDT_TM=excluded.UPDT_TM;
-    """, {
-        'id': course_work_item['id'],
-        'courseId': course_work_item['courseId'],
-        'title': course_work_item.get('title'),
-        'description': course_work_item.get('description'),
-        'workType': course_work_item.get('workType'),
-        'maxPoints': course_work_item.get('maxPoints'),
-        'creationTime': course_work_item['creationTime'],
-        'updateTime': course_work_item['updateTime']
-    })
-
-def save_student_submission(conn: Connection, submission: dict):
-    """Saves a single student submission to the database."""
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO STDNT_SBMSSNS (ID, CRS_WRK_ID, USR_ID, STT, ASSGND_GRD, DRFT_GRD, CRTN_TM, UPDT_TM)
-        VALUES (:id, :courseWorkId, :userId, :state, :assignedGrade, :draftGrade, :creationTime, :updateTime)
+            UPDT_TM=excluded.UPDT_TM,
+            CNTNT_HSH=excluded.CNTNT_HSH,
+            CRTR_USR_ID=excluded.CRTR_USR_ID
+        WHERE CRS_WRK.CNTNT_HSH IS NOT excluded.CNTNT_HSH;
+    """,
+    'STDNT_SBMSSNS': """
+        INSERT INTO STDNT_SBMSSNS (ID, CRS_WRK_ID, USR_ID, STT, ASSGND_GRD, DRFT_GRD, CRTN_TM, UPDT_TM, CNTNT_HSH, LT)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(ID) DO UPDATE SET
             STT=excluded.STT,
             ASSGND_GRD=excluded.ASSGND_GRD,
             DRFT_GRD=excluded.DRFT_GRD,
-            UPDT_TM=excluded.UPDT_TM;
-    """, {
-        'id': submission['id'],
-        'courseWorkId': submission['courseWorkId'],
-        'userId': submission['userId'],
-        'state': submission.get('state'),
-        'assignedGrade': submission.get('assignedGrade'),
-        'draftGrade': submission.get('draftGrade'),
-        'creationTime': submission['creationTime'],
-        'updateTime': submission['updateTime']
-    })
+            UPDT_TM=excluded.UPDT_TM,
+            CNTNT_HSH=excluded.CNTNT_HSH,
+            LT=excluded.LT
+        WHERE STDNT_SBMSSNS.CNTNT_HSH IS NOT excluded.CNTNT_HSH;
+    """,
+}
 
-def create_views(conn: Connection):
+def save_rows(conn: Connection, table: str, rows: list) -> int:
     """
-    Creates analytics views in the database.
+    Upserts normalized rows (see src.normalize) into a table in one executemany().
 
-    These views denormalize the data to make it easier to query for
-    common analytical and investigative purposes.
+    Returns:
+        The number of rows inserted or changed; the others were up to date.
+    """
+    if not rows:
+        return 0
+    return conn.executemany(UPSERT_SQL[table], rows).rowcount
+
+def _save_item(conn: Connection, table: str, item: dict):
+    """
+    Saves one API item into a table, quarantining it if it is malformed.
+
+    Returns:
+        True if the row was inserted or changed, False if it was already up
+        to date, None if the item was quarantined.
+    """
+    try:
+        row = NORMALIZERS[table](item)
+    except MalformedItemError as e:
+        save_quarantined(conn, table, [Rejected(item, str(e))])
+        return None
+    return conn.execute(UPSERT_SQL[table], row).rowcount > 0
+
+def save_user(conn: Connection, user_profile: dict):
+    """
+    Saves a single user's profile to the database.
+
+    Returns:
+        True if the row was inserted or changed, False if it was already up
+        to date, None if the profile was quarantined.
+    """
+    return _save_item(conn, 'USRS', user_profile)
+
+def save_course(conn: Connection, course: dict):
+    """
+    Saves a single course to the database.
+
+    Returns:
+        True if the row was inserted or changed, False if it was already up
+        to date, None if the course was quarantined.
+    """
+    return _save_item(conn, 'CRSS', course)
+
+def save_enrollment(conn: Connection, course_id: str, user_id: str, role: str) -> bool:
+    """
+    Saves a single enrollment record to the database.
+
+    Returns:
+        True if the enrollment was new, False if it already existed.
     """
     cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO ENRLLMNTS (CRS_ID, USR_ID, RL)
+        VALUES (?, ?, ?)
+        ON CONFLICT(CRS_ID, USR_ID) DO NOTHING;
+    """, (course_id, user_id, role))
+    return cursor.rowcount > 0
 
+def save_announcement(conn: Connection, announcement: dict):
+    """
+    Saves a single announcement to the database.
+
+    Returns:
+        True if the row was inserted or changed, False if it was already up
+        to date, None if the announcement was quarantined.
+    """
+    return _save_item(conn, 'ANNCMNTS', announcement)
+
+def save_course_work(conn: Connection, course_work_item: dict):
+    """
+    Saves a single course work item to the database.
+
+    Returns:
+        True if the row was inserted or changed, False if it was already up
+        to date, None if the item was quarantined.
+    """
+    return _save_item(conn, 'CRS_WRK', course_work_item)
+
+def save_student_submission(conn: Connection, submission: dict):
+    """
+    Saves a single student submission to the database.
+
+    Returns:
+        True if the row was inserted or changed, False if it was already up
+        to date, None if the submission was quarantined.
+    """
+    return _save_item(conn, 'STDNT_SBMSSNS', submission)
+
+def quarantine_rows(table: str, rejected) -> list:
+    """Returns the QRNTN rows for Rejected items of a table."""
+    now = utc_now()
+    rows = []
+    for item, reason in rejected:
+        item_id = item.get('id') if isinstance(item, dict) else None
+        rows.append({
+            'table': table,
+            'itemId': '' if item_id is None else str(item_id),
+            'reason': reason,
+            'payload': quarantine_payload(item),
+            'now': now,
+        })
+        logger.warning(f"Quarantined a malformed {table} item ({item_id or 'no ID'}): {reason}")
+    return rows
+
+def save_quarantined(conn: Connection, table: str, rejected):
+    """
+    Records malformed items in the quarantine table instead of saving them.
+
+    An item already quarantined for the same reason has its count increased
+    and its latest payload kept.
+
+    Args:
+        conn: The database connection.
+        table: The table the items were meant for.
+        rejected: Rejected items, as returned by src.normalize.normalize_items.
+    """
+    conn.executemany("""
+        INSERT INTO QRNTN (TBL, ITM_ID, RSN, PYLD, FRST_SN_TM, LST_SN_TM)
+        VALUES (:table, :itemId, :reason, :payload, :now, :now)
+        ON CONFLICT(TBL, ITM_ID, RSN) DO UPDATE SET
+            PYLD=excluded.PYLD,
+            SN_CNT=QRNTN.SN_CNT + 1,
+            LST_SN_TM=excluded.LST_SN_TM;
+    """, quarantine_rows(table, rejected))
+
+# A recorded failed request. page_token is None for a listing's first page.
+DeadLetter = namedtuple('DeadLetter', [
+    'id', 'endpoint', 'params', 'page_token', 'status', 'message', 'attempts', 'first_failed', 'last_failed'
+])
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def dead_letter_rows(failures) -> list:
+    """Returns the DD_LTTRS rows for FailedRequests, parameters as canonical JSON."""
+    now = utc_now()
+    return [{
+        'endpoint': failure.endpoint,
+        'params': json.dumps(failure.params, sort_keys=True),
+        'pageToken': failure.page_token or '',
+        'status': failure.status,
+        'message': failure.message,
+        'now': now,
+    } for failure in failures]
+
+def dead_letter_from_row(row) -> DeadLetter:
+    """Builds a DeadLetter from a DD_LTTRS row, in table column order."""
+    letter_id, endpoint, params, page_token, status, message, attempts, first_failed, last_failed = row
+    return DeadLetter(letter_id, endpoint, json.loads(params), page_token or None, status, message,
+                      attempts, first_failed, last_failed)
+
+def save_dead_letters(conn: Connection, failures):
+    """
+    Records failed requests in the dead-letter table.
+
+    A request that is already there (same endpoint, parameters and page
+    token) has its attempt count increased and its latest error kept.
+
+    Args:
+        conn: The database connection.
+        failures: FailedRequests, as collected by the src.extractor functions.
+    """
+    conn.executemany("""
+        INSERT INTO DD_LTTRS (ENDPNT, PRMS, PG_TKN, STTS, MSSG, FRST_FLD_TM, LST_FLD_TM)
+        VALUES (:endpoint, :params, :pageToken, :status, :message, :now, :now)
+        ON CONFLICT(ENDPNT, PRMS, PG_TKN) DO UPDATE SET
+            STTS=excluded.STTS,
+            MSSG=excluded.MSSG,
+            ATTMPTS=DD_LTTRS.ATTMPTS + 1,
+            LST_FLD_TM=excluded.LST_FLD_TM;
+    """, dead_letter_rows(failures))
+
+def load_dead_letters(conn: Connection) -> list:
+    """Returns the recorded failed requests as DeadLetters, oldest first."""
+    return [dead_letter_from_row(row) for row in conn.execute("""
+        SELECT ID, ENDPNT, PRMS, PG_TKN, STTS, MSSG, ATTMPTS, FRST_FLD_TM, LST_FLD_TM
+        FROM DD_LTTRS ORDER BY ID;
+    """)]
+
+def delete_dead_letter(conn: Connection, letter_id: int):
+    """Removes a dead letter once its request has been replayed successfully."""
+    conn.execute("DELETE FROM DD_LTTRS WHERE ID = ?;", (letter_id,))
+
+# Collections whose vanished rows are purged at the end of a run. Each maps to
+# the table it lives in, the expression identifying a row's parent (a constant
+# for the top-level course listing), the column holding the listed ID, and any
+# extra condition narrowing the table to the collection.
+TRACKED_COLLECTIONS = {
+    'CRSS': ('CRSS', "''", 'ID', ''),
+    'TEACHERS': ('ENRLLMNTS', 'ENRLLMNTS.CRS_ID', 'USR_ID', "RL = 'TEACHER'"),
+    'STUDENTS': ('ENRLLMNTS', 'ENRLLMNTS.CRS_ID', 'USR_ID', "RL = 'STUDENT'"),
+    'ANNCMNTS': ('ANNCMNTS', 'ANNCMNTS.CRS_ID', 'ID', ''),
+    'CRS_WRK': ('CRS_WRK', 'CRS_WRK.CRS_ID', 'ID', ''),
+    'STDNT_SBMSSNS': ('STDNT_SBMSSNS', 'STDNT_SBMSSNS.CRS_WRK_ID', 'ID', ''),
+}
+
+def begin_seen_tracking(conn: Connection):
+    """
+    Prepares the per-run record of the IDs seen in each listed collection.
+
+    The IDs are kept in temporary tables that live only as long as the
+    connection, so nothing is persisted between runs.
+    """
+    conn.executescript("""
+        CREATE TEMP TABLE IF NOT EXISTS SEEN_IDS (
+            CLLCTN TEXT NOT NULL,
+            PRNT_ID TEXT NOT NULL,
+            ID TEXT NOT NULL,
+            PRIMARY KEY (CLLCTN, PRNT_ID, ID)
+        ) WITHOUT ROWID;
+        CREATE TEMP TABLE IF NOT EXISTS LSTD_PRNTS (
+            CLLCTN TEXT NOT NULL,
+            PRNT_ID TEXT NOT NULL,
+            PRIMARY KEY (CLLCTN, PRNT_ID)
+        ) WITHOUT ROWID;
+        DELETE FROM temp.SEEN_IDS;
+        DELETE FROM temp.LSTD_PRNTS;
+    """)
+
+def record_listing(conn: Connection, collection: str, parent_id: str, ids):
+    """
+    Records the IDs returned by one complete listing of a collection.
+
+    Only record listings that finished without errors: every row of the
+    collection under this parent that is not among the IDs will be purged.
+
+    Args:
+        conn: The database connection.
+        collection: A key of TRACKED_COLLECTIONS, e.g. 'CRS_WRK'.
+        parent_id: The ID of the parent (e.g. the course ID), or '' for courses.
+        ids: The IDs seen in the listing.
+    """
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp.SEEN_IDS (CLLCTN, PRNT_ID, ID) VALUES (?, ?, ?);",
+        ((collection, parent_id, item_id) for item_id in ids)
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO temp.LSTD_PRNTS (CLLCTN, PRNT_ID) VALUES (?, ?);",
+        (collection, parent_id)
+    )
+
+def purge_unseen(conn: Connection) -> dict:
+    """
+    Deletes rows that were not seen in their collection's listing this run.
+
+    Runs one set-based DELETE per collection, restricted to parents whose
+    listing was recorded, so collections that were not listed (or failed part
+    way) are left untouched. Dependent rows go with their parents through the
+    schema's ON DELETE CASCADE.
+
+    Returns:
+        A dict of collection name to the number of rows deleted.
+    """
+    deleted = {}
+    for collection, (table, parent, id_column, condition) in TRACKED_COLLECTIONS.items():
+        extra = f" AND {condition}" if condition else ''
+        cursor = conn.execute(f"""
+            DELETE FROM {table}
+            WHERE {parent} IN (
+                SELECT PRNT_ID FROM temp.LSTD_PRNTS WHERE CLLCTN = :collection
+            ){extra}
+            AND {id_column} NOT IN (
+                SELECT ID FROM temp.SEEN_IDS
+                WHERE CLLCTN = :collection AND PRNT_ID = {parent}
+            );
+        """, {'collection': collection})
+        deleted[collection] = cursor.rowcount
+    return deleted
+
+# Analytics views as (name, query). The queries are plain SQL that every
+# storage backend accepts.
+ANALYTICS_VIEWS = (
     # View for Enrollment Details
-    cursor.execute("""
-    CREATE VIEW IF NOT EXISTS VW_ENRLLMNT_DTLS AS
+    ('VW_ENRLLMNT_DTLS', """
     SELECT
         c.NM AS CRS_NM,
         c.SCTN AS CRS_SCTN,
@@ -249,12 +535,10 @@ def create_views(conn: Connection):
         e.RL AS USR_RL
     FROM ENRLLMNTS e
     JOIN USRS u ON e.USR_ID = u.ID
-    JOIN CRSS c ON e.CRS_ID = c.ID;
-    """)
-
+    JOIN CRSS c ON e.CRS_ID = c.ID
+    """),
     # View for Assignment Grades with explicit submission status
-    cursor.execute("""
-    CREATE VIEW IF NOT EXISTS VW_ASSGNMNT_GRDS AS
+    ('VW_ASSGNMNT_GRDS', """
     SELECT
         c.NM AS CRS_NM,
         cw.TTL AS ASSGNMNT_TTL,
@@ -272,12 +556,10 @@ def create_views(conn: Connection):
     FROM STDNT_SBMSSNS s
     JOIN USRS u ON s.USR_ID = u.ID
     JOIN CRS_WRK cw ON s.CRS_WRK_ID = cw.ID
-    JOIN CRSS c ON cw.CRS_ID = c.ID;
-    """)
-
+    JOIN CRSS c ON cw.CRS_ID = c.ID
+    """),
     # View for a combined Course Activity Log
-    cursor.execute("""
-    CREATE VIEW IF NOT EXISTS VW_CRS_ACTVTY_LG AS
+    ('VW_CRS_ACTVTY_LG', """
     SELECT
         c.NM AS CRS_NM,
         cw.CRTN_TM AS ACTVTY_DT,
@@ -296,12 +578,10 @@ def create_views(conn: Connection):
         u.NM AS CRTR_NM
     FROM ANNCMNTS a
     JOIN CRSS c ON a.CRS_ID = c.ID
-    JOIN USRS u ON a.CRTR_USR_ID = u.ID;
-    """)
-
+    JOIN USRS u ON a.CRTR_USR_ID = u.ID
+    """),
     # View for SIS Enrollment Roster
-    cursor.execute("""
-    CREATE VIEW IF NOT EXISTS VW_SIS_ENRLLMNT_ROSTER AS
+    ('VW_SIS_ENRLLMNT_ROSTER', """
     SELECT
         e.CRS_ID,
         c.NM AS CRS_NM,
@@ -310,8 +590,20 @@ def create_views(conn: Connection):
         e.RL
     FROM ENRLLMNTS e
     JOIN USRS u ON e.USR_ID = u.ID
-    JOIN CRSS c ON e.CRS_ID = c.ID;
-    """)
+    JOIN CRSS c ON e.CRS_ID = c.ID
+    """),
+)
+
+def create_views(conn: Connection):
+    """
+    Creates analytics views in the database.
+
+    These views denormalize the data to make it easier to query for
+    common analytical and investigative purposes.
+    """
+    cursor = conn.cursor()
+    for name, query in ANALYTICS_VIEWS:
+        cursor.execute(f"CREATE VIEW IF NOT EXISTS {name} AS{query};")
 
     conn.commit()
-    print("Database views created successfully.")
+    logger.info("Database views created successfully.")
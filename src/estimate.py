@@ -0,0 +1,293 @@
+"""
+Dry-run estimate of what a full extraction will cost.
+
+Before the first run against a new domain, the estimate lists all courses,
+then probes only the first page(s) of each per-course listing for a random
+sample of them. From the probed counts it extrapolates the API calls, pages
+and rows of a full run. The probed items are saved to a scratch in-memory
+database with the real schema and search index, a page at a time as the
+extraction saves them, to measure the bytes and the save time per row;
+combined with the latency measured per endpoint, this projects the database
+size and wall time at a given concurrency.
+
+Nothing is written to the configured database.
+
+A submissions listing is probed for one course work item per sampled
+course. Each student is normally assigned each course work item, so when
+that listing is longer than the probe the course's student count is used
+instead.
+"""
+
+import logging
+import math
+import random
+import sqlite3
+from collections import Counter
+
+from src.database import initialize_database
+from src.extractor import get_courses, probe_listing
+from src.metrics import MetricsRecorder
+from src.search import initialize_search_index
+from src.storage import SQLiteBackend
+
+logger = logging.getLogger(__name__)
+
+# Courses probed unless told otherwise. 0 probes every course.
+DEFAULT_SAMPLE = 50
+
+# Pages fetched per listing when probing
+DEFAULT_PROBE_PAGES = 1
+
+# A listing with more pages than were probed is assumed to be this many
+# times as long as the probed part
+TRUNCATED_LISTING_FACTOR = 2
+
+# Fraction of each database page filled with rows, for the size projection
+_PAGE_FILL = 0.8
+
+# Tables the estimate projects rows for
+ROW_TABLES = ('CRSS', 'USRS', 'ENRLLMNTS', 'ANNCMNTS', 'CRS_WRK', 'STDNT_SBMSSNS')
+
+
+class EstimateError(Exception):
+    """Custom exception for estimate errors."""
+    pass
+
+
+def _extrapolate(probe) -> tuple:
+    """Returns the (items, pages) a listing is expected to have, given its probe."""
+    if probe.complete:
+        return len(probe.items), probe.pages
+    return len(probe.items) * TRUNCATED_LISTING_FACTOR, probe.pages * TRUNCATED_LISTING_FACTOR
+
+def _listed_pages(probe) -> list:
+    """Splits a probe's items into as many pages as were fetched, of about equal size, to save a page at a time."""
+    size = math.ceil(len(probe.items) / probe.pages) if probe.pages else 0
+    return [probe.items[start:start + size] for start in range(0, len(probe.items), size or 1)]
+
+def _scratch_database() -> sqlite3.Connection:
+    """Returns an in-memory database with the extraction schema, for measuring rows."""
+    conn = initialize_database(':memory:')
+    # Probed rows lack some of their parents (e.g. users who are no longer enrolled)
+    conn.execute("PRAGMA foreign_keys = OFF;")
+    initialize_search_index(conn)
+    return conn
+
+def _bytes_per_row(conn: sqlite3.Connection) -> dict:
+    """
+    Returns the bytes stored per row of each table, including its indexes
+    and full-text index, or the overall average if dbstat is unavailable.
+    """
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0] for table in ROW_TABLES}
+    try:
+        stored = conn.execute("""
+            SELECT m.tbl_name, SUM(d.payload) + 12 * SUM(d.ncell)
+            FROM dbstat AS d JOIN sqlite_master AS m ON m.name = d.name
+            GROUP BY m.tbl_name;
+        """).fetchall()
+    except sqlite3.Error:
+        page_size = conn.execute("PRAGMA page_size;").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count;").fetchone()[0]
+        average = page_size * page_count * _PAGE_FILL / max(sum(counts.values()), 1)
+        return {table: average for table in ROW_TABLES}
+
+    # Attribute each B-tree to its table; full-text shadow tables (e.g.
+    # ANNCMNTS_FTS_data) to the table they index
+    totals = Counter()
+    for name, size in stored:
+        owner = max((table for table in ROW_TABLES if name == table or name.startswith(f"{table}_FTS")),
+                    key=len, default=None)
+        if owner:
+            totals[owner] += size or 0
+    return {table: totals[table] / counts[table] if counts[table] else 0.0 for table in ROW_TABLES}
+
+def _probe_course(service, course: dict, scratch: sqlite3.Connection, probe_pages: int,
+                  metrics: MetricsRecorder, writes: MetricsRecorder, limiter) -> dict:
+    """
+    Probes one course's listings and saves the probed items to the scratch
+    database, each listing's page at once as the extraction does, timing the
+    saves in `writes`.
+
+    Returns:
+        The course's expected pages per endpoint, rows per table and number
+        of truncated listings.
+    """
+    course_id = course['id']
+    pages = Counter()
+    rows = Counter(CRSS=1)
+    truncated = 0
+    storage = SQLiteBackend(scratch, writes)
+    storage.save_course(course)
+
+    def probe(endpoint, **params):
+        nonlocal truncated
+        result = probe_listing(service, endpoint, probe_pages, metrics, limiter, **params)
+        items, listing_pages = _extrapolate(result)
+        pages[endpoint] += listing_pages
+        truncated += not result.complete
+        return result, items
+
+    students_items = 0
+    for endpoint, role in (('courses.teachers.list', 'TEACHER'), ('courses.students.list', 'STUDENT')):
+        result, items = probe(endpoint, courseId=course_id)
+        rows['ENRLLMNTS'] += items
+        if role == 'STUDENT':
+            students_items = items
+        for page in _listed_pages(result):
+            profiles = [member['profile'] for member in page
+                        if 'name' in member.get('profile', {}) and 'emailAddress' in member['profile']]
+            for user_id in storage.save_page('USRS', profiles):
+                storage.save_enrollment(course_id, user_id, role)
+
+    result, rows['ANNCMNTS'] = probe('courses.announcements.list', courseId=course_id)
+    for page in _listed_pages(result):
+        storage.save_page('ANNCMNTS', page)
+
+    result, course_works = probe('courses.courseWork.list', courseId=course_id)
+    rows['CRS_WRK'] = course_works
+    for page in _listed_pages(result):
+        storage.save_page('CRS_WRK', page)
+
+    if result.items:
+        endpoint = 'courses.courseWork.studentSubmissions.list'
+        submissions = probe_listing(service, endpoint, probe_pages, metrics, limiter,
+                                    courseId=course_id, courseWorkId=result.items[0]['id'])
+        if submissions.complete:
+            per_work, pages_per_work = len(submissions.items), submissions.pages
+        else:
+            truncated += 1
+            page_size = len(submissions.items) / submissions.pages
+            per_work = max(students_items, len(submissions.items))
+            pages_per_work = math.ceil(per_work / page_size) if page_size else submissions.pages
+        pages[endpoint] += course_works * pages_per_work
+        rows['STDNT_SBMSSNS'] = course_works * per_work
+        for page in _listed_pages(submissions):
+            storage.save_page('STDNT_SBMSSNS', page)
+
+    return {'pages': pages, 'rows': rows, 'truncated': truncated}
+
+def estimate_run(service, concurrency: int, sample_size: int = DEFAULT_SAMPLE,
+                 probe_pages: int = DEFAULT_PROBE_PAGES, metrics: MetricsRecorder = None,
+                 limiter=None, rng=random) -> dict:
+    """
+    Estimates the API calls, rows, database size and wall time of a full run.
+
+    Args:
+        service: An authorized Google Classroom API service resource object.
+        concurrency: The number of concurrent requests to project the wall time for.
+        sample_size: The number of courses to probe. 0 probes all of them.
+        probe_pages: The pages fetched per listing when probing.
+        metrics: An optional MetricsRecorder for the probe requests.
+        limiter: An optional AdaptiveLimiter for the probe requests.
+        rng: The random number generator used to pick the sample.
+
+    Returns:
+        A dict with the projected 'pages' per endpoint, 'api_calls', 'rows'
+        per table, 'database_bytes', 'api_seconds' (one request at a time),
+        'write_seconds', 'wall_seconds' at the given 'concurrency' and
+        'requests_per_minute', plus the number of 'courses',
+        'sampled_courses', 'truncated_listings' and 'probe_calls'.
+
+    Raises:
+        EstimateError: If the courses could not be listed.
+    """
+    # Deferred import: the client library is only loaded once requests are made
+    from googleapiclient.errors import HttpError
+
+    metrics = metrics or MetricsRecorder()
+    failures = []
+    courses = get_courses(service, metrics, failures, limiter)
+    if failures:
+        raise EstimateError(f"Could not list the courses: {failures[0].message}")
+    if sample_size and sample_size < len(courses):
+        sample = rng.sample(courses, sample_size)
+    else:
+        sample = courses
+
+    scratch = _scratch_database()
+    writes = MetricsRecorder()
+    pages = Counter()
+    rows = Counter()
+    truncated = 0
+    probed = 0
+    for course in sample:
+        try:
+            course_estimate = _probe_course(service, course, scratch, probe_pages, metrics, writes, limiter)
+        except HttpError as e:
+            logger.warning(f"Could not probe course {course['id']}; it is left out of the sample: {e}")
+            continue
+        probed += 1
+        pages.update(course_estimate['pages'])
+        rows.update(course_estimate['rows'])
+        truncated += course_estimate['truncated']
+
+    # Scale the sample up to all courses; the course listing was fetched in full
+    scale = len(courses) / probed if probed else 0.0
+    pages = {endpoint: round(count * scale) for endpoint, count in sorted(pages.items())}
+    pages['courses.list'] = metrics.summary()['endpoints'].get('courses.list', {}).get('pages', 0)
+    rows = {table: round(rows[table] * scale) for table in ROW_TABLES}
+
+    # Users enrolled in several courses are stored once
+    enrollments = scratch.execute("SELECT COUNT(*) FROM ENRLLMNTS;").fetchone()[0]
+    users = scratch.execute("SELECT COUNT(*) FROM USRS;").fetchone()[0]
+    rows['USRS'] = round(rows['ENRLLMNTS'] * users / enrollments) if enrollments else 0
+
+    bytes_per_row = _bytes_per_row(scratch)
+    scratch.close()
+
+    latency = {name: stats['latency_seconds']['mean'] for name, stats in metrics.summary()['endpoints'].items()}
+    mean_latency = sum(latency.values()) / len(latency) if latency else 0.0
+    api_seconds = sum(count * latency.get(endpoint, mean_latency) for endpoint, count in pages.items())
+    # The writer saves each page in one executemany(), and enrollments one at
+    # a time; project from the time per probed row, saved the same way
+    saved = writes.summary()['tables']
+    saved_rows = sum(stats['rows'] + stats['skipped'] for stats in saved.values())
+    write_seconds = sum(stats['seconds'] for stats in saved.values()) / saved_rows * sum(rows.values()) \
+        if saved_rows else 0.0
+    api_calls = sum(pages.values())
+
+    return {
+        'courses': len(courses),
+        'sampled_courses': probed,
+        'truncated_listings': truncated,
+        'probe_calls': metrics.progress_counts()[0],
+        'pages': pages,
+        'api_calls': api_calls,
+        'rows': rows,
+        'database_bytes': round(sum(rows[table] * bytes_per_row[table] for table in ROW_TABLES) / _PAGE_FILL),
+        'concurrency': concurrency,
+        'api_seconds': round(api_seconds, 1),
+        'write_seconds': round(write_seconds, 1),
+        'wall_seconds': round(api_seconds / max(concurrency, 1) + write_seconds, 1),
+        'requests_per_minute': round(60 * concurrency * api_calls / api_seconds, 1) if api_seconds else 0.0,
+    }
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+def format_estimate(estimate: dict) -> str:
+    """Formats an estimate as a short human-readable report."""
+    lines = [
+        f"Courses: {estimate['courses']} ({estimate['sampled_courses']} probed, "
+        f"{estimate['probe_calls']} API calls made for the estimate)",
+        f"API calls: {estimate['api_calls']}",
+    ]
+    for endpoint, count in estimate['pages'].items():
+        lines.append(f"  {endpoint:<45} {count:>10}")
+    lines.append("Rows:")
+    for table, count in estimate['rows'].items():
+        lines.append(f"  {table:<45} {count:>10}")
+    lines.append(f"Database size: {estimate['database_bytes'] / 1048576:.1f} MiB")
+    lines.append(
+        f"Projected time at {estimate['concurrency']} concurrent requests: {_duration(estimate['wall_seconds'])} "
+        f"({_duration(estimate['api_seconds'])} of API time, {_duration(estimate['write_seconds'])} of writes), "
+        f"about {estimate['requests_per_minute']:g} requests per minute"
+    )
+    if estimate['truncated_listings']:
+        lines.append(
+            f"{estimate['truncated_listings']} probed listings had more pages than were fetched; their sizes "
+            f"are extrapolated. Use --probe-pages for a closer estimate."
+        )
+    return '\n'.join(lines)
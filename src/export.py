@@ -0,0 +1,195 @@
+"""
+Streams tables and views out of the database as CSV or JSON Lines files.
+
+Rows are read with fetchmany() in fixed-size chunks and written as they
+arrive, so memory use stays constant however large the table or view is.
+Several exports can run in parallel, each on its own read-only connection.
+Parquet and Arrow exports are written by src.columnar.
+"""
+
+import csv
+import gzip
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from sqlite3 import Connection
+
+from src.columnar import (
+    BASE_TABLES, COLUMNAR_FORMATS, columnar_output_name, export_columnar, import_pyarrow
+)
+from src.search import SEARCH_INDEXES
+
+TEXT_FORMATS = ('csv', 'jsonl')
+EXPORT_FORMATS = TEXT_FORMATS + COLUMNAR_FORMATS
+
+# Rows fetched from SQLite per chunk
+DEFAULT_CHUNK_SIZE = 5000
+
+# Exported when no names are given
+DEFAULT_EXPORTS = ('VW_ENRLLMNT_DTLS', 'VW_ASSGNMNT_GRDS', 'VW_CRS_ACTVTY_LG', 'VW_SIS_ENRLLMNT_ROSTER')
+
+class ExportError(Exception):
+    """Custom exception for export errors."""
+    pass
+
+def connect_read_only(db_path: str) -> Connection:
+    """
+    Opens a read-only connection to a database file.
+
+    Raises:
+        sqlite3.OperationalError: If the file does not exist or cannot be opened.
+    """
+    return sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                           check_same_thread=False)
+
+def exportable_names(conn: Connection) -> list:
+    """
+    Returns the names of the tables and views that can be exported. The
+    full-text indexes and their FTS5 shadow tables (ANNCMNTS_FTS_data, ...)
+    are left out: they only repeat the tables they index.
+    """
+    cursor = conn.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'
+        ORDER BY name;
+    """)
+    return [row[0] for row in cursor if not row[0].startswith(tuple(SEARCH_INDEXES))]
+
+def default_exports(fmt: str) -> tuple:
+    """
+    Returns what is exported when no names are given: the analytics views,
+    plus the base tables for the columnar formats.
+    """
+    if fmt in COLUMNAR_FORMATS:
+        return BASE_TABLES + DEFAULT_EXPORTS
+    return DEFAULT_EXPORTS
+
+def export_file_name(name: str, fmt: str, compress: bool = False) -> str:
+    """Returns the file name an export of the given table or view is written to."""
+    if fmt in COLUMNAR_FORMATS:
+        return columnar_output_name(name, fmt)
+    return f"{name}.{fmt}" + ('.gz' if compress else '')
+
+def export_table(conn: Connection, name: str, path: str, fmt: str = 'csv',
+                 compress: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Streams one table or view to a file.
+
+    The file is written under a temporary name and renamed into place once
+    complete, so a reader never sees a partial export.
+
+    Args:
+        conn: The database connection.
+        name: The table or view to export.
+        path: The output file path.
+        fmt: 'csv' (with a header row) or 'jsonl' (one JSON object per row).
+             Use export_columnar() for Parquet and Arrow.
+        compress: Whether to gzip the output.
+        chunk_size: The number of rows fetched from SQLite at a time.
+
+    Returns:
+        The number of rows exported.
+
+    Raises:
+        ExportError: If the name is not a table or view, or the format is unknown.
+    """
+    if fmt not in TEXT_FORMATS:
+        raise ExportError(f"Unknown export format '{fmt}'. Use one of: {', '.join(TEXT_FORMATS)}.")
+    if name not in exportable_names(conn):
+        raise ExportError(f"'{name}' is not a table or view in the database.")
+
+    # The name has been checked against sqlite_master, so it is safe to quote
+    cursor = conn.execute(f'SELECT * FROM "{name}";')
+    columns = [column[0] for column in cursor.description]
+
+    temp_path = f"{path}.tmp"
+    opener = gzip.open if compress else open
+    rows = 0
+    try:
+        with opener(temp_path, 'wt', encoding='utf-8', newline='') as f:
+            if fmt == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(columns)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(chunk)
+                else:
+                    f.writelines(
+                        json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in chunk
+                    )
+                rows += len(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        cursor.close()
+    return rows
+
+def export_many(db_path: str, names: list, output_dir: str, fmt: str = 'csv',
+                compress: bool = False, chunk_size: int = None, workers: int = 4) -> dict:
+    """
+    Exports several tables or views in parallel, each on its own read-only connection.
+
+    SQLite serves concurrent readers without blocking one another, so each
+    export proceeds at the speed of its own query and file.
+
+    Args:
+        db_path: The database file to export from.
+        names: The tables and views to export.
+        output_dir: The directory the files are written to. Created if missing.
+        fmt: 'csv', 'jsonl', 'parquet' or 'arrow'.
+        compress: Whether to gzip the output (csv and jsonl only).
+        chunk_size: Rows fetched at a time, or record batch size for the
+                    columnar formats. Defaults to the format's default.
+        workers: The maximum number of exports running at once.
+
+    Returns:
+        A dict of table or view name to (file path, rows exported).
+
+    Raises:
+        ExportError: If the options are invalid or any name is not a table or
+                     view. Nothing is exported then.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}.")
+    if compress and fmt in COLUMNAR_FORMATS:
+        raise ExportError("Compression applies to csv and jsonl only.")
+    if fmt in COLUMNAR_FORMATS:
+        try:
+            import_pyarrow()
+        except ImportError as e:
+            raise ExportError(str(e)) from e
+
+    conn = connect_read_only(db_path)
+    try:
+        available = set(exportable_names(conn))
+    finally:
+        conn.close()
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ExportError(f"Not a table or view in the database: {', '.join(unknown)}.")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    def export_one(name):
+        conn = connect_read_only(db_path)
+        try:
+            if fmt in COLUMNAR_FORMATS:
+                if chunk_size:
+                    return export_columnar(conn, name, output_dir, fmt, chunk_size)
+                return export_columnar(conn, name, output_dir, fmt)
+            path = os.path.join(output_dir, export_file_name(name, fmt, compress))
+            return path, export_table(conn, name, path, fmt, compress, chunk_size or DEFAULT_CHUNK_SIZE)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names) or 1))) as executor:
+        results = executor.map(export_one, names)
+        return dict(zip(names, results))
@@ -2,10 +2,173 @@
 Handles the extraction of data from the Google Classroom API.
 """
 
-from googleapiclient.discovery import Resource
-from googleapiclient.errors import HttpError
+import logging
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
 
-def get_courses(service: Resource) -> list:
+from src.concurrency import THROTTLE_STATUSES
+from src.metrics import MetricsRecorder
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+
+    from src.concurrency import AdaptiveLimiter
+
+logger = logging.getLogger(__name__)
+
+# A list request that failed with an HttpError, with everything needed to
+# re-issue it. A listing with a failure is incomplete from that page on.
+FailedRequest = namedtuple('FailedRequest', ['endpoint', 'params', 'page_token', 'status', 'message'])
+
+# The first pages of a listing, and whether they were all of it
+ListingProbe = namedtuple('ListingProbe', ['items', 'pages', 'complete'])
+
+# Endpoint -> (list method of a service, response key holding the items)
+_LIST_METHODS = {
+    'courses.list': (lambda service: service.courses().list, 'courses'),
+    'courses.teachers.list': (lambda service: service.courses().teachers().list, 'teachers'),
+    'courses.students.list': (lambda service: service.courses().students().list, 'students'),
+    'courses.announcements.list': (lambda service: service.courses().announcements().list, 'announcements'),
+    'courses.courseWork.list': (lambda service: service.courses().courseWork().list, 'courseWork'),
+    'courses.courseWork.studentSubmissions.list': (
+        lambda service: service.courses().courseWork().studentSubmissions().list, 'studentSubmissions'
+    ),
+}
+
+
+def _capture_response_size(request) -> list:
+    """
+    Arranges for the size of the raw response body to be recorded.
+
+    Wraps the request's post-processor, which receives the undecoded body,
+    so the size is known without re-serializing the parsed response. Returns
+    a one-element list holding the size once the request has executed.
+    """
+    size = [0]
+    postproc = getattr(request, 'postproc', None)
+    if callable(postproc):
+
+        def measuring_postproc(resp, content):
+            size[0] = len(content) if content else 0
+            return postproc(resp, content)
+
+        request.postproc = measuring_postproc
+    return size
+
+
+def _iter_pages(endpoint: str, list_method, items_key: str, error_context: str,
+                metrics: MetricsRecorder = None, failures: list = None,
+                limiter: 'AdaptiveLimiter' = None, page_token: str = None, **params):
+    """
+    Calls a Classroom list method repeatedly, yielding each page's items.
+
+    The next page is only requested once the caller asks for it, so a
+    caller that processes each page before continuing holds one page at a time.
+
+    Args:
+        endpoint: The name the endpoint is reported under in the run metrics.
+        list_method: The bound API list method, e.g. service.courses().list.
+        items_key: The response key holding the page's items.
+        error_context: Describes what was being fetched, for error messages.
+        metrics: An optional MetricsRecorder to report each page to.
+        failures: An optional list to which a FailedRequest is appended if a
+                  page cannot be fetched.
+        limiter: An optional AdaptiveLimiter that bounds concurrent requests
+                 and retries throttled ones.
+        page_token: The page to start from. By default, the first.
+        **params: Request parameters other than the page token.
+
+    Yields:
+        A list of the items on each page.
+    """
+    # Deferred import: the client library is only loaded once requests are made
+    from googleapiclient.errors import HttpError
+
+    while True:
+        request = list_method(pageToken=page_token, **params)
+        response_size = _capture_response_size(request) if metrics else None
+        try:
+            response, elapsed = _execute(request, endpoint, metrics, limiter)
+        except HttpError as e:
+            logger.warning(f"An HTTP error occurred while fetching {error_context}: {e}")
+            if failures is not None:
+                failures.append(FailedRequest(
+                    endpoint, params, page_token, getattr(e.resp, 'status', None), str(e)
+                ))
+            return
+        page_items = response.get(items_key, [])
+        if metrics:
+            metrics.observe_page(endpoint, elapsed, len(page_items), response_size[0])
+        page_token = response.get('nextPageToken')
+        yield page_items
+        if not page_token:
+            return
+
+def _execute(request, endpoint: str, metrics: MetricsRecorder = None, limiter: 'AdaptiveLimiter' = None) -> tuple:
+    """
+    Executes a request, within a limiter slot if a limiter is given.
+
+    With a limiter, throttling responses (429 and 5xx) are reported to it and
+    retried after a backoff, up to its retry limit. Failed attempts are
+    recorded in the metrics.
+
+    Returns:
+        The response and the seconds the successful attempt took.
+
+    Raises:
+        HttpError: If the request failed and was not, or no longer, retried.
+    """
+    from googleapiclient.errors import HttpError
+
+    attempt = 0
+    while True:
+        slot = limiter.slot() if limiter else nullcontext()
+        with slot as ticket:
+            start = time.perf_counter()
+            try:
+                response = request.execute()
+            except HttpError as e:
+                elapsed = time.perf_counter() - start
+                if metrics:
+                    metrics.record_error(endpoint, elapsed)
+                if limiter is None or getattr(e.resp, 'status', None) not in THROTTLE_STATUSES:
+                    raise
+                limiter.throttled(ticket)
+                if attempt >= limiter.max_retries:
+                    raise
+                retry_after = e.resp.get('retry-after') if hasattr(e.resp, 'get') else None
+            else:
+                elapsed = time.perf_counter() - start
+                if limiter:
+                    limiter.succeeded(ticket, elapsed)
+                return response, elapsed
+        # Back off outside the slot, so other requests can use it meanwhile
+        if metrics:
+            metrics.record_retry(endpoint)
+        limiter.sleep(limiter.retry_delay(attempt, retry_after))
+        attempt += 1
+
+def _list_all(endpoint: str, list_method, items_key: str, error_context: str,
+              metrics: MetricsRecorder = None, failures: list = None,
+              limiter: 'AdaptiveLimiter' = None, **params) -> list:
+    """
+    Calls a Classroom list method repeatedly until all pages are retrieved.
+
+    Takes the same arguments as _iter_pages().
+
+    Returns:
+        A list of all items across all pages.
+    """
+    items = []
+    for page_items in _iter_pages(endpoint, list_method, items_key, error_context,
+                                  metrics, failures, limiter, **params):
+        items.extend(page_items)
+    return items
+
+def get_courses(service: 'Resource', metrics: MetricsRecorder = None,
+                failures: list = None, limiter: 'AdaptiveLimiter' = None) -> list:
     """
     Fetches all courses accessible by the authenticated user.
 
@@ -13,26 +176,21 @@ def get_courses(service: Resource) -> list:
 
     Args:
         service: An authorized Google Classroom API service resource object.
+        metrics: An optional MetricsRecorder to report API requests to.
+        failures: An optional list collecting requests that failed.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
 
     Returns:
         A list of course objects.
     """
-    courses = []
-    page_token = None
-    while True:
-        try:
-            response = service.courses().list(pageToken=page_token).execute()
-            courses.extend(response.get('courses', []))
-            page_token = response.get('nextPageToken')
-            if not page_token:
-                break
-        except HttpError as e:
-            print(f"An HTTP error occurred while fetching courses: {e}")
-            break
-    print(f"Found {len(courses)} courses.")
+    courses = _list_all(
+        'courses.list', service.courses().list, 'courses', 'courses', metrics, failures, limiter
+    )
+    logger.info(f"Found {len(courses)} courses.")
     return courses
 
-def get_students(service: Resource, course_id: str) -> list:
+def get_students(service: 'Resource', course_id: str, metrics: MetricsRecorder = None,
+                 failures: list = None, limiter: 'AdaptiveLimiter' = None) -> list:
     """
     Fetches all students enrolled in a specific course.
 
@@ -41,27 +199,20 @@ def get_students(service: Resource, course_id: str) -> list:
     Args:
         service: An authorized Google Classroom API service resource object.
         course_id: The ID of the course from which to fetch students.
+        metrics: An optional MetricsRecorder to report API requests to.
+        failures: An optional list collecting requests that failed.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
 
     Returns:
         A list of student objects.
     """
-    students = []
-    page_token = None
-    while True:
-        try:
-            response = service.courses().students().list(
-                courseId=course_id, pageToken=page_token
-            ).execute()
-            students.extend(response.get('students', []))
-            page_token = response.get('nextPageToken')
-            if not page_token:
-                break
-        except HttpError as e:
-            print(f"An HTTP error occurred while fetching students for course {course_id}: {e}")
-            break
-    return students
+    return _list_all(
+        'courses.students.list', service.courses().students().list, 'students',
+        f"students for course {course_id}", metrics, failures, limiter, courseId=course_id
+    )
 
-def get_teachers(service: Resource, course_id: str) -> list:
+def get_teachers(service: 'Resource', course_id: str, metrics: MetricsRecorder = None,
+                 failures: list = None, limiter: 'AdaptiveLimiter' = None) -> list:
     """
     Fetches all teachers for a specific course.
 
@@ -70,27 +221,20 @@ def get_teachers(service: Resource, course_id: str) -> list:
     Args:
         service: An authorized Google Classroom API service resource object.
         course_id: The ID of the course from which to fetch teachers.
+        metrics: An optional MetricsRecorder to report API requests to.
+        failures: An optional list collecting requests that failed.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
 
     Returns:
         A list of teacher objects.
     """
-    teachers = []
-    page_token = None
-    while True:
-        try:
-            response = service.courses().teachers().list(
-                courseId=course_id, pageToken=page_token
-            ).execute()
-            teachers.extend(response.get('teachers', []))
-            page_token = response.get('nextPageToken')
-            if not page_token:
-                break
-        except HttpError as e:
-            print(f"An HTTP error occurred while fetching teachers for course {course_id}: {e}")
-            break
-    return teachers
+    return _list_all(
+        'courses.teachers.list', service.courses().teachers().list, 'teachers',
+        f"teachers for course {course_id}", metrics, failures, limiter, courseId=course_id
+    )
 
-def get_announcements(service: Resource, course_id: str) -> list:
+def get_announcements(service: 'Resource', course_id: str, metrics: MetricsRecorder = None,
+                      failures: list = None, limiter: 'AdaptiveLimiter' = None) -> list:
     """
     Fetches all announcements for a specific course.
 
@@ -99,54 +243,41 @@ def get_announcements(service: Resource, course_id: str) -> list:
     Args:
         service: An authorized Google Classroom API service resource object.
         course_id: The ID of the course from which to fetch announcements.
+        metrics: An optional MetricsRecorder to report API requests to.
+        failures: An optional list collecting requests that failed.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
 
     Returns:
         A list of announcement objects.
     """
-    announcements = []
-    page_token = None
-    while True:
-        try:
-            response = service.courses().announcements().list(
-                courseId=course_id, pageToken=page_token
-            ).execute()
-            announcements.extend(response.get('announcements', []))
-            page_token = response.get('nextPageToken')
-            if not page_token:
-                break
-        except HttpError as e:
-            print(f"An HTTP error occurred while fetching announcements for course {course_id}: {e}")
-            break
-    return announcements
+    return _list_all(
+        'courses.announcements.list', service.courses().announcements().list, 'announcements',
+        f"announcements for course {course_id}", metrics, failures, limiter, courseId=course_id
+    )
 
-def get_course_work(service: Resource, course_id: str) -> list:
+def get_course_work(service: 'Resource', course_id: str, metrics: MetricsRecorder = None,
+                    failures: list = None, limiter: 'AdaptiveLimiter' = None) -> list:
     """
     Fetches all course work (assignments, etc.) for a specific course.
 
     Args:
         service: An authorized Google Classroom API service resource object.
         course_id: The ID of the course from which to fetch course work.
+        metrics: An optional MetricsRecorder to report API requests to.
+        failures: An optional list collecting requests that failed.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
 
     Returns:
         A list of course work objects.
     """
-    course_work = []
-    page_token = None
-    while True:
-        try:
-            response = service.courses().courseWork().list(
-                courseId=course_id, pageToken=page_token
-            ).execute()
-            course_work.extend(response.get('courseWork', []))
-            page_token = response.get('nextPageToken')
-            if not page_token:
-                break
-        except HttpError as e:
-            print(f"An HTTP error occurred while fetching course work for course {course_id}: {e}")
-            break
-    return course_work
+    return _list_all(
+        'courses.courseWork.list', service.courses().courseWork().list, 'courseWork',
+        f"course work for course {course_id}", metrics, failures, limiter, courseId=course_id
+    )
 
-def get_student_submissions(service: Resource, course_id: str, course_work_id: str) -> list:
+def get_student_submissions(service: 'Resource', course_id: str, course_work_id: str,
+                            metrics: MetricsRecorder = None, failures: list = None,
+                            limiter: 'AdaptiveLimiter' = None) -> list:
     """
     Fetches all student submissions for a specific piece of course work.
 
@@ -154,24 +285,153 @@ def get_student_submissions(service: Resource, course_id: str, course_work_id: s
         service: An authorized Google Classroom API service resource object.
         course_id: The ID of the course.
         course_work_id: The ID of the course work.
+        metrics: An optional MetricsRecorder to report API requests to.
+        failures: An optional list collecting requests that failed.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
 
     Returns:
         A list of student submission objects.
     """
-    submissions = []
+    return _list_all(
+        'courses.courseWork.studentSubmissions.list',
+        service.courses().courseWork().studentSubmissions().list, 'studentSubmissions',
+        f"submissions for course work {course_work_id}", metrics, failures, limiter,
+        courseId=course_id, courseWorkId=course_work_id
+    )
+
+def iter_announcement_pages(service: 'Resource', course_id: str, metrics: MetricsRecorder = None,
+                            failures: list = None, limiter: 'AdaptiveLimiter' = None):
+    """
+    Fetches the announcements for a course one page at a time.
+
+    Takes the same arguments as get_announcements(), and yields a list of
+    announcement objects per page.
+    """
+    return _iter_pages(
+        'courses.announcements.list', service.courses().announcements().list, 'announcements',
+        f"announcements for course {course_id}", metrics, failures, limiter, courseId=course_id
+    )
+
+def iter_course_work_pages(service: 'Resource', course_id: str, metrics: MetricsRecorder = None,
+                           failures: list = None, limiter: 'AdaptiveLimiter' = None):
+    """
+    Fetches the course work for a course one page at a time.
+
+    Takes the same arguments as get_course_work(), and yields a list of
+    course work objects per page.
+    """
+    return _iter_pages(
+        'courses.courseWork.list', service.courses().courseWork().list, 'courseWork',
+        f"course work for course {course_id}", metrics, failures, limiter, courseId=course_id
+    )
+
+def iter_student_submission_pages(service: 'Resource', course_id: str, course_work_id: str,
+                                  metrics: MetricsRecorder = None, failures: list = None,
+                                  limiter: 'AdaptiveLimiter' = None):
+    """
+    Fetches the student submissions for a piece of course work one page at a time.
+
+    Takes the same arguments as get_student_submissions(), and yields a list
+    of student submission objects per page.
+    """
+    return _iter_pages(
+        'courses.courseWork.studentSubmissions.list',
+        service.courses().courseWork().studentSubmissions().list, 'studentSubmissions',
+        f"submissions for course work {course_work_id}", metrics, failures, limiter,
+        courseId=course_id, courseWorkId=course_work_id
+    )
+
+def get_course(service: 'Resource', course_id: str, metrics: MetricsRecorder = None,
+               limiter: 'AdaptiveLimiter' = None):
+    """
+    Fetches one course by its ID.
+
+    Args:
+        service: An authorized Google Classroom API service resource object.
+        course_id: The ID of the course.
+        metrics: An optional MetricsRecorder to report the API request to.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
+
+    Returns:
+        The course object, or None if no such course exists.
+
+    Raises:
+        HttpError: If the request failed for any other reason.
+    """
+    from googleapiclient.errors import HttpError
+
+    request = service.courses().get(id=course_id)
+    try:
+        response, elapsed = _execute(request, 'courses.get', metrics, limiter)
+    except HttpError as e:
+        if getattr(e.resp, 'status', None) == 404:
+            return None
+        raise
+    if metrics:
+        metrics.observe_page('courses.get', elapsed, 1)
+    return response
+
+def iter_listing_pages(service: 'Resource', endpoint: str, params: dict, page_token: str = None,
+                       metrics: MetricsRecorder = None, failures: list = None,
+                       limiter: 'AdaptiveLimiter' = None):
+    """
+    Fetches any listing one page at a time, from a given page on.
+
+    Used to re-issue a FailedRequest: its endpoint, params and page_token
+    are passed back as they were recorded.
+
+    Args:
+        service: An authorized Google Classroom API service resource object.
+        endpoint: The listing, e.g. 'courses.students.list'.
+        params: Request parameters other than the page token, e.g. courseId.
+        page_token: The page to start from. By default, the first.
+        metrics: An optional MetricsRecorder to report API requests to.
+        failures: An optional list to collect FailedRequests in.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
+
+    Yields:
+        A list of the items on each page.
+    """
+    method, items_key = _LIST_METHODS[endpoint]
+    return _iter_pages(
+        endpoint, method(service), items_key, f"{endpoint} {params}", metrics, failures, limiter,
+        page_token, **params
+    )
+
+def probe_listing(service: 'Resource', endpoint: str, max_pages: int = 1, metrics: MetricsRecorder = None,
+                  limiter: 'AdaptiveLimiter' = None, **params) -> ListingProbe:
+    """
+    Fetches at most the first max_pages pages of a listing.
+
+    Used to size a run without fetching everything. HTTP errors propagate.
+
+    Args:
+        service: An authorized Google Classroom API service resource object.
+        endpoint: The listing, e.g. 'courses.students.list'.
+        max_pages: The most pages to fetch.
+        metrics: An optional MetricsRecorder to report API requests to.
+        limiter: An optional AdaptiveLimiter shared by concurrent requests.
+        **params: Request parameters other than the page token, e.g. courseId.
+
+    Returns:
+        A ListingProbe with the items fetched, the number of pages fetched and
+        whether that was the whole listing.
+    """
+    method, items_key = _LIST_METHODS[endpoint]
+    list_method = method(service)
+    items = []
+    pages = 0
     page_token = None
-    while True:
-        try:
-            response = service.courses().courseWork().studentSubmissions().list(
-                courseId=course_id,
-                courseWorkId=course_work_id,
-                pageToken=page_token
-            ).execute()
-            submissions.extend(response.get('studentSubmissions', []))
-            page_token = response.get('nextPageToken')
-            if not page_token:
-                break
-        except HttpError as e:
-            print(f"An HTTP error occurred while fetching submissions for course work {course_work_id}: {e}")
-            break
-    return submissions
+    while pages < max_pages:
+        request = list_method(pageToken=page_token, **params)
+        response_size = _capture_response_size(request) if metrics else None
+        response, elapsed = _execute(request, endpoint, metrics, limiter)
+        page_items = response.get(items_key, [])
+        if metrics:
+            metrics.observe_page(endpoint, elapsed, len(page_items), response_size[0])
+        items.extend(page_items)
+        pages += 1
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return ListingProbe(items, pages, True)
+    return ListingProbe(items, pages, False)
@@ -0,0 +1,311 @@
+"""
+Builds per-course gradebook matrices and grade statistics with NumPy.
+
+Submissions joined to their course work are loaded once into flat arrays,
+with every course, assignment and student ID mapped to an integer index.
+Grades are normalized to a percentage of the assignment's MX_PNTS, and all
+statistics are computed with grouped array operations (bincount and a
+single sort for medians) rather than per-row Python loops.
+
+The statistics are stored in summary tables:
+
+*   CRS_GRD_STTS: per course.
+*   ASSGNMNT_GRD_STTS: per course work item.
+*   STDNT_GRD_STTS: per student in each course.
+*   GRD_DSTRBTN: per course, the number of grades in each 10% band.
+
+Requires numpy.
+"""
+
+import csv
+import os
+import time
+from collections import namedtuple
+from sqlite3 import Connection
+
+import numpy as np
+
+# Width of the grade distribution bands, in percent. Grades of 100% or more
+# (extra credit) fall in the top band.
+DISTRIBUTION_BAND = 10
+DISTRIBUTION_BANDS = 100 // DISTRIBUTION_BAND
+
+GradeData = namedtuple('GradeData', [
+    'course_ids', 'assignment_ids', 'student_ids',   # index -> ID
+    'course', 'assignment', 'student',               # per submission: integer index
+    'assignment_course',                             # per assignment: course index
+    'score',                                         # per submission: percent, NaN if ungraded
+])
+
+CourseGradebook = namedtuple('CourseGradebook', ['course_id', 'student_ids', 'assignment_ids', 'scores'])
+
+GroupStats = namedtuple('GroupStats', ['count', 'mean', 'median', 'std', 'low', 'high'])
+
+def _create_tables(conn: Connection):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS CRS_GRD_STTS (
+            CRS_ID TEXT PRIMARY KEY,
+            STDNT_CNT INTEGER,
+            ASSGNMNT_CNT INTEGER,
+            SBMSSN_CNT INTEGER,
+            GRDD_CNT INTEGER,
+            MN_PCT REAL,
+            MDN_PCT REAL,
+            STDV_PCT REAL,
+            LWST_PCT REAL,
+            HGHST_PCT REAL,
+            CMPTD_TM TEXT
+        );
+        CREATE TABLE IF NOT EXISTS ASSGNMNT_GRD_STTS (
+            CRS_WRK_ID TEXT PRIMARY KEY,
+            CRS_ID TEXT NOT NULL,
+            SBMSSN_CNT INTEGER,
+            GRDD_CNT INTEGER,
+            MN_PCT REAL,
+            MDN_PCT REAL,
+            STDV_PCT REAL,
+            LWST_PCT REAL,
+            HGHST_PCT REAL
+        );
+        CREATE TABLE IF NOT EXISTS STDNT_GRD_STTS (
+            CRS_ID TEXT NOT NULL,
+            USR_ID TEXT NOT NULL,
+            SBMSSN_CNT INTEGER,
+            GRDD_CNT INTEGER,
+            MN_PCT REAL,
+            MDN_PCT REAL,
+            LWST_PCT REAL,
+            HGHST_PCT REAL,
+            PRIMARY KEY (CRS_ID, USR_ID)
+        );
+        CREATE TABLE IF NOT EXISTS GRD_DSTRBTN (
+            CRS_ID TEXT NOT NULL,
+            BND_LWR_PCT INTEGER NOT NULL,
+            GRDD_CNT INTEGER,
+            PRIMARY KEY (CRS_ID, BND_LWR_PCT)
+        );
+        CREATE INDEX IF NOT EXISTS IDX_ASSGNMNT_GRD_STTS_CRS_ID ON ASSGNMNT_GRD_STTS (CRS_ID);
+    """)
+
+def _dense(conn: Connection, table: str, rowids: np.ndarray) -> tuple:
+    """
+    Maps a table's rowids to dense indices 0..n-1.
+
+    Returns:
+        The index of each rowid, and the ID of each index.
+    """
+    distinct, indices = np.unique(rowids, return_inverse=True)
+    ids = dict(conn.execute(f"SELECT rowid, ID FROM {table};").fetchall())
+    return indices, np.array([ids[rowid] for rowid in distinct.tolist()], dtype=object)
+
+def load_grades(conn: Connection, course_ids: list = None) -> GradeData:
+    """
+    Loads submissions and their course work into integer-indexed arrays.
+
+    Rows are identified by their SQLite rowids, so no ID strings are handled
+    per submission.
+
+    Args:
+        conn: The database connection.
+        course_ids: Only load these courses. Defaults to all courses.
+    """
+    query = """
+        SELECT c.rowid, w.rowid, u.rowid,
+               -- Percent of the available points; NULL if ungraded or the work is ungraded
+               CASE WHEN w.MX_PNTS > 0 THEN 100.0 * s.ASSGND_GRD / w.MX_PNTS END
+        FROM STDNT_SBMSSNS s
+        JOIN CRS_WRK w ON w.ID = s.CRS_WRK_ID
+        JOIN CRSS c ON c.ID = w.CRS_ID
+        JOIN USRS u ON u.ID = s.USR_ID
+    """
+    params = ()
+    if course_ids:
+        query += f" WHERE w.CRS_ID IN ({', '.join('?' * len(course_ids))})"
+        params = tuple(course_ids)
+    # NULL scores become NaN
+    rows = np.array(conn.execute(query, params).fetchall(), dtype=np.float64).reshape(-1, 4)
+    keys = rows[:, :3].astype(np.int64)
+
+    course, course_index = _dense(conn, 'CRSS', keys[:, 0])
+    assignment, assignment_index = _dense(conn, 'CRS_WRK', keys[:, 1])
+    student, student_index = _dense(conn, 'USRS', keys[:, 2])
+    score = rows[:, 3]
+
+    # Each assignment belongs to one course
+    assignment_course = np.zeros(len(assignment_index), dtype=np.int64)
+    assignment_course[assignment] = course
+
+    return GradeData(course_index, assignment_index, student_index,
+                     course, assignment, student, assignment_course, score)
+
+def group_stats(groups: np.ndarray, values: np.ndarray, size: int) -> GroupStats:
+    """
+    Computes grouped statistics of the non-NaN values, one entry per group.
+
+    Args:
+        groups: The group index of each value, in range(size).
+        values: The values, with NaN for missing ones.
+        size: The number of groups.
+
+    Returns:
+        Arrays of length size. Groups without values have a count of 0 and NaN statistics.
+    """
+    valid = ~np.isnan(values)
+    groups = groups[valid]
+    values = values[valid]
+
+    count = np.bincount(groups, minlength=size)
+    total = np.bincount(groups, weights=values, minlength=size)
+    squares = np.bincount(groups, weights=values * values, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        # Population standard deviation; clipped because rounding can leave it just below zero
+        std = np.sqrt(np.maximum(squares / count - mean * mean, 0.0))
+
+    # Sorting by group, then value, lays each group's values out in order,
+    # so medians, minimums and maximums are found by position
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    median = np.full(size, np.nan)
+    low = np.full(size, np.nan)
+    high = np.full(size, np.nan)
+    present = count > 0
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))[present]
+    counts = count[present]
+    if len(ordered):
+        median[present] = (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+        low[present] = ordered[starts]
+        high[present] = ordered[starts + counts - 1]
+    return GroupStats(count, mean, median, std, low, high)
+
+def distribution(groups: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """Returns a (size, DISTRIBUTION_BANDS) array counting each group's values per band."""
+    valid = ~np.isnan(values)
+    bands = np.clip((values[valid] // DISTRIBUTION_BAND).astype(np.int64), 0, DISTRIBUTION_BANDS - 1)
+    cells = np.bincount(groups[valid] * DISTRIBUTION_BANDS + bands, minlength=size * DISTRIBUTION_BANDS)
+    return cells.reshape(size, DISTRIBUTION_BANDS)
+
+def course_gradebooks(data: GradeData):
+    """
+    Yields a CourseGradebook per course: a students x assignments matrix of
+    percent scores, with NaN where there is no grade.
+    """
+    order = np.argsort(data.course, kind='stable')
+    bounds = np.searchsorted(data.course[order], np.arange(len(data.course_ids) + 1))
+    for course in range(len(data.course_ids)):
+        rows = order[bounds[course]:bounds[course + 1]]
+        students, student_rows = np.unique(data.student[rows], return_inverse=True)
+        assignments, assignment_columns = np.unique(data.assignment[rows], return_inverse=True)
+        scores = np.full((len(students), len(assignments)), np.nan)
+        scores[student_rows, assignment_columns] = data.score[rows]
+        yield CourseGradebook(
+            data.course_ids[course], data.student_ids[students], data.assignment_ids[assignments], scores
+        )
+
+def write_matrix_csv(conn: Connection, gradebook: CourseGradebook, path: str):
+    """
+    Writes a course's gradebook matrix as CSV: one row per student, one
+    column per assignment, percent scores with blanks where ungraded.
+    """
+    names = dict(conn.execute(
+        f"SELECT ID, NM FROM USRS WHERE ID IN ({', '.join('?' * len(gradebook.student_ids))});",
+        gradebook.student_ids.tolist()
+    ).fetchall())
+    titles = dict(conn.execute(
+        f"SELECT ID, TTL FROM CRS_WRK WHERE ID IN ({', '.join('?' * len(gradebook.assignment_ids))});",
+        gradebook.assignment_ids.tolist()
+    ).fetchall())
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['USR_ID', 'USR_NM'] + [
+            f"{titles.get(assignment_id, '')} ({assignment_id})" for assignment_id in gradebook.assignment_ids
+        ])
+        for student_id, scores in zip(gradebook.student_ids, gradebook.scores.round(2).tolist()):
+            writer.writerow([student_id, names.get(student_id, '')] + [
+                '' if score != score else score for score in scores
+            ])
+    os.replace(temp_path, path)
+
+def _column(values: np.ndarray) -> list:
+    """Converts an array to a list of Python values for SQLite, with None for NaN."""
+    if values.dtype.kind == 'f':
+        return [None if value != value else round(value, 4) for value in values.tolist()]
+    return values.tolist()
+
+def compute_grade_statistics(conn: Connection, course_ids: list = None) -> GradeData:
+    """
+    Computes grade statistics and replaces them in the summary tables.
+
+    Args:
+        conn: The database connection.
+        course_ids: Only compute these courses; statistics for other courses
+                    are left as they are. Defaults to all courses.
+
+    Returns:
+        The loaded GradeData, which course_gradebooks() can turn into matrices.
+    """
+    _create_tables(conn)
+    data = load_grades(conn, course_ids)
+    courses = len(data.course_ids)
+    computed_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    # Per course
+    by_course = group_stats(data.course, data.score, courses)
+    submissions_per_course = np.bincount(data.course, minlength=courses)
+    assignments_per_course = np.bincount(data.assignment_course, minlength=courses)
+    # Distinct students per course, from the distinct (course, student) pairs
+    # encoded as single integers
+    width = max(len(data.student_ids), 1)
+    pair_keys = data.course * width + data.student
+    pairs = np.unique(pair_keys)
+    course_of_pair = pairs // width
+    student_of_pair = pairs % width
+    students_per_course = np.bincount(course_of_pair, minlength=courses)
+
+    # Per assignment
+    assignments = len(data.assignment_ids)
+    by_assignment = group_stats(data.assignment, data.score, assignments)
+    submissions_per_assignment = np.bincount(data.assignment, minlength=assignments)
+
+    # Per student in each course
+    pair_index = np.searchsorted(pairs, pair_keys)
+    by_student = group_stats(pair_index, data.score, len(pairs))
+    submissions_per_student = np.bincount(pair_index, minlength=len(pairs))
+
+    bands = distribution(data.course, data.score, courses)
+
+    cursor = conn.cursor()
+    if course_ids:
+        placeholders = ', '.join('?' * len(course_ids))
+        for table in ('CRS_GRD_STTS', 'ASSGNMNT_GRD_STTS', 'STDNT_GRD_STTS', 'GRD_DSTRBTN'):
+            cursor.execute(f"DELETE FROM {table} WHERE CRS_ID IN ({placeholders});", tuple(course_ids))
+    else:
+        for table in ('CRS_GRD_STTS', 'ASSGNMNT_GRD_STTS', 'STDNT_GRD_STTS', 'GRD_DSTRBTN'):
+            cursor.execute(f"DELETE FROM {table};")
+
+    cursor.executemany("INSERT INTO CRS_GRD_STTS VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", zip(
+        data.course_ids.tolist(), _column(students_per_course), _column(assignments_per_course),
+        _column(submissions_per_course), _column(by_course.count), _column(by_course.mean),
+        _column(by_course.median), _column(by_course.std), _column(by_course.low),
+        _column(by_course.high), [computed_at] * courses
+    ))
+    cursor.executemany("INSERT INTO ASSGNMNT_GRD_STTS VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);", zip(
+        data.assignment_ids.tolist(), data.course_ids[data.assignment_course].tolist(),
+        _column(submissions_per_assignment), _column(by_assignment.count), _column(by_assignment.mean),
+        _column(by_assignment.median), _column(by_assignment.std), _column(by_assignment.low),
+        _column(by_assignment.high)
+    ))
+    cursor.executemany("INSERT INTO STDNT_GRD_STTS VALUES (?, ?, ?, ?, ?, ?, ?, ?);", zip(
+        data.course_ids[course_of_pair].tolist(), data.student_ids[student_of_pair].tolist(),
+        _column(submissions_per_student), _column(by_student.count), _column(by_student.mean),
+        _column(by_student.median), _column(by_student.low), _column(by_student.high)
+    ))
+    course_cells, band_cells = np.nonzero(bands)
+    cursor.executemany("INSERT INTO GRD_DSTRBTN VALUES (?, ?, ?);", zip(
+        data.course_ids[course_cells].tolist(), (band_cells * DISTRIBUTION_BAND).tolist(),
+        bands[course_cells, band_cells].tolist()
+    ))
+    conn.commit()
+    return data
@@ -0,0 +1,143 @@
+"""
+Keeps the extraction within a memory budget.
+
+The extractor streams each listing page by page. After every page the
+MemoryBudget is told how many rows were written; it samples the process's
+resident set size (RSS) and applies backpressure by committing early, so the
+pipeline never holds more than a bounded number of uncommitted rows, and
+by flushing and collecting garbage when RSS nears the budget. The next page
+is only fetched once that is done. The peak RSS seen in each stage is
+reported to the run metrics.
+"""
+
+import gc
+import logging
+import os
+import sys
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:  # Optional; /proc is used instead where available
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Backpressure starts when RSS reaches this fraction of the budget
+HIGH_WATER = 0.9
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss() -> int:
+    """
+    Returns the resident set size of this process in bytes, or None if it
+    cannot be determined on this platform.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Only the peak is available here: kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class MemoryBudget:
+    """
+    Tracks RSS and buffered rows and decides when the pipeline must flush.
+
+    Args:
+        limit_mb: The memory budget in MiB. 0 disables the RSS-based backpressure.
+        max_buffered_rows: Commit once this many rows have been written since
+                           the last commit. 0 disables the row limit.
+        metrics: An optional MetricsRecorder the peak RSS per stage is reported to.
+    """
+
+    def __init__(self, limit_mb: int = 0, max_buffered_rows: int = 0, metrics=None):
+        self.limit = limit_mb * 1024 * 1024
+        self.max_buffered_rows = max_buffered_rows
+        self.metrics = metrics
+        self.buffered_rows = 0
+        self.early_flushes = 0
+        self.pressure_events = 0
+        self.peaks = {}
+        self._stage = 'startup'
+        self._warned = False
+
+    def sample(self) -> int:
+        """Samples RSS and records it against the current stage."""
+        rss = current_rss()
+        if rss is not None:
+            if rss > self.peaks.get(self._stage, 0):
+                self.peaks[self._stage] = rss
+            if self.metrics:
+                self.metrics.observe_memory(self._stage, rss)
+        return rss
+
+    @contextmanager
+    def stage(self, name: str):
+        """Context manager attributing memory samples to a pipeline stage."""
+        previous = self._stage
+        self._stage = name
+        self.sample()
+        try:
+            yield
+        finally:
+            self.sample()
+            self._stage = previous
+
+    def rows_written(self, rows: int, flush):
+        """
+        Reports rows written since the last call and applies backpressure.
+
+        Args:
+            rows: The number of rows just written.
+            flush: A callable that commits the buffered rows.
+        """
+        self.buffered_rows += rows
+        if self.max_buffered_rows and self.buffered_rows >= self.max_buffered_rows:
+            self.early_flushes += 1
+            self._flush(flush)
+
+        if not self.limit:
+            return
+        rss = self.sample()
+        if rss is None or rss < self.limit * HIGH_WATER:
+            return
+
+        # Near the budget: release what the pipeline holds before fetching more
+        self.pressure_events += 1
+        self._flush(flush)
+        gc.collect()
+        rss = self.sample()
+        if rss is not None and rss > self.limit and not self._warned:
+            self._warned = True
+            logger.warning(f"Memory use ({rss / 1048576:.0f} MiB) is above the "
+                           f"{self.limit / 1048576:.0f} MiB budget after flushing.")
+
+    def flushed(self):
+        """Records that the buffered rows were committed."""
+        self.buffered_rows = 0
+
+    def _flush(self, flush):
+        if self.buffered_rows:
+            flush()
+        self.buffered_rows = 0
+
+    def report(self):
+        """Logs the peak RSS per stage."""
+        if not self.peaks:
+            return
+        lines = ["Peak memory (RSS) per stage:"]
+        for stage, peak in sorted(self.peaks.items(), key=lambda item: -item[1]):
+            lines.append(f"  {stage:<16} {peak / 1048576:8.1f} MiB")
+        if self.early_flushes or self.pressure_events:
+            lines.append(f"  Early commits: {self.early_flushes} for buffered rows, "
+                         f"{self.pressure_events} for memory pressure.")
+        logger.info("\n".join(lines))
@@ -0,0 +1,393 @@
+"""
+Collects run metrics for the extraction pipeline and writes them out as a
+Prometheus textfile and a JSON run summary.
+
+A single MetricsRecorder is created per run. The extractor reports every API
+page it fetches (latency, response size, item count, errors and retries) and
+the database layer reports rows written and skipped per table and the time
+spent in each flush. The peak memory (RSS) of each pipeline stage and the
+adaptive concurrency limit's changes are kept too. Together these show
+whether a slow run was spent waiting on Google, on the disk, or in our own
+code.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+METRIC_PREFIX = 'fairplay'
+
+
+class _Histogram:
+    """A fixed-bucket latency histogram, in the Prometheus sense."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def cumulative(self) -> list:
+        """Returns (upper_bound, cumulative_count) pairs."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        lower = 0.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            if seen + count >= rank and count:
+                upper = min(bound, self.max)
+                if upper <= lower:
+                    return upper
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.latency = _Histogram()
+        self.pages = 0
+        self.items = 0
+        self.response_bytes = 0
+        self.errors = 0
+        self.retries = 0
+
+
+class _TableStats:
+    def __init__(self):
+        self.rows = 0
+        self.skipped = 0
+        self.quarantined = 0
+        self.seconds = 0.0
+
+
+class _ConcurrencyStats:
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.lowest = limit
+        self.highest = limit
+        self.increases = 0
+        self.decreases = 0
+
+
+class MetricsRecorder:
+    """
+    Thread-safe collector for per-endpoint and per-table run metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._tables = {}
+        self._flushes = _Histogram()
+        self._memory = {}
+        self._concurrency = None
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+    def _endpoint(self, endpoint: str) -> _EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = _EndpointStats()
+        return stats
+
+    def _table(self, table: str) -> _TableStats:
+        stats = self._tables.get(table)
+        if stats is None:
+            stats = self._tables[table] = _TableStats()
+        return stats
+
+    def observe_page(self, endpoint: str, seconds: float, items: int, response_bytes: int = 0):
+        """Records one successfully fetched API page."""
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats.latency.observe(seconds)
+            stats.pages += 1
+            stats.items += items
+            stats.response_bytes += response_bytes
+
+    def record_error(self, endpoint: str, seconds: float = None):
+        """Records a failed API request. The latency is kept when known."""
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats.errors += 1
+            if seconds is not None:
+                stats.latency.observe(seconds)
+
+    def record_retry(self, endpoint: str):
+        """Records that a request to the endpoint is being retried."""
+        with self._lock:
+            self._endpoint(endpoint).retries += 1
+
+    def observe_write(self, table: str, rows: int, seconds: float, skipped: int = 0, quarantined: int = 0):
+        """
+        Records rows saved to a table and the time it took.
+
+        Args:
+            table: The table name.
+            rows: Rows actually written (inserted or changed).
+            seconds: Time spent saving, including skipped rows.
+            skipped: Rows that were already up to date and not rewritten.
+            quarantined: Malformed items quarantined instead of saved.
+        """
+        with self._lock:
+            stats = self._table(table)
+            stats.rows += rows
+            stats.skipped += skipped
+            stats.quarantined += quarantined
+            stats.seconds += seconds
+
+    def instrument_write(self, table: str, save_function):
+        """
+        Wraps a single-row save function so every call is counted against
+        the given table: as skipped if the function returns False, as
+        quarantined if it returns None, otherwise as written. The time of a
+        call that raises is recorded too, with no row counted.
+        """
+        def instrumented(*args, **kwargs):
+            written, skipped, quarantined = 0, 0, 0
+            start = time.perf_counter()
+            try:
+                result = save_function(*args, **kwargs)
+                if result is None:
+                    quarantined = 1
+                elif result is False:
+                    skipped = 1
+                else:
+                    written = 1
+                return result
+            finally:
+                # A save that raised still spent the time, but saved nothing
+                self.observe_write(table, written, time.perf_counter() - start, skipped=skipped,
+                                   quarantined=quarantined)
+        return instrumented
+
+    def write_totals(self) -> tuple:
+        """Returns the total (written, skipped, quarantined) row counts across all tables."""
+        with self._lock:
+            return (
+                sum(stats.rows for stats in self._tables.values()),
+                sum(stats.skipped for stats in self._tables.values()),
+                sum(stats.quarantined for stats in self._tables.values()),
+            )
+
+    def observe_memory(self, stage: str, rss_bytes: int):
+        """Records a memory (RSS) sample, keeping the peak per pipeline stage."""
+        with self._lock:
+            if rss_bytes > self._memory.get(stage, 0):
+                self._memory[stage] = rss_bytes
+
+    def observe_concurrency(self, limit: float, decision: str = None):
+        """
+        Records the adaptive concurrency limit.
+
+        Args:
+            limit: The limit after the decision.
+            decision: 'increase' or 'decrease', or None for the starting limit.
+        """
+        limit = int(limit)
+        with self._lock:
+            stats = self._concurrency
+            if stats is None:
+                stats = self._concurrency = _ConcurrencyStats(limit)
+            stats.limit = limit
+            stats.lowest = min(stats.lowest, limit)
+            stats.highest = max(stats.highest, limit)
+            if decision == 'increase':
+                stats.increases += 1
+            elif decision == 'decrease':
+                stats.decreases += 1
+
+    def progress_counts(self) -> tuple:
+        """
+        Returns the API requests made so far and the rows handled (written or
+        skipped) per table, cheaply enough to call after every page.
+        """
+        with self._lock:
+            return (
+                sum(stats.latency.count for stats in self._endpoints.values()),
+                {name: stats.rows + stats.skipped for name, stats in self._tables.items()},
+            )
+
+    @contextmanager
+    def time_flush(self):
+        """Context manager that times a database flush (commit)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._flushes.observe(elapsed)
+
+    def summary(self) -> dict:
+        """Returns the collected metrics as a JSON-serializable dict."""
+        with self._lock:
+            endpoints = {}
+            for name, stats in sorted(self._endpoints.items()):
+                latency = stats.latency
+                endpoints[name] = {
+                    'requests': latency.count,
+                    'pages': stats.pages,
+                    'items': stats.items,
+                    'response_bytes': stats.response_bytes,
+                    'errors': stats.errors,
+                    'retries': stats.retries,
+                    'latency_seconds': {
+                        'sum': round(latency.sum, 6),
+                        'mean': round(latency.sum / latency.count, 6) if latency.count else 0.0,
+                        'p50': round(latency.quantile(0.5), 6),
+                        'p95': round(latency.quantile(0.95), 6),
+                        'max': round(latency.max, 6),
+                    },
+                    'bytes_per_second': round(stats.response_bytes / latency.sum, 1) if latency.sum else 0.0,
+                    'items_per_second': round(stats.items / latency.sum, 1) if latency.sum else 0.0,
+                }
+            tables = {
+                name: {
+                    'rows': stats.rows,
+                    'skipped': stats.skipped,
+                    'quarantined': stats.quarantined,
+                    'seconds': round(stats.seconds, 6),
+                    'rows_per_second': round((stats.rows + stats.skipped) / stats.seconds, 1) if stats.seconds else 0.0,
+                }
+                for name, stats in sorted(self._tables.items())
+            }
+            flushes = {
+                'count': self._flushes.count,
+                'seconds': round(self._flushes.sum, 6),
+                'max_seconds': round(self._flushes.max, 6),
+            }
+            memory = dict(sorted(self._memory.items()))
+            concurrency = self._concurrency
+            if concurrency is not None:
+                concurrency = {
+                    'limit': concurrency.limit,
+                    'lowest': concurrency.lowest,
+                    'highest': concurrency.highest,
+                    'increases': concurrency.increases,
+                    'decreases': concurrency.decreases,
+                }
+        return {
+            'started_at': self.started_at,
+            'duration_seconds': round(time.perf_counter() - self._start, 6),
+            'endpoints': endpoints,
+            'tables': tables,
+            'flushes': flushes,
+            'peak_rss_bytes': memory,
+            'concurrency': concurrency,
+        }
+
+    def to_prometheus(self) -> str:
+        """Renders the collected metrics in the Prometheus text exposition format."""
+        p = METRIC_PREFIX
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            tables = sorted(self._tables.items())
+
+            header('request_duration_seconds', 'histogram', 'Classroom API request latency.')
+            for name, stats in endpoints:
+                for bound, count in stats.latency.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{p}_request_duration_seconds_bucket{{endpoint="{name}",le="{le}"}} {count}')
+                lines.append(f'{p}_request_duration_seconds_sum{{endpoint="{name}"}} {stats.latency.sum:.6f}')
+                lines.append(f'{p}_request_duration_seconds_count{{endpoint="{name}"}} {stats.latency.count}')
+
+            counters = (
+                ('request_pages_total', 'pages', 'API pages fetched.'),
+                ('request_items_total', 'items', 'Items returned by the API.'),
+                ('response_bytes_total', 'response_bytes', 'Response body bytes received.'),
+                ('request_errors_total', 'errors', 'Failed API requests.'),
+                ('request_retries_total', 'retries', 'Retried API requests.'),
+            )
+            for metric, attribute, help_text in counters:
+                header(metric, 'counter', help_text)
+                for name, stats in endpoints:
+                    lines.append(f'{p}_{metric}{{endpoint="{name}"}} {getattr(stats, attribute)}')
+
+            header('table_rows_written_total', 'counter', 'Rows written per table.')
+            for name, stats in tables:
+                lines.append(f'{p}_table_rows_written_total{{table="{name}"}} {stats.rows}')
+            header('table_rows_skipped_total', 'counter', 'Unchanged rows skipped per table.')
+            for name, stats in tables:
+                lines.append(f'{p}_table_rows_skipped_total{{table="{name}"}} {stats.skipped}')
+            header('table_rows_quarantined_total', 'counter', 'Malformed items quarantined per table.')
+            for name, stats in tables:
+                lines.append(f'{p}_table_rows_quarantined_total{{table="{name}"}} {stats.quarantined}')
+            header('table_write_seconds_total', 'counter', 'Time spent writing rows per table.')
+            for name, stats in tables:
+                lines.append(f'{p}_table_write_seconds_total{{table="{name}"}} {stats.seconds:.6f}')
+
+            header('flush_duration_seconds', 'summary', 'Database commit duration.')
+            lines.append(f'{p}_flush_duration_seconds_sum {self._flushes.sum:.6f}')
+            lines.append(f'{p}_flush_duration_seconds_count {self._flushes.count}')
+
+            if self._memory:
+                header('stage_peak_rss_bytes', 'gauge', 'Peak resident memory per pipeline stage.')
+                for stage, peak in sorted(self._memory.items()):
+                    lines.append(f'{p}_stage_peak_rss_bytes{{stage="{stage}"}} {peak}')
+
+            concurrency = self._concurrency
+            if concurrency is not None:
+                header('concurrency_limit', 'gauge', 'Current adaptive limit on concurrent API requests.')
+                lines.append(f'{p}_concurrency_limit {concurrency.limit}')
+                header('concurrency_limit_changes_total', 'counter', 'Adaptive concurrency limit changes.')
+                lines.append(f'{p}_concurrency_limit_changes_total{{decision="increase"}} {concurrency.increases}')
+                lines.append(f'{p}_concurrency_limit_changes_total{{decision="decrease"}} {concurrency.decreases}')
+
+        header('run_duration_seconds', 'gauge', 'Wall time of the extraction run so far.')
+        lines.append(f'{p}_run_duration_seconds {time.perf_counter() - self._start:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus_textfile(self, path: str):
+        """
+        Writes the metrics to a textfile for the node_exporter textfile collector.
+
+        The file is written to a temporary name and renamed into place so the
+        collector never reads a partially written file.
+        """
+        _atomic_write(path, self.to_prometheus())
+
+    def write_json_summary(self, path: str):
+        """Writes the run summary as JSON."""
+        _atomic_write(path, json.dumps(self.summary(), indent=2) + '\n')
+
+
+def _atomic_write(path: str, content: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, path)
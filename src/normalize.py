@@ -0,0 +1,190 @@
+"""
+Turns Classroom API items into database rows.
+
+Each table's row is described once, in ENTITY_FIELDS: its columns in order,
+the API field each is read from, which fields an item must have, and which
+go into the content hash. From that description a normalizer function is
+generated and compiled when the module is imported, one per table. A
+normalizer reads each field with a single subscript or get(), with no loops
+or lookups in the mapping, and returns the row as a tuple in column order,
+ready to bind positionally, a page at a time, with executemany().
+
+An item lacking a required field (or with it set to null) raises
+MalformedItemError from its normalizer. normalize_items() sets such items
+aside with the reason, to be quarantined instead of aborting the run.
+"""
+
+import hashlib
+import json
+from collections import namedtuple
+
+# A column of a table's row, read from the item's field at path ('a.b' for
+# a nested field). A required field must be present and not null. Hashed
+# fields make up the content hash, in column order; a flag is stored as 1 or
+# 0 and hashed (as its path) only when set, so that adding one to a table
+# does not change the hash of rows saved before.
+Field = namedtuple('Field', ['column', 'path', 'required', 'hashed', 'flag'], defaults=(False, False, False))
+
+# Where a table's content hash (CNTNT_HSH) goes among its columns
+HASH = Field('CNTNT_HSH', None)
+
+ENTITY_FIELDS = {
+    'USRS': (
+        Field('ID', 'id', required=True),
+        Field('NM', 'name.fullName', required=True, hashed=True),
+        Field('EML', 'emailAddress', required=True, hashed=True),
+        Field('PHT_URL', 'photoUrl', hashed=True),
+        HASH,
+    ),
+    'CRSS': (
+        Field('ID', 'id', required=True),
+        Field('NM', 'name', required=True, hashed=True),
+        Field('SCTN', 'section', hashed=True),
+        Field('DSCRPTN', 'description', hashed=True),
+        Field('CRTN_TM', 'creationTime', required=True),
+        Field('UPDT_TM', 'updateTime', required=True, hashed=True),
+        Field('CRS_STT', 'courseState', required=True, hashed=True),
+        HASH,
+    ),
+    'ANNCMNTS': (
+        Field('ID', 'id', required=True),
+        Field('CRS_ID', 'courseId', required=True),
+        Field('CRTR_USR_ID', 'creatorUserId', required=True),
+        Field('TXT', 'text', hashed=True),
+        Field('STT', 'state', hashed=True),
+        Field('CRTN_TM', 'creationTime', required=True),
+        Field('UPDT_TM', 'updateTime', required=True, hashed=True),
+        HASH,
+    ),
+    'CRS_WRK': (
+        Field('ID', 'id', required=True),
+        Field('CRS_ID', 'courseId', required=True),
+        Field('TTL', 'title', required=True, hashed=True),
+        Field('DSCRPTN', 'description', hashed=True),
+        Field('WRK_TYP', 'workType', hashed=True),
+        Field('MX_PNTS', 'maxPoints', hashed=True),
+        Field('CRTN_TM', 'creationTime', required=True),
+        Field('UPDT_TM', 'updateTime', required=True, hashed=True),
+        HASH,
+        Field('CRTR_USR_ID', 'creatorUserId', hashed=True),
+    ),
+    'STDNT_SBMSSNS': (
+        Field('ID', 'id', required=True),
+        Field('CRS_WRK_ID', 'courseWorkId', required=True),
+        Field('USR_ID', 'userId', required=True),
+        Field('STT', 'state', hashed=True),
+        Field('ASSGND_GRD', 'assignedGrade', hashed=True),
+        Field('DRFT_GRD', 'draftGrade', hashed=True),
+        Field('CRTN_TM', 'creationTime', required=True),
+        Field('UPDT_TM', 'updateTime', required=True, hashed=True),
+        HASH,
+        Field('LT', 'late', hashed=True, flag=True),
+    ),
+}
+
+# Each table's columns, in the order of its rows
+COLUMNS = {table: tuple(field.column for field in fields) for table, fields in ENTITY_FIELDS.items()}
+
+# An item set aside, and why
+Rejected = namedtuple('Rejected', ['item', 'reason'])
+
+class MalformedItemError(Exception):
+    """Custom exception for API items that cannot be saved."""
+    pass
+
+def content_hash(*values) -> int:
+    """Returns a 64-bit hash of the given field values, stored as an INTEGER."""
+    digest = hashlib.blake2b(repr(values).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def _lookup(item, path: str):
+    """Returns the field at path, or None if it or an object on the way is missing."""
+    for key in path.split('.'):
+        if not isinstance(item, dict):
+            return None
+        item = item.get(key)
+    return item
+
+def _missing(item, paths: tuple) -> str:
+    """Describes what makes an item malformed: the required fields it lacks."""
+    if not isinstance(item, dict):
+        return f"not an object: {type(item).__name__}"
+    return "missing required fields: " + ", ".join(path for path in paths if _lookup(item, path) is None)
+
+def _source(fields: tuple) -> str:
+    """Returns the source of a normalizer for rows of the given fields."""
+    required = [(i, field) for i, field in enumerate(fields) if field.required]
+    paths = tuple(field.path for _, field in required)
+    lines = ["def normalize(item):", "    try:"]
+    lines += [f"        v{i} = item" + ''.join(f"[{key!r}]" for key in field.path.split('.'))
+              for i, field in required]
+    lines += [
+        "    except (KeyError, TypeError):",
+        f"        raise MalformedItemError(_missing(item, {paths!r})) from None",
+        f"    if {' or '.join(f'v{i} is None' for i, _ in required)}:",
+        f"        raise MalformedItemError(_missing(item, {paths!r}))",
+        "    get = item.get",
+    ]
+    for i, field in enumerate(fields):
+        if field.flag:
+            lines.append(f"    v{i} = 1 if get({field.path!r}) else 0")
+        elif not (field.required or field is HASH):
+            lines.append(f"    v{i} = get({field.path!r})")
+    hashed = ', '.join(f"*(({field.path!r},) if v{i} else ())" if field.flag else f"v{i}"
+                       for i, field in enumerate(fields) if field.hashed)
+    values = ', '.join(f"content_hash({hashed})" if field is HASH else f"v{i}" for i, field in enumerate(fields))
+    lines.append(f"    return ({values})")
+    return '\n'.join(lines) + '\n'
+
+def compile_normalizer(table: str, fields: tuple):
+    """
+    Generates and compiles the normalizer of a table's rows.
+
+    Args:
+        table: The table name, used to name the function.
+        fields: The table's Fields, in column order. Optional fields are read
+                from the top level of an item only.
+
+    Returns:
+        A function taking an API item and returning its row as a tuple, or
+        raising MalformedItemError if the item lacks a required field.
+    """
+    source = _source(fields)
+    namespace = {'MalformedItemError': MalformedItemError, '_missing': _missing, 'content_hash': content_hash}
+    exec(compile(source, f"<normalizer {table}>", 'exec'), namespace)
+    normalize = namespace['normalize']
+    normalize.__name__ = normalize.__qualname__ = f"normalize_{table.lower()}"
+    normalize.__doc__ = f"Returns the {table} row of an API item.\n\n{source}"
+    return normalize
+
+NORMALIZERS = {table: compile_normalizer(table, fields) for table, fields in ENTITY_FIELDS.items()}
+
+def normalize_items(table: str, items) -> tuple:
+    """
+    Normalizes a page of API items into rows of a table.
+
+    Returns:
+        A tuple of (rows, rejected): the rows of the well-formed items, in
+        order, and a Rejected for each malformed one.
+    """
+    normalize = NORMALIZERS[table]
+    rows, rejected = [], []
+    append = rows.append
+    for item in items:
+        try:
+            append(normalize(item))
+        except MalformedItemError as e:
+            rejected.append(Rejected(item, str(e)))
+    return rows, rejected
+
+def listed_ids(items) -> list:
+    """
+    Returns the IDs of a page of listed items, malformed ones included, so
+    that a row saved from an item before is not purged because the item is
+    malformed now.
+    """
+    return [item['id'] for item in items if isinstance(item, dict) and item.get('id') is not None]
+
+def quarantine_payload(item) -> str:
+    """Returns a malformed item as JSON, as stored in the quarantine table."""
+    return json.dumps(item, sort_keys=True, default=str)
@@ -0,0 +1,206 @@
+"""
+Optional profiling of the extraction pipeline.
+
+The StageProfiler records wall and CPU time for each pipeline stage, both in
+total and per course, and can additionally capture a cProfile dump of the
+whole run and tracemalloc allocation snapshots. A stage's CPU time is that of
+the thread running it plus that of the worker threads it hands work to (the
+submission fetches), each of which reports its own through worker(). When profiling is switched off
+the pipeline uses NULL_PROFILER, whose stages are a shared no-op context
+manager, so a normal run pays nothing for the instrumentation.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Number of allocation sites listed in the tracemalloc report.
+TRACEMALLOC_TOP = 25
+
+
+class _StageTimes:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_traced_bytes = 0
+
+    def as_dict(self) -> dict:
+        stats = {
+            'calls': self.calls,
+            'wall_seconds': round(self.wall, 6),
+            'cpu_seconds': round(self.cpu, 6),
+        }
+        if self.peak_traced_bytes:
+            stats['peak_traced_bytes'] = self.peak_traced_bytes
+        return stats
+
+
+class StageProfiler:
+    """
+    Records per-stage and per-course timings for an extraction run.
+
+    Args:
+        output_dir: Directory the profile outputs are written to.
+        use_cprofile: Whether to write a cProfile .pstats dump of the run.
+        use_tracemalloc: Whether to trace allocations, recording the peak
+                         traced memory per stage and a top-allocations report.
+    """
+
+    enabled = True
+
+    def __init__(self, output_dir: str = 'profile', use_cprofile: bool = False,
+                 use_tracemalloc: bool = False):
+        self.output_dir = output_dir
+        self.use_cprofile = use_cprofile
+        self.use_tracemalloc = use_tracemalloc
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._courses = {}
+        self._cprofile = None
+        self._wall_start = None
+        # CPU time reported by worker threads, and the thread of the stage they work for
+        self._worker_cpu = 0.0
+        self._stage_thread = None
+
+    def start(self):
+        """Starts run-level profiling (cProfile and tracemalloc, if enabled)."""
+        self._wall_start = time.perf_counter()
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.use_cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    @contextmanager
+    def stage(self, name: str, course_id: str = None):
+        """
+        Context manager that times one pipeline stage.
+
+        Args:
+            name: The stage name, e.g. 'students'.
+            course_id: The course being processed, if the stage is per course.
+        """
+        if self.use_tracemalloc:
+            tracemalloc.reset_peak()
+        with self._lock:
+            self._stage_thread = threading.get_ident()
+            worker_cpu_start = self._worker_cpu
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            peak = tracemalloc.get_traced_memory()[1] if self.use_tracemalloc else 0
+            with self._lock:
+                # Stages run one after another, so the workers' CPU time since the start is this stage's
+                cpu += self._worker_cpu - worker_cpu_start
+                self._add(self._stages, name, wall, cpu, peak)
+                if course_id is not None:
+                    self._add(self._courses.setdefault(course_id, {}), name, wall, cpu, peak)
+
+    @contextmanager
+    def worker(self):
+        """
+        Context manager for work a stage hands to another thread, whose CPU
+        time is then added to the stage's. Work done in the stage's own
+        thread (a single worker runs there) is already counted.
+        """
+        thread = threading.get_ident()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            # A generator closed by the garbage collector may finish in another thread
+            if threading.get_ident() == thread and thread != self._stage_thread:
+                cpu = time.thread_time() - cpu_start
+                with self._lock:
+                    self._worker_cpu += cpu
+
+    @staticmethod
+    def _add(stages: dict, name: str, wall: float, cpu: float, peak: int):
+        times = stages.get(name)
+        if times is None:
+            times = stages[name] = _StageTimes()
+        times.calls += 1
+        times.wall += wall
+        times.cpu += cpu
+        times.peak_traced_bytes = max(times.peak_traced_bytes, peak)
+
+    def summary(self) -> dict:
+        """Returns the recorded timings as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                'wall_seconds': round(time.perf_counter() - self._wall_start, 6) if self._wall_start else 0.0,
+                'stages': {name: times.as_dict() for name, times in self._stages.items()},
+                'courses': {
+                    course_id: {name: times.as_dict() for name, times in stages.items()}
+                    for course_id, stages in self._courses.items()
+                },
+            }
+
+    def stop(self):
+        """
+        Stops profiling and writes the outputs to the output directory.
+
+        Always writes 'stages.json'; also writes 'run.pstats' when cProfile is
+        enabled and 'tracemalloc_top.txt' when tracemalloc is enabled.
+        """
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(os.path.join(self.output_dir, 'run.pstats'))
+            self._cprofile = None
+
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            with open(os.path.join(self.output_dir, 'tracemalloc_top.txt'), 'w', encoding='utf-8') as f:
+                for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+                    f.write(f"{stat}\n")
+
+        summary = self.summary()
+        with open(os.path.join(self.output_dir, 'stages.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+        lines = ["Stage timings (wall / CPU seconds):"]
+        for name, stats in summary['stages'].items():
+            lines.append(f"  {name:<15} {stats['wall_seconds']:>10.3f} {stats['cpu_seconds']:>10.3f}  ({stats['calls']} calls)")
+        lines.append(f"Profile written to '{self.output_dir}'.")
+        logger.info("\n".join(lines))
+
+
+class _NullProfiler:
+    """Stand-in used when profiling is off; every stage is a shared no-op."""
+
+    enabled = False
+    _null_stage = nullcontext()
+
+    def start(self):
+        pass
+
+    def stage(self, name: str, course_id: str = None):
+        return self._null_stage
+
+    def worker(self):
+        return self._null_stage
+
+    def summary(self) -> dict:
+        return {}
+
+    def stop(self):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
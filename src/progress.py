@@ -0,0 +1,238 @@
+"""
+Progress reporting and non-blocking logging for the extraction.
+
+Instead of a line per course work item, the extraction logs a progress
+line at most once per interval. Each line gives courses done and remaining,
+rows per second for each table, API calls per second and an ETA. The
+numbers are also attached to the log record, so the JSON log format emits
+them as fields.
+
+Log records are handed to a queue and written by a background thread
+(logging.handlers.QueueListener), so a slow console or log shipper never
+holds up the extraction. When several tenants are extracted at once, each
+record is tagged with the tenant it was logged for (current_tenant).
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+# Loggers of this application; everything else (e.g. googleapiclient) only
+# logs warnings and errors
+APPLICATION_LOGGERS = ('__main__', 'main', 'src')
+
+# Seconds between progress lines
+DEFAULT_INTERVAL = 10.0
+
+# Entity names used in progress lines, per table
+ENTITY_NAMES = {
+    'CRSS': 'courses',
+    'USRS': 'users',
+    'ENRLLMNTS': 'enrollments',
+    'ANNCMNTS': 'announcements',
+    'CRS_WRK': 'course work',
+    'STDNT_SBMSSNS': 'submissions',
+}
+
+# The tenant being extracted by the current thread, if any
+current_tenant = contextvars.ContextVar('current_tenant', default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class _TenantFilter(logging.Filter):
+    """
+    Tags each record with the current tenant.
+
+    It is attached to the QueueHandler, so it runs in the thread that logs
+    the record, where current_tenant is that thread's tenant. On the
+    listener's handlers it would run in the writer thread and see no tenant.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.tenant = current_tenant.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line, including any progress fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        tenant = getattr(record, 'tenant', None)
+        if tenant:
+            entry['tenant'] = tenant
+        progress = getattr(record, 'progress', None)
+        if progress:
+            entry['progress'] = progress
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _TextFormatter(logging.Formatter):
+    """Plain messages for information, with the level shown for warnings and errors."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        if record.levelno >= logging.WARNING:
+            message = f"{record.levelname}: {message}"
+        tenant = getattr(record, 'tenant', None)
+        if tenant:
+            message = f"[{tenant}] {message}"
+        return message
+
+
+def start_logging(log_format: str = 'text', verbose: bool = False,
+                  stream=None) -> logging.handlers.QueueListener:
+    """
+    Routes log output through a queue to a background writer thread.
+
+    Args:
+        log_format: 'text' for plain lines or 'json' for one JSON object per line.
+        verbose: Also log per-item detail (DEBUG level) from the application.
+        stream: Where to write everything. By default, information goes to
+                standard output and warnings and errors to standard error,
+                so wrappers that split the two still see the errors apart.
+
+    Returns:
+        The running QueueListener. Pass it to stop_logging() to flush and stop it.
+    """
+    if stream is not None:
+        handlers = [logging.StreamHandler(stream)]
+    else:
+        handlers = [logging.StreamHandler(sys.stdout), logging.StreamHandler(sys.stderr)]
+        handlers[0].addFilter(lambda record: record.levelno < logging.WARNING)
+        handlers[1].setLevel(logging.WARNING)
+    formatter = JsonFormatter() if log_format == 'json' else _TextFormatter('%(message)s')
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        root.removeHandler(existing)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_TenantFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(logging.WARNING)
+    for name in APPLICATION_LOGGERS:
+        logging.getLogger(name).setLevel(logging.DEBUG if verbose else logging.INFO)
+
+    listener.start()
+    return listener
+
+
+def stop_logging(listener: logging.handlers.QueueListener):
+    """Writes any queued records and stops the background writer."""
+    if listener is not None:
+        listener.stop()
+        root = logging.getLogger()
+        for existing in [h for h in root.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+            root.removeHandler(existing)
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+class ProgressReporter:
+    """
+    Logs rate-limited progress lines from the run metrics and the course count.
+
+    Args:
+        total_courses: The number of courses in the run.
+        metrics: The run's MetricsRecorder, which supplies API call and row counts.
+        interval: The minimum number of seconds between progress lines.
+        clock: The time source, replaceable for testing.
+    """
+
+    def __init__(self, total_courses: int, metrics, interval: float = DEFAULT_INTERVAL,
+                 clock=time.monotonic):
+        self.total_courses = total_courses
+        self.metrics = metrics
+        self.interval = interval
+        self.clock = clock
+        self.courses_done = 0
+        self._started = clock()
+        self._last_time = self._started
+        self._last_requests, self._last_rows = metrics.progress_counts()
+        self._first_requests, self._first_rows = self._last_requests, self._last_rows
+
+    def course_done(self):
+        """Records a finished course and reports if the interval has passed."""
+        self.courses_done += 1
+        self.maybe_report()
+
+    def maybe_report(self):
+        """Reports progress if at least one interval has passed since the last report."""
+        if self.clock() - self._last_time >= self.interval:
+            self.report()
+
+    def snapshot(self, whole_run: bool = False) -> dict:
+        """
+        Returns the current progress figures and starts a new rate window.
+
+        Rates are per second over the window since the previous snapshot, or
+        over the whole run if whole_run is set. The ETA extrapolates the
+        average time per course so far.
+        """
+        now = self.clock()
+        requests, rows = self.metrics.progress_counts()
+        if whole_run:
+            since, base_requests, base_rows = self._started, self._first_requests, self._first_rows
+        else:
+            since, base_requests, base_rows = self._last_time, self._last_requests, self._last_rows
+        window = max(now - since, 1e-9)
+        elapsed = now - self._started
+        remaining = self.total_courses - self.courses_done
+
+        rates = {
+            ENTITY_NAMES.get(table, table): round((count - base_rows.get(table, 0)) / window, 1)
+            for table, count in sorted(rows.items())
+        }
+        progress = {
+            'courses_done': self.courses_done,
+            'courses_total': self.total_courses,
+            'courses_remaining': remaining,
+            'elapsed_seconds': round(elapsed, 1),
+            'api_calls_per_second': round((requests - base_requests) / window, 1),
+            'rows_per_second': rates,
+            'eta_seconds': round(elapsed / self.courses_done * remaining, 1) if self.courses_done else None,
+        }
+        self._last_time, self._last_requests, self._last_rows = now, requests, rows
+        return progress
+
+    def report(self, final: bool = False):
+        """Logs a progress line. The final line gives rates over the whole run."""
+        progress = self.snapshot(whole_run=final)
+        done, total = progress['courses_done'], progress['courses_total']
+        percent = 100.0 * done / total if total else 100.0
+        rates = ', '.join(f"{name} {rate:g}/s" for name, rate in progress['rows_per_second'].items() if rate)
+        parts = [f"{done}/{total} courses ({percent:.1f}%)"]
+        if rates:
+            parts.append(rates)
+        parts.append(f"API {progress['api_calls_per_second']:g} calls/s")
+        if final:
+            parts.append(f"finished in {_duration(progress['elapsed_seconds'])}")
+        elif progress['eta_seconds'] is not None:
+            parts.append(f"ETA {_duration(progress['eta_seconds'])}")
+        logger.info("Progress: " + "; ".join(parts), extra={'progress': progress})
@@ -0,0 +1,101 @@
+"""
+Publishes a read-only snapshot of the extraction database for reporting.
+
+The extractor writes to its working database (DATABASE.PATH) in long
+transactions, and a course is only complete when its transaction commits.
+Readers that open that file can wait on its locks and see some courses from
+this run and some from the last. Instead, readers open the published
+snapshot (DATABASE.PUBLISH_PATH), which only ever changes by being replaced
+as a whole:
+
+*   `VACUUM INTO` copies the committed state of the working database into a
+    temporary file beside the snapshot, in one read transaction, leaving out
+    free pages and fragmentation;
+*   the copy's full-text indexes are rebuilt, since the copy may renumber
+    the rowids they refer to, and ANALYZE gathers statistics for the
+    query planner;
+*   the finished file is renamed over the previous snapshot. The rename is
+    atomic: a new connection opens either the old snapshot or the new one,
+    and connections already open keep reading the old file until they close.
+"""
+
+import logging
+import os
+import sqlite3
+import stat
+from sqlite3 import Connection
+
+from src.search import SEARCH_INDEXES
+
+logger = logging.getLogger(__name__)
+
+def _search_indexes(conn: Connection) -> list:
+    """Returns the full-text indexes present in the database."""
+    present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    return [index for index in SEARCH_INDEXES if index in present]
+
+def _finish_snapshot(path: str):
+    """Rebuilds the search indexes of a fresh snapshot and analyzes it."""
+    snapshot = sqlite3.connect(path)
+    try:
+        indexes = _search_indexes(snapshot)
+        if indexes:
+            # Empty the indexes and compact again before rebuilding, so the
+            # index built against the old rowids leaves no free pages behind
+            for index in indexes:
+                snapshot.execute(f"INSERT INTO {index} ({index}) VALUES ('delete-all');")
+            snapshot.commit()
+            snapshot.execute("VACUUM;")
+            for index in indexes:
+                snapshot.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild');")
+                snapshot.execute(f"INSERT INTO {index} ({index}) VALUES ('optimize');")
+        snapshot.execute("ANALYZE;")
+        snapshot.commit()
+    finally:
+        snapshot.close()
+
+def _sync_directory(path: str):
+    """Makes a rename in the directory holding path durable, where the OS allows it."""
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def publish_snapshot(conn: Connection, dest_path: str) -> int:
+    """
+    Publishes a compact, analyzed snapshot of the database behind conn.
+
+    Args:
+        conn: A connection to the working extraction database. Pending
+              changes are committed first.
+        dest_path: The file path of the published snapshot. A previous
+                   snapshot there is replaced.
+
+    Returns:
+        The size of the published snapshot in bytes.
+    """
+    temp_path = f"{dest_path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    conn.commit()
+    try:
+        conn.execute("VACUUM INTO ?;", (temp_path,))
+        _finish_snapshot(temp_path)
+        # Published snapshots are for reading; a new one replaces the file
+        # rather than writing into it
+        if os.name == 'posix':
+            os.chmod(temp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _sync_directory(dest_path)
+
+    size = os.path.getsize(dest_path)
+    logger.info(f"Snapshot published to '{dest_path}' ({size / 1048576:.1f} MiB).")
+    return size
@@ -0,0 +1,281 @@
+"""
+Read-side query service for dashboards.
+
+Dashboards ask the same few questions of the analytics views (and the
+engagement rollups) over and over between runs, and each time SQLite runs
+the view's joins again. QueryService answers them from a result cache that
+is only invalidated when the database changes, which, for the published
+snapshot, is once per extraction run:
+
+*   Queries run on a small pool of read-only connections. A query is a view
+    with equality filters on its columns and an optional row limit; its SQL
+    text depends only on the view and the filtered columns, so each
+    connection's statement cache keeps it prepared.
+*   Results are cached, least recently used first out, under the version of
+    the database file: its identity, modification time and size. The
+    published snapshot is replaced once per run, so its version changes
+    only then; the working database changes with every commit. When the
+    version changes the whole cache is dropped, and connections opened on a
+    replaced snapshot are reopened.
+*   Each result carries an ETag made from the run (the latest in RNS, if the
+    change log records runs), the version and the query, so HTTP clients
+    can revalidate a dashboard with If-None-Match and get an empty 304
+    response until the next run.
+
+serve_http() exposes the service on a local HTTP port:
+
+    GET /views                                      the views and their columns
+    GET /views/VW_ASSGNMNT_GRDS?CRS_NM=Biology&limit=100
+
+Results are JSON objects with the columns, the rows and the run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from src.database import ANALYTICS_VIEWS
+
+logger = logging.getLogger(__name__)
+
+class QueryError(Exception):
+    """Custom exception for query service errors."""
+    pass
+
+# The views and tables that can be queried, when present in the database
+QUERYABLE = tuple(name for name, _ in ANALYTICS_VIEWS) + ('CRS_RLLPS', 'STDNT_RLLPS')
+
+# Connections in the pool, and results kept in the cache, unless configured otherwise
+DEFAULT_CONNECTIONS = 4
+DEFAULT_CACHE_ENTRIES = 256
+
+# Prepared statements each connection keeps
+STATEMENT_CACHE_SIZE = 256
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# A query's answer. body is the JSON the HTTP endpoint sends, encoded once.
+QueryResult = namedtuple('QueryResult', ['columns', 'rows', 'run_id', 'etag', 'body'])
+
+@lru_cache(maxsize=None)
+def _sql(view: str, columns: tuple, limited: bool) -> str:
+    """Returns the SQL of a query, the same text for the same view and filtered columns."""
+    where = " WHERE " + " AND ".join(f"{column} = ?" for column in columns) if columns else ""
+    return f"SELECT * FROM {view}{where}{' LIMIT ?' if limited else ''};"
+
+def _latest_run(conn: sqlite3.Connection):
+    """Returns the ID of the latest run in RNS, or None if the change log has recorded none."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'RNS';").fetchone():
+        return None
+    return conn.execute("SELECT MAX(ID) FROM RNS;").fetchone()[0]
+
+def _etag(run_id, version: tuple, key: tuple) -> str:
+    """Returns the ETag of a query's result: the run, and a hash of the database version and the query."""
+    digest = hashlib.blake2b(repr((version, key)).encode('utf-8'), digest_size=8).hexdigest()
+    return f'"{run_id or 0}-{digest}"'
+
+class QueryService:
+    """
+    Answers queries of the analytics views from a database, caching results
+    until the database changes.
+
+    Args:
+        path: The SQLite database, usually the published snapshot.
+        connections: The most read-only connections open at once.
+        cache_entries: The most results kept in the cache. 0 disables it.
+    """
+
+    def __init__(self, path: str, connections: int = DEFAULT_CONNECTIONS,
+                 cache_entries: int = DEFAULT_CACHE_ENTRIES):
+        if not os.path.exists(path):
+            raise QueryError(f"No database at '{path}'.")
+        self.path = path
+        self.cache_entries = cache_entries
+        self._slots = threading.BoundedSemaphore(max(1, connections))
+        self._idle = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._version = None
+        with self._lease() as conn:
+            self._columns = {
+                name: tuple(row[1] for row in conn.execute(f"PRAGMA table_info({name});"))
+                for (name,) in conn.execute(
+                    f"SELECT name FROM sqlite_master WHERE name IN ({', '.join('?' * len(QUERYABLE))});", QUERYABLE
+                )
+            }
+        if not self._columns:
+            raise QueryError(f"'{path}' has no analytics views. Run an extraction first.")
+
+    @staticmethod
+    def _identity(stat) -> tuple:
+        """Returns what identifies a database file: a published snapshot replaced is a new file."""
+        return stat.st_dev, stat.st_ino
+
+    @contextmanager
+    def _lease(self, identity: tuple = None):
+        """
+        Context manager yielding a read-only connection for the current
+        thread's sole use. A connection opened on a file since replaced would
+        go on reading the old snapshot, so it is reopened.
+        """
+        identity = identity or self._identity(os.stat(self.path))
+        with self._slots:
+            try:
+                conn, opened_on = self._idle.get_nowait()
+            except queue.Empty:
+                conn, opened_on = None, None
+            if conn is not None and opened_on != identity:
+                conn.close()
+                conn = None
+            if conn is None:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+                                       cached_statements=STATEMENT_CACHE_SIZE)
+            try:
+                yield conn
+            finally:
+                self._idle.put((conn, identity))
+
+    def views(self) -> dict:
+        """Returns the views and tables that can be queried, with their columns."""
+        return dict(self._columns)
+
+    def query(self, view: str, filters: dict = None, limit: int = None) -> QueryResult:
+        """
+        Returns the rows of a view, from the cache if the database has not
+        changed since they were read.
+
+        Args:
+            view: One of the analytics views, or a rollup table.
+            filters: Column -> value; only rows with those values are returned.
+            limit: The most rows returned, or None for all.
+
+        Raises:
+            QueryError: If the view or a column does not exist, or the limit is invalid.
+        """
+        filters = filters or {}
+        columns = self._columns.get(view)
+        if columns is None:
+            raise QueryError(f"Unknown view '{view}'. Choose from: {', '.join(sorted(self._columns))}.")
+        unknown = sorted(set(filters) - set(columns))
+        if unknown:
+            raise QueryError(f"Unknown columns of {view}: {', '.join(unknown)}.")
+        if limit is not None and (not isinstance(limit, int) or limit < 0):
+            raise QueryError(f"Invalid limit: {limit!r}.")
+
+        filtered = tuple(sorted(filters))
+        key = (view, tuple((column, filters[column]) for column in filtered), limit)
+        stat = os.stat(self.path)
+        version = (self._identity(stat), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            result = self._cache.get(key) if version == self._version else None
+            if result is not None:
+                self._cache.move_to_end(key)
+                return result
+
+        with self._lease(version[0]) as conn:
+            run_id = _latest_run(conn)
+            params = [filters[column] for column in filtered] + ([limit] if limit is not None else [])
+            rows = conn.execute(_sql(view, filtered, limit is not None), params).fetchall()
+
+        etag = _etag(run_id, version, key)
+        body = json.dumps({'view': view, 'run': run_id, 'columns': columns, 'rows': rows},
+                          default=str).encode('utf-8')
+        result = QueryResult(columns, rows, run_id, etag, body)
+        with self._lock:
+            if version != self._version:
+                # The first query since the database changed
+                self._cache.clear()
+                self._version = version
+                logger.info(f"Query cache cleared for run {run_id}.")
+            if self.cache_entries:
+                self._cache[key] = result
+                if len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return result
+
+    def close(self):
+        """Closes the idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait()[0].close()
+            except queue.Empty:
+                return
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers GET requests from the server's QueryService."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        if parts == ['views']:
+            self._send(200, json.dumps(self.server.service.views()).encode('utf-8'))
+            return
+        if len(parts) != 2 or parts[0] != 'views':
+            self._send_error(404, f"Not found: {url.path}. Use /views or /views/<view>.")
+            return
+
+        filters = dict(parse_qsl(url.query, keep_blank_values=True))
+        limit = filters.pop('limit', None)
+        try:
+            if limit is not None:
+                if not limit.isdigit():
+                    raise QueryError(f"Invalid limit: {limit!r}.")
+                limit = int(limit)
+            result = self.server.service.query(parts[1], filters, limit)
+        except QueryError as e:
+            self._send_error(404 if parts[1] not in self.server.service.views() else 400, str(e))
+            return
+        except sqlite3.Error as e:
+            self._send_error(503, f"Query failed: {e}")
+            return
+
+        if self.headers.get('If-None-Match') == result.etag:
+            self._send(304, b'', result.etag)
+        else:
+            self._send(200, result.body, result.etag)
+
+    def _send(self, status: int, body: bytes, etag: str = None):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+            # Clients may keep the result, but must revalidate it each time
+            self.send_header('Cache-Control', 'no-cache')
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send(status, json.dumps({'error': message}).encode('utf-8'))
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def serve_http(service: QueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """
+    Returns an HTTP server answering queries from the service, one thread per
+    request. Call serve_forever() on it to start serving.
+
+    Args:
+        service: The QueryService to answer from.
+        host: The address to listen on; by default only this machine can connect.
+        port: The port to listen on, or 0 for any free port.
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
@@ -0,0 +1,139 @@
+"""
+Targeted refresh of a few courses, without running the whole extraction.
+
+When a teacher reports a grading issue, support can bring just that course
+(or every course of one user) up to date in seconds:
+
+*   each course is fetched by its ID;
+*   the courses' teachers, students, announcements and course work are
+    listed, then the submissions of every course work item, on worker threads
+    that each use their own API client, while the calling thread saves the
+    pages as the extraction does;
+*   rows deleted in Classroom from these courses' listings are removed, as
+    PURGE_DELETED does in a full run. A listing that failed is not used to
+    delete anything and is recorded as a dead letter, for the 'replay'
+    command.
+
+Nothing outside the given courses is read or changed. A course Classroom no
+longer has is reported and left for the next full run to remove.
+"""
+
+import logging
+
+from src.concurrency import fetch_concurrently
+from src.extractor import get_course, iter_listing_pages
+from src.metrics import MetricsRecorder
+from src.replay import COURSE_LISTINGS, save_listing_page
+
+logger = logging.getLogger(__name__)
+
+# Listing endpoint -> the collection it is recorded under for deletion detection
+_COLLECTIONS = {
+    'courses.teachers.list': 'TEACHERS',
+    'courses.students.list': 'STUDENTS',
+    'courses.announcements.list': 'ANNCMNTS',
+    'courses.courseWork.list': 'CRS_WRK',
+    'courses.courseWork.studentSubmissions.list': 'STDNT_SBMSSNS',
+}
+
+def courses_for_user(storage, user: str) -> list:
+    """
+    Returns the IDs of the courses a user is enrolled in, as teacher or student.
+
+    Args:
+        storage: The StorageBackend to look the enrollments up in.
+        user: The user's ID or email address.
+    """
+    rows = storage.query("""
+        SELECT DISTINCT CRS_ID FROM ENRLLMNTS
+        WHERE USR_ID = ? OR USR_ID IN (SELECT ID FROM USRS WHERE EML = ?)
+        ORDER BY CRS_ID;
+    """, (user, user))
+    return [row[0] for row in rows]
+
+def _params(job: tuple) -> dict:
+    endpoint, course_id, course_work_id = job
+    if course_work_id is None:
+        return {'courseId': course_id}
+    return {'courseId': course_id, 'courseWorkId': course_work_id}
+
+def refresh_courses(storage, services, course_ids, masking_level: str = 'none', purge_deleted: bool = True,
+                    metrics: MetricsRecorder = None, limiter=None, workers: int = 1) -> dict:
+    """
+    Re-extracts the given courses with their rosters, content and submissions.
+
+    Args:
+        storage: The StorageBackend to save to. Changes are committed at the end.
+        services: A ServicePool of API services, one per worker thread.
+        course_ids: The IDs of the courses to refresh.
+        masking_level: The PII masking level for teachers and students.
+        purge_deleted: Whether to remove rows deleted from the courses' listings.
+        metrics: An optional MetricsRecorder for the requests and rows.
+        limiter: An optional AdaptiveLimiter shared by the workers.
+        workers: The most listings fetched at once.
+
+    Returns:
+        A dict with the IDs of the courses refreshed ('courses'), of those
+        not found ('missing') and of those quarantined as malformed
+        ('quarantined'), the pages and items fetched, the listings that
+        failed, the rows deleted per collection and the API calls made.
+    """
+    metrics = metrics or MetricsRecorder()
+    course_ids = list(dict.fromkeys(course_ids))
+    summary = {'courses': [], 'missing': [], 'quarantined': [], 'pages': 0, 'items': 0, 'failed_listings': 0,
+               'deleted': {}}
+    if purge_deleted:
+        storage.begin_seen_tracking()
+
+    def fetch_course(course_id):
+        with services.lease() as service:
+            yield [get_course(service, course_id, metrics, limiter)]
+
+    for course_id, page in fetch_concurrently(course_ids, fetch_course, workers):
+        if page is None:
+            continue
+        course = page[0]
+        if course is None:
+            logger.warning(f"Course {course_id} was not found in Classroom.")
+            summary['missing'].append(course_id)
+            continue
+        if storage.save_course(course) is None:
+            # Quarantined: its rosters and content are not refreshed without a course row to refer to
+            summary['quarantined'].append(course_id)
+            continue
+        summary['courses'].append(course_id)
+
+    # The courses' listings, then the submissions of the course work they found
+    jobs = [(endpoint, course_id, None) for course_id in summary['courses'] for endpoint in COURSE_LISTINGS]
+    while jobs:
+        failures = {job: [] for job in jobs}
+        saved_ids = {job: [] for job in jobs}
+        follow_up = []
+
+        def listing_pages(job):
+            with services.lease() as service:
+                yield from iter_listing_pages(service, job[0], _params(job), None, metrics, failures[job], limiter)
+
+        for job, page in fetch_concurrently(jobs, listing_pages, workers):
+            endpoint, course_id, course_work_id = job
+            if page is None:
+                job_failures, ids = failures.pop(job), saved_ids.pop(job)
+                if job_failures:
+                    storage.record_dead_letters(job_failures)
+                    summary['failed_listings'] += 1
+                elif purge_deleted:
+                    storage.record_listing(_COLLECTIONS[endpoint], course_work_id or course_id, ids)
+                continue
+            saved_ids[job].extend(save_listing_page(storage, endpoint, _params(job), page, masking_level, follow_up))
+            summary['pages'] += 1
+            summary['items'] += len(page)
+        jobs = [(endpoint, params['courseId'], params['courseWorkId']) for endpoint, params, _ in follow_up]
+
+    if purge_deleted:
+        summary['deleted'] = {collection: count for collection, count in storage.purge_unseen().items() if count}
+    storage.commit()
+
+    summary['api_calls'] = metrics.progress_counts()[0]
+    logger.info(f"Refreshed {len(summary['courses'])} courses: {summary['items']} items in "
+                f"{summary['pages']} pages, {summary['api_calls']} API calls.")
+    return summary
@@ -0,0 +1,173 @@
+"""
+Replays the requests recorded in the dead-letter table.
+
+When a list request fails during an extraction, the listing stops at that
+page and the request (endpoint, parameters and page token) is recorded as a
+dead letter. Replaying re-issues only those requests instead of running the
+whole extraction again:
+
+*   each dead letter's listing is resumed from its page token and followed to
+    its last page. If the token has expired, the listing restarts from its
+    first page;
+*   the items are saved as the extraction saves them, and anything the
+    extraction never reached because of the failure is fetched as well: the
+    teachers, students, announcements and course work of courses on a
+    missing page of courses, and the submissions of course work on a missing
+    page of course work;
+*   a dead letter is removed once its request succeeds. Requests that fail
+    during the replay are recorded as dead letters in turn, for the next one.
+
+A replay does not detect deletions: it only adds and updates rows.
+"""
+
+import json
+import logging
+from collections import deque
+
+from src.extractor import iter_listing_pages
+from src.masking import mask_user_profile
+from src.normalize import listed_ids
+from src.metrics import MetricsRecorder
+
+logger = logging.getLogger(__name__)
+
+# Status of a request whose page token is no longer accepted
+EXPIRED_TOKEN_STATUS = 400
+
+# The listings an extraction fetches for each course
+COURSE_LISTINGS = (
+    'courses.teachers.list', 'courses.students.list', 'courses.announcements.list', 'courses.courseWork.list'
+)
+
+def _save_courses(storage, params: dict, page: list, masking_level: str, queue: list) -> list:
+    for course in page:
+        # Nothing is listed for a quarantined course: its rows would have no course to refer to
+        if storage.save_course(course) is None:
+            continue
+        for endpoint in COURSE_LISTINGS:
+            queue.append((endpoint, {'courseId': course['id']}, None))
+    return listed_ids(page)
+
+def _save_members(role: str):
+    def save(storage, params: dict, page: list, masking_level: str, queue: list) -> list:
+        # Some profiles are incomplete if the user has been deleted
+        profiles = [mask_user_profile(member['profile'], role, masking_level) for member in page
+                    if 'name' in member['profile'] and 'emailAddress' in member['profile']]
+        for user_id in storage.save_page('USRS', profiles):
+            storage.save_enrollment(params['courseId'], user_id, role)
+        return listed_ids(profiles)
+    return save
+
+def _save_announcements(storage, params: dict, page: list, masking_level: str, queue: list) -> list:
+    storage.save_page('ANNCMNTS', page)
+    return listed_ids(page)
+
+def _save_course_work(storage, params: dict, page: list, masking_level: str, queue: list) -> list:
+    # Submissions are listed for the items saved, not those quarantined
+    for work_id in storage.save_page('CRS_WRK', page):
+        queue.append((
+            'courses.courseWork.studentSubmissions.list',
+            {'courseId': params['courseId'], 'courseWorkId': work_id}, None
+        ))
+    return listed_ids(page)
+
+def _save_submissions(storage, params: dict, page: list, masking_level: str, queue: list) -> list:
+    storage.save_page('STDNT_SBMSSNS', page)
+    return listed_ids(page)
+
+# Endpoint -> how a page of its items is saved
+_SAVERS = {
+    'courses.list': _save_courses,
+    'courses.teachers.list': _save_members('TEACHER'),
+    'courses.students.list': _save_members('STUDENT'),
+    'courses.announcements.list': _save_announcements,
+    'courses.courseWork.list': _save_course_work,
+    'courses.courseWork.studentSubmissions.list': _save_submissions,
+}
+
+def save_listing_page(storage, endpoint: str, params: dict, page: list, masking_level: str, queue: list) -> list:
+    """
+    Saves a page of any listing as the extraction does.
+
+    The listings its items lead to (a course's rosters, announcements and
+    course work; a course work item's submissions) are appended to queue as
+    (endpoint, params, page token) for the caller to fetch.
+
+    Returns:
+        The IDs listed, as recorded for deletion detection. Malformed items
+        are quarantined rather than saved, but their IDs are included.
+    """
+    return _SAVERS[endpoint](storage, params, page, masking_level, queue)
+
+def _follow(service, endpoint: str, params: dict, page_token: str, metrics: MetricsRecorder,
+            failures: list, limiter):
+    """
+    Yields the pages of a listing from page_token to its end, restarting
+    from the first page if the token has expired. Failed requests are
+    appended to failures.
+    """
+    attempt = []
+    fetched = False
+    for page in iter_listing_pages(service, endpoint, params, page_token, metrics, attempt, limiter):
+        fetched = True
+        yield page
+    if page_token and not fetched and attempt and attempt[0].status == EXPIRED_TOKEN_STATUS:
+        logger.info(f"The page token for {endpoint} {params} was not accepted; "
+                    f"restarting the listing from its first page.")
+        attempt = []
+        yield from iter_listing_pages(service, endpoint, params, None, metrics, attempt, limiter)
+    failures.extend(attempt)
+
+def _request_key(endpoint: str, params: dict, page_token: str) -> tuple:
+    return endpoint, json.dumps(params, sort_keys=True), page_token or ''
+
+def replay_dead_letters(storage, service, masking_level: str = 'none', metrics: MetricsRecorder = None,
+                        limiter=None) -> dict:
+    """
+    Re-issues every dead letter's request and saves the results.
+
+    Each dead letter is committed as it completes, so an interrupted replay
+    keeps what it has recovered.
+
+    Args:
+        storage: The StorageBackend holding the dead letters.
+        service: An authorized Google Classroom API service resource object.
+        masking_level: The PII masking level for teachers and students.
+        metrics: An optional MetricsRecorder for the requests and rows.
+        limiter: An optional AdaptiveLimiter that retries throttled requests.
+
+    Returns:
+        A dict with the dead letters replayed, those recovered and those still
+        failing, the new failures recorded, and the pages, items and API
+        calls fetched.
+    """
+    metrics = metrics or MetricsRecorder()
+    summary = {'replayed': 0, 'recovered': 0, 'still_failing': 0, 'new_failures': 0, 'pages': 0, 'items': 0}
+    for letter in storage.dead_letters():
+        logger.debug(f"Replaying {letter.endpoint} {letter.params} from page token {letter.page_token!r} "
+                     f"(attempt {letter.attempts + 1}).")
+        failures = []
+        queue = deque([(letter.endpoint, letter.params, letter.page_token)])
+        while queue:
+            endpoint, params, page_token = queue.popleft()
+            for page in _follow(service, endpoint, params, page_token, metrics, failures, limiter):
+                save_listing_page(storage, endpoint, params, page, masking_level, queue)
+                summary['pages'] += 1
+                summary['items'] += len(page)
+
+        storage.record_dead_letters(failures)
+        letter_key = _request_key(letter.endpoint, letter.params, letter.page_token)
+        failed_again = any(_request_key(f.endpoint, f.params, f.page_token) == letter_key for f in failures)
+        if failed_again:
+            summary['still_failing'] += 1
+        else:
+            storage.resolve_dead_letter(letter.id)
+            summary['recovered'] += 1
+        summary['new_failures'] += len(failures) - failed_again
+        summary['replayed'] += 1
+        storage.commit()
+
+    summary['api_calls'] = metrics.progress_counts()[0]
+    logger.info(f"Replayed {summary['replayed']} dead letters: {summary['recovered']} recovered, "
+                f"{summary['still_failing']} still failing, in {summary['api_calls']} API calls.")
+    return summary
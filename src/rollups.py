@@ -0,0 +1,289 @@
+"""
+Engagement rollups, kept up to date as rows are saved.
+
+Two summary tables hold the per-course and per-student counts engagement
+reports need, so that they read a few rows instead of scanning every
+submission after each load:
+
+*   CRS_RLLPS, one row per course: its submissions in total and by state,
+    the late ones, its announcements, and the latest update time of any of
+    them (LST_ACTVTY_TM);
+*   STDNT_RLLPS, one row per course and student: the student's submissions
+    in total and by state, the late ones, and their latest update time.
+
+The states are counted under the names VW_ASSGNMNT_GRDS gives them: NEW is
+ASSGND_CNT, CREATED is MSSNG_CNT, TURNED_IN is SBMTD_CNT, RETURNED is
+RTRND_CNT and RECLAIMED_BY_STUDENT is RCLMD_CNT.
+
+In SQLite, triggers on STDNT_SBMSSNS, ANNCMNTS, CRS_WRK and CRSS apply each
+insert, update and delete to the rollups as it happens, whichever command
+makes it (an extraction, a refresh, a replay or the purge of deleted rows,
+cascades included). Unchanged rows are not rewritten, so they cost nothing.
+A latest update time is only recomputed, from the course's rows, when the
+row that held it is deleted or goes back in time. DuckDB has no triggers:
+its backend recomputes the rollups with one aggregate query when the views
+are created at the end of a run, a columnar scan that takes milliseconds.
+
+Rows with nothing left to count are removed, so the tables always match
+ROLLUP_QUERIES run over the base tables.
+"""
+
+import logging
+from sqlite3 import Connection
+
+logger = logging.getLogger(__name__)
+
+# Submission states and the rollup column counting each
+STATE_COUNTS = (
+    ('NEW', 'ASSGND_CNT'),
+    ('CREATED', 'MSSNG_CNT'),
+    ('TURNED_IN', 'SBMTD_CNT'),
+    ('RETURNED', 'RTRND_CNT'),
+    ('RECLAIMED_BY_STUDENT', 'RCLMD_CNT'),
+)
+
+# The submission counts of both rollups
+SUBMISSION_COUNTS = ('SBMSSN_CNT', *(column for _, column in STATE_COUNTS), 'LT_CNT')
+
+_COUNT_DEFINITIONS = ',\n'.join(f"    {column} INTEGER NOT NULL DEFAULT 0" for column in SUBMISSION_COUNTS)
+
+# Plain SQL that every storage backend accepts
+ROLLUP_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS CRS_RLLPS (
+    CRS_ID TEXT PRIMARY KEY,
+{_COUNT_DEFINITIONS},
+    ANNCMNT_CNT INTEGER NOT NULL DEFAULT 0,
+    LST_ACTVTY_TM TEXT
+);
+CREATE TABLE IF NOT EXISTS STDNT_RLLPS (
+    CRS_ID TEXT NOT NULL,
+    USR_ID TEXT NOT NULL,
+{_COUNT_DEFINITIONS},
+    LST_ACTVTY_TM TEXT,
+    PRIMARY KEY (CRS_ID, USR_ID)
+);
+"""
+
+def _counts(row: str) -> list:
+    """Returns one submission's contribution to each of SUBMISSION_COUNTS, as expressions over a row alias."""
+    return ['1', *(f"(CASE WHEN {row}.STT = '{state}' THEN 1 ELSE 0 END)" for state, _ in STATE_COUNTS),
+            f"{row}.LT"]
+
+def _sums(row: str) -> str:
+    """Returns the SUM of each of SUBMISSION_COUNTS over the submissions aliased row."""
+    return ', '.join(f"SUM({expression}) AS {column}" for expression, column in zip(_counts(row), SUBMISSION_COUNTS))
+
+_COUNT_NAMES = ', '.join(SUBMISSION_COUNTS)
+
+# Each rollup computed from the base tables: how the rollups are rebuilt,
+# and what they always equal
+ROLLUP_QUERIES = {
+    'CRS_RLLPS': f"""
+        SELECT CRS_ID, {', '.join(f'SUM({column})' for column in SUBMISSION_COUNTS)}, SUM(ANNCMNT_CNT),
+               MAX(LST_ACTVTY_TM)
+        FROM (
+            SELECT w.CRS_ID, {_sums('s')}, 0 AS ANNCMNT_CNT, MAX(s.UPDT_TM) AS LST_ACTVTY_TM
+            FROM STDNT_SBMSSNS s JOIN CRS_WRK w ON w.ID = s.CRS_WRK_ID
+            GROUP BY w.CRS_ID
+            UNION ALL
+            SELECT CRS_ID, {', '.join('0' for _ in SUBMISSION_COUNTS)}, COUNT(*), MAX(UPDT_TM)
+            FROM ANNCMNTS
+            GROUP BY CRS_ID
+        ) AS c
+        GROUP BY CRS_ID
+    """,
+    'STDNT_RLLPS': f"""
+        SELECT w.CRS_ID, s.USR_ID, {_sums('s')}, MAX(s.UPDT_TM)
+        FROM STDNT_SBMSSNS s JOIN CRS_WRK w ON w.ID = s.CRS_WRK_ID
+        GROUP BY w.CRS_ID, s.USR_ID
+    """,
+}
+
+def rebuild_rollups(conn):
+    """
+    Recomputes both rollups from the base tables.
+
+    Args:
+        conn: A SQLite or DuckDB connection, inside the caller's transaction.
+    """
+    for table, query in ROLLUP_QUERIES.items():
+        conn.execute(f"DELETE FROM {table};")
+        conn.execute(f"INSERT INTO {table} {query};")
+
+# --- SQLite triggers ---
+
+def _later(current: str, candidate: str) -> str:
+    """The later of two times, either of which may be NULL."""
+    return f"CASE WHEN {current} IS NULL OR {candidate} > {current} THEN {candidate} ELSE {current} END"
+
+def _student_latest(course: str, user: str, except_work: str = None) -> str:
+    """A student's latest submission update time in a course, optionally leaving one course work item out."""
+    extra = f" AND w.ID <> {except_work}" if except_work else ''
+    return f"""(SELECT MAX(s.UPDT_TM) FROM CRS_WRK w JOIN STDNT_SBMSSNS s ON s.CRS_WRK_ID = w.ID
+                WHERE w.CRS_ID = {course} AND s.USR_ID = {user}{extra})"""
+
+def _course_latest(course: str, except_work: str = None) -> str:
+    """A course's latest submission or announcement update time, optionally leaving one course work item out."""
+    extra = f" AND w.ID <> {except_work}" if except_work else ''
+    return f"""(SELECT MAX(t) FROM (
+                SELECT s.UPDT_TM AS t FROM CRS_WRK w JOIN STDNT_SBMSSNS s ON s.CRS_WRK_ID = w.ID
+                WHERE w.CRS_ID = {course}{extra}
+                UNION ALL
+                SELECT UPDT_TM FROM ANNCMNTS WHERE CRS_ID = {course}))"""
+
+def _add(row: str, sign: str) -> str:
+    """SET assignments adding (sign '+') or removing (sign '-') one submission's counts."""
+    return ', '.join(f"{column} = {column} {sign} {expression}"
+                     for column, expression in zip(SUBMISSION_COUNTS, _counts(row)))
+
+def _triggers() -> dict:
+    """Returns the rollup triggers, by name."""
+    course_of = "(SELECT CRS_ID FROM CRS_WRK WHERE ID = {row}.CRS_WRK_ID)"
+    new_course, old_course = course_of.format(row='new'), course_of.format(row='old')
+    insert_counts = ', '.join(_counts('new'))
+    merge_counts = ', '.join(f"{column} = {column} + excluded.{column}" for column in SUBMISSION_COUNTS)
+    changed_counts = ', '.join(f"{column} = {column} + {new} - {old}"
+                               for column, new, old in zip(SUBMISSION_COUNTS, _counts('new'), _counts('old')))
+    empty_student = "SBMSSN_CNT = 0"
+    empty_course = "SBMSSN_CNT = 0 AND ANNCMNT_CNT = 0"
+    # A submission keeps its course work and student when it is updated.
+    # While a course work item is deleted, its submissions are removed by
+    # the cascade after it is gone: their course is then unknown and their
+    # triggers change nothing, as the item's own trigger has already
+    # removed their counts.
+    return {
+        'STDNT_SBMSSNS_RLLP_AI': f"""
+            CREATE TRIGGER STDNT_SBMSSNS_RLLP_AI AFTER INSERT ON STDNT_SBMSSNS BEGIN
+                INSERT INTO STDNT_RLLPS (CRS_ID, USR_ID, {_COUNT_NAMES}, LST_ACTVTY_TM)
+                SELECT w.CRS_ID, new.USR_ID, {insert_counts}, new.UPDT_TM FROM CRS_WRK w WHERE w.ID = new.CRS_WRK_ID
+                ON CONFLICT (CRS_ID, USR_ID) DO UPDATE SET {merge_counts},
+                    LST_ACTVTY_TM = {_later('LST_ACTVTY_TM', 'excluded.LST_ACTVTY_TM')};
+                INSERT INTO CRS_RLLPS (CRS_ID, {_COUNT_NAMES}, LST_ACTVTY_TM)
+                SELECT w.CRS_ID, {insert_counts}, new.UPDT_TM FROM CRS_WRK w WHERE w.ID = new.CRS_WRK_ID
+                ON CONFLICT (CRS_ID) DO UPDATE SET {merge_counts},
+                    LST_ACTVTY_TM = {_later('LST_ACTVTY_TM', 'excluded.LST_ACTVTY_TM')};
+            END;
+        """,
+        'STDNT_SBMSSNS_RLLP_AU': f"""
+            CREATE TRIGGER STDNT_SBMSSNS_RLLP_AU AFTER UPDATE ON STDNT_SBMSSNS BEGIN
+                UPDATE STDNT_RLLPS SET {changed_counts}, LST_ACTVTY_TM = CASE
+                    WHEN new.UPDT_TM < old.UPDT_TM AND old.UPDT_TM IS LST_ACTVTY_TM
+                    THEN {_student_latest('STDNT_RLLPS.CRS_ID', 'STDNT_RLLPS.USR_ID')}
+                    ELSE {_later('LST_ACTVTY_TM', 'new.UPDT_TM')} END
+                WHERE CRS_ID = {new_course} AND USR_ID = new.USR_ID;
+                UPDATE CRS_RLLPS SET {changed_counts}, LST_ACTVTY_TM = CASE
+                    WHEN new.UPDT_TM < old.UPDT_TM AND old.UPDT_TM IS LST_ACTVTY_TM
+                    THEN {_course_latest('CRS_RLLPS.CRS_ID')}
+                    ELSE {_later('LST_ACTVTY_TM', 'new.UPDT_TM')} END
+                WHERE CRS_ID = {new_course};
+            END;
+        """,
+        'STDNT_SBMSSNS_RLLP_AD': f"""
+            CREATE TRIGGER STDNT_SBMSSNS_RLLP_AD AFTER DELETE ON STDNT_SBMSSNS BEGIN
+                UPDATE STDNT_RLLPS SET {_add('old', '-')}, LST_ACTVTY_TM = CASE
+                    WHEN old.UPDT_TM IS LST_ACTVTY_TM THEN {_student_latest('STDNT_RLLPS.CRS_ID', 'STDNT_RLLPS.USR_ID')}
+                    ELSE LST_ACTVTY_TM END
+                WHERE CRS_ID = {old_course} AND USR_ID = old.USR_ID;
+                DELETE FROM STDNT_RLLPS WHERE CRS_ID = {old_course} AND USR_ID = old.USR_ID AND {empty_student};
+                UPDATE CRS_RLLPS SET {_add('old', '-')}, LST_ACTVTY_TM = CASE
+                    WHEN old.UPDT_TM IS LST_ACTVTY_TM THEN {_course_latest('CRS_RLLPS.CRS_ID')}
+                    ELSE LST_ACTVTY_TM END
+                WHERE CRS_ID = {old_course};
+                DELETE FROM CRS_RLLPS WHERE CRS_ID = {old_course} AND {empty_course};
+            END;
+        """,
+        # Removes the counts of a course work item's submissions, before the
+        # cascade deletes them
+        'CRS_WRK_RLLP_BD': f"""
+            CREATE TRIGGER CRS_WRK_RLLP_BD BEFORE DELETE ON CRS_WRK BEGIN
+                UPDATE STDNT_RLLPS SET
+                    {', '.join(f'{column} = STDNT_RLLPS.{column} - d.{column}' for column in SUBMISSION_COUNTS)},
+                    LST_ACTVTY_TM = CASE
+                        WHEN d.LST_ACTVTY_TM IS STDNT_RLLPS.LST_ACTVTY_TM
+                        THEN {_student_latest('old.CRS_ID', 'STDNT_RLLPS.USR_ID', 'old.ID')}
+                        ELSE STDNT_RLLPS.LST_ACTVTY_TM END
+                FROM (
+                    SELECT s.USR_ID, {_sums('s')}, MAX(s.UPDT_TM) AS LST_ACTVTY_TM
+                    FROM STDNT_SBMSSNS s WHERE s.CRS_WRK_ID = old.ID GROUP BY s.USR_ID
+                ) AS d
+                WHERE STDNT_RLLPS.CRS_ID = old.CRS_ID AND STDNT_RLLPS.USR_ID = d.USR_ID;
+                DELETE FROM STDNT_RLLPS WHERE CRS_ID = old.CRS_ID AND {empty_student};
+                UPDATE CRS_RLLPS SET
+                    {', '.join(f'{column} = CRS_RLLPS.{column} - d.{column}' for column in SUBMISSION_COUNTS)},
+                    LST_ACTVTY_TM = CASE
+                        WHEN d.LST_ACTVTY_TM IS CRS_RLLPS.LST_ACTVTY_TM THEN {_course_latest('old.CRS_ID', 'old.ID')}
+                        ELSE CRS_RLLPS.LST_ACTVTY_TM END
+                FROM (
+                    SELECT {_sums('s')}, MAX(s.UPDT_TM) AS LST_ACTVTY_TM
+                    FROM STDNT_SBMSSNS s WHERE s.CRS_WRK_ID = old.ID
+                ) AS d
+                WHERE CRS_RLLPS.CRS_ID = old.CRS_ID AND d.SBMSSN_CNT > 0;
+                DELETE FROM CRS_RLLPS WHERE CRS_ID = old.CRS_ID AND {empty_course};
+            END;
+        """,
+        'ANNCMNTS_RLLP_AI': f"""
+            CREATE TRIGGER ANNCMNTS_RLLP_AI AFTER INSERT ON ANNCMNTS BEGIN
+                INSERT INTO CRS_RLLPS (CRS_ID, ANNCMNT_CNT, LST_ACTVTY_TM) VALUES (new.CRS_ID, 1, new.UPDT_TM)
+                ON CONFLICT (CRS_ID) DO UPDATE SET ANNCMNT_CNT = ANNCMNT_CNT + 1,
+                    LST_ACTVTY_TM = {_later('LST_ACTVTY_TM', 'excluded.LST_ACTVTY_TM')};
+            END;
+        """,
+        'ANNCMNTS_RLLP_AU': f"""
+            CREATE TRIGGER ANNCMNTS_RLLP_AU AFTER UPDATE ON ANNCMNTS BEGIN
+                UPDATE CRS_RLLPS SET LST_ACTVTY_TM = CASE
+                    WHEN new.UPDT_TM < old.UPDT_TM AND old.UPDT_TM IS LST_ACTVTY_TM
+                    THEN {_course_latest('CRS_RLLPS.CRS_ID')}
+                    ELSE {_later('LST_ACTVTY_TM', 'new.UPDT_TM')} END
+                WHERE CRS_ID = new.CRS_ID;
+            END;
+        """,
+        'ANNCMNTS_RLLP_AD': f"""
+            CREATE TRIGGER ANNCMNTS_RLLP_AD AFTER DELETE ON ANNCMNTS BEGIN
+                UPDATE CRS_RLLPS SET ANNCMNT_CNT = ANNCMNT_CNT - 1, LST_ACTVTY_TM = CASE
+                    WHEN old.UPDT_TM IS LST_ACTVTY_TM THEN {_course_latest('CRS_RLLPS.CRS_ID')}
+                    ELSE LST_ACTVTY_TM END
+                WHERE CRS_ID = old.CRS_ID;
+                DELETE FROM CRS_RLLPS WHERE CRS_ID = old.CRS_ID AND {empty_course};
+            END;
+        """,
+        # Everything of a deleted course has gone with it
+        'CRSS_RLLP_AD': """
+            CREATE TRIGGER CRSS_RLLP_AD AFTER DELETE ON CRSS BEGIN
+                DELETE FROM STDNT_RLLPS WHERE CRS_ID = old.ID;
+                DELETE FROM CRS_RLLPS WHERE CRS_ID = old.ID;
+            END;
+        """,
+    }
+
+def initialize_rollups(conn: Connection, enabled: bool = True):
+    """
+    Creates the rollup tables and the triggers maintaining them, or drops both.
+
+    When the triggers are created (a new database, an existing one, or one on
+    which the rollups were turned off for a while), the rollups are rebuilt
+    once from the base tables; from then on every write keeps them current.
+
+    Args:
+        conn: The SQLite database connection.
+        enabled: Whether the rollups are maintained.
+    """
+    triggers = _triggers()
+    present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger';")}
+    if not enabled:
+        for name in triggers:
+            if name in present:
+                conn.execute(f"DROP TRIGGER {name};")
+        # Rollups no longer maintained would only mislead readers
+        conn.executescript("DROP TABLE IF EXISTS CRS_RLLPS; DROP TABLE IF EXISTS STDNT_RLLPS;")
+        conn.commit()
+        return
+
+    missing = [name for name in triggers if name not in present]
+    if not missing:
+        return
+    conn.executescript(ROLLUP_SCHEMA)
+    for name in missing:
+        conn.execute(triggers[name])
+    rebuild_rollups(conn)
+    conn.commit()
+    logger.info("Engagement rollups rebuilt from the base tables; they are kept up to date from now on.")
@@ -0,0 +1,128 @@
+"""
+Full-text search over announcement and course work text.
+
+Announcement text (ANNCMNTS.TXT) and course work titles and descriptions
+(CRS_WRK.TTL, CRS_WRK.DSCRPTN) are indexed with SQLite's FTS5 extension.
+The indexes are external-content tables: they store only the index, not a
+second copy of the text, and triggers keep them in step with every insert,
+update and delete made through the save_* functions or the deletion purge.
+"""
+
+import logging
+import sqlite3
+from sqlite3 import Connection
+
+logger = logging.getLogger(__name__)
+
+# Index name -> (source table, indexed columns)
+SEARCH_INDEXES = {
+    'ANNCMNTS_FTS': ('ANNCMNTS', ('TXT',)),
+    'CRS_WRK_FTS': ('CRS_WRK', ('TTL', 'DSCRPTN')),
+}
+
+def fts5_available(conn: Connection) -> bool:
+    """Returns True if the SQLite library was built with FTS5."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.FTS5_PROBE USING fts5(x);")
+        conn.execute("DROP TABLE temp.FTS5_PROBE;")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def initialize_search_index(conn: Connection) -> bool:
+    """
+    Creates the full-text indexes and their maintenance triggers if missing.
+
+    Indexes created for a database that already holds data are filled from
+    the existing rows.
+
+    Returns:
+        True if the indexes are available, False if SQLite lacks FTS5.
+    """
+    if not fts5_available(conn):
+        logger.warning("SQLite was built without FTS5; full-text search is not available.")
+        return False
+
+    for index, (table, columns) in SEARCH_INDEXES.items():
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (index,)
+        ).fetchone()
+        if exists:
+            continue
+
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f"new.{column}" for column in columns)
+        old_values = ', '.join(f"old.{column}" for column in columns)
+        conn.executescript(f"""
+            CREATE VIRTUAL TABLE {index} USING fts5(
+                {column_list}, content='{table}', content_rowid='rowid'
+            );
+            CREATE TRIGGER {index}_AI AFTER INSERT ON {table} BEGIN
+                INSERT INTO {index} (rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END;
+            CREATE TRIGGER {index}_AD AFTER DELETE ON {table} BEGIN
+                INSERT INTO {index} ({index}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+            END;
+            CREATE TRIGGER {index}_AU AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {index} ({index}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO {index} (rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END;
+            INSERT INTO {index} ({index}) VALUES ('rebuild');
+        """)
+    conn.commit()
+    return True
+
+def rebuild_search_index(conn: Connection):
+    """
+    Rebuilds the full-text indexes from their source tables.
+
+    Needed after anything that can renumber the source tables' rowids, such
+    as VACUUM, since the indexes refer to rows by rowid.
+    """
+    for index in SEARCH_INDEXES:
+        conn.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild');")
+    conn.commit()
+
+def search_text(conn: Connection, query: str, limit: int = 20) -> list:
+    """
+    Searches announcements and course work, best matches first.
+
+    Args:
+        conn: The database connection.
+        query: An FTS5 query, e.g. 'photosynthesis', '"lab report"' or 'quiz NOT retake'.
+        limit: The maximum number of hits to return.
+
+    Returns:
+        A list of dicts with the keys 'type' ('Announcement' or 'Assignment'),
+        'id', 'course_id', 'course_name', 'course_section', 'title', 'snippet'
+        and 'rank' (lower is better).
+
+    Raises:
+        sqlite3.OperationalError: If the query is not valid FTS5 syntax.
+    """
+    cursor = conn.execute("""
+        SELECT * FROM (
+            SELECT 'Announcement' AS TYP, a.ID, c.ID, c.NM, c.SCTN,
+                   substr(a.TXT, 1, 80) AS TTL,
+                   snippet(ANNCMNTS_FTS, 0, '[', ']', '...', 12) AS SNPPT,
+                   bm25(ANNCMNTS_FTS) AS RNK
+            FROM ANNCMNTS_FTS
+            JOIN ANNCMNTS a ON a.rowid = ANNCMNTS_FTS.rowid
+            JOIN CRSS c ON c.ID = a.CRS_ID
+            WHERE ANNCMNTS_FTS MATCH :query
+            UNION ALL
+            SELECT 'Assignment', w.ID, c.ID, c.NM, c.SCTN,
+                   w.TTL,
+                   snippet(CRS_WRK_FTS, -1, '[', ']', '...', 12),
+                   -- Title matches count double
+                   bm25(CRS_WRK_FTS, 2.0, 1.0)
+            FROM CRS_WRK_FTS
+            JOIN CRS_WRK w ON w.rowid = CRS_WRK_FTS.rowid
+            JOIN CRSS c ON c.ID = w.CRS_ID
+            WHERE CRS_WRK_FTS MATCH :query
+        )
+        ORDER BY RNK
+        LIMIT :limit;
+    """, {'query': query, 'limit': limit})
+    keys = ('type', 'id', 'course_id', 'course_name', 'course_section', 'title', 'snippet', 'rank')
+    return [dict(zip(keys, row)) for row in cursor.fetchall()]
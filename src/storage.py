@@ -0,0 +1,583 @@
+"""
+Storage backends: where an extraction is written.
+
+The extractor saves rows through a StorageBackend instead of a database
+connection, so the database engine is a configuration choice
+(DATABASE.BACKEND):
+
+*   'sqlite' (the default) writes each row as it arrives, through the save_*
+    functions in src.database. The database supports every feature: full-text
+    search, the compact copy, published snapshots and the search, export and
+    gradebook commands.
+*   'duckdb' writes to an embedded DuckDB database. Rows are buffered per
+    table and appended a batch at a time through Arrow, then merged into the
+    table with one upsert per batch. DuckDB's columnar engine answers
+    aggregate queries over submissions (grades per assignment, completion per
+    course) many times faster than SQLite's row engine.
+
+Both backends create the same tables and analytics views, skip unchanged rows
+by content hash and report rows written and skipped to the run metrics.
+
+The DuckDB backend requires duckdb and pyarrow, which are imported only when
+it is used.
+"""
+
+import logging
+import time
+from sqlite3 import Connection
+
+from src.database import (
+    ANALYTICS_VIEWS, TRACKED_COLLECTIONS, begin_seen_tracking, create_views, dead_letter_from_row,
+    dead_letter_rows, delete_dead_letter, initialize_database, load_dead_letters, purge_unseen,
+    quarantine_rows, record_listing, save_announcement, save_course, save_course_work, save_dead_letters,
+    save_enrollment, save_quarantined, save_rows, save_student_submission, save_user
+)
+from src.normalize import NORMALIZERS, MalformedItemError, Rejected, normalize_items
+from src.rollups import ROLLUP_SCHEMA, rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('sqlite', 'duckdb')
+DEFAULT_BACKEND = 'sqlite'
+
+# Rows buffered per table before the DuckDB backend appends them
+DEFAULT_BATCH_ROWS = 10000
+
+class StorageBackend:
+    """
+    The interface the extractor writes through.
+
+    Each save_* method takes one API object. Whether it is written at once or
+    later, it is durable after the next commit(). A malformed object is
+    quarantined instead, and its save_* method returns None. Rows written and
+    skipped, and objects quarantined, are reported to the metrics recorder, if
+    one is given, under their table.
+    """
+
+    name = None
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+
+    def save_user(self, user_profile: dict):
+        raise NotImplementedError
+
+    def save_course(self, course: dict):
+        raise NotImplementedError
+
+    def save_enrollment(self, course_id: str, user_id: str, role: str):
+        raise NotImplementedError
+
+    def save_announcement(self, announcement: dict):
+        raise NotImplementedError
+
+    def save_course_work(self, course_work_item: dict):
+        raise NotImplementedError
+
+    def save_student_submission(self, submission: dict):
+        raise NotImplementedError
+
+    def save_page(self, table: str, items: list) -> list:
+        """
+        Saves a page of API objects into one table ('USRS', 'CRSS', 'ANNCMNTS',
+        'CRS_WRK' or 'STDNT_SBMSSNS') at once. Malformed objects are
+        quarantined instead.
+
+        Returns:
+            The IDs of the objects saved, in order.
+        """
+        raise NotImplementedError
+
+    def begin_seen_tracking(self):
+        """Starts recording the IDs seen in each listing, for purge_unseen()."""
+        raise NotImplementedError
+
+    def record_listing(self, collection: str, parent_id: str, ids):
+        """Records the IDs returned by one complete listing of a collection."""
+        raise NotImplementedError
+
+    def purge_unseen(self) -> dict:
+        """Deletes rows not seen in their collection's listing, with their dependents."""
+        raise NotImplementedError
+
+    def record_dead_letters(self, failures):
+        """Records failed requests (FailedRequests) in the dead-letter table."""
+        raise NotImplementedError
+
+    def dead_letters(self) -> list:
+        """Returns the recorded failed requests as DeadLetters, oldest first."""
+        raise NotImplementedError
+
+    def resolve_dead_letter(self, letter_id: int):
+        """Removes a dead letter whose request has since succeeded."""
+        raise NotImplementedError
+
+    def create_views(self):
+        """Creates (or replaces) the analytics views."""
+        raise NotImplementedError
+
+    def query(self, sql: str, params=()) -> list:
+        """Runs a query against everything saved so far and returns its rows."""
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def close(self):
+        """Closes the database. Anything not committed is discarded."""
+        raise NotImplementedError
+
+
+class SQLiteBackend(StorageBackend):
+    """Writes each row to a SQLite database as it is saved."""
+
+    name = 'sqlite'
+
+    def __init__(self, conn: Connection, metrics=None):
+        super().__init__(metrics)
+        self.conn = conn
+        self._savers = {}
+        for table, save_function in (
+            ('USRS', save_user), ('CRSS', save_course), ('ENRLLMNTS', save_enrollment),
+            ('ANNCMNTS', save_announcement), ('CRS_WRK', save_course_work),
+            ('STDNT_SBMSSNS', save_student_submission),
+        ):
+            self._savers[table] = metrics.instrument_write(table, save_function) if metrics else save_function
+
+    def save_user(self, user_profile: dict):
+        return self._savers['USRS'](self.conn, user_profile)
+
+    def save_course(self, course: dict):
+        return self._savers['CRSS'](self.conn, course)
+
+    def save_enrollment(self, course_id: str, user_id: str, role: str) -> bool:
+        return self._savers['ENRLLMNTS'](self.conn, course_id, user_id, role)
+
+    def save_announcement(self, announcement: dict):
+        return self._savers['ANNCMNTS'](self.conn, announcement)
+
+    def save_course_work(self, course_work_item: dict):
+        return self._savers['CRS_WRK'](self.conn, course_work_item)
+
+    def save_student_submission(self, submission: dict):
+        return self._savers['STDNT_SBMSSNS'](self.conn, submission)
+
+    def save_page(self, table: str, items: list) -> list:
+        start = time.perf_counter()
+        rows, rejected = normalize_items(table, items)
+        written = save_rows(self.conn, table, rows)
+        if rejected:
+            save_quarantined(self.conn, table, rejected)
+        if self.metrics:
+            self.metrics.observe_write(table, written, time.perf_counter() - start,
+                                       skipped=len(rows) - written, quarantined=len(rejected))
+        return [row[0] for row in rows]
+
+    def begin_seen_tracking(self):
+        begin_seen_tracking(self.conn)
+
+    def record_listing(self, collection: str, parent_id: str, ids):
+        record_listing(self.conn, collection, parent_id, ids)
+
+    def purge_unseen(self) -> dict:
+        return purge_unseen(self.conn)
+
+    def record_dead_letters(self, failures):
+        save_dead_letters(self.conn, failures)
+
+    def dead_letters(self) -> list:
+        return load_dead_letters(self.conn)
+
+    def resolve_dead_letter(self, letter_id: int):
+        delete_dead_letter(self.conn, letter_id)
+
+    def create_views(self):
+        create_views(self.conn)
+
+    def query(self, sql: str, params=()) -> list:
+        return self.conn.execute(sql, params).fetchall()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def import_duckdb():
+    """Imports duckdb and pyarrow, with a clear message if they are not installed."""
+    try:
+        import duckdb
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("The DuckDB backend requires duckdb and pyarrow: pip install duckdb pyarrow") from e
+    return duckdb, pyarrow
+
+# Without foreign keys: DuckDB cannot cascade deletes, and would refuse to
+# update a parent row that other rows refer to. purge_unseen() removes
+# dependent rows itself.
+_DUCKDB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS USRS (
+    ID VARCHAR PRIMARY KEY,
+    NM VARCHAR NOT NULL,
+    EML VARCHAR NOT NULL UNIQUE,
+    PHT_URL VARCHAR,
+    CNTNT_HSH BIGINT
+);
+CREATE TABLE IF NOT EXISTS CRSS (
+    ID VARCHAR PRIMARY KEY,
+    NM VARCHAR NOT NULL,
+    SCTN VARCHAR,
+    DSCRPTN VARCHAR,
+    CRTN_TM VARCHAR,
+    UPDT_TM VARCHAR,
+    CRS_STT VARCHAR,
+    CNTNT_HSH BIGINT
+);
+CREATE SEQUENCE IF NOT EXISTS ENRLLMNT_ID_SEQ;
+CREATE TABLE IF NOT EXISTS ENRLLMNTS (
+    ENRLLMNT_ID BIGINT PRIMARY KEY DEFAULT nextval('ENRLLMNT_ID_SEQ'),
+    CRS_ID VARCHAR NOT NULL,
+    USR_ID VARCHAR NOT NULL,
+    RL VARCHAR NOT NULL CHECK (RL IN ('TEACHER', 'STUDENT')),
+    UNIQUE (CRS_ID, USR_ID)
+);
+CREATE TABLE IF NOT EXISTS ANNCMNTS (
+    ID VARCHAR PRIMARY KEY,
+    CRS_ID VARCHAR NOT NULL,
+    CRTR_USR_ID VARCHAR NOT NULL,
+    TXT VARCHAR,
+    STT VARCHAR,
+    CRTN_TM VARCHAR,
+    UPDT_TM VARCHAR,
+    CNTNT_HSH BIGINT
+);
+CREATE TABLE IF NOT EXISTS CRS_WRK (
+    ID VARCHAR PRIMARY KEY,
+    CRS_ID VARCHAR NOT NULL,
+    TTL VARCHAR NOT NULL,
+    DSCRPTN VARCHAR,
+    WRK_TYP VARCHAR,
+    MX_PNTS DOUBLE,
+    CRTN_TM VARCHAR,
+    UPDT_TM VARCHAR,
+    CNTNT_HSH BIGINT,
+    CRTR_USR_ID VARCHAR
+);
+CREATE TABLE IF NOT EXISTS STDNT_SBMSSNS (
+    ID VARCHAR PRIMARY KEY,
+    CRS_WRK_ID VARCHAR NOT NULL,
+    USR_ID VARCHAR NOT NULL,
+    STT VARCHAR,
+    ASSGND_GRD DOUBLE,
+    DRFT_GRD DOUBLE,
+    CRTN_TM VARCHAR,
+    UPDT_TM VARCHAR,
+    CNTNT_HSH BIGINT,
+    LT INTEGER NOT NULL DEFAULT 0
+);
+CREATE SEQUENCE IF NOT EXISTS DD_LTTR_ID_SEQ;
+CREATE TABLE IF NOT EXISTS DD_LTTRS (
+    ID BIGINT PRIMARY KEY DEFAULT nextval('DD_LTTR_ID_SEQ'),
+    ENDPNT VARCHAR NOT NULL,
+    PRMS VARCHAR NOT NULL,
+    PG_TKN VARCHAR NOT NULL DEFAULT '',
+    STTS INTEGER,
+    MSSG VARCHAR,
+    ATTMPTS INTEGER NOT NULL DEFAULT 1,
+    FRST_FLD_TM VARCHAR NOT NULL,
+    LST_FLD_TM VARCHAR NOT NULL,
+    UNIQUE (ENDPNT, PRMS, PG_TKN)
+);
+CREATE SEQUENCE IF NOT EXISTS QRNTN_ID_SEQ;
+CREATE TABLE IF NOT EXISTS QRNTN (
+    ID BIGINT PRIMARY KEY DEFAULT nextval('QRNTN_ID_SEQ'),
+    TBL VARCHAR NOT NULL,
+    ITM_ID VARCHAR NOT NULL DEFAULT '',
+    RSN VARCHAR NOT NULL,
+    PYLD VARCHAR NOT NULL,
+    SN_CNT INTEGER NOT NULL DEFAULT 1,
+    FRST_SN_TM VARCHAR NOT NULL,
+    LST_SN_TM VARCHAR NOT NULL,
+    UNIQUE (TBL, ITM_ID, RSN)
+);
+-- Columns added after a database was created
+ALTER TABLE STDNT_SBMSSNS ADD COLUMN IF NOT EXISTS LT INTEGER DEFAULT 0;
+"""
+
+# How each table is appended: its columns with their Arrow types, in the order
+# of its rows (src.normalize.COLUMNS), the conflict key, and the columns an
+# upsert updates. Updates mirror the SQLite upserts.
+_DUCKDB_TABLES = {
+    'USRS': (
+        (('ID', 'string'), ('NM', 'string'), ('EML', 'string'), ('PHT_URL', 'string'), ('CNTNT_HSH', 'int64')),
+        ('ID',), ('NM', 'EML', 'PHT_URL', 'CNTNT_HSH'),
+    ),
+    'CRSS': (
+        (('ID', 'string'), ('NM', 'string'), ('SCTN', 'string'), ('DSCRPTN', 'string'), ('CRTN_TM', 'string'),
+         ('UPDT_TM', 'string'), ('CRS_STT', 'string'), ('CNTNT_HSH', 'int64')),
+        ('ID',), ('NM', 'SCTN', 'DSCRPTN', 'UPDT_TM', 'CRS_STT', 'CNTNT_HSH'),
+    ),
+    'ENRLLMNTS': (
+        (('CRS_ID', 'string'), ('USR_ID', 'string'), ('RL', 'string')),
+        ('CRS_ID', 'USR_ID'), (),
+    ),
+    'ANNCMNTS': (
+        (('ID', 'string'), ('CRS_ID', 'string'), ('CRTR_USR_ID', 'string'), ('TXT', 'string'), ('STT', 'string'),
+         ('CRTN_TM', 'string'), ('UPDT_TM', 'string'), ('CNTNT_HSH', 'int64')),
+        ('ID',), ('TXT', 'STT', 'UPDT_TM', 'CNTNT_HSH'),
+    ),
+    'CRS_WRK': (
+        (('ID', 'string'), ('CRS_ID', 'string'), ('TTL', 'string'), ('DSCRPTN', 'string'), ('WRK_TYP', 'string'),
+         ('MX_PNTS', 'float64'), ('CRTN_TM', 'string'), ('UPDT_TM', 'string'), ('CNTNT_HSH', 'int64'),
+         ('CRTR_USR_ID', 'string')),
+        ('ID',), ('TTL', 'DSCRPTN', 'WRK_TYP', 'MX_PNTS', 'UPDT_TM', 'CNTNT_HSH', 'CRTR_USR_ID'),
+    ),
+    'STDNT_SBMSSNS': (
+        (('ID', 'string'), ('CRS_WRK_ID', 'string'), ('USR_ID', 'string'), ('STT', 'string'),
+         ('ASSGND_GRD', 'float64'), ('DRFT_GRD', 'float64'), ('CRTN_TM', 'string'), ('UPDT_TM', 'string'),
+         ('CNTNT_HSH', 'int64'), ('LT', 'int32')),
+        ('ID',), ('STT', 'ASSGND_GRD', 'DRFT_GRD', 'UPDT_TM', 'CNTNT_HSH', 'LT'),
+    ),
+}
+
+# Dependent rows removed after a purge, parents first: (table, parent key, parent table)
+_DEPENDENTS = (
+    ('ENRLLMNTS', 'CRS_ID', 'CRSS'),
+    ('ANNCMNTS', 'CRS_ID', 'CRSS'),
+    ('CRS_WRK', 'CRS_ID', 'CRSS'),
+    ('STDNT_SBMSSNS', 'CRS_WRK_ID', 'CRS_WRK'),
+)
+
+def _upsert_sql(table: str) -> str:
+    """Returns the statement merging the registered batch into a table."""
+    columns, key, updates = _DUCKDB_TABLES[table]
+    names = ', '.join(name for name, _ in columns)
+    sql = f"INSERT INTO {table} ({names}) SELECT {names} FROM _batch ON CONFLICT ({', '.join(key)}) "
+    if not updates:
+        return sql + "DO NOTHING;"
+    assignments = ', '.join(f"{column} = excluded.{column}" for column in updates)
+    return sql + f"DO UPDATE SET {assignments} WHERE {table}.CNTNT_HSH IS DISTINCT FROM excluded.CNTNT_HSH;"
+
+
+class DuckDBBackend(StorageBackend):
+    """
+    Buffers rows per table and appends them to a DuckDB database in batches.
+
+    A batch is appended once batch_rows rows of one table are pending, and
+    everything pending is appended on commit(), before a query, and before
+    views are created or rows purged. Within a batch the last row saved for a
+    key wins, as it would with row-at-a-time upserts.
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, path: str, metrics=None, batch_rows: int = DEFAULT_BATCH_ROWS):
+        super().__init__(metrics)
+        duckdb, self._pa = import_duckdb()
+        self.path = path
+        self.batch_rows = batch_rows
+        self.conn = duckdb.connect(path)
+        self.conn.execute(_DUCKDB_SCHEMA)
+        self.conn.execute(ROLLUP_SCHEMA)
+        self._pending = {table: {} for table in _DUCKDB_TABLES}
+        self._upserts = {table: _upsert_sql(table) for table in _DUCKDB_TABLES}
+        self._tracking = False
+        self.conn.begin()
+        logger.info(f"DuckDB database opened at '{path}'.")
+
+    def _queue(self, table: str, key, row: dict):
+        pending = self._pending[table]
+        pending[key] = row
+        if len(pending) >= self.batch_rows:
+            self._append(table)
+
+    def _arrow_table(self, table: str, rows):
+        """Builds an Arrow table of the given row tuples, one typed column at a time."""
+        pa = self._pa
+        columns = _DUCKDB_TABLES[table][0]
+        values = list(zip(*rows))
+        return pa.table({
+            name: pa.array(values[i], type=getattr(pa, arrow_type)())
+            for i, (name, arrow_type) in enumerate(columns)
+        })
+
+    def _append(self, table: str):
+        """Merges the rows pending for one table into it."""
+        rows = self._pending[table]
+        if not rows:
+            return
+        self._pending[table] = {}
+        start = time.perf_counter()
+        self.conn.register('_batch', self._arrow_table(table, rows.values()))
+        try:
+            written = self.conn.execute(self._upserts[table]).fetchone()[0]
+        finally:
+            self.conn.unregister('_batch')
+        if self.metrics:
+            self.metrics.observe_write(table, written, time.perf_counter() - start, skipped=len(rows) - written)
+
+    def flush(self):
+        """Appends every pending row."""
+        for table in _DUCKDB_TABLES:
+            self._append(table)
+
+    def _save_item(self, table: str, item: dict):
+        try:
+            row = NORMALIZERS[table](item)
+        except MalformedItemError as e:
+            self.record_quarantined(table, [Rejected(item, str(e))])
+            return None
+        self._queue(table, row[0], row)
+        return True
+
+    def save_user(self, user_profile: dict):
+        return self._save_item('USRS', user_profile)
+
+    def save_course(self, course: dict):
+        return self._save_item('CRSS', course)
+
+    def save_enrollment(self, course_id: str, user_id: str, role: str):
+        # The first enrollment saved is kept, as SQLite's DO NOTHING would
+        key = (course_id, user_id)
+        if key not in self._pending['ENRLLMNTS']:
+            self._queue('ENRLLMNTS', key, (course_id, user_id, role))
+
+    def save_announcement(self, announcement: dict):
+        return self._save_item('ANNCMNTS', announcement)
+
+    def save_course_work(self, course_work_item: dict):
+        return self._save_item('CRS_WRK', course_work_item)
+
+    def save_student_submission(self, submission: dict):
+        return self._save_item('STDNT_SBMSSNS', submission)
+
+    def save_page(self, table: str, items: list) -> list:
+        rows, rejected = normalize_items(table, items)
+        for row in rows:
+            self._queue(table, row[0], row)
+        if rejected:
+            self.record_quarantined(table, rejected)
+        return [row[0] for row in rows]
+
+    def record_quarantined(self, table: str, rejected):
+        """Records malformed items in the quarantine table, at once like dead letters."""
+        if self.metrics:
+            self.metrics.observe_write(table, 0, 0.0, quarantined=len(rejected))
+        self.conn.executemany("""
+            INSERT INTO QRNTN (TBL, ITM_ID, RSN, PYLD, FRST_SN_TM, LST_SN_TM)
+            VALUES ($table, $itemId, $reason, $payload, $now, $now)
+            ON CONFLICT (TBL, ITM_ID, RSN) DO UPDATE SET
+                PYLD = excluded.PYLD,
+                SN_CNT = QRNTN.SN_CNT + 1,
+                LST_SN_TM = excluded.LST_SN_TM;
+        """, quarantine_rows(table, rejected))
+
+    def begin_seen_tracking(self):
+        self.conn.execute("""
+            CREATE OR REPLACE TEMP TABLE SEEN_IDS (CLLCTN VARCHAR, PRNT_ID VARCHAR, ID VARCHAR);
+            CREATE OR REPLACE TEMP TABLE LSTD_PRNTS (CLLCTN VARCHAR, PRNT_ID VARCHAR);
+        """)
+        self._tracking = True
+
+    def record_listing(self, collection: str, parent_id: str, ids):
+        pa = self._pa
+        ids = list(ids)
+        if ids:
+            self.conn.register('_seen', pa.table({
+                'CLLCTN': pa.array([collection] * len(ids), type=pa.string()),
+                'PRNT_ID': pa.array([parent_id] * len(ids), type=pa.string()),
+                'ID': pa.array(ids, type=pa.string()),
+            }))
+            try:
+                self.conn.execute("INSERT INTO temp.SEEN_IDS SELECT * FROM _seen;")
+            finally:
+                self.conn.unregister('_seen')
+        self.conn.execute("INSERT INTO temp.LSTD_PRNTS VALUES (?, ?);", (collection, parent_id))
+
+    def purge_unseen(self) -> dict:
+        self.flush()
+        deleted = {}
+        for collection, (table, parent, id_column, condition) in TRACKED_COLLECTIONS.items():
+            extra = f" AND {condition}" if condition else ''
+            deleted[collection] = self.conn.execute(f"""
+                DELETE FROM {table}
+                WHERE {parent} IN (
+                    SELECT PRNT_ID FROM temp.LSTD_PRNTS WHERE CLLCTN = $collection
+                ){extra}
+                AND {id_column} NOT IN (
+                    SELECT ID FROM temp.SEEN_IDS
+                    WHERE CLLCTN = $collection AND PRNT_ID = {parent}
+                );
+            """, {'collection': collection}).fetchone()[0]
+        if any(deleted.values()):
+            for table, parent_key, parent_table in _DEPENDENTS:
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE {parent_key} NOT IN (SELECT ID FROM {parent_table});"
+                )
+        return deleted
+
+    def record_dead_letters(self, failures):
+        # Dead letters are few, so they are written at once rather than batched
+        rows = dead_letter_rows(failures)
+        if not rows:
+            return
+        self.conn.executemany("""
+            INSERT INTO DD_LTTRS (ENDPNT, PRMS, PG_TKN, STTS, MSSG, FRST_FLD_TM, LST_FLD_TM)
+            VALUES ($endpoint, $params, $pageToken, $status, $message, $now, $now)
+            ON CONFLICT (ENDPNT, PRMS, PG_TKN) DO UPDATE SET
+                STTS = excluded.STTS,
+                MSSG = excluded.MSSG,
+                ATTMPTS = DD_LTTRS.ATTMPTS + 1,
+                LST_FLD_TM = excluded.LST_FLD_TM;
+        """, rows)
+
+    def dead_letters(self) -> list:
+        return [dead_letter_from_row(row) for row in self.conn.execute("""
+            SELECT ID, ENDPNT, PRMS, PG_TKN, STTS, MSSG, ATTMPTS, FRST_FLD_TM, LST_FLD_TM
+            FROM DD_LTTRS ORDER BY ID;
+        """).fetchall()]
+
+    def resolve_dead_letter(self, letter_id: int):
+        self.conn.execute("DELETE FROM DD_LTTRS WHERE ID = ?;", (letter_id,))
+
+    def create_views(self):
+        self.flush()
+        # Without triggers, the rollups are recomputed once per run: a
+        # columnar aggregate over the submissions
+        rebuild_rollups(self.conn)
+        for name, query in ANALYTICS_VIEWS:
+            self.conn.execute(f"CREATE OR REPLACE VIEW {name} AS{query};")
+        self.commit()
+        logger.info("Database views created successfully.")
+
+    def query(self, sql: str, params=()) -> list:
+        self.flush()
+        return self.conn.execute(sql, params).fetchall()
+
+    def commit(self):
+        self.flush()
+        self.conn.commit()
+        self.conn.begin()
+
+    def close(self):
+        self._pending = {table: {} for table in _DUCKDB_TABLES}
+        self.conn.rollback()
+        self.conn.close()
+
+
+def open_storage(path: str, backend: str = DEFAULT_BACKEND, metrics=None) -> StorageBackend:
+    """
+    Opens (creating if needed) the database at path with the named backend.
+
+    Args:
+        path: The database file path.
+        backend: One of BACKENDS.
+        metrics: An optional MetricsRecorder for the rows written.
+
+    Returns:
+        The opened StorageBackend.
+    """
+    if backend == 'duckdb':
+        return DuckDBBackend(path, metrics)
+    return SQLiteBackend(initialize_database(path), metrics)
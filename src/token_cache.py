@@ -0,0 +1,168 @@
+"""
+A file-backed OAuth access token cache shared between runs and processes.
+
+Delegated service account credentials normally exchange a signed JWT for an
+access token the first time each process makes a request. With the cache,
+the token is stored in a local file protected by an exclusive lock: the first
+process to need a token fetches it, and every other run or worker reuses it
+until shortly before it expires, when exactly one of them refreshes it.
+
+The cache file holds live access tokens, so it is created readable by the
+owner only and should be kept out of version control.
+"""
+
+import calendar
+import datetime
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+import google.auth.credentials
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Tokens are refreshed this long before they expire. Google access tokens are
+# valid for an hour, so a five-minute margin leaves every consumer a usable
+# token while keeping refreshes to about one per hour.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+def _utcnow() -> datetime.datetime:
+    # google-auth represents expiry as a naive UTC datetime
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class SharedTokenCache:
+    """
+    Stores access tokens in a JSON file, keyed by service account, subject and scopes.
+
+    Args:
+        path: The path of the cache file. A '<path>.lock' file is created beside it.
+        refresh_margin: How long before expiry a cached token stops being used.
+    """
+
+    def __init__(self, path: str, refresh_margin: datetime.timedelta = REFRESH_MARGIN):
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._thread_lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(credentials) -> str:
+        """Returns the cache key for a delegated service account credential."""
+        identity = '|'.join([
+            getattr(credentials, 'service_account_email', '') or '',
+            getattr(credentials, '_subject', '') or '',
+            ' '.join(sorted(getattr(credentials, '_scopes', None) or [])),
+        ])
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def _locked(self):
+        """Holds an exclusive lock across threads and processes."""
+        with self._thread_lock:
+            fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+                os.close(fd)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            # A missing or corrupt cache is simply refilled
+            return {}
+
+    def _write(self, entries: dict):
+        temp_path = f"{self.path}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(temp_path, self.path)
+
+    def is_fresh(self, expiry: datetime.datetime) -> bool:
+        """Returns True if a token with this expiry can still be handed out."""
+        return expiry is not None and _utcnow() < expiry - self.refresh_margin
+
+    def get_token(self, credentials, request) -> tuple:
+        """
+        Returns a fresh (token, expiry) pair for the credentials.
+
+        Uses the cached token if it is not close to expiry; otherwise refreshes
+        the credentials with the given transport request and stores the result.
+
+        Args:
+            credentials: The google-auth credentials to obtain a token for.
+            request: A google.auth.transport.Request used if a refresh is needed.
+
+        Returns:
+            A tuple of the access token and its expiry (naive UTC datetime).
+        """
+        key = self.cache_key(credentials)
+        with self._locked():
+            entries = self._read()
+            entry = entries.get(key)
+            if entry:
+                expiry = datetime.datetime.fromtimestamp(
+                    entry['expiry'], datetime.timezone.utc
+                ).replace(tzinfo=None)
+                if self.is_fresh(expiry):
+                    return entry['token'], expiry
+
+            credentials.refresh(request)
+            entries[key] = {
+                'token': credentials.token,
+                'expiry': calendar.timegm(credentials.expiry.utctimetuple()),
+            }
+            # Drop tokens that have already expired so the file stays small
+            now = calendar.timegm(_utcnow().utctimetuple())
+            entries = {k: v for k, v in entries.items() if v['expiry'] > now}
+            self._write(entries)
+            return credentials.token, credentials.expiry
+
+
+@lru_cache(maxsize=None)
+def get_token_cache(path: str) -> SharedTokenCache:
+    """Returns the process-wide SharedTokenCache for a cache file path."""
+    return SharedTokenCache(path)
+
+
+class SharedCacheCredentials(google.auth.credentials.Credentials):
+    """
+    Credentials that obtain their access token through a SharedTokenCache.
+
+    Wraps another set of credentials (typically delegated service account
+    credentials), which are only refreshed when the shared cache has no
+    fresh token for them.
+    """
+
+    def __init__(self, credentials, cache: SharedTokenCache):
+        super().__init__()
+        self._wrapped = credentials
+        self._cache = cache
+
+    @property
+    def expired(self) -> bool:
+        # Treat the token as expired at the same point the cache stops
+        # handing it out, so all consumers move to the new token together.
+        return self.expiry is not None and not self._cache.is_fresh(self.expiry)
+
+    def refresh(self, request):
+        self.token, self.expiry = self._cache.get_token(self._wrapped, request)
@@ -0,0 +1,128 @@
+"""
+Classroom API items for tests, shaped as the API returns them, and a fake
+Classroom service that lists them.
+
+Each factory fills in the fields a save needs; keyword arguments add or
+override any field, e.g. submission('s1', state='RETURNED', late=True).
+"""
+
+import threading
+from unittest.mock import MagicMock
+
+from googleapiclient.errors import HttpError
+
+def user(user_id='user1', name=None, **fields):
+    return {'id': user_id, 'name': {'fullName': name or user_id.title()},
+            'emailAddress': f'{user_id}@example.org', **fields}
+
+def course(course_id='course1', name=None, **fields):
+    return {'id': course_id, 'name': name or course_id, 'courseState': 'ACTIVE',
+            'creationTime': 't', 'updateTime': 't', **fields}
+
+def announcement(announcement_id='anno1', course_id='course1', creator_id='teacher1', **fields):
+    return {'id': announcement_id, 'courseId': course_id, 'creatorUserId': creator_id, 'text': 'Hello',
+            'creationTime': 't', 'updateTime': 't', **fields}
+
+def course_work(work_id='work1', course_id='course1', **fields):
+    return {'id': work_id, 'courseId': course_id, 'title': work_id, 'creationTime': 't', 'updateTime': 't', **fields}
+
+def submission(submission_id='sub1', work_id='work1', user_id='user1', **fields):
+    return {'id': submission_id, 'courseWorkId': work_id, 'userId': user_id, 'state': 'TURNED_IN',
+            'creationTime': 't', 'updateTime': 't', **fields}
+
+class FakeClassroom:
+    """
+    A Classroom service of courses c0, c1, ..., each with its teachers,
+    students (the same students in every course), announcements and course
+    work items, and a submission from each student to each item.
+
+    Listings are paged, page_size items a page (course_page_size for the
+    courses). failing holds (items key, parent ID, page token) triples that
+    fail with a 500, and forbidden those that fail with a 403; expired holds
+    page tokens that fail with a 400. grade returns the submissions with that
+    grade, and the courses in malformed_courses are returned without their
+    creationTime. calls counts the requests executed.
+    """
+
+    def __init__(self, courses=3, teachers=1, students=15, announcements=2, works=3, page_size=10,
+                 course_page_size=2, failing=(), forbidden=(), expired=(), grade=None, malformed_courses=()):
+        self.courses = courses
+        self.malformed_courses = set(malformed_courses)
+        self.page_size = page_size
+        self.course_page_size = course_page_size
+        self.failing = set(failing)
+        self.forbidden = set(forbidden)
+        self.expired = set(expired)
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.service = MagicMock()
+        service_courses = self.service.courses()
+        service_courses.get.side_effect = self._getter
+        service_courses.list.side_effect = self._lister('courses', lambda params: [
+            self._course(f'c{i}') for i in range(courses)
+        ])
+        service_courses.teachers().list.side_effect = self._lister('teachers', lambda params: [
+            {'profile': user(f"{params['courseId']}-t{i}", 'Teacher')} for i in range(teachers)
+        ])
+        service_courses.students().list.side_effect = self._lister('students', lambda params: [
+            {'profile': user(f's{i}', f'Student {i}')} for i in range(students)
+        ])
+        service_courses.announcements().list.side_effect = self._lister('announcements', lambda params: [
+            announcement(f"{params['courseId']}-a{i}", params['courseId'], f"{params['courseId']}-t0",
+                         text='Reminder')
+            for i in range(announcements)
+        ])
+        service_courses.courseWork().list.side_effect = self._lister('courseWork', lambda params: [
+            course_work(f"{params['courseId']}-w{i}", params['courseId'], title='Lab report')
+            for i in range(works)
+        ])
+        service_courses.courseWork().studentSubmissions().list.side_effect = self._lister(
+            'studentSubmissions', lambda params: [
+                submission(f"{params['courseWorkId']}-s{i}", params['courseWorkId'], f's{i}',
+                           state='RETURNED' if grade else 'TURNED_IN', assignedGrade=grade)
+                for i in range(students)
+            ])
+
+    def _course(self, course_id):
+        item = course(course_id, f'Course {course_id[1:]}')
+        if course_id in self.malformed_courses:
+            del item['creationTime']
+        return item
+
+    def _getter(self, id):
+        request = MagicMock()
+
+        def execute():
+            with self.lock:
+                self.calls += 1
+            if id not in {f'c{i}' for i in range(self.courses)}:
+                raise HttpError(MagicMock(status=404), b'not found')
+            return self._course(id)
+        request.execute.side_effect = execute
+        return request
+
+    def _lister(self, key, make_items):
+        size = self.course_page_size if key == 'courses' else self.page_size
+
+        def execute(params, page_token):
+            with self.lock:
+                self.calls += 1
+            parent = params.get('courseWorkId', params.get('courseId', ''))
+            if (key, parent, page_token) in self.failing:
+                raise HttpError(MagicMock(status=500), b'backend error')
+            if (key, parent, page_token) in self.forbidden:
+                raise HttpError(MagicMock(status=403), b'forbidden')
+            if page_token in self.expired:
+                raise HttpError(MagicMock(status=400), b'invalid page token')
+            items = make_items(params)
+            start = int(page_token.rsplit('-', 1)[-1]) if page_token else 0
+            page = {key: items[start:start + size]}
+            if start + size < len(items):
+                page['nextPageToken'] = f'{parent}-{start + size}'
+            return page
+
+        def list_method(pageToken=None, **params):
+            request = MagicMock()
+            request.execute.side_effect = lambda: execute(params, pageToken)
+            return request
+        return list_method
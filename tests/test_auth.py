@@ -1,8 +1,11 @@
+import os
+import subprocess
+import sys
 import unittest
 from unittest.mock import patch, MagicMock
 import configparser
 
-from src.auth import get_classroom_service, SCOPES
+from src.auth import get_classroom_service, load_discovery_document, SCOPES
 
 class TestAuth(unittest.TestCase):
 
@@ -14,12 +17,13 @@ class TestAuth(unittest.TestCase):
             'ADMIN_USER_EMAIL': 'admin@example.com'
         }
 
-    @patch('src.auth.build')
-    @patch('src.auth.google.oauth2.service_account.Credentials')
-    def test_get_classroom_service(self, mock_credentials, mock_build):
+    @patch('src.transport.PooledHttp')
+    @patch('googleapiclient.discovery.build_from_document')
+    @patch('google.oauth2.service_account.Credentials')
+    def test_get_classroom_service(self, mock_credentials, mock_build, mock_pooled_http):
         """
-        Tests that the Google API service is built with the correct,
-        delegated credentials.
+        Tests that the Google API service is built on a pooled transport with
+        the correct, delegated credentials.
         """
         # Arrange
         # Mock the credentials object and the delegated credentials object
@@ -31,6 +35,8 @@ class TestAuth(unittest.TestCase):
         # Mock the build object
         mock_service = MagicMock()
         mock_build.return_value = mock_service
+        self.mock_config['GOOGLE']['HTTP_READ_TIMEOUT'] = '30'
+        self.mock_config['SETTINGS'] = {'MAX_CONCURRENT_REQUESTS': '4'}
 
         # Act
         service = get_classroom_service(self.mock_config)
@@ -44,14 +50,83 @@ class TestAuth(unittest.TestCase):
         # Check that we impersonated the correct user
         mock_creds_instance.with_subject.assert_called_once_with('admin@example.com')
 
-        # Check that the service was built with the delegated credentials
-        mock_build.assert_called_once_with(
-            'classroom', 'v1', credentials=mock_delegated_creds_instance
+        # Check that the transport pools a connection per request in flight
+        # and authorizes with the delegated credentials
+        mock_pooled_http.assert_called_once_with(
+            mock_delegated_creds_instance, pool_size=4, connect_timeout=10.0, read_timeout=30.0
         )
 
+        # Check that the service was built from the packaged discovery document
+        # on the pooled transport
+        mock_build.assert_called_once_with(load_discovery_document(), http=mock_pooled_http.return_value)
+
         # Check that the final service object is returned
         self.assertEqual(service, mock_service)
 
+    @patch('googleapiclient.discovery.build_from_document')
+    @patch('google.oauth2.service_account.Credentials')
+    def test_get_classroom_service_httplib2(self, mock_credentials, mock_build):
+        """Tests that the client library's own transport is used when HTTP_TRANSPORT is httplib2."""
+        mock_delegated_creds_instance = mock_credentials.from_service_account_file.return_value.with_subject.return_value
+        self.mock_config['GOOGLE']['HTTP_TRANSPORT'] = 'httplib2'
+
+        get_classroom_service(self.mock_config)
+
+        mock_build.assert_called_once_with(load_discovery_document(), credentials=mock_delegated_creds_instance)
+
+    @patch('googleapiclient.discovery.build_from_document')
+    @patch('google.oauth2.service_account.Credentials')
+    def test_get_classroom_service_shared_transport(self, mock_credentials, mock_build):
+        """Tests that services given a transport share it, without loading credentials again."""
+        http = MagicMock()
+        get_classroom_service(self.mock_config, http)
+        get_classroom_service(self.mock_config, http)
+
+        mock_credentials.from_service_account_file.assert_not_called()
+        self.assertEqual([call.kwargs for call in mock_build.call_args_list], [{'http': http}, {'http': http}])
+
+    @patch('src.transport.PooledHttp')
+    @patch('googleapiclient.discovery.build_from_document')
+    @patch('google.oauth2.service_account.Credentials')
+    def test_get_classroom_service_with_token_cache(self, mock_credentials, mock_build, mock_pooled_http):
+        """Tests that the delegated credentials are wrapped when a token cache is configured."""
+        from src.token_cache import SharedCacheCredentials
+
+        self.mock_config['GOOGLE']['TOKEN_CACHE_FILE'] = 'tokens.json'
+        get_classroom_service(self.mock_config)
+
+        credentials = mock_pooled_http.call_args.args[0]
+        self.assertIsInstance(credentials, SharedCacheCredentials)
+        self.assertEqual(credentials._cache.path, 'tokens.json')
+
+    def test_load_discovery_document(self):
+        """Tests that the packaged discovery document is parsed once and cached."""
+        document = load_discovery_document()
+        self.assertEqual(document['name'], 'classroom')
+        self.assertEqual(document['version'], 'v1')
+        self.assertIn('courses', document['resources'])
+        self.assertIs(load_discovery_document(), document)
+
+    def test_service_built_from_packaged_document(self):
+        """Tests that a real service object can be built from the packaged document."""
+        from googleapiclient.discovery import build_from_document
+        from google.auth.credentials import AnonymousCredentials
+
+        service = build_from_document(load_discovery_document(), credentials=AnonymousCredentials())
+        request = service.courses().courseWork().studentSubmissions().list(
+            courseId='c1', courseWorkId='cw1', pageToken=None
+        )
+        self.assertIn('/v1/courses/c1/courseWork/cw1/studentSubmissions', request.uri)
+
+    def test_client_library_not_imported_by_main(self):
+        """Tests that importing main leaves the Google client library to be loaded when first used."""
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        output = subprocess.run(
+            [sys.executable, '-c', "import sys, main; print(sorted(m for m in sys.modules if m.startswith('google')))"],
+            cwd=root, capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(output.strip(), '[]')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,111 @@
+import argparse
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+
+import main
+from src.changes import ChangeLogError, begin_run, change_cursor, end_run, initialize_change_log, iter_changes
+from src.database import (
+    initialize_database, purge_unseen, begin_seen_tracking, record_listing, save_course, save_course_work,
+    save_enrollment, save_student_submission, save_user
+)
+from tests.factories import course, course_work, submission, user
+
+class TestChangeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = initialize_database(':memory:')
+        initialize_change_log(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _changes(self, since=0, tables=None, chunk_size=100):
+        return [change for chunk in iter_changes(self.conn, since, tables, chunk_size) for change in chunk]
+
+    def _first_run(self):
+        run_id = begin_run(self.conn)
+        save_course(self.conn, course('course1', 'Biology'))
+        save_user(self.conn, user('student1'))
+        save_enrollment(self.conn, 'course1', 'student1', 'STUDENT')
+        save_course_work(self.conn, course_work('work1', title='Lab report', maxPoints=10))
+        save_student_submission(self.conn, submission(user_id='student1'))
+        end_run(self.conn, run_id)
+        return run_id
+
+    def test_inserts_updates_and_deletes_logged(self):
+        """Tests that each write is logged with its run, key and changed columns, and unchanged rows are not."""
+        first = self._first_run()
+        cursor = change_cursor(self.conn)
+        self.assertEqual([(c.run_id, c.table, c.key, c.operation) for c in self._changes()], [
+            (first, 'CRSS', 'course1', 'INSERT'),
+            (first, 'USRS', 'student1', 'INSERT'),
+            (first, 'ENRLLMNTS', 'course1:student1', 'INSERT'),
+            (first, 'CRS_WRK', 'work1', 'INSERT'),
+            (first, 'STDNT_SBMSSNS', 'sub1', 'INSERT'),
+        ])
+
+        second = begin_run(self.conn)
+        save_course(self.conn, course('course1', 'Biology'))
+        save_enrollment(self.conn, 'course1', 'student1', 'STUDENT')
+        save_student_submission(self.conn, submission(user_id='student1', state='RETURNED', assignedGrade=9))
+        # The course work disappears from its listing: it goes, with its submission
+        begin_seen_tracking(self.conn)
+        record_listing(self.conn, 'CRS_WRK', 'course1', [])
+        purge_unseen(self.conn)
+        end_run(self.conn, second)
+
+        self.assertEqual([(c.run_id, c.table, c.key, c.operation, c.columns) for c in self._changes(cursor)], [
+            (second, 'STDNT_SBMSSNS', 'sub1', 'UPDATE', ('STT', 'ASSGND_GRD')),
+            (second, 'STDNT_SBMSSNS', 'sub1', 'DELETE', None),
+            (second, 'CRS_WRK', 'work1', 'DELETE', None),
+        ])
+
+    def test_changes_streamed_in_chunks(self):
+        """Tests that changes come in chunks after the cursor, optionally for some tables only."""
+        self._first_run()
+        chunks = list(iter_changes(self.conn, since=1, chunk_size=2))
+        self.assertEqual([[c.seq for c in chunk] for chunk in chunks], [[2, 3], [4, 5]])
+        self.assertEqual([c.key for c in self._changes(tables=['ENRLLMNTS', 'STDNT_SBMSSNS'])],
+                         ['course1:student1', 'sub1'])
+        self.assertEqual(self._changes(since=change_cursor(self.conn)), [])
+        with self.assertRaises(ChangeLogError):
+            self._changes(tables=['DD_LTTRS'])
+
+    def test_old_runs_dropped(self):
+        """Tests that only the last runs' changes are kept, and an older cursor is refused."""
+        self._first_run()
+        for grade in (5, 6):
+            run_id = begin_run(self.conn)
+            save_student_submission(self.conn, submission(user_id='student1', state='RETURNED', assignedGrade=grade))
+            end_run(self.conn, run_id, keep_runs=2)
+
+        self.assertEqual([(c.seq, c.columns) for c in self._changes(since=5)], [(6, ('STT', 'ASSGND_GRD')),
+                                                                                (7, ('ASSGND_GRD',))])
+        with self.assertRaises(ChangeLogError):
+            self._changes(since=4)
+
+    def test_disabling_stops_logging(self):
+        """Tests that disabling the log stops logging and keeps what was logged."""
+        self._first_run()
+        initialize_change_log(self.conn, enabled=False)
+        save_student_submission(self.conn, submission(user_id='student1', state='RETURNED', assignedGrade=7))
+        self.assertEqual(len(self._changes()), 5)
+
+    def test_changes_command(self):
+        """Tests that the changes command prints one JSON object per change after the cursor."""
+        self._first_run()
+        options = argparse.Namespace(since=3, tables=None, chunk_size=1, tenant=None)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main.changes(options, db_conn_for_testing=self.conn)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(lines, [
+            {'seq': 4, 'run': 1, 'table': 'CRS_WRK', 'key': 'work1', 'op': 'INSERT', 'columns': None},
+            {'seq': 5, 'run': 1, 'table': 'STDNT_SBMSSNS', 'key': 'sub1', 'op': 'INSERT', 'columns': None},
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import os
+import tempfile
+
+from src.database import (
+    initialize_database, create_views, save_user, save_course, save_enrollment,
+    save_course_work, save_student_submission
+)
+from src.export import connect_read_only, export_many
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.ipc
+    import pyarrow.parquet
+    from src.columnar import export_columnar
+except ImportError:
+    pyarrow = None
+
+@unittest.skipUnless(pyarrow, "pyarrow is not installed")
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a database file with two courses of graded submissions."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'classroom.sqlite3')
+        conn = initialize_database(self.db_path)
+        for number in range(1, 4):
+            save_user(conn, {'id': f's{number}', 'name': {'fullName': f'Student {number}'}, 'emailAddress': f's{number}@example.com'})
+        for course_id in ('c1', 'c2'):
+            save_course(conn, {'id': course_id, 'name': f'Course {course_id}', 'creationTime': 't1', 'updateTime': 't2', 'courseState': 'ACTIVE'})
+            save_course_work(conn, {'id': f'{course_id}-w', 'courseId': course_id, 'title': 'Quiz', 'workType': 'ASSIGNMENT', 'maxPoints': 10, 'creationTime': 't3', 'updateTime': 't4'})
+            for number in range(1, 4):
+                save_enrollment(conn, course_id, f's{number}', 'STUDENT')
+                state = 'RETURNED' if number < 3 else 'TURNED_IN'
+                save_student_submission(conn, {'id': f'{course_id}-s{number}', 'courseWorkId': f'{course_id}-w', 'userId': f's{number}', 'state': state, 'assignedGrade': number * 3.0, 'creationTime': 't5', 'updateTime': 't6'})
+        conn.commit()
+        create_views(conn)
+        conn.close()
+        self.output_dir = os.path.join(self.temp_dir.name, 'export')
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_parquet_in_record_batches_with_dictionary_encoding(self):
+        """Tests that a view written in small batches keeps all rows, types and dictionary columns."""
+        conn = connect_read_only(self.db_path)
+        path, rows = export_columnar(conn, 'VW_ASSGNMNT_GRDS', self.output_dir, 'parquet', batch_size=2)
+        conn.close()
+
+        self.assertEqual(rows, 6)
+        self.assertTrue(path.endswith('VW_ASSGNMNT_GRDS.parquet'))
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.num_rows, 6)
+        self.assertTrue(pyarrow.types.is_dictionary(table.schema.field('SBMSSN_STS').type))
+        self.assertEqual(table.schema.field('ASSGND_GRD').type, pyarrow.float64())
+        self.assertEqual(sorted(table.column('SBMSSN_STS').to_pylist()), ['RETURNED'] * 4 + ['SBMITD'] * 2)
+
+    def test_arrow_ipc_file(self):
+        """Tests that Arrow IPC output reads back with its dictionaries across batches."""
+        conn = connect_read_only(self.db_path)
+        path, rows = export_columnar(conn, 'ENRLLMNTS', self.output_dir, 'arrow', batch_size=4)
+        conn.close()
+
+        table = pyarrow.ipc.open_file(path).read_all()
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(table.schema.field('ENRLLMNT_ID').type, pyarrow.int64())
+        self.assertEqual(set(table.column('RL').to_pylist()), {'STUDENT'})
+
+    def test_submissions_partitioned_by_course(self):
+        """Tests that submissions are written as one Hive-style partition per course."""
+        conn = connect_read_only(self.db_path)
+        path, rows = export_columnar(conn, 'STDNT_SBMSSNS', self.output_dir, 'parquet', batch_size=2)
+        conn.close()
+
+        self.assertEqual(rows, 6)
+        self.assertEqual(sorted(os.listdir(path)), ['CRS_ID=c1', 'CRS_ID=c2'])
+        dataset = pyarrow.dataset.dataset(path, format='parquet', partitioning='hive')
+        c2 = dataset.to_table(filter=pyarrow.dataset.field('CRS_ID') == 'c2')
+        self.assertEqual(sorted(c2.column('ID').to_pylist()), ['c2-s1', 'c2-s2', 'c2-s3'])
+
+        # Exporting again replaces the previous partitions
+        conn = connect_read_only(self.db_path)
+        export_columnar(conn, 'STDNT_SBMSSNS', self.output_dir, 'parquet')
+        conn.close()
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['STDNT_SBMSSNS'])
+
+    def test_export_many_columnar(self):
+        """Tests the parallel columnar export through export_many."""
+        results = export_many(self.db_path, ['USRS', 'VW_CRS_ACTVTY_LG'], self.output_dir, 'parquet')
+        self.assertEqual(results['USRS'][1], 3)
+        self.assertEqual(pyarrow.parquet.read_table(results['VW_CRS_ACTVTY_LG'][0]).num_rows, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+
+from src.compact import to_epoch_micros, write_compact_copy
+from src.database import (
+    initialize_database, save_user, save_course, save_enrollment,
+    save_announcement, save_course_work, save_student_submission
+)
+
+TABLE_COLUMNS = {
+    'USRS': 'ID, NM, EML, PHT_URL',
+    'CRSS': 'ID, NM, SCTN, DSCRPTN, CRTN_TM, UPDT_TM, CRS_STT',
+    'ENRLLMNTS': 'ENRLLMNT_ID, CRS_ID, USR_ID, RL',
+    'ANNCMNTS': 'ID, CRS_ID, CRTR_USR_ID, TXT, STT, CRTN_TM, UPDT_TM',
+    'CRS_WRK': 'ID, CRS_ID, TTL, DSCRPTN, WRK_TYP, MX_PNTS, CRTN_TM, UPDT_TM',
+    'STDNT_SBMSSNS': 'ID, CRS_WRK_ID, USR_ID, STT, ASSGND_GRD, DRFT_GRD, CRTN_TM, UPDT_TM',
+}
+
+class TestCompact(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a database with a course, a teacher, students and submissions."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = initialize_database(os.path.join(self.tmp.name, 'source.sqlite3'))
+        course_id = '6' * 12
+        save_course(self.conn, {'id': course_id, 'name': 'Biology', 'section': 'B1', 'creationTime': '2023-08-01T12:00:00.123Z', 'updateTime': '2024-01-15T08:30:00Z', 'courseState': 'ACTIVE'})
+        save_user(self.conn, {'id': 'teacher', 'name': {'fullName': 'Prof'}, 'emailAddress': 'prof@example.com'})
+        save_enrollment(self.conn, course_id, 'teacher', 'TEACHER')
+        save_announcement(self.conn, {'id': 'anno1', 'courseId': course_id, 'creatorUserId': 'teacher', 'text': 'Hello', 'state': 'PUBLISHED', 'creationTime': 'not a timestamp', 'updateTime': '2024-01-15T08:30:00.5Z'})
+        for w in range(20):
+            save_course_work(self.conn, {'id': f"{700000000000 + w}", 'courseId': course_id, 'title': f"Work {w}", 'workType': 'ASSIGNMENT', 'maxPoints': 100, 'creationTime': '2024-01-01T00:00:00.000Z', 'updateTime': f'2024-01-02T00:00:00.{w * 50:03d}Z'})
+        for u in range(50):
+            user_id = f"1{u:020d}"
+            save_user(self.conn, {'id': user_id, 'name': {'fullName': f"Student {u}"}, 'emailAddress': f"s{u}@example.com"})
+            save_enrollment(self.conn, course_id, user_id, 'STUDENT')
+            for w in range(20):
+                save_student_submission(self.conn, {'id': f"Cg4I{u:08d}{w:08d}EJ2Zw", 'courseWorkId': f"{700000000000 + w}", 'userId': user_id, 'state': 'TURNED_IN', 'assignedGrade': u % 100, 'creationTime': '2024-01-03T10:11:12.345678Z', 'updateTime': '2024-01-04T10:11:12.345Z'})
+        self.conn.commit()
+        self.dest = os.path.join(self.tmp.name, 'compact.sqlite3')
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_to_epoch_micros(self):
+        """Tests RFC 3339 parsing and the pass-through of other values."""
+        self.assertEqual(to_epoch_micros('1970-01-01T00:00:01.500Z'), 1500000)
+        self.assertEqual(to_epoch_micros('2024-01-15T08:30:00.000Z'), 1705307400000000)
+        self.assertEqual(to_epoch_micros('2024-01-15T08:30:00.000001Z'), 1705307400000001)
+        # Forms the views would not render back the same are kept as text
+        for value in ('2024-01-15T08:30:00Z', '1970-01-01T00:00:01.5Z', '2024-01-15T08:30:00.500000Z',
+                      '2024-01-15T08:30:00.123456789Z', '1969-12-31T23:59:59.000Z'):
+            self.assertEqual(to_epoch_micros(value), value)
+        self.assertEqual(to_epoch_micros('t1'), 't1')
+        self.assertIsNone(to_epoch_micros(None))
+
+    def test_compatibility_views_match_source(self):
+        """Tests that the compact copy exposes the same rows under the original names."""
+        write_compact_copy(self.conn, self.dest)
+        compact = sqlite3.connect(self.dest)
+        try:
+            for table, columns in TABLE_COLUMNS.items():
+                with self.subTest(table=table):
+                    query = f"SELECT {columns} FROM {table} ORDER BY 1, 2"
+                    self.assertEqual(compact.execute(query).fetchall(), self.conn.execute(query).fetchall())
+
+            # The analytics views work on top of the compatibility views
+            grades = compact.execute("SELECT COUNT(*) FROM VW_ASSGNMNT_GRDS").fetchone()[0]
+            self.assertEqual(grades, 1000)
+            # Timestamps are stored as integers, roles as codes
+            stored = compact.execute("SELECT typeof(UPDT_TM), typeof(STT_CD) FROM C_STDNT_SBMSSNS LIMIT 1").fetchone()
+            self.assertEqual(stored, ('integer', 'integer'))
+        finally:
+            compact.close()
+
+    def test_compact_copy_is_smaller(self):
+        """Tests that the compact copy takes less space than the source."""
+        write_compact_copy(self.conn, self.dest)
+        self.conn.execute("VACUUM;")
+        source_size = os.path.getsize(os.path.join(self.tmp.name, 'source.sqlite3'))
+        self.assertLess(os.path.getsize(self.dest), source_size)
+        self.assertFalse(os.path.exists(self.dest + '.tmp'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+
+from src.auth import load_discovery_document
+from src.concurrency import AdaptiveLimiter, FairShare, ServicePool, fetch_concurrently
+from src.extractor import get_courses, iter_student_submission_pages
+from src.metrics import MetricsRecorder
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """
+    Serves two pages of submissions per course work, answering 429 whenever
+    more than `capacity` requests are in flight.
+    """
+    capacity = 3
+    lock = threading.Lock()
+    in_flight = 0
+    throttled = 0
+    served = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            over = cls.in_flight > cls.capacity
+            if over:
+                cls.throttled += 1
+        try:
+            if over:
+                self._reply(429, {'error': {'code': 429, 'message': 'Quota exceeded'}}, {'Retry-After': '0'})
+                return
+            time.sleep(0.01)
+            url = urlparse(self.path)
+            work_id = url.path.split('/')[-2]
+            token = parse_qs(url.query).get('pageToken', [None])[0]
+            if token is None:
+                body = {'studentSubmissions': [{'id': f'{work_id}-a'}, {'id': f'{work_id}-b'}], 'nextPageToken': 'p2'}
+            else:
+                body = {'studentSubmissions': [{'id': f'{work_id}-c'}]}
+            with cls.lock:
+                cls.served += 1
+            self._reply(200, body)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def _reply(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_additive_increase(self):
+        """Tests that the limit grows by one after each healthy window of requests."""
+        limiter = AdaptiveLimiter(maximum=4)
+        limits = []
+        for _ in range(8):
+            with limiter.slot() as ticket:
+                limiter.succeeded(ticket, 0.1)
+            limits.append(int(limiter.limit))
+        # A window is as many successes as the current limit; capped at the maximum
+        self.assertEqual(limits, [2, 2, 3, 3, 3, 4, 4, 4])
+        self.assertEqual(limiter.increases, 3)
+
+    def test_multiplicative_decrease_once_per_window(self):
+        """Tests that throttling halves the limit once for requests already in flight."""
+        metrics = MetricsRecorder()
+        limiter = AdaptiveLimiter(maximum=16, initial=8, metrics=metrics)
+        tickets = [limiter._epoch] * 3  # Three requests in flight
+        for ticket in tickets:
+            limiter.throttled(ticket)
+        self.assertEqual(limiter.limit, 4)
+
+        # A request started after the cut is throttled too: cut again
+        with limiter.slot() as ticket:
+            limiter.throttled(ticket)
+        self.assertEqual(limiter.limit, 2)
+
+        # Never below the minimum
+        for _ in range(3):
+            with limiter.slot() as ticket:
+                limiter.throttled(ticket)
+        self.assertEqual(limiter.limit, 1)
+
+        concurrency = metrics.summary()['concurrency']
+        self.assertEqual(concurrency['decreases'], 5)
+        self.assertEqual((concurrency['lowest'], concurrency['highest']), (1, 8))
+        self.assertIn('fairplay_concurrency_limit_changes_total{decision="decrease"} 5', metrics.to_prometheus())
+
+    def test_slow_responses_hold_the_limit(self):
+        """Tests that the limit stops growing while latency is well above its best."""
+        limiter = AdaptiveLimiter(maximum=8)
+        with limiter.slot() as ticket:
+            limiter.succeeded(ticket, 0.1)
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(20):
+            with limiter.slot() as ticket:
+                limiter.succeeded(ticket, 2.0)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_retry_after_respected(self):
+        """Tests that a Retry-After header lengthens the backoff."""
+        limiter = AdaptiveLimiter(backoff=0.1)
+        self.assertLessEqual(limiter.retry_delay(0), 0.1)
+        self.assertEqual(limiter.retry_delay(0, '5'), 5.0)
+        self.assertLessEqual(limiter.retry_delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT'), 0.1)
+
+    def test_throttled_request_retried(self):
+        """Tests that a 429 is retried through the limiter and recorded in the metrics."""
+        metrics = MetricsRecorder()
+        limiter = AdaptiveLimiter(metrics=metrics, sleep=MagicMock())
+        service = MagicMock()
+        service.courses().list().execute.side_effect = [
+            HttpError(MagicMock(status=429), b'rate limited'),
+            {'courses': [{'id': 'course1'}]},
+        ]
+
+        courses = get_courses(service, metrics, limiter=limiter)
+
+        self.assertEqual(courses, [{'id': 'course1'}])
+        stats = metrics.summary()['endpoints']['courses.list']
+        self.assertEqual((stats['errors'], stats['retries'], stats['pages']), (1, 1, 1))
+        limiter.sleep.assert_called_once()
+
+class TestFairShare(unittest.TestCase):
+
+    def test_free_slot_goes_to_tenant_holding_fewest(self):
+        """Tests that a tenant waiting behind a busy tenant is served first."""
+        share = FairShare(2)
+        releases = [threading.Event(), threading.Event()]
+        granted = []
+
+        def hold(tenant, release):
+            with share.slot(tenant):
+                granted.append(tenant)
+                release.wait(5)
+
+        def wait_for(condition):
+            deadline = time.monotonic() + 5
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.005)
+
+        holders = [threading.Thread(target=hold, args=('big', release)) for release in releases]
+        for thread in holders:
+            thread.start()
+        wait_for(lambda: share.in_use == 2)
+
+        # Another request from the busy tenant queues first, then one from another tenant
+        waiters = [threading.Thread(target=hold, args=(tenant, releases[1])) for tenant in ('big', 'small')]
+        waiters[0].start()
+        wait_for(lambda: len(share._waiting) == 1)
+        waiters[1].start()
+        wait_for(lambda: len(share._waiting) == 2)
+
+        # One slot frees up: 'big' still holds one, 'small' none
+        releases[0].set()
+        wait_for(lambda: len(granted) == 3)
+        self.assertEqual(granted, ['big', 'big', 'small'])
+
+        releases[1].set()
+        for thread in holders + waiters:
+            thread.join(5)
+        self.assertEqual(granted, ['big', 'big', 'small', 'big'])
+
+class TestFetchConcurrently(unittest.TestCase):
+
+    def test_all_pages_delivered(self):
+        """Tests that every page of every job reaches the caller, followed by its end marker."""
+        def fetch(job):
+            for page in range(3):
+                yield [f'{job}-{page}']
+
+        seen = {}
+        finished = []
+        for job, page in fetch_concurrently(range(10), fetch, workers=4, queue_size=2):
+            if page is None:
+                finished.append(job)
+            else:
+                self.assertNotIn(job, finished)
+                seen.setdefault(job, []).extend(page)
+        self.assertEqual(sorted(finished), list(range(10)))
+        self.assertEqual(seen[7], ['7-0', '7-1', '7-2'])
+
+    def test_worker_error_raised(self):
+        """Tests that an error in a worker is raised in the caller."""
+        def fetch(job):
+            if job == 3:
+                raise ValueError('boom')
+            yield [job]
+
+        with self.assertRaises(ValueError):
+            list(fetch_concurrently(range(6), fetch, workers=3))
+
+class TestAgainstThrottlingServer(unittest.TestCase):
+
+    def setUp(self):
+        ThrottlingHandler.in_flight = ThrottlingHandler.throttled = ThrottlingHandler.served = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        endpoint = f'http://127.0.0.1:{self.server.server_address[1]}/'
+        self.services = ServicePool(lambda: build_from_document(
+            load_discovery_document(), http=httplib2.Http(), client_options={'api_endpoint': endpoint}
+        ))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_limit_adapts_to_throttling(self):
+        """Tests that the limiter backs off from a throttling server and every page still arrives."""
+        metrics = MetricsRecorder()
+        limiter = AdaptiveLimiter(maximum=12, backoff=0.01, max_retries=20, metrics=metrics)
+        failures = []
+        work_ids = [f'w{i}' for i in range(40)]
+
+        def fetch(work_id):
+            with self.services.lease() as service:
+                yield from iter_student_submission_pages(service, 'c1', work_id, metrics, failures, limiter)
+
+        submissions = []
+        for _, page in fetch_concurrently(work_ids, fetch, limiter.maximum):
+            if page:
+                submissions.extend(item['id'] for item in page)
+
+        self.assertEqual(failures, [])
+        self.assertEqual(len(submissions), 3 * len(work_ids))
+        self.assertEqual(ThrottlingHandler.served, 2 * len(work_ids))
+
+        concurrency = metrics.summary()['concurrency']
+        stats = metrics.summary()['endpoints']['courses.courseWork.studentSubmissions.list']
+        # It probed above the server's capacity, was throttled and backed off
+        self.assertGreater(concurrency['highest'], ThrottlingHandler.capacity)
+        self.assertGreater(concurrency['decreases'], 0)
+        self.assertGreater(ThrottlingHandler.throttled, 0)
+        self.assertEqual(stats['retries'], ThrottlingHandler.throttled)
+        self.assertLess(concurrency['limit'], limiter.maximum)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import unittest
 from unittest.mock import patch, mock_open
 import configparser
 
-from src.config import get_config, ConfigError
+from src.config import get_config, tenant_config, tenant_names, ConfigError
 
 class TestConfig(unittest.TestCase):
 
@@ -73,5 +73,215 @@ PII_MASKING_LEVEL = wrong_value
                     get_config('dummy_path.ini')
                 self.assertIn("Invalid value for 'PII_MASKING_LEVEL'", str(cm.exception))
 
+    def test_get_config_invalid_purge_deleted(self):
+        """Tests that ConfigError is raised for a non-boolean PURGE_DELETED."""
+        mock_content = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+[DATABASE]
+PATH = data.sqlite3
+[SETTINGS]
+PURGE_DELETED = sometimes
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("Invalid value for 'PURGE_DELETED'", str(cm.exception))
+
+    def test_get_config_invalid_memory_budget(self):
+        """Tests that ConfigError is raised for a memory limit that is not a whole number."""
+        mock_content = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+[DATABASE]
+PATH = data.sqlite3
+[SETTINGS]
+MEMORY_BUDGET_MB = 1.5GB
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("Invalid value for 'MEMORY_BUDGET_MB'", str(cm.exception))
+
+    def test_get_config_invalid_concurrency(self):
+        """Tests that ConfigError is raised for a concurrency limit below one."""
+        mock_content = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+[DATABASE]
+PATH = data.sqlite3
+[SETTINGS]
+MAX_CONCURRENT_REQUESTS = 0
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("Invalid value for 'MAX_CONCURRENT_REQUESTS'", str(cm.exception))
+
+    def test_get_config_publish_over_working_database(self):
+        """Tests that ConfigError is raised when the snapshot would replace the working database."""
+        mock_content = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+[DATABASE]
+PATH = data.sqlite3
+PUBLISH_PATH = ./data.sqlite3
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("Invalid value for 'PUBLISH_PATH'", str(cm.exception))
+
+    def test_get_config_snapshot_needs_sqlite(self):
+        """Tests that ConfigError is raised for a published snapshot of a DuckDB database."""
+        mock_content = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+[DATABASE]
+PATH = data.duckdb
+BACKEND = duckdb
+PUBLISH_PATH = published.duckdb
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("'PUBLISH_PATH'", str(cm.exception))
+                self.assertIn("only supported with the sqlite backend", str(cm.exception))
+
+    def test_get_config_change_log_values(self):
+        """Tests that CHANGE_LOG must be a boolean, and needs the sqlite backend."""
+        base = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+[DATABASE]
+PATH = data.db
+"""
+        for extra, message in (
+            ("CHANGE_LOG = yes\n", "Invalid value for 'CHANGE_LOG'"),
+            ("CHANGE_LOG = true\nBACKEND = duckdb\n", "'CHANGE_LOG'"),
+            ("CHANGE_LOG = true\nCHANGE_LOG_RUNS = -1\n", "Invalid value for 'CHANGE_LOG_RUNS'"),
+        ):
+            with self.subTest(extra=extra):
+                with patch('os.path.exists', return_value=True):
+                    with patch('builtins.open', mock_open(read_data=base + extra)):
+                        with self.assertRaises(ConfigError) as cm:
+                            get_config('dummy_path.ini')
+                        self.assertIn(message, str(cm.exception))
+
+    def test_get_config_invalid_rollups(self):
+        """Tests that ConfigError is raised for a non-boolean ROLLUPS."""
+        mock_content = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+[DATABASE]
+PATH = data.sqlite3
+ROLLUPS = nightly
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("Invalid value for 'ROLLUPS'", str(cm.exception))
+
+    def test_get_config_http_transport_values(self):
+        """Tests that ConfigError is raised for an unknown transport or a timeout that is not positive."""
+        for extra, message in (
+            ("HTTP_TRANSPORT = urllib\n", "Invalid value for 'HTTP_TRANSPORT'"),
+            ("HTTP_CONNECT_TIMEOUT = 0\n", "Invalid value for 'HTTP_CONNECT_TIMEOUT'"),
+            ("HTTP_READ_TIMEOUT = 1m\n", "Invalid value for 'HTTP_READ_TIMEOUT'"),
+        ):
+            mock_content = f"""
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = path/to/creds.json
+ADMIN_USER_EMAIL = admin@example.com
+{extra}[DATABASE]
+PATH = data.db
+"""
+            with self.subTest(extra=extra):
+                with patch('os.path.exists', return_value=True):
+                    with patch('builtins.open', mock_open(read_data=mock_content)):
+                        with self.assertRaises(ConfigError) as cm:
+                            get_config('dummy_path.ini')
+                        self.assertIn(message, str(cm.exception))
+
+    def test_tenant_sections(self):
+        """Tests that each tenant resolves to its own configuration, inheriting shared values."""
+        mock_content = """
+[GOOGLE]
+TOKEN_CACHE_FILE = .token_cache.json
+[SETTINGS]
+PII_MASKING_LEVEL = students_only
+[METRICS]
+JSON_SUMMARY = metrics/summary.json
+[TENANT:north]
+SERVICE_ACCOUNT_FILE = north.json
+ADMIN_USER_EMAIL = admin@north.example.org
+PATH = north.sqlite3
+[TENANT:south]
+SERVICE_ACCOUNT_FILE = south.json
+ADMIN_USER_EMAIL = admin@south.example.org
+PATH = south.sqlite3
+PII_MASKING_LEVEL = all
+JSON_SUMMARY = south-summary.json
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                config = get_config('dummy_path.ini')
+
+        self.assertEqual(tenant_names(config), ['north', 'south'])
+        north = tenant_config(config, 'north')
+        self.assertEqual(north.get('GOOGLE', 'ADMIN_USER_EMAIL'), 'admin@north.example.org')
+        self.assertEqual(north.get('GOOGLE', 'TOKEN_CACHE_FILE'), '.token_cache.json')
+        self.assertEqual(north.get('DATABASE', 'PATH'), 'north.sqlite3')
+        self.assertEqual(north.get('SETTINGS', 'PII_MASKING_LEVEL'), 'students_only')
+        self.assertEqual(north.get('METRICS', 'JSON_SUMMARY'), 'metrics/summary.north.json')
+        south = tenant_config(config, 'south')
+        self.assertEqual(south.get('SETTINGS', 'PII_MASKING_LEVEL'), 'all')
+        self.assertEqual(south.get('METRICS', 'JSON_SUMMARY'), 'south-summary.json')
+
+    def test_tenants_sharing_a_database(self):
+        """Tests that ConfigError is raised when two tenants would write to one database."""
+        mock_content = """
+[GOOGLE]
+SERVICE_ACCOUNT_FILE = shared.json
+[DATABASE]
+PATH = shared.sqlite3
+[TENANT:north]
+ADMIN_USER_EMAIL = admin@north.example.org
+[TENANT:south]
+ADMIN_USER_EMAIL = admin@south.example.org
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("both use the database 'shared.sqlite3'", str(cm.exception))
+
+    def test_tenant_missing_key(self):
+        """Tests that a tenant lacking a required key is reported by name."""
+        mock_content = """
+[TENANT:north]
+SERVICE_ACCOUNT_FILE = north.json
+PATH = north.sqlite3
+"""
+        with patch('os.path.exists', return_value=True):
+            with patch('builtins.open', mock_open(read_data=mock_content)):
+                with self.assertRaises(ConfigError) as cm:
+                    get_config('dummy_path.ini')
+                self.assertIn("'ADMIN_USER_EMAIL'", str(cm.exception))
+                self.assertIn("(tenant 'north')", str(cm.exception))
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,11 @@
+import json
 import unittest
 import sqlite3
 
 from src.database import (
     initialize_database, create_views, save_user, save_course,
-    save_enrollment, save_announcement, save_course_work, save_student_submission
+    save_enrollment, save_announcement, save_course_work, save_student_submission,
+    begin_seen_tracking, record_listing, purge_unseen
 )
 
 class TestDatabase(unittest.TestCase):
@@ -65,7 +67,7 @@ class TestDatabase(unittest.TestCase):
         user_profile = {'id': 'user123', 'name': {'fullName': 'Test User'}, 'emailAddress': 'test@example.com', 'photoUrl': 'http://example.com/photo.jpg'}
         save_user(self.conn, user_profile)
         self.conn.commit()
-        self.cursor.execute("SELECT * FROM USRS WHERE ID='user123';")
+        self.cursor.execute("SELECT ID, NM, EML, PHT_URL FROM USRS WHERE ID='user123';")
         self.assertEqual(self.cursor.fetchone(), ('user123', 'Test User', 'test@example.com', 'http://example.com/photo.jpg'))
 
     def test_save_course(self):
@@ -85,5 +87,83 @@ class TestDatabase(unittest.TestCase):
         self.cursor.execute("SELECT RL FROM ENRLLMNTS WHERE CRS_ID='course456' AND USR_ID='user123';")
         self.assertEqual(self.cursor.fetchone()[0], 'STUDENT')
 
+    def test_unchanged_rows_skipped(self):
+        """Tests that re-saving identical content is skipped and a change is written."""
+        submission = {'id': 'sub1', 'courseWorkId': 'cw1', 'userId': 'user123', 'state': 'TURNED_IN', 'assignedGrade': None, 'creationTime': 't7', 'updateTime': 't8'}
+        self._populate_data_for_views()
+
+        self.assertFalse(save_student_submission(self.conn, dict(submission, state='RETURNED')))
+        self.assertTrue(save_student_submission(self.conn, dict(submission, assignedGrade=90)))
+        self.assertFalse(save_student_submission(self.conn, dict(submission, assignedGrade=90)))
+        self.cursor.execute("SELECT ASSGND_GRD FROM STDNT_SBMSSNS WHERE ID='sub1'")
+        self.assertEqual(self.cursor.fetchone()[0], 90)
+
+        user_profile = {'id': 'user123', 'name': {'fullName': 'Test User'}, 'emailAddress': 'test@example.com', 'photoUrl': ''}
+        self.assertFalse(save_user(self.conn, user_profile))
+        self.assertFalse(save_enrollment(self.conn, 'course456', 'user123', 'STUDENT'))
+
+    def test_malformed_item_quarantined(self):
+        """Tests that an item lacking a required field is quarantined instead of raising."""
+        self._populate_data_for_views()
+        submission = {'id': 'sub2', 'courseWorkId': 'cw1', 'userId': 'user123', 'state': 'NEW', 'updateTime': 't9'}
+        self.assertFalse(save_student_submission(self.conn, submission))
+        self.assertFalse(save_student_submission(self.conn, submission))
+
+        self.cursor.execute("SELECT COUNT(*) FROM STDNT_SBMSSNS WHERE ID='sub2'")
+        self.assertEqual(self.cursor.fetchone()[0], 0)
+        self.cursor.execute("SELECT TBL, ITM_ID, RSN, SN_CNT, PYLD FROM QRNTN")
+        table, item_id, reason, seen, payload = self.cursor.fetchone()
+        self.assertEqual((table, item_id, reason, seen),
+                         ('STDNT_SBMSSNS', 'sub2', 'missing required fields: creationTime', 2))
+        self.assertEqual(json.loads(payload), submission)
+
+    def test_hash_column_added_to_existing_database(self):
+        """Tests that a database created before content hashing is migrated."""
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'old.sqlite3')
+            old = sqlite3.connect(path)
+            old.execute("CREATE TABLE USRS (ID TEXT PRIMARY KEY, NM TEXT NOT NULL, EML TEXT NOT NULL UNIQUE, PHT_URL TEXT);")
+            old.execute("INSERT INTO USRS VALUES ('u1', 'Old Name', 'old@example.com', NULL);")
+            old.commit()
+            old.close()
+
+            conn = initialize_database(path)
+            user_profile = {'id': 'u1', 'name': {'fullName': 'Old Name'}, 'emailAddress': 'old@example.com'}
+            # The first save fills in the missing hash, after which it is skipped
+            self.assertTrue(save_user(conn, user_profile))
+            self.assertFalse(save_user(conn, user_profile))
+            conn.close()
+
+    def test_purge_unseen(self):
+        """Tests that rows missing from a complete listing are deleted, with their dependents."""
+        self._populate_data_for_views()
+        second_work = {'id': 'cw2', 'courseId': 'course456', 'title': 'Kept', 'creationTime': 't1', 'updateTime': 't2'}
+        save_course_work(self.conn, second_work)
+
+        begin_seen_tracking(self.conn)
+        record_listing(self.conn, 'CRS_WRK', 'course456', ['cw2'])
+        deleted = purge_unseen(self.conn)
+
+        self.assertEqual(deleted['CRS_WRK'], 1)
+        self.cursor.execute("SELECT ID FROM CRS_WRK")
+        self.assertEqual(self.cursor.fetchall(), [('cw2',)])
+        # The submission for cw1 is removed by ON DELETE CASCADE
+        self.cursor.execute("SELECT COUNT(*) FROM STDNT_SBMSSNS")
+        self.assertEqual(self.cursor.fetchone()[0], 0)
+
+    def test_purge_unseen_skips_unlisted_collections(self):
+        """Tests that collections without a recorded listing are left untouched."""
+        self._populate_data_for_views()
+        begin_seen_tracking(self.conn)
+        record_listing(self.conn, 'TEACHERS', 'course456', [])
+        deleted = purge_unseen(self.conn)
+
+        # The enrollment is a STUDENT one, and students were not listed
+        self.assertEqual(sum(deleted.values()), 0)
+        self.cursor.execute("SELECT COUNT(*) FROM ENRLLMNTS")
+        self.assertEqual(self.cursor.fetchone()[0], 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,99 @@
+import configparser
+import contextlib
+import io
+import random
+import unittest
+from unittest.mock import patch
+
+import main
+from src.estimate import estimate_run, format_estimate
+from src.storage import SQLiteBackend
+from tests.factories import FakeClassroom
+
+class TestEstimate(unittest.TestCase):
+
+    def _classroom(self, **kwargs):
+        """
+        Four courses, each with 2 teachers, 30 students (shared between the
+        courses), 3 announcements and 5 course work items with 30 submissions
+        each, listed 20 items a page.
+        """
+        return FakeClassroom(courses=4, teachers=2, students=30, announcements=3, works=5,
+                             page_size=20, course_page_size=20, **kwargs).service
+
+    def test_truncated_listings_extrapolated(self):
+        """Tests the projected calls and rows when only first pages are probed."""
+        estimate = estimate_run(self._classroom(), concurrency=4, sample_size=0, probe_pages=1)
+
+        # Students and submissions have a second page that was not fetched:
+        # assumed twice the probed length, so 40 students and 40 submissions
+        # (one per student) in 2 pages per course work item
+        self.assertEqual(estimate['pages'], {
+            'courses.announcements.list': 4,
+            'courses.courseWork.list': 4,
+            'courses.courseWork.studentSubmissions.list': 40,
+            'courses.list': 1,
+            'courses.students.list': 8,
+            'courses.teachers.list': 4,
+        })
+        self.assertEqual(estimate['api_calls'], 61)
+        self.assertEqual(estimate['rows']['ENRLLMNTS'], 4 * 42)
+        self.assertEqual(estimate['rows']['STDNT_SBMSSNS'], 4 * 5 * 40)
+        self.assertEqual(estimate['rows']['CRS_WRK'], 20)
+        # Students are shared between courses: 8 teachers and 20 students among 88 probed enrollments
+        self.assertEqual(estimate['rows']['USRS'], round(168 * 28 / 88))
+        self.assertEqual(estimate['truncated_listings'], 8)
+        self.assertEqual(estimate['probe_calls'], 21)
+
+        self.assertGreater(estimate['database_bytes'], 0)
+        self.assertAlmostEqual(estimate['wall_seconds'],
+                               estimate['api_seconds'] / 4 + estimate['write_seconds'], delta=0.2)
+        self.assertIn('Projected time at 4 concurrent requests', format_estimate(estimate))
+
+    def test_complete_listings_counted_exactly(self):
+        """Tests that listings probed to the end are counted exactly."""
+        estimate = estimate_run(self._classroom(), concurrency=1, sample_size=0, probe_pages=2)
+        self.assertEqual(estimate['rows']['ENRLLMNTS'], 4 * 32)
+        self.assertEqual(estimate['rows']['STDNT_SBMSSNS'], 4 * 5 * 30)
+        self.assertEqual(estimate['pages']['courses.courseWork.studentSubmissions.list'], 4 * 5 * 2)
+        self.assertEqual(estimate['truncated_listings'], 0)
+
+    def test_probed_rows_saved_a_page_at_a_time(self):
+        """Tests that the write time is measured saving each probed page at once, as the extraction does."""
+        with patch('src.estimate.SQLiteBackend.save_page', autospec=True, side_effect=SQLiteBackend.save_page) as save:
+            estimate_run(self._classroom(), concurrency=1, sample_size=1, probe_pages=2, rng=random.Random(1))
+        pages = [(call.args[1], len(call.args[2])) for call in save.call_args_list]
+        # Two pages each of students and submissions
+        self.assertEqual(pages, [('USRS', 2), ('USRS', 15), ('USRS', 15), ('ANNCMNTS', 3), ('CRS_WRK', 5),
+                                 ('STDNT_SBMSSNS', 15), ('STDNT_SBMSSNS', 15)])
+
+    def test_sample_scaled_to_all_courses(self):
+        """Tests that a sample of the courses is scaled up to all of them."""
+        estimate = estimate_run(self._classroom(), concurrency=1, sample_size=2, probe_pages=2,
+                                rng=random.Random(1))
+        self.assertEqual(estimate['sampled_courses'], 2)
+        self.assertEqual(estimate['rows']['STDNT_SBMSSNS'], 4 * 5 * 30)
+        self.assertEqual(estimate['rows']['CRSS'], 4)
+
+    def test_failed_probe_left_out(self):
+        """Tests that a course that cannot be probed is left out of the sample."""
+        estimate = estimate_run(self._classroom(forbidden={('teachers', 'c2', None)}), concurrency=1,
+                                sample_size=0, probe_pages=2)
+        self.assertEqual(estimate['sampled_courses'], 3)
+        self.assertEqual(estimate['rows']['CRS_WRK'], 20)
+
+    def test_command_probes_at_projected_concurrency(self):
+        """Tests that the estimate command probes with the concurrency it projects the run time for."""
+        config = configparser.ConfigParser()
+        config.read_dict({'SETTINGS': {'MAX_CONCURRENT_REQUESTS': '12'}})
+        for argv, expected in ((['estimate'], 12), (['estimate', '--concurrency', '3'], 3)):
+            with self.subTest(argv=argv), patch('main.get_config', return_value=config), \
+                    patch('main.get_classroom_service', return_value=self._classroom()), \
+                    patch('main.estimate_run', wraps=estimate_run) as run, \
+                    contextlib.redirect_stdout(io.StringIO()):
+                main.estimate(main.parse_args(argv + ['--json']))
+            self.assertEqual(run.call_args.args[1], expected)
+            self.assertEqual(run.call_args.kwargs['limiter'].maximum, expected)
+
+if __name__ == '__main__':
+    unittest.main()
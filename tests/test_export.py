@@ -0,0 +1,98 @@
+import unittest
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+
+from src.database import (
+    initialize_database, create_views, save_user, save_course, save_enrollment,
+    save_course_work, save_student_submission
+)
+from src.export import (
+    ExportError, connect_read_only, export_many, export_table, exportable_names, DEFAULT_EXPORTS
+)
+from src.search import initialize_search_index
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a database file with a course, two students and their grades."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'classroom.sqlite3')
+        conn = initialize_database(self.db_path)
+        save_course(conn, {'id': 'c1', 'name': 'Biology', 'section': 'P3', 'creationTime': 't1', 'updateTime': 't2', 'courseState': 'ACTIVE'})
+        save_course_work(conn, {'id': 'w1', 'courseId': 'c1', 'title': 'Lab, "part one"', 'creatorUserId': 'teacher1', 'creationTime': 't3', 'updateTime': 't4'})
+        for number, grade in ((1, 90.0), (2, None)):
+            save_user(conn, {'id': f's{number}', 'name': {'fullName': f'Student {number}'}, 'emailAddress': f's{number}@example.com'})
+            save_enrollment(conn, 'c1', f's{number}', 'STUDENT')
+            save_student_submission(conn, {'id': f'sub{number}', 'courseWorkId': 'w1', 'userId': f's{number}', 'state': 'RETURNED', 'assignedGrade': grade, 'creationTime': 't5', 'updateTime': 't6'})
+        conn.commit()
+        create_views(conn)
+        initialize_search_index(conn)
+        conn.close()
+        self.output_dir = os.path.join(self.temp_dir.name, 'export')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_export_csv_in_chunks(self):
+        """Tests that a view exported in small chunks keeps every row, quoted correctly."""
+        conn = connect_read_only(self.db_path)
+        path = os.path.join(self.temp_dir.name, 'grades.csv')
+        rows = export_table(conn, 'VW_ASSGNMNT_GRDS', path, chunk_size=1)
+        conn.close()
+
+        self.assertEqual(rows, 2)
+        with open(path, newline='', encoding='utf-8') as f:
+            records = list(csv.DictReader(f))
+        self.assertEqual([record['STNDT_NM'] for record in records], ['Student 1', 'Student 2'])
+        self.assertEqual(records[0]['ASSGNMNT_TTL'], 'Lab, "part one"')
+        self.assertEqual(records[1]['SBMSSN_STS'], 'EXCSD')
+        self.assertFalse(os.path.exists(f"{path}.tmp"))
+
+    def test_export_gzipped_jsonl(self):
+        """Tests JSON Lines output with gzip compression."""
+        conn = connect_read_only(self.db_path)
+        path = os.path.join(self.temp_dir.name, 'roster.jsonl.gz')
+        export_table(conn, 'VW_SIS_ENRLLMNT_ROSTER', path, fmt='jsonl', compress=True)
+        conn.close()
+
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[0], {'CRS_ID': 'c1', 'CRS_NM': 'Biology', 'USR_ID': 's1', 'USR_EML': 's1@example.com', 'RL': 'STUDENT'})
+        self.assertEqual(len(records), 2)
+
+    def test_export_many_in_parallel(self):
+        """Tests that all the analytics views export in parallel on read-only connections."""
+        results = export_many(self.db_path, list(DEFAULT_EXPORTS), self.output_dir, workers=4)
+
+        self.assertEqual(set(results), set(DEFAULT_EXPORTS))
+        self.assertEqual(results['VW_ENRLLMNT_DTLS'][1], 2)
+        # The activity log lists the course work item
+        self.assertEqual(results['VW_CRS_ACTVTY_LG'][1], 1)
+        for path, _ in results.values():
+            self.assertTrue(os.path.exists(path))
+
+    def test_unknown_names_rejected(self):
+        """Tests that only existing tables and views can be exported."""
+        with self.assertRaises(ExportError):
+            export_many(self.db_path, ['VW_ENRLLMNT_DTLS', 'USRS; DROP TABLE USRS'], self.output_dir)
+        with self.assertRaises(ExportError):
+            export_many(self.db_path, ['CRS_WRK_FTS_data'], self.output_dir)
+        self.assertFalse(os.path.exists(self.output_dir))
+
+        conn = connect_read_only(self.db_path)
+        # The full-text indexes are not offered
+        self.assertFalse([name for name in exportable_names(conn) if '_FTS' in name])
+        self.assertIn('CRS_WRK', exportable_names(conn))
+        with self.assertRaises(ExportError):
+            export_table(conn, 'USRS', os.path.join(self.temp_dir.name, 'users.xml'), fmt='xml')
+        # The connection cannot write
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM USRS;")
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
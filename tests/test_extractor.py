@@ -1,10 +1,13 @@
 import unittest
 from unittest.mock import MagicMock
 
+from googleapiclient.errors import HttpError
+
 from src.extractor import (
     get_courses, get_students, get_teachers, get_announcements,
-    get_course_work, get_student_submissions
+    get_course_work, get_student_submissions, iter_student_submission_pages
 )
+from src.metrics import MetricsRecorder
 
 class TestExtractor(unittest.TestCase):
 
@@ -79,5 +82,54 @@ class TestExtractor(unittest.TestCase):
             courseId='course1', courseWorkId='cw1', pageToken=None
         )
 
+    def test_metrics_recorded_per_page(self):
+        """Tests that each fetched page and failed request is reported to the metrics."""
+        metrics = MetricsRecorder()
+        self.mock_service.courses().list().execute.side_effect = [
+            {'courses': [{'id': 'course1'}, {'id': 'course2'}], 'nextPageToken': 'token123'},
+            HttpError(MagicMock(status=500), b'error'),
+        ]
+
+        courses = get_courses(self.mock_service, metrics)
+
+        self.assertEqual(len(courses), 2)
+        stats = metrics.summary()['endpoints']['courses.list']
+        self.assertEqual(stats['pages'], 1)
+        self.assertEqual(stats['items'], 2)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['requests'], 2)
+
+    def test_failed_request_recorded(self):
+        """Tests that a failed page is reported with its parameters and page token."""
+        failures = []
+        self.mock_service.courses().courseWork().list().execute.side_effect = [
+            {'courseWork': [{'id': 'cw1'}], 'nextPageToken': 'token123'},
+            HttpError(MagicMock(status=503), b'unavailable'),
+        ]
+
+        course_work = get_course_work(self.mock_service, 'course1', failures=failures)
+
+        self.assertEqual(len(course_work), 1)
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0].endpoint, 'courses.courseWork.list')
+        self.assertEqual(failures[0].params, {'courseId': 'course1'})
+        self.assertEqual(failures[0].page_token, 'token123')
+        self.assertEqual(failures[0].status, 503)
+
+    def test_pages_fetched_on_demand(self):
+        """Tests that the page iterators only request a page when the previous one is consumed."""
+        execute = self.mock_service.courses().courseWork().studentSubmissions().list().execute
+        execute.side_effect = [
+            {'studentSubmissions': [{'id': 'sub1'}, {'id': 'sub2'}], 'nextPageToken': 'token123'},
+            {'studentSubmissions': [{'id': 'sub3'}]},
+        ]
+
+        pages = iter_student_submission_pages(self.mock_service, 'course1', 'cw1')
+        self.assertEqual(execute.call_count, 0)
+        self.assertEqual([item['id'] for item in next(pages)], ['sub1', 'sub2'])
+        self.assertEqual(execute.call_count, 1)
+        self.assertEqual([[item['id'] for item in page] for page in pages], [['sub3']])
+        self.assertEqual(execute.call_count, 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import argparse
+import contextlib
+import csv
+import io
+import os
+import statistics
+import sys
+import tempfile
+from unittest.mock import patch
+
+import main
+
+from src.database import (
+    initialize_database, save_user, save_course, save_course_work, save_student_submission
+)
+
+try:
+    import numpy as np
+    from src.gradebook import (
+        compute_grade_statistics, course_gradebooks, group_stats, load_grades, write_matrix_csv
+    )
+except ImportError:
+    np = None
+
+@unittest.skipUnless(np, "numpy is not installed")
+class TestGradebook(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up two courses. Course c1 has two assignments (10 and 20 points)
+        and three students; course c2 has one assignment and one student.
+        """
+        self.conn = initialize_database(':memory:')
+        for student in ('s1', 's2', 's3'):
+            save_user(self.conn, {'id': student, 'name': {'fullName': f'Student {student}'}, 'emailAddress': f'{student}@example.com'})
+        for course in ('c1', 'c2'):
+            save_course(self.conn, {'id': course, 'name': course, 'creationTime': 't', 'updateTime': 't', 'courseState': 'ACTIVE'})
+        for work_id, course, points in (('w1', 'c1', 10), ('w2', 'c1', 20), ('w3', 'c2', 50)):
+            save_course_work(self.conn, {'id': work_id, 'courseId': course, 'title': f'Work {work_id}', 'maxPoints': points, 'creationTime': 't', 'updateTime': 't'})
+        grades = (
+            ('w1', 's1', 10), ('w1', 's2', 5), ('w1', 's3', None),
+            ('w2', 's1', 15), ('w2', 's2', 20), ('w2', 's3', 2),
+            ('w3', 's1', 45),
+        )
+        for work_id, student, grade in grades:
+            save_student_submission(self.conn, {'id': f'{work_id}-{student}', 'courseWorkId': work_id, 'userId': student, 'state': 'RETURNED', 'assignedGrade': grade, 'creationTime': 't', 'updateTime': 't'})
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_group_stats_match_reference(self):
+        """Tests the vectorized grouped statistics against the statistics module."""
+        groups = np.array([0, 0, 0, 1, 1, 2, 0])
+        values = np.array([3.0, 1.0, np.nan, 4.0, 8.0, np.nan, 2.0])
+        stats = group_stats(groups, values, 4)
+
+        self.assertEqual(stats.count.tolist(), [3, 2, 0, 0])
+        self.assertAlmostEqual(stats.mean[0], statistics.mean([3, 1, 2]))
+        self.assertAlmostEqual(stats.median[0], 2.0)
+        self.assertAlmostEqual(stats.median[1], 6.0)
+        self.assertAlmostEqual(stats.std[1], statistics.pstdev([4, 8]))
+        self.assertEqual((stats.low[0], stats.high[0]), (1.0, 3.0))
+        self.assertTrue(np.isnan(stats.mean[2]) and np.isnan(stats.median[3]))
+
+    def test_statistics_persisted(self):
+        """Tests the per-course, per-assignment, per-student and distribution tables."""
+        compute_grade_statistics(self.conn)
+        cursor = self.conn.cursor()
+
+        cursor.execute("SELECT STDNT_CNT, ASSGNMNT_CNT, SBMSSN_CNT, GRDD_CNT, MN_PCT, MDN_PCT, LWST_PCT, HGHST_PCT FROM CRS_GRD_STTS WHERE CRS_ID = 'c1';")
+        # Percentages: w1 100, 50; w2 75, 100, 10
+        self.assertEqual(cursor.fetchone(), (3, 2, 6, 5, 67.0, 75.0, 10.0, 100.0))
+
+        cursor.execute("SELECT CRS_ID, GRDD_CNT, MN_PCT, MDN_PCT FROM ASSGNMNT_GRD_STTS WHERE CRS_WRK_ID = 'w1';")
+        self.assertEqual(cursor.fetchone(), ('c1', 2, 75.0, 75.0))
+
+        cursor.execute("SELECT SBMSSN_CNT, GRDD_CNT, MN_PCT FROM STDNT_GRD_STTS WHERE CRS_ID = 'c1' AND USR_ID = 's3';")
+        self.assertEqual(cursor.fetchone(), (2, 1, 10.0))
+        cursor.execute("SELECT COUNT(*) FROM STDNT_GRD_STTS;")
+        self.assertEqual(cursor.fetchone()[0], 4)
+
+        cursor.execute("SELECT BND_LWR_PCT, GRDD_CNT FROM GRD_DSTRBTN WHERE CRS_ID = 'c1' ORDER BY BND_LWR_PCT;")
+        self.assertEqual(cursor.fetchall(), [(10, 1), (50, 1), (70, 1), (90, 2)])
+
+    def test_single_course_refresh_keeps_others(self):
+        """Tests that recomputing one course leaves the other courses' statistics in place."""
+        compute_grade_statistics(self.conn)
+        save_student_submission(self.conn, {'id': 'w3-s1', 'courseWorkId': 'w3', 'userId': 's1', 'state': 'RETURNED', 'assignedGrade': 25, 'creationTime': 't', 'updateTime': 't2'})
+        compute_grade_statistics(self.conn, ['c2'])
+
+        rows = dict(self.conn.execute("SELECT CRS_ID, MN_PCT FROM CRS_GRD_STTS;").fetchall())
+        self.assertEqual(rows, {'c1': 67.0, 'c2': 50.0})
+
+    def test_gradebook_matrix(self):
+        """Tests the students x assignments matrix and its CSV output."""
+        data = load_grades(self.conn, ['c1'])
+        (gradebook,) = list(course_gradebooks(data))
+
+        self.assertEqual(gradebook.course_id, 'c1')
+        self.assertEqual(gradebook.scores.shape, (3, 2))
+        row = gradebook.student_ids.tolist().index('s3')
+        column = gradebook.assignment_ids.tolist().index('w2')
+        self.assertEqual(gradebook.scores[row, column], 10.0)
+        self.assertTrue(np.isnan(gradebook.scores[row, 1 - column]))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'c1.csv')
+            write_matrix_csv(self.conn, gradebook, path)
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['USR_ID', 'USR_NM', 'Work w1 (w1)', 'Work w2 (w2)'])
+        self.assertIn(['s3', 'Student s3', '', '10.0'], rows)
+
+    def test_empty_database(self):
+        """Tests that a database without submissions produces empty statistics."""
+        conn = initialize_database(':memory:')
+        data = compute_grade_statistics(conn)
+        self.assertEqual(len(data.course_ids), 0)
+        self.assertEqual(list(course_gradebooks(data)), [])
+        conn.close()
+
+
+class TestGradebookCommand(unittest.TestCase):
+
+    def test_missing_numpy(self):
+        """Tests that without numpy the command exits with an install hint rather than a traceback."""
+        conn = initialize_database(':memory:')
+        stderr = io.StringIO()
+        with patch.dict(sys.modules, {'src.gradebook': None}), contextlib.redirect_stderr(stderr), \
+                self.assertRaises(SystemExit) as raised:
+            main.gradebook(argparse.Namespace(course_ids=None, matrix_dir=None), db_conn_for_testing=conn)
+        conn.close()
+        self.assertEqual(raised.exception.code, 1)
+        self.assertIn("pip install numpy", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
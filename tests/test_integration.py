@@ -2,6 +2,10 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sqlite3
 import os
+import io
+import configparser
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
 
 # Add parent directory to path to import main
 import sys
@@ -10,6 +14,11 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 import main
 from src.database import initialize_database
 
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
 class TestIntegration(unittest.TestCase):
 
     def setUp(self):
@@ -22,12 +31,14 @@ class TestIntegration(unittest.TestCase):
         self.mock_submission = {'id': 'sub1', 'courseWorkId': 'work1', 'userId': 'student1', 'state': 'TURNED_IN', 'assignedGrade': 95, 'creationTime': 't7', 'updateTime': 't8'}
 
     @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
     @patch('main.get_classroom_service')
     def test_end_to_end_flow(self, mock_get_service, mock_get_config):
         """Tests the full application flow with the new schema."""
         # --- Arrange ---
         mock_config = MagicMock()
-        mock_config.get.side_effect = lambda section, key, fallback=None: ':memory:' if key == 'PATH' else 'none'
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
         mock_get_config.return_value = mock_config
 
         conn = initialize_database(':memory:')
@@ -58,16 +69,305 @@ class TestIntegration(unittest.TestCase):
         self.assertEqual(cursor.fetchone()[0], 'Stud Test')
         cursor.execute("SELECT ASSGND_GRD FROM VW_ASSGNMNT_GRDS WHERE STNDT_NM='Stud Test'")
         self.assertEqual(cursor.fetchone()[0], 95)
+
+        # Verify the extracted text is searchable
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main.search(main.parse_args(['search', 'assignment']), db_conn_for_testing=conn)
+        self.assertIn('Assignment work1 in Test Course (101) [course1]', output.getvalue())
         
         conn.close()
 
     @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def test_deleted_items_removed_on_next_run(self, mock_get_service, mock_get_config):
+        """Tests that items deleted in Classroom are removed by the following run."""
+        mock_config = MagicMock()
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
+        mock_get_config.return_value = mock_config
+
+        conn = initialize_database(':memory:')
+        mock_service = MagicMock()
+        mock_get_service.return_value = mock_service
+
+        mock_service.courses().list().execute.return_value = {'courses': [self.mock_course]}
+        mock_service.courses().teachers().list().execute.return_value = {'teachers': [self.mock_teacher]}
+        mock_service.courses().students().list().execute.return_value = {'students': [self.mock_student]}
+        mock_service.courses().announcements().list().execute.return_value = {'announcements': [self.mock_announcement]}
+        mock_service.courses().courseWork().list().execute.return_value = {'courseWork': [self.mock_work]}
+        mock_service.courses().courseWork().studentSubmissions().list().execute.return_value = {'studentSubmissions': [self.mock_submission]}
+        main.main(db_conn_for_testing=conn)
+
+        # The assignment and the student's enrollment are deleted in Classroom
+        mock_service.courses().students().list().execute.return_value = {}
+        mock_service.courses().courseWork().list().execute.return_value = {}
+        main.main(db_conn_for_testing=conn)
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM CRS_WRK")
+        self.assertEqual(cursor.fetchone()[0], 0)
+        cursor.execute("SELECT COUNT(*) FROM STDNT_SBMSSNS")
+        self.assertEqual(cursor.fetchone()[0], 0)
+        cursor.execute("SELECT USR_ID FROM ENRLLMNTS")
+        self.assertEqual(cursor.fetchall(), [('teacher1',)])
+        cursor.execute("SELECT COUNT(*) FROM ANNCMNTS")
+        self.assertEqual(cursor.fetchone()[0], 1)
+        # The rollups no longer count the deleted submission
+        cursor.execute("SELECT SBMSSN_CNT, ANNCMNT_CNT FROM CRS_RLLPS")
+        self.assertEqual(cursor.fetchall(), [(0, 1)])
+        cursor.execute("SELECT COUNT(*) FROM STDNT_RLLPS")
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+        conn.close()
+
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def test_malformed_items_quarantined(self, mock_get_service, mock_get_config):
+        """Tests that malformed items are quarantined while the rest of the run is saved."""
+        mock_config = MagicMock()
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
+        mock_get_config.return_value = mock_config
+
+        conn = initialize_database(':memory:')
+        mock_service = MagicMock()
+        mock_get_service.return_value = mock_service
+        broken_work = {'id': 'work2', 'courseId': 'course1', 'title': 'No dates'}
+        broken_submission = dict(self.mock_submission, id='sub2', creationTime=None)
+
+        mock_service.courses().list().execute.return_value = {'courses': [self.mock_course]}
+        mock_service.courses().teachers().list().execute.return_value = {'teachers': [self.mock_teacher]}
+        mock_service.courses().students().list().execute.return_value = {'students': [self.mock_student]}
+        mock_service.courses().announcements().list().execute.return_value = {'announcements': [self.mock_announcement]}
+        mock_service.courses().courseWork().list().execute.return_value = {'courseWork': [self.mock_work, broken_work]}
+        mock_service.courses().courseWork().studentSubmissions().list().execute.return_value = {
+            'studentSubmissions': [self.mock_submission, broken_submission]
+        }
+        main.main(db_conn_for_testing=conn)
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT ID FROM CRS_WRK")
+        self.assertEqual(cursor.fetchall(), [('work1',)])
+        cursor.execute("SELECT ID FROM STDNT_SBMSSNS")
+        self.assertEqual(cursor.fetchall(), [('sub1',)])
+        cursor.execute("SELECT TBL, ITM_ID FROM QRNTN ORDER BY TBL")
+        self.assertEqual(cursor.fetchall(), [('CRS_WRK', 'work2'), ('STDNT_SBMSSNS', 'sub2')])
+        # Submissions were only listed for the course work saved
+        listed = mock_service.courses().courseWork().studentSubmissions().list.call_args_list
+        self.assertEqual({call.kwargs['courseWorkId'] for call in listed if call.kwargs}, {'work1'})
+
+        conn.close()
+
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def test_changes_logged_per_run(self, mock_get_service, mock_get_config):
+        """Tests that with CHANGE_LOG on, a run over an almost unchanged domain logs only what changed."""
+        mock_config = MagicMock()
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none', 'CHANGE_LOG': 'true'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
+        mock_get_config.return_value = mock_config
+
+        conn = initialize_database(':memory:')
+        mock_service = MagicMock()
+        mock_get_service.return_value = mock_service
+        mock_service.courses().list().execute.return_value = {'courses': [self.mock_course]}
+        mock_service.courses().teachers().list().execute.return_value = {'teachers': [self.mock_teacher]}
+        mock_service.courses().students().list().execute.return_value = {'students': [self.mock_student]}
+        mock_service.courses().announcements().list().execute.return_value = {'announcements': [self.mock_announcement]}
+        mock_service.courses().courseWork().list().execute.return_value = {'courseWork': [self.mock_work]}
+        mock_service.courses().courseWork().studentSubmissions().list().execute.return_value = {'studentSubmissions': [self.mock_submission]}
+        main.main(db_conn_for_testing=conn)
+
+        # The submission is graded and the student leaves the course
+        mock_service.courses().students().list().execute.return_value = {}
+        mock_service.courses().courseWork().studentSubmissions().list().execute.return_value = {
+            'studentSubmissions': [dict(self.mock_submission, state='RETURNED', assignedGrade=97)]
+        }
+        main.main(db_conn_for_testing=conn)
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM CHNG_LG WHERE RN_ID = 1")
+        self.assertEqual(cursor.fetchone()[0], 8)
+        cursor.execute("SELECT TBL, KY, OP, CHNGD_CLMNS FROM CHNG_LG WHERE RN_ID = 2 ORDER BY SEQ")
+        self.assertEqual(cursor.fetchall(), [
+            ('STDNT_SBMSSNS', 'sub1', 'UPDATE', 'STT,ASSGND_GRD'),
+            ('ENRLLMNTS', 'course1:student1', 'DELETE', None),
+        ])
+        cursor.execute("SELECT COUNT(*) FROM RNS WHERE FNSHD_TM IS NOT NULL")
+        self.assertEqual(cursor.fetchone()[0], 2)
+
+        conn.close()
+
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def test_paged_extraction_with_buffered_row_limit(self, mock_get_service, mock_get_config):
+        """Tests that paged listings are saved completely when commits happen every row."""
+        mock_config = MagicMock()
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none', 'MAX_BUFFERED_ROWS': '1', 'MEMORY_BUDGET_MB': '4096'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
+        mock_get_config.return_value = mock_config
+
+        conn = initialize_database(':memory:')
+        mock_service = MagicMock()
+        mock_get_service.return_value = mock_service
+
+        second_announcement = dict(self.mock_announcement, id='anno2', text='Second page')
+        mock_service.courses().list().execute.return_value = {'courses': [self.mock_course]}
+        mock_service.courses().teachers().list().execute.return_value = {'teachers': [self.mock_teacher]}
+        mock_service.courses().students().list().execute.return_value = {'students': [self.mock_student]}
+        mock_service.courses().announcements().list().execute.side_effect = [
+            {'announcements': [self.mock_announcement], 'nextPageToken': 'token123'},
+            {'announcements': [second_announcement]},
+        ]
+        mock_service.courses().courseWork().list().execute.return_value = {'courseWork': [self.mock_work]}
+        mock_service.courses().courseWork().studentSubmissions().list().execute.return_value = {'studentSubmissions': [self.mock_submission]}
+        main.main(db_conn_for_testing=conn)
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT ID FROM ANNCMNTS ORDER BY ID")
+        self.assertEqual(cursor.fetchall(), [('anno1',), ('anno2',)])
+        cursor.execute("SELECT COUNT(*) FROM STDNT_SBMSSNS")
+        self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertFalse(conn.in_transaction)
+
+        conn.close()
+
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def test_submissions_listed_concurrently(self, mock_get_service, mock_get_config):
+        """Tests that submissions of many course work items, listed on worker threads, are all saved."""
+        mock_config = MagicMock()
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none', 'MAX_CONCURRENT_REQUESTS': '4'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
+        mock_get_config.return_value = mock_config
+
+        conn = initialize_database(':memory:')
+        mock_service = MagicMock()
+        mock_get_service.return_value = mock_service
+
+        works = [dict(self.mock_work, id=f'work{i}') for i in range(10)]
+
+        def list_submissions(courseId, courseWorkId, pageToken):
+            request = MagicMock()
+            request.execute.return_value = {'studentSubmissions': [
+                dict(self.mock_submission, id=f'sub-{courseWorkId}', courseWorkId=courseWorkId)
+            ]}
+            return request
+
+        mock_service.courses().list().execute.return_value = {'courses': [self.mock_course]}
+        mock_service.courses().teachers().list().execute.return_value = {'teachers': [self.mock_teacher]}
+        mock_service.courses().students().list().execute.return_value = {'students': [self.mock_student]}
+        mock_service.courses().announcements().list().execute.return_value = {'announcements': []}
+        mock_service.courses().courseWork().list().execute.return_value = {'courseWork': works}
+        mock_service.courses().courseWork().studentSubmissions().list.side_effect = list_submissions
+        main.main(db_conn_for_testing=conn)
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM STDNT_SBMSSNS")
+        self.assertEqual(cursor.fetchone()[0], 10)
+        cursor.execute("SELECT COUNT(*) FROM STDNT_SBMSSNS WHERE ID = 'sub-' || CRS_WRK_ID")
+        self.assertEqual(cursor.fetchone()[0], 10)
+
+        conn.close()
+
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def test_tenants_extracted_into_their_own_databases(self, mock_get_service, mock_get_config):
+        """Tests that each tenant's data is extracted with its own credentials into its own database."""
+        with tempfile.TemporaryDirectory() as tmp:
+            config = configparser.ConfigParser()
+            config.read_dict({
+                'SETTINGS': {'MAX_PARALLEL_TENANTS': '2'},
+                'TENANT:north': {'SERVICE_ACCOUNT_FILE': 'north.json', 'ADMIN_USER_EMAIL': 'admin@north.example.org',
+                                 'PATH': os.path.join(tmp, 'north.sqlite3')},
+                'TENANT:south': {'SERVICE_ACCOUNT_FILE': 'south.json', 'ADMIN_USER_EMAIL': 'admin@south.example.org',
+                                 'PATH': os.path.join(tmp, 'south.sqlite3'), 'PII_MASKING_LEVEL': 'all'},
+            })
+            mock_get_config.return_value = config
+
+            def service_for(tenant_config, http=None):
+                domain = tenant_config.get('GOOGLE', 'ADMIN_USER_EMAIL').split('@')[1]
+                service = MagicMock()
+                course = dict(self.mock_course, id=f'course-{domain}', name=domain)
+                service.courses().list().execute.return_value = {'courses': [course]}
+                service.courses().teachers().list().execute.return_value = {'teachers': [self.mock_teacher]}
+                service.courses().students().list().execute.return_value = {'students': [self.mock_student]}
+                service.courses().announcements().list().execute.return_value = {'announcements': []}
+                service.courses().courseWork().list().execute.return_value = {'courseWork': []}
+                return service
+            mock_get_service.side_effect = service_for
+
+            main.main()
+
+            for tenant, domain, teacher_name in (('north', 'north.example.org', 'Prof Test'),
+                                                 ('south', 'south.example.org', 'user_teacher1')):
+                conn = sqlite3.connect(os.path.join(tmp, f'{tenant}.sqlite3'))
+                self.assertEqual(conn.execute("SELECT ID FROM CRSS").fetchall(), [(f'course-{domain}',)])
+                self.assertEqual(conn.execute("SELECT NM FROM USRS WHERE ID = 'teacher1'").fetchone()[0], teacher_name)
+                conn.close()
+
+            # The commands that read a database work on the tenant chosen
+            output = io.StringIO()
+            with redirect_stdout(output):
+                main.search(main.parse_args(['search', 'anything', '--tenant', 'north']))
+                main.export(main.parse_args(['export', 'USRS', '--tenant', 'south',
+                                             '--output-dir', os.path.join(tmp, 'export')]))
+            self.assertIn("No matches found.", output.getvalue())
+            with open(os.path.join(tmp, 'export', 'USRS.csv')) as exported:
+                self.assertIn('user_teacher1', exported.read())
+            for argv in (['search', 'anything'], ['export'], ['gradebook']):
+                with self.subTest(argv=argv), redirect_stderr(io.StringIO()) as errors, \
+                        self.assertRaises(SystemExit):
+                    getattr(main, argv[0])(main.parse_args(argv))
+                self.assertIn("Choose a tenant", errors.getvalue())
+
+    @unittest.skipUnless(duckdb, "duckdb is not installed")
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def test_end_to_end_flow_into_duckdb(self, mock_get_service, mock_get_config):
+        """Tests that an extraction can be written to a DuckDB database instead."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'classroom.duckdb')
+            mock_config = MagicMock()
+            settings = {'PATH': db_path, 'BACKEND': 'duckdb', 'PII_MASKING_LEVEL': 'none'}
+            mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
+            mock_get_config.return_value = mock_config
+
+            mock_service = MagicMock()
+            mock_get_service.return_value = mock_service
+            mock_service.courses().list().execute.return_value = {'courses': [self.mock_course]}
+            mock_service.courses().teachers().list().execute.return_value = {'teachers': [self.mock_teacher]}
+            mock_service.courses().students().list().execute.return_value = {'students': [self.mock_student]}
+            mock_service.courses().announcements().list().execute.return_value = {'announcements': [self.mock_announcement]}
+            mock_service.courses().courseWork().list().execute.return_value = {'courseWork': [self.mock_work]}
+            mock_service.courses().courseWork().studentSubmissions().list().execute.return_value = {'studentSubmissions': [self.mock_submission]}
+
+            main.main()
+
+            conn = duckdb.connect(db_path, read_only=True)
+            self.assertEqual(conn.execute("SELECT USR_NM FROM VW_ENRLLMNT_DTLS WHERE USR_RL = 'STUDENT'").fetchall(),
+                             [('Stud Test',)])
+            self.assertEqual(conn.execute("SELECT ASSGND_GRD FROM VW_ASSGNMNT_GRDS WHERE STNDT_NM = 'Stud Test'").fetchall(),
+                             [(95.0,)])
+            conn.close()
+
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
     @patch('main.get_classroom_service')
     def test_end_to_end_flow_with_student_masking(self, mock_get_service, mock_get_config):
         """Tests the full application flow with student PII masking enabled and new schema."""
         # --- Arrange ---
         mock_config = MagicMock()
-        mock_config.get.side_effect = lambda section, key, fallback=None: ':memory:' if key == 'PATH' else 'students_only'
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'students_only'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
         mock_get_config.return_value = mock_config
 
         conn = initialize_database(':memory:')
@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.memory import MemoryBudget, current_rss
+from src.metrics import MetricsRecorder
+
+MIB = 1024 * 1024
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def test_current_rss(self):
+        """Tests that the process's resident memory can be read."""
+        rss = current_rss()
+        self.assertIsNotNone(rss)
+        self.assertGreater(rss, MIB)
+
+    def test_buffered_rows_commit_early(self):
+        """Tests that a commit happens each time the buffered row limit is reached."""
+        budget = MemoryBudget(max_buffered_rows=100)
+        flush = MagicMock(side_effect=budget.flushed)
+        for _ in range(5):
+            budget.rows_written(40, flush)
+        # 40, 80, 120 -> flush, 40, 80
+        self.assertEqual(flush.call_count, 1)
+        self.assertEqual(budget.buffered_rows, 80)
+        self.assertEqual(budget.early_flushes, 1)
+
+    def test_no_limits_never_flush(self):
+        """Tests that without limits the pipeline is left alone."""
+        budget = MemoryBudget()
+        flush = MagicMock()
+        budget.rows_written(10 ** 6, flush)
+        flush.assert_not_called()
+
+    @patch('src.memory.gc.collect')
+    @patch('src.memory.current_rss')
+    def test_backpressure_near_budget(self, mock_rss, mock_collect):
+        """Tests that nearing the budget flushes and collects before the next page."""
+        budget = MemoryBudget(limit_mb=100)
+        flush = MagicMock()
+
+        mock_rss.return_value = 50 * MIB
+        budget.rows_written(10, flush)
+        flush.assert_not_called()
+
+        mock_rss.return_value = 95 * MIB
+        budget.rows_written(10, flush)
+        flush.assert_called_once()
+        mock_collect.assert_called_once()
+        self.assertEqual(budget.pressure_events, 1)
+        self.assertEqual(budget.buffered_rows, 0)
+
+    @patch('src.memory.current_rss')
+    def test_peak_per_stage(self, mock_rss):
+        """Tests that the peak RSS is kept per stage and reported to the metrics."""
+        metrics = MetricsRecorder()
+        budget = MemoryBudget(limit_mb=1000, metrics=metrics)
+        mock_rss.side_effect = [10 * MIB, 30 * MIB, 20 * MIB, 40 * MIB, 5 * MIB]
+        with budget.stage('submissions'):
+            budget.rows_written(1, MagicMock())
+        with budget.stage('views'):
+            pass
+
+        self.assertEqual(budget.peaks, {'submissions': 30 * MIB, 'views': 40 * MIB})
+        self.assertEqual(metrics.summary()['peak_rss_bytes'], {'submissions': 30 * MIB, 'views': 40 * MIB})
+        self.assertIn('fairplay_stage_peak_rss_bytes{stage="views"} 41943040', metrics.to_prometheus())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import json
+import os
+import tempfile
+import time
+
+from src.metrics import MetricsRecorder
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a recorder with a few observations."""
+        self.metrics = MetricsRecorder()
+        self.metrics.observe_page('courses.list', 0.2, 10, 2048)
+        self.metrics.observe_page('courses.list', 0.4, 5, 1024)
+        self.metrics.record_error('courses.list', 1.5)
+        self.metrics.record_retry('courses.list')
+        self.metrics.observe_write('CRSS', 15, 0.01)
+
+    def test_summary(self):
+        """Tests that endpoint and table totals are aggregated."""
+        summary = self.metrics.summary()
+        endpoint = summary['endpoints']['courses.list']
+        self.assertEqual(endpoint['requests'], 3)
+        self.assertEqual(endpoint['pages'], 2)
+        self.assertEqual(endpoint['items'], 15)
+        self.assertEqual(endpoint['response_bytes'], 3072)
+        self.assertEqual(endpoint['errors'], 1)
+        self.assertEqual(endpoint['retries'], 1)
+        self.assertAlmostEqual(endpoint['latency_seconds']['max'], 1.5)
+        self.assertEqual(summary['tables']['CRSS']['rows'], 15)
+        self.assertEqual(summary['tables']['CRSS']['rows_per_second'], 1500.0)
+
+    def test_instrument_write_and_flush(self):
+        """Tests that wrapped save functions and flushes are counted."""
+        calls = []
+
+        def fake_save(conn, row):
+            calls.append(row)
+            if row == 'bad':
+                time.sleep(0.001)
+                raise ValueError(row)
+            if row == 'malformed':
+                return None
+            return row != 'unchanged'
+
+        save = self.metrics.instrument_write('USRS', fake_save)
+        save(None, 'a')
+        save(None, 'b')
+        save(None, 'unchanged')
+        save(None, 'malformed')
+        seconds = self.metrics.summary()['tables']['USRS']['seconds']
+        # A save that raises is timed, but not counted
+        with self.assertRaises(ValueError):
+            save(None, 'bad')
+        self.assertGreater(self.metrics.summary()['tables']['USRS']['seconds'], seconds)
+        with self.metrics.time_flush():
+            pass
+        summary = self.metrics.summary()
+        self.assertEqual(calls, ['a', 'b', 'unchanged', 'malformed', 'bad'])
+        self.assertEqual(summary['tables']['USRS']['rows'], 2)
+        self.assertEqual(summary['tables']['USRS']['skipped'], 1)
+        self.assertEqual(summary['tables']['USRS']['quarantined'], 1)
+        self.assertEqual(self.metrics.write_totals(), (17, 1, 1))
+        self.assertEqual(summary['flushes']['count'], 1)
+
+    def test_prometheus_histogram(self):
+        """Tests that histogram buckets are cumulative in the textfile output."""
+        text = self.metrics.to_prometheus()
+        self.assertIn('fairplay_request_duration_seconds_bucket{endpoint="courses.list",le="0.25"} 1', text)
+        self.assertIn('fairplay_request_duration_seconds_bucket{endpoint="courses.list",le="0.5"} 2', text)
+        self.assertIn('fairplay_request_duration_seconds_bucket{endpoint="courses.list",le="+Inf"} 3', text)
+        self.assertIn('fairplay_table_rows_written_total{table="CRSS"} 15', text)
+
+    def test_write_outputs(self):
+        """Tests that both output files are written."""
+        with tempfile.TemporaryDirectory() as tmp:
+            textfile = os.path.join(tmp, 'metrics.prom')
+            summary_file = os.path.join(tmp, 'summary.json')
+            self.metrics.write_prometheus_textfile(textfile)
+            self.metrics.write_json_summary(summary_file)
+            with open(summary_file) as f:
+                self.assertIn('courses.list', json.load(f)['endpoints'])
+            self.assertTrue(os.path.exists(textfile))
+            self.assertFalse(os.path.exists(textfile + '.tmp'))
+
+if __name__ == '__main__':
+    unittest.main()
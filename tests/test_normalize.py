@@ -0,0 +1,58 @@
+import unittest
+
+from src.normalize import (
+    COLUMNS, NORMALIZERS, MalformedItemError, Rejected, content_hash, listed_ids, normalize_items
+)
+from tests.factories import submission, user
+
+class TestNormalizers(unittest.TestCase):
+
+    def setUp(self):
+        self.submission = submission('sub1', 'cw1', 'user1', assignedGrade=9, creationTime='t1', updateTime='t2',
+                                     alternateLink='https://classroom.example/sub1')
+
+    def test_rows_in_column_order(self):
+        """Tests that items become tuples in column order, with the content hash of the hashed fields."""
+        row = NORMALIZERS['STDNT_SBMSSNS'](self.submission)
+        self.assertEqual(len(row), len(COLUMNS['STDNT_SBMSSNS']))
+        self.assertEqual(dict(zip(COLUMNS['STDNT_SBMSSNS'], row)), {
+            'ID': 'sub1', 'CRS_WRK_ID': 'cw1', 'USR_ID': 'user1', 'STT': 'TURNED_IN', 'ASSGND_GRD': 9,
+            'DRFT_GRD': None, 'CRTN_TM': 't1', 'UPDT_TM': 't2', 'LT': 0,
+            'CNTNT_HSH': content_hash('TURNED_IN', 9, None, 't2'),
+        })
+        # A late flag is hashed only when set
+        late = NORMALIZERS['STDNT_SBMSSNS'](dict(self.submission, late=True))
+        self.assertEqual(late[-2:], (content_hash('TURNED_IN', 9, None, 't2', 'late'), 1))
+
+        row = NORMALIZERS['USRS'](user('u1', 'Ada'))
+        self.assertEqual(row, ('u1', 'Ada', 'u1@example.org', None, content_hash('Ada', 'u1@example.org', None)))
+        self.assertEqual(NORMALIZERS['USRS'].__name__, 'normalize_usrs')
+
+    def test_malformed_items(self):
+        """Tests that items lacking required fields, or null in them, are rejected with the fields named."""
+        normalize = NORMALIZERS['STDNT_SBMSSNS']
+        for item, reason in (
+            ({k: v for k, v in self.submission.items() if k != 'creationTime'}, "missing required fields: creationTime"),
+            (dict(self.submission, userId=None, updateTime=None), "missing required fields: userId, updateTime"),
+            (None, "not an object: NoneType"),
+        ):
+            with self.subTest(reason=reason):
+                with self.assertRaises(MalformedItemError) as cm:
+                    normalize(item)
+                self.assertEqual(str(cm.exception), reason)
+        with self.assertRaises(MalformedItemError):
+            NORMALIZERS['USRS']({'id': 'u1', 'name': 'Ada', 'emailAddress': 'ada@example.org'})
+
+    def test_normalize_items(self):
+        """Tests that a page is split into rows and rejected items, and every listed ID is kept."""
+        broken = {'id': 'sub2', 'courseWorkId': 'cw1'}
+        page = [self.submission, broken, {'state': 'NEW'}]
+        rows, rejected = normalize_items('STDNT_SBMSSNS', page)
+        self.assertEqual([row[0] for row in rows], ['sub1'])
+        self.assertEqual([item for item, _ in rejected], [broken, {'state': 'NEW'}])
+        self.assertIsInstance(rejected[0], Rejected)
+        self.assertEqual(listed_ids(page), ['sub1', 'sub2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+import time
+
+from src.profiling import NULL_PROFILER, StageProfiler
+
+class TestProfiling(unittest.TestCase):
+
+    def test_stage_timings(self):
+        """Tests that stages are aggregated in total and per course."""
+        profiler = StageProfiler()
+        profiler.start()
+        with profiler.stage('students', 'course1'):
+            sum(range(1000))
+        with profiler.stage('students', 'course2'):
+            pass
+        with profiler.stage('views'):
+            pass
+
+        summary = profiler.summary()
+        self.assertEqual(summary['stages']['students']['calls'], 2)
+        self.assertEqual(summary['stages']['views']['calls'], 1)
+        self.assertEqual(set(summary['courses']), {'course1', 'course2'})
+        self.assertGreaterEqual(summary['stages']['students']['wall_seconds'], 0.0)
+
+    def test_worker_cpu_added_to_stage(self):
+        """Tests that the CPU time of a stage's worker threads is counted once, with the stage's own."""
+        profiler = StageProfiler()
+
+        def spin():
+            with profiler.worker():
+                end = time.thread_time() + 0.05
+                while time.thread_time() < end:
+                    pass
+
+        with profiler.stage('submissions', 'course1'):
+            worker = threading.Thread(target=spin)
+            worker.start()
+            worker.join()
+        # A single worker runs in the stage's own thread
+        with profiler.stage('teachers'):
+            spin()
+
+        summary = profiler.summary()
+        self.assertGreaterEqual(summary['courses']['course1']['submissions']['cpu_seconds'], 0.05)
+        self.assertGreaterEqual(summary['stages']['teachers']['cpu_seconds'], 0.05)
+        self.assertLess(summary['stages']['teachers']['cpu_seconds'], 0.09)
+        with NULL_PROFILER.worker():
+            pass
+
+    def test_stage_recorded_on_exception(self):
+        """Tests that a stage which raises is still timed."""
+        profiler = StageProfiler()
+        with self.assertRaises(ValueError):
+            with profiler.stage('courses'):
+                raise ValueError("boom")
+        self.assertEqual(profiler.summary()['stages']['courses']['calls'], 1)
+
+    def test_outputs_written(self):
+        """Tests that the stage summary, cProfile dump and tracemalloc report are written."""
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = StageProfiler(tmp, use_cprofile=True, use_tracemalloc=True)
+            profiler.start()
+            with profiler.stage('courses'):
+                data = [str(i) for i in range(1000)]
+            profiler.stop()
+
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'run.pstats')))
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'tracemalloc_top.txt')))
+            with open(os.path.join(tmp, 'stages.json')) as f:
+                stages = json.load(f)['stages']
+            self.assertGreater(stages['courses']['peak_traced_bytes'], 0)
+            self.assertEqual(len(data), 1000)
+
+    def test_null_profiler(self):
+        """Tests that the disabled profiler records nothing."""
+        with NULL_PROFILER.stage('courses', 'course1'):
+            pass
+        self.assertFalse(NULL_PROFILER.enabled)
+        self.assertEqual(NULL_PROFILER.summary(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import io
+import json
+import logging
+import logging.handlers
+import unittest
+from unittest.mock import patch
+
+from src.metrics import MetricsRecorder
+from src.progress import JsonFormatter, ProgressReporter, current_tenant, start_logging, stop_logging
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestProgressReporter(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRecorder()
+        self.clock = FakeClock()
+        self.progress = ProgressReporter(4, self.metrics, interval=10, clock=self.clock)
+
+    def _write_rows(self, table, count):
+        save = self.metrics.instrument_write(table, lambda conn, item: True)
+        for _ in range(count):
+            save(None, {})
+
+    def test_reports_at_most_once_per_interval(self):
+        """Tests that progress lines are rate limited by the interval."""
+        with self.assertLogs('src.progress', level='INFO') as logs:
+            self.progress.maybe_report()
+            self.clock.now = 5
+            self.progress.course_done()
+            self.clock.now = 12
+            self.progress.maybe_report()
+            self.progress.maybe_report()
+        self.assertEqual(len(logs.records), 1)
+
+    def test_rates_and_eta(self):
+        """Tests the rows per second, courses remaining and ETA in a snapshot."""
+        self._write_rows('STDNT_SBMSSNS', 160)
+        self.clock.now = 8
+        self.progress.course_done()
+        snapshot = self.progress.snapshot()
+
+        self.assertEqual(snapshot['courses_done'], 1)
+        self.assertEqual(snapshot['courses_remaining'], 3)
+        self.assertEqual(snapshot['rows_per_second'], {'submissions': 20.0})
+        # 8 seconds for the first course, three to go
+        self.assertEqual(snapshot['eta_seconds'], 24.0)
+
+        # The next window starts where this one ended
+        self._write_rows('STDNT_SBMSSNS', 50)
+        self.clock.now = 18
+        self.assertEqual(self.progress.snapshot()['rows_per_second'], {'submissions': 5.0})
+
+    def test_final_report_covers_whole_run(self):
+        """Tests that the final line gives rates over the whole run."""
+        self._write_rows('ANNCMNTS', 100)
+        self.clock.now = 10
+        self.progress.report()
+        self.clock.now = 20
+        for _ in range(4):
+            self.progress.courses_done += 1
+        with self.assertLogs('src.progress', level='INFO') as logs:
+            self.progress.report(final=True)
+
+        record = logs.records[0]
+        self.assertIn('4/4 courses (100.0%)', record.getMessage())
+        self.assertIn('finished in 20s', record.getMessage())
+        self.assertEqual(record.progress['rows_per_second'], {'announcements': 5.0})
+
+class TestLogging(unittest.TestCase):
+
+    def test_json_formatter(self):
+        """Tests that progress fields are emitted as JSON fields."""
+        record = logging.LogRecord('src.progress', logging.INFO, __file__, 1, 'Progress: 1/2 courses', None, None)
+        record.progress = {'courses_done': 1, 'courses_total': 2}
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['message'], 'Progress: 1/2 courses')
+        self.assertEqual(entry['progress'], {'courses_done': 1, 'courses_total': 2})
+
+    def test_queued_logging(self):
+        """Tests that records reach the stream through the background writer."""
+        stream = io.StringIO()
+        listener = start_logging('text', verbose=False, stream=stream)
+        try:
+            logging.getLogger('src.extractor').info("Found 3 courses.")
+            logging.getLogger('src.extractor').debug("Per-item detail.")
+            logging.getLogger('src.memory').warning("Memory use is above the budget.")
+            logging.getLogger('googleapiclient').info("Library chatter.")
+        finally:
+            stop_logging(listener)
+
+        self.assertEqual(stream.getvalue().splitlines(), [
+            "Found 3 courses.",
+            "WARNING: Memory use is above the budget.",
+        ])
+        self.assertFalse(any(isinstance(h, logging.handlers.QueueHandler) for h in logging.getLogger().handlers))
+
+    def test_errors_logged_to_stderr(self):
+        """Tests that by default information goes to standard output, and warnings and errors to standard error."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch('sys.stdout', stdout), patch('sys.stderr', stderr):
+            listener = start_logging('text')
+            try:
+                logging.getLogger('main').info("Loading configuration...")
+                logging.getLogger('main').error("Configuration Error: no [DATABASE] section.")
+            finally:
+                stop_logging(listener)
+
+        self.assertEqual(stdout.getvalue().splitlines(), ["Loading configuration..."])
+        self.assertEqual(stderr.getvalue().splitlines(), ["ERROR: Configuration Error: no [DATABASE] section."])
+
+    def test_records_tagged_with_tenant(self):
+        """Tests that records logged while extracting a tenant carry its name."""
+        stream = io.StringIO()
+        listener = start_logging('json', stream=stream)
+        token = current_tenant.set('north')
+        try:
+            logging.getLogger('src.extractor').info("Found 3 courses.")
+        finally:
+            current_tenant.reset(token)
+            stop_logging(listener)
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry['tenant'], 'north')
+        self.assertEqual(entry['message'], 'Found 3 courses.')
+
+if __name__ == '__main__':
+    unittest.main()
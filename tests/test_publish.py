@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.database import initialize_database, save_announcement, save_course, save_user
+from src.publish import publish_snapshot
+from src.search import initialize_search_index, search_text
+
+class TestPublish(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a working database with announcements, some of them since deleted."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.working = os.path.join(self.tmp.name, 'working.sqlite3')
+        self.dest = os.path.join(self.tmp.name, 'published.sqlite3')
+        self.conn = initialize_database(self.working)
+        initialize_search_index(self.conn)
+        save_course(self.conn, {'id': 'course1', 'name': 'Biology', 'courseState': 'ACTIVE',
+                                 'creationTime': '2024-01-01T00:00:00Z', 'updateTime': '2024-01-01T00:00:00Z'})
+        save_user(self.conn, {'id': 'teacher', 'name': {'fullName': 'Prof'}, 'emailAddress': 'prof@example.com'})
+        for i in range(500):
+            topic = 'photosynthesis' if i % 100 == 99 else 'homework'
+            save_announcement(self.conn, {
+                'id': f'anno{i:04d}', 'courseId': 'course1', 'creatorUserId': 'teacher',
+                'text': f'Announcement {i} about {topic}. ' + 'Please read the chapter. ' * 20,
+                'creationTime': '2024-01-01T00:00:00Z', 'updateTime': '2024-01-01T00:00:00Z',
+            })
+        self.conn.commit()
+        # Deleting most rows leaves free pages and gaps in the rowids
+        self.conn.execute("DELETE FROM ANNCMNTS WHERE ID < 'anno0400';")
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def _open(self, path):
+        return sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+    def test_snapshot_is_compact_analyzed_and_searchable(self):
+        """Tests that the snapshot holds the committed data, compacted, with working search."""
+        publish_snapshot(self.conn, self.dest)
+
+        self.assertFalse(os.path.exists(self.dest + '.tmp'))
+        self.assertLess(os.path.getsize(self.dest), os.path.getsize(self.working))
+        snapshot = self._open(self.dest)
+        try:
+            self.assertEqual(snapshot.execute("SELECT COUNT(*) FROM ANNCMNTS").fetchone()[0], 100)
+            self.assertEqual(snapshot.execute("PRAGMA freelist_count").fetchone()[0], 0)
+            analyzed = snapshot.execute("SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 'ANNCMNTS'").fetchone()[0]
+            self.assertGreater(analyzed, 0)
+            # The index refers to the snapshot's rows, whatever their rowids
+            self.assertEqual([hit['id'] for hit in search_text(snapshot, 'photosynthesis')], ['anno0499'])
+            self.assertEqual(len(search_text(snapshot, 'homework', limit=200)), 99)
+        finally:
+            snapshot.close()
+
+    def test_open_readers_keep_their_snapshot(self):
+        """Tests that publishing replaces the snapshot without disturbing readers."""
+        publish_snapshot(self.conn, self.dest)
+        reader = self._open(self.dest)
+        try:
+            # A reader mid-transaction does not hold up the next publish
+            reader.execute("BEGIN;")
+            self.assertEqual(reader.execute("SELECT COUNT(*) FROM ANNCMNTS").fetchone()[0], 100)
+
+            self.conn.execute("DELETE FROM ANNCMNTS WHERE ID < 'anno0450';")
+            # Uncommitted work is committed first: the snapshot is never older than the run
+            publish_snapshot(self.conn, self.dest)
+
+            self.assertEqual(reader.execute("SELECT COUNT(*) FROM ANNCMNTS").fetchone()[0], 100)
+            reader.rollback()
+        finally:
+            reader.close()
+
+        fresh = self._open(self.dest)
+        try:
+            self.assertEqual(fresh.execute("SELECT COUNT(*) FROM ANNCMNTS").fetchone()[0], 50)
+        finally:
+            fresh.close()
+
+    def test_failed_publish_keeps_previous_snapshot(self):
+        """Tests that a snapshot that cannot be written leaves the previous one in place."""
+        publish_snapshot(self.conn, self.dest)
+        before = os.path.getsize(self.dest)
+
+        self.conn.execute("DELETE FROM ANNCMNTS;")
+        with patch('src.publish._finish_snapshot', side_effect=sqlite3.OperationalError('disk I/O error')):
+            with self.assertRaises(sqlite3.OperationalError):
+                publish_snapshot(self.conn, self.dest)
+
+        self.assertEqual(os.path.getsize(self.dest), before)
+        self.assertFalse(os.path.exists(self.dest + '.tmp'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from src.changes import begin_run, end_run, initialize_change_log
+from src.database import create_views, initialize_database, save_course, save_enrollment, save_user
+from src.publish import publish_snapshot
+from src.queries import QueryError, QueryService, serve_http
+from tests.factories import course, user
+
+class TestQueries(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a working database of two courses and publish it, as a run does."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.snapshot = os.path.join(self.tmp.name, 'published.sqlite3')
+        self.conn = initialize_database(os.path.join(self.tmp.name, 'working.sqlite3'))
+        initialize_change_log(self.conn)
+        run_id = begin_run(self.conn)
+        save_course(self.conn, course('c1', 'Biology'))
+        save_course(self.conn, course('c2', 'Chemistry'))
+        for user_id, course_id, role in (('prof', 'c1', 'TEACHER'), ('ann', 'c1', 'STUDENT'),
+                                         ('bob', 'c1', 'STUDENT'), ('ann', 'c2', 'STUDENT')):
+            save_user(self.conn, user(user_id))
+            save_enrollment(self.conn, course_id, user_id, role)
+        end_run(self.conn, run_id)
+        create_views(self.conn)
+        publish_snapshot(self.conn, self.snapshot)
+        self.service = QueryService(self.snapshot, connections=2)
+
+    def tearDown(self):
+        self.service.close()
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def _publish_run(self, *users):
+        """Publishes a run that enrolls more students in Biology."""
+        run_id = begin_run(self.conn)
+        for user_id in users:
+            save_user(self.conn, user(user_id))
+            save_enrollment(self.conn, 'c1', user_id, 'STUDENT')
+        end_run(self.conn, run_id)
+        publish_snapshot(self.conn, self.snapshot)
+        return run_id
+
+    def test_queries_cached_until_next_run(self):
+        """Tests that results are filtered, cached, and read again once a new snapshot is published."""
+        result = self.service.query('VW_ENRLLMNT_DTLS', {'CRS_NM': 'Biology', 'USR_RL': 'STUDENT'})
+        self.assertEqual(result.columns, ('CRS_NM', 'CRS_SCTN', 'USR_NM', 'USR_EML', 'USR_RL'))
+        self.assertEqual(sorted(row[2] for row in result.rows), ['Ann', 'Bob'])
+        self.assertEqual(result.run_id, 1)
+        self.assertTrue(result.etag.startswith('"1-'))
+        self.assertEqual(json.loads(result.body)['rows'], [list(row) for row in result.rows])
+
+        # The same query, with its filters in any order, is answered from the cache
+        self.assertIs(self.service.query('VW_ENRLLMNT_DTLS', {'USR_RL': 'STUDENT', 'CRS_NM': 'Biology'}), result)
+        self.assertEqual(len(self.service.query('VW_ENRLLMNT_DTLS', limit=2).rows), 2)
+
+        # Writes to the working database are not seen until they are published
+        save_user(self.conn, user('cy'))
+        save_enrollment(self.conn, 'c1', 'cy', 'STUDENT')
+        self.conn.commit()
+        self.assertIs(self.service.query('VW_ENRLLMNT_DTLS', {'CRS_NM': 'Biology', 'USR_RL': 'STUDENT'}), result)
+
+        run_id = self._publish_run('dee')
+        updated = self.service.query('VW_ENRLLMNT_DTLS', {'CRS_NM': 'Biology', 'USR_RL': 'STUDENT'})
+        self.assertEqual(sorted(row[2] for row in updated.rows), ['Ann', 'Bob', 'Cy', 'Dee'])
+        self.assertEqual(updated.run_id, run_id)
+        self.assertNotEqual(updated.etag, result.etag)
+
+    def test_invalid_queries(self):
+        """Tests that unknown views and columns, and invalid limits, are refused."""
+        with self.assertRaisesRegex(QueryError, "Unknown view 'USRS'"):
+            self.service.query('USRS')
+        with self.assertRaisesRegex(QueryError, "Unknown columns of VW_ENRLLMNT_DTLS: EML"):
+            self.service.query('VW_ENRLLMNT_DTLS', {'EML': 'ann@example.org'})
+        with self.assertRaisesRegex(QueryError, "Invalid limit"):
+            self.service.query('VW_ENRLLMNT_DTLS', limit=-1)
+        with self.assertRaisesRegex(QueryError, "No database"):
+            QueryService(os.path.join(self.tmp.name, 'missing.sqlite3'))
+
+    def test_http_etags(self):
+        """Tests that the HTTP endpoint answers queries, and 304 to a revalidation until the next run."""
+        server = serve_http(self.service, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def get(path, etag=None):
+            request = urllib.request.Request(base + path, headers={'If-None-Match': etag} if etag else {})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status, response.headers.get('ETag'), response.read()
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers.get('ETag'), e.read()
+
+        try:
+            status, _, body = get('/views')
+            self.assertEqual(status, 200)
+            self.assertIn('VW_ASSGNMNT_GRDS', json.loads(body))
+
+            path = '/views/VW_SIS_ENRLLMNT_ROSTER?USR_ID=ann&limit=10'
+            status, etag, body = get(path)
+            self.assertEqual(status, 200)
+            self.assertEqual(sorted(row[0] for row in json.loads(body)['rows']), ['c1', 'c2'])
+            self.assertEqual(get(path, etag), (304, etag, b''))
+
+            self._publish_run('eve')
+            status, new_etag, _ = get(path, etag)
+            self.assertEqual(status, 200)
+            self.assertNotEqual(new_etag, etag)
+
+            self.assertEqual(get('/views/USRS')[0], 404)
+            self.assertEqual(get('/views/VW_SIS_ENRLLMNT_ROSTER?EML=x')[0], 400)
+            self.assertEqual(get('/views/VW_SIS_ENRLLMNT_ROSTER?limit=all')[0], 400)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
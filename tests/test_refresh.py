@@ -0,0 +1,110 @@
+import argparse
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from src.concurrency import AdaptiveLimiter, ServicePool
+from src.database import initialize_database
+from src.refresh import courses_for_user, refresh_courses
+from src.storage import SQLiteBackend
+from tests.factories import FakeClassroom
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class TestRefresh(unittest.TestCase):
+
+    def setUp(self):
+        """Extract the whole fake domain, then change it in Classroom."""
+        self.conn = initialize_database(':memory:')
+        self.storage = SQLiteBackend(self.conn)
+        self.settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none', 'MAX_CONCURRENT_REQUESTS': '4'}
+        self._run(lambda: main.main(db_conn_for_testing=self.conn), FakeClassroom())
+        # One student leaves every course, and every submission is graded
+        self.changed = FakeClassroom(students=14, grade=88)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _run(self, command, fake):
+        mock_config = MagicMock()
+        mock_config.get.side_effect = lambda section, key, fallback=None: self.settings.get(key, fallback)
+        with patch('main.get_config', return_value=mock_config), \
+                patch('main.get_authorized_http', lambda config: None), \
+                patch('main.get_classroom_service', return_value=fake.service), \
+                patch('main.AdaptiveLimiter', partial(AdaptiveLimiter, sleep=lambda seconds: None)):
+            command()
+
+    def _roster(self, course_id):
+        return self.conn.execute("SELECT COUNT(*) FROM ENRLLMNTS WHERE CRS_ID = ? AND RL = 'STUDENT'",
+                                 (course_id,)).fetchone()[0]
+
+    def _graded(self, course_id):
+        return self.conn.execute("""
+            SELECT COUNT(*) FROM STDNT_SBMSSNS s JOIN CRS_WRK w ON w.ID = s.CRS_WRK_ID
+            WHERE w.CRS_ID = ? AND s.ASSGND_GRD = 88
+        """, (course_id,)).fetchone()[0]
+
+    def test_only_given_courses_refreshed(self):
+        """Tests that a refresh re-extracts only its courses, including deletions, in few calls."""
+        summary = refresh_courses(self.storage, ServicePool(lambda: self.changed.service), ['c1'], workers=4)
+
+        # The course, its four listings (two pages of students) and its three
+        # course work items' submissions (two pages each)
+        self.assertEqual(self.changed.calls, 1 + 5 + 3 * 2)
+        self.assertEqual(summary['api_calls'], self.changed.calls)
+        self.assertEqual((summary['courses'], summary['missing'], summary['failed_listings']), (['c1'], [], 0))
+        self.assertEqual(summary['deleted'], {'STUDENTS': 1, 'STDNT_SBMSSNS': 3})
+        self.assertEqual((self._roster('c1'), self._graded('c1')), (14, 42))
+        self.assertEqual((self._roster('c0'), self._graded('c0')), (15, 0))
+
+    def test_malformed_course_not_refreshed(self):
+        """Tests that a course now malformed is quarantined, and its rosters and content left as they were."""
+        changed = FakeClassroom(students=14, grade=88, malformed_courses={'c1'})
+        summary = refresh_courses(self.storage, ServicePool(lambda: changed.service), ['c0', 'c1'], workers=4)
+        self.assertEqual((summary['courses'], summary['quarantined']), (['c0'], ['c1']))
+        self.assertEqual((self._roster('c1'), self._graded('c1')), (15, 0))
+        self.assertEqual((self._roster('c0'), self._graded('c0')), (14, 42))
+
+    def test_courses_for_user(self):
+        """Tests that a user, by ID or email, resolves to their courses."""
+        self.assertEqual(courses_for_user(self.storage, 'c2-t0'), ['c2'])
+        self.assertEqual(courses_for_user(self.storage, 's3@example.org'), ['c0', 'c1', 'c2'])
+        self.assertEqual(courses_for_user(self.storage, 'nobody'), [])
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_refresh_command(self):
+        """Tests the refresh command for a user, updating that course's grade statistics."""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main.gradebook(argparse.Namespace(course_ids=None, matrix_dir=None), db_conn_for_testing=self.conn)
+            self._run(lambda: main.refresh(argparse.Namespace(course_ids=[], users=['c0-t0'], tenant=None),
+                                           db_conn_for_testing=self.conn), self.changed)
+
+        self.assertIn("Refreshed 1 courses", output.getvalue())
+        self.assertEqual(self._graded('c0'), 42)
+        # Only the refreshed course's statistics were recomputed
+        self.assertEqual(self.conn.execute("SELECT CRS_ID, SBMSSN_CNT FROM CRS_GRD_STTS ORDER BY CRS_ID").fetchall(),
+                         [('c0', 42), ('c1', 45), ('c2', 45)])
+
+    def test_missing_course_reported(self):
+        """Tests that a course Classroom does not have is reported and the command fails."""
+        errors = io.StringIO()
+        with redirect_stdout(io.StringIO()), redirect_stderr(errors), self.assertRaises(SystemExit):
+            self._run(lambda: main.refresh(argparse.Namespace(course_ids=['c1', 'gone'], users=[], tenant=None),
+                                           db_conn_for_testing=self.conn), self.changed)
+        self.assertIn("Courses not found in Classroom: gone", errors.getvalue())
+        self.assertEqual(self._roster('c1'), 14)
+
+
+if __name__ == '__main__':
+    unittest.main()
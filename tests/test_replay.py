@@ -0,0 +1,132 @@
+import os
+import sys
+import unittest
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from src.concurrency import AdaptiveLimiter
+from src.database import initialize_database
+from src.extractor import FailedRequest
+from src.replay import replay_dead_letters
+from src.storage import SQLiteBackend
+from tests.factories import FakeClassroom
+
+TABLES = ('CRSS', 'USRS', 'ENRLLMNTS', 'ANNCMNTS', 'CRS_WRK', 'STDNT_SBMSSNS')
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = initialize_database(':memory:')
+        self.storage = SQLiteBackend(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    # Failing requests are retried without waiting
+    @patch('main.AdaptiveLimiter', partial(AdaptiveLimiter, sleep=lambda seconds: None))
+    @patch('main.get_config')
+    @patch('main.get_authorized_http', lambda config: None)
+    @patch('main.get_classroom_service')
+    def _extract(self, conn, fake, mock_get_service, mock_get_config):
+        """Runs an extraction into conn against a fake Classroom."""
+        mock_config = MagicMock()
+        settings = {'PATH': ':memory:', 'PII_MASKING_LEVEL': 'none', 'PURGE_DELETED': 'true'}
+        mock_config.get.side_effect = lambda section, key, fallback=None: settings.get(key, fallback)
+        mock_get_config.return_value = mock_config
+        mock_get_service.return_value = fake.service
+        main.main(db_conn_for_testing=conn)
+
+    def _counts(self, conn):
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TABLES}
+
+    def test_replay_recovers_what_the_failures_missed(self):
+        """Tests that replaying a bad run's dead letters completes it, re-issuing only missing pages."""
+        self._extract(self.conn, FakeClassroom(failing={
+            ('courses', '', '-2'), ('studentSubmissions', 'c0-w1', 'c0-w1-10'),
+        }))
+        letters = self.storage.dead_letters()
+        self.assertEqual([(l.endpoint, l.params, l.page_token, l.status) for l in letters], [
+            ('courses.list', {}, '-2', 500),
+            ('courses.courseWork.studentSubmissions.list', {'courseId': 'c0', 'courseWorkId': 'c0-w1'},
+             'c0-w1-10', 500),
+        ])
+
+        fake = FakeClassroom()
+        summary = replay_dead_letters(self.storage, fake.service)
+
+        # The second page of courses, then the listings of the course on it;
+        # and the second page of one assignment's submissions
+        self.assertEqual(fake.calls, 1 + (1 + 2 + 1 + 1 + 3 * 2) + 1)
+        self.assertEqual(summary['api_calls'], fake.calls)
+        self.assertEqual((summary['replayed'], summary['recovered'], summary['still_failing']), (2, 2, 0))
+        self.assertEqual(self.storage.dead_letters(), [])
+
+        clean = initialize_database(':memory:')
+        try:
+            self._extract(clean, FakeClassroom())
+            self.assertEqual(self._counts(self.conn), self._counts(clean))
+        finally:
+            clean.close()
+
+    def test_malformed_course_quarantined_with_its_listings(self):
+        """Tests that an extraction and a replay quarantine a malformed course and save nothing under it."""
+        malformed = {'c1', 'c2'}
+        # c1 is on the first page of courses; c2 on the second, which fails until the replay.
+        # Neither run exits, as it did when the course's enrollments failed its foreign key.
+        self._extract(self.conn, FakeClassroom(failing={('courses', '', '-2')}, malformed_courses=malformed))
+        summary = replay_dead_letters(self.storage, FakeClassroom(malformed_courses=malformed).service)
+        self.assertEqual((summary['recovered'], summary['still_failing'], summary['new_failures']), (1, 0, 0))
+
+        self.assertEqual(self.conn.execute("SELECT TBL, ITM_ID FROM QRNTN ORDER BY ITM_ID;").fetchall(),
+                         [('CRSS', 'c1'), ('CRSS', 'c2')])
+        for table in ('CRSS', 'ENRLLMNTS', 'ANNCMNTS', 'CRS_WRK'):
+            column = 'ID' if table == 'CRSS' else 'CRS_ID'
+            with self.subTest(table=table):
+                self.assertEqual(self.conn.execute(f"SELECT DISTINCT {column} FROM {table};").fetchall(), [('c0',)])
+
+    def _save_courses(self):
+        for i in range(3):
+            self.storage.save_course({'id': f'c{i}', 'name': f'Course {i}', 'courseState': 'ACTIVE',
+                                      'creationTime': 't', 'updateTime': 't'})
+
+    def test_failing_again_kept_with_attempts(self):
+        """Tests that a request failing again stays, and a failure further on is recorded."""
+        self._save_courses()
+        self.storage.record_dead_letters([
+            FailedRequest('courses.students.list', {'courseId': 'c1'}, None, 503, 'unavailable'),
+            FailedRequest('courses.courseWork.list', {'courseId': 'c2'}, None, 500, 'backend error'),
+        ])
+
+        summary = replay_dead_letters(self.storage, FakeClassroom(failing={
+            ('students', 'c1', 'c1-10'), ('courseWork', 'c2', None),
+        }).service)
+
+        self.assertEqual((summary['recovered'], summary['still_failing'], summary['new_failures']), (1, 1, 1))
+        letters = {(l.endpoint, l.page_token): l for l in self.storage.dead_letters()}
+        self.assertEqual(set(letters), {('courses.students.list', 'c1-10'), ('courses.courseWork.list', None)})
+        self.assertEqual(letters['courses.courseWork.list', None].attempts, 2)
+        self.assertEqual(letters['courses.students.list', 'c1-10'].attempts, 1)
+        # The first page of students was saved
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM ENRLLMNTS").fetchone()[0], 10)
+
+    def test_expired_page_token_restarts_listing(self):
+        """Tests that a listing whose page token is refused is fetched from its first page."""
+        self._save_courses()
+        self.storage.record_dead_letters([
+            FailedRequest('courses.students.list', {'courseId': 'c0'}, 'stale', 500, 'backend error'),
+        ])
+
+        fake = FakeClassroom(expired={'stale'})
+        summary = replay_dead_letters(self.storage, fake.service)
+
+        self.assertEqual(summary['recovered'], 1)
+        self.assertEqual(fake.calls, 3)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM ENRLLMNTS").fetchone()[0], 15)
+        self.assertEqual(self.storage.dead_letters(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
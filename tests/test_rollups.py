@@ -0,0 +1,122 @@
+import random
+import unittest
+
+from src.database import (
+    initialize_database, purge_unseen, begin_seen_tracking, record_listing, save_announcement, save_course,
+    save_course_work, save_student_submission, save_user
+)
+from src.rollups import ROLLUP_QUERIES, initialize_rollups
+from tests.factories import announcement, course, course_work, submission, user
+
+COURSES = ['course0', 'course1', 'course2']
+USERS = ['user0', 'user1', 'user2', 'user3']
+STATES = ['NEW', 'CREATED', 'TURNED_IN', 'RETURNED', 'RECLAIMED_BY_STUDENT', None]
+
+class TestRollups(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = initialize_database(':memory:')
+        initialize_rollups(self.conn)
+        for user_id in USERS:
+            self._save_user(user_id)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _save_user(self, user_id):
+        save_user(self.conn, user(user_id))
+
+    def _rows(self, table):
+        return sorted(self.conn.execute(f"SELECT * FROM {table};").fetchall())
+
+    def _assert_consistent(self):
+        for table, query in ROLLUP_QUERIES.items():
+            self.assertEqual(self._rows(table), sorted(self.conn.execute(query).fetchall()), table)
+
+    def test_counts_follow_saves(self):
+        """Tests that the rollups count submissions by state as they are inserted and upserted."""
+        save_course(self.conn, course('course0'))
+        save_course_work(self.conn, course_work('work0', 'course0'))
+        save_course_work(self.conn, course_work('work1', 'course0'))
+        save_student_submission(self.conn, submission('s0', 'work0', 'user0', state='CREATED', updateTime='2024-09-02'))
+        save_student_submission(self.conn, submission('s1', 'work1', 'user0', late=True, updateTime='2024-09-03'))
+        save_student_submission(self.conn, submission('s2', 'work0', 'user1', state='NEW', updateTime='2024-09-01'))
+        save_announcement(self.conn, announcement('a0', 'course0', 'user0', updateTime='2024-09-04'))
+
+        columns = "SBMSSN_CNT, ASSGND_CNT, MSSNG_CNT, SBMTD_CNT, RTRND_CNT, RCLMD_CNT, LT_CNT"
+        self.assertEqual(self.conn.execute(f"SELECT {columns}, ANNCMNT_CNT, LST_ACTVTY_TM FROM CRS_RLLPS;").fetchall(),
+                         [(3, 1, 1, 1, 0, 0, 1, 1, '2024-09-04')])
+        self.assertEqual(self.conn.execute(f"SELECT USR_ID, {columns}, LST_ACTVTY_TM FROM STDNT_RLLPS "
+                                           "ORDER BY USR_ID;").fetchall(),
+                         [('user0', 2, 0, 1, 1, 0, 0, 1, '2024-09-03'), ('user1', 1, 1, 0, 0, 0, 0, 0, '2024-09-01')])
+
+        # The missing work is turned in late, and the other is returned on time
+        save_student_submission(self.conn, submission('s0', 'work0', 'user0', late=True, updateTime='2024-09-05'))
+        save_student_submission(self.conn, submission('s1', 'work1', 'user0', state='RETURNED', updateTime='2024-09-06'))
+        self.assertEqual(self.conn.execute(f"SELECT {columns}, LST_ACTVTY_TM FROM STDNT_RLLPS "
+                                           "WHERE USR_ID = 'user0';").fetchall(),
+                         [(2, 0, 0, 1, 1, 0, 1, '2024-09-06')])
+        self._assert_consistent()
+
+    def test_rollups_match_base_tables(self):
+        """Tests that the rollups equal a full recount after random saves, purges and deletes."""
+        rng = random.Random(48)
+        works = {}
+        for step in range(600):
+            operation = rng.random()
+            course_id = rng.choice(COURSES)
+            time = f'2024-09-{rng.randint(1, 28):02d}'
+            if operation < 0.5:
+                work_id, user_id = f'work{rng.randint(0, 8)}', rng.choice(USERS)
+                if work_id not in works:
+                    save_course(self.conn, course(course_id))
+                    save_course_work(self.conn, course_work(work_id, course_id))
+                self._save_user(user_id)
+                save_student_submission(self.conn, submission(
+                    f'{work_id}-{user_id}', work_id, user_id, state=rng.choice(STATES), late=rng.random() < 0.3, updateTime=time
+                ))
+            elif operation < 0.7:
+                save_course(self.conn, course(course_id))
+                save_announcement(self.conn, announcement(f'a{rng.randint(0, 5)}', course_id, 'user0', updateTime=time))
+            elif operation < 0.8 and works:
+                # Some of a course work item's submissions are no longer listed
+                work_id = rng.choice(sorted(works))
+                ids = [row[0] for row in self.conn.execute(
+                    "SELECT ID FROM STDNT_SBMSSNS WHERE CRS_WRK_ID = ?;", (work_id,))]
+                begin_seen_tracking(self.conn)
+                record_listing(self.conn, 'STDNT_SBMSSNS', work_id, rng.sample(ids, len(ids) // 2))
+                purge_unseen(self.conn)
+            elif operation < 0.9:
+                # Some of a course's work or announcements are no longer listed
+                collection = rng.choice(['CRS_WRK', 'ANNCMNTS'])
+                ids = [row[0] for row in self.conn.execute(
+                    f"SELECT ID FROM {collection} WHERE CRS_ID = ?;", (course_id,))]
+                begin_seen_tracking(self.conn)
+                record_listing(self.conn, collection, course_id, rng.sample(ids, len(ids) // 2))
+                purge_unseen(self.conn)
+            elif operation < 0.95:
+                self.conn.execute("DELETE FROM CRSS WHERE ID = ?;", (course_id,))
+            else:
+                self.conn.execute("DELETE FROM USRS WHERE ID = ?;", (rng.choice(USERS[1:]),))
+            works = dict(self.conn.execute("SELECT ID, CRS_ID FROM CRS_WRK;").fetchall())
+            with self.subTest(step=step):
+                self._assert_consistent()
+        self.assertTrue(self._rows('STDNT_RLLPS'))
+
+    def test_rebuilt_when_enabled(self):
+        """Tests that rollups turned on for an existing database start from its rows, and turned off are dropped."""
+        initialize_rollups(self.conn, enabled=False)
+        save_course(self.conn, course('course0'))
+        save_course_work(self.conn, course_work('work0', 'course0'))
+        save_student_submission(self.conn, submission('s0', 'work0', 'user0'))
+        self.assertEqual(self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name LIKE '%RLLP%';").fetchone()[0], 0)
+
+        initialize_rollups(self.conn)
+        self.assertEqual(self.conn.execute("SELECT CRS_ID, SBMSSN_CNT FROM CRS_RLLPS;").fetchall(), [('course0', 1)])
+        save_student_submission(self.conn, submission('s1', 'work0', 'user1'))
+        self._assert_consistent()
+
+
+if __name__ == '__main__':
+    unittest.main()
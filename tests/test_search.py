@@ -0,0 +1,78 @@
+import unittest
+import sqlite3
+
+from src.database import (
+    initialize_database, save_user, save_course, save_announcement, save_course_work,
+    begin_seen_tracking, record_listing, purge_unseen
+)
+from src.search import initialize_search_index, rebuild_search_index, search_text
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an in-memory database with a search index and one course."""
+        self.conn = initialize_database(':memory:')
+        self.assertTrue(initialize_search_index(self.conn))
+        save_user(self.conn, {'id': 'u1', 'name': {'fullName': 'Teacher'}, 'emailAddress': 'teacher@example.com'})
+        save_course(self.conn, {'id': 'c1', 'name': 'Biology', 'section': 'P3', 'creationTime': 't1', 'updateTime': 't2', 'courseState': 'ACTIVE'})
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _announce(self, announcement_id, text):
+        save_announcement(self.conn, {'id': announcement_id, 'courseId': 'c1', 'creatorUserId': 'u1', 'text': text, 'state': 'PUBLISHED', 'creationTime': 't3', 'updateTime': 't4'})
+
+    def test_search_returns_ranked_hits_with_course_context(self):
+        """Tests that matches from both tables are returned with their course, best first."""
+        self._announce('a1', 'Bring your lab coat on Friday.')
+        save_course_work(self.conn, {'id': 'w1', 'courseId': 'c1', 'title': 'Photosynthesis lab', 'description': 'Write up the lab.', 'creationTime': 't5', 'updateTime': 't6'})
+        save_course_work(self.conn, {'id': 'w2', 'courseId': 'c1', 'title': 'Cell quiz', 'description': 'Covers mitosis.', 'creationTime': 't5', 'updateTime': 't6'})
+
+        hits = search_text(self.conn, 'lab')
+        self.assertEqual({hit['id'] for hit in hits}, {'a1', 'w1'})
+        # The course work matches in both title and description and ranks first
+        self.assertEqual(hits[0]['id'], 'w1')
+        self.assertEqual(hits[0]['type'], 'Assignment')
+        self.assertEqual((hits[0]['course_id'], hits[0]['course_name'], hits[0]['course_section']), ('c1', 'Biology', 'P3'))
+        self.assertIn('[lab]', hits[0]['snippet'])
+
+        self.assertEqual(search_text(self.conn, 'lab', limit=1)[0]['id'], 'w1')
+
+    def test_index_follows_updates_and_deletes(self):
+        """Tests that the triggers keep the index in step with the source rows."""
+        self._announce('a1', 'Field trip permission slips are due.')
+        self.assertEqual(len(search_text(self.conn, 'permission')), 1)
+
+        self._announce('a1', 'The field trip is cancelled.')
+        self.assertEqual(search_text(self.conn, 'permission'), [])
+        self.assertEqual(len(search_text(self.conn, 'cancelled')), 1)
+
+        # Rows removed by the deletion purge leave the index too
+        begin_seen_tracking(self.conn)
+        record_listing(self.conn, 'ANNCMNTS', 'c1', [])
+        purge_unseen(self.conn)
+        self.assertEqual(search_text(self.conn, 'cancelled'), [])
+
+    def test_index_created_for_existing_data(self):
+        """Tests that an index added to a populated database covers the existing rows."""
+        conn = initialize_database(':memory:')
+        save_user(conn, {'id': 'u1', 'name': {'fullName': 'Teacher'}, 'emailAddress': 'teacher@example.com'})
+        save_course(conn, {'id': 'c1', 'name': 'Biology', 'creationTime': 't1', 'updateTime': 't2', 'courseState': 'ACTIVE'})
+        save_announcement(conn, {'id': 'a1', 'courseId': 'c1', 'creatorUserId': 'u1', 'text': 'Quiz on Monday', 'creationTime': 't3', 'updateTime': 't4'})
+        conn.commit()
+
+        initialize_search_index(conn)
+        self.assertEqual([hit['id'] for hit in search_text(conn, 'quiz')], ['a1'])
+        # Initializing again is harmless
+        initialize_search_index(conn)
+        rebuild_search_index(conn)
+        self.assertEqual(len(search_text(conn, 'quiz')), 1)
+        conn.close()
+
+    def test_invalid_query_raises(self):
+        """Tests that malformed FTS5 syntax is reported as an OperationalError."""
+        with self.assertRaises(sqlite3.OperationalError):
+            search_text(self.conn, '"unbalanced')
+
+if __name__ == '__main__':
+    unittest.main()
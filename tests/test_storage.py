@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from src.extractor import FailedRequest
+from src.metrics import MetricsRecorder
+from src.storage import SQLiteBackend, open_storage
+from tests.factories import announcement, course, course_work, submission, user
+
+try:
+    import duckdb
+    import pyarrow
+    from src.storage import DuckDBBackend
+except ImportError:
+    duckdb = None
+
+class BackendTests:
+    """Tests every storage backend must pass. Subclasses open the backend."""
+
+    def open(self, metrics=None):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.metrics = MetricsRecorder()
+        self.storage = self.open(self.metrics)
+        self.user = user('user123', 'Test User')
+        self.teacher = user('teacher1', 'Prof')
+        self.course = course('course456', 'Test Course', section='TC101', description='A test course.')
+        self.announcement = announcement('anno1', 'course456', 'teacher1', state='PUBLISHED')
+        self.submission = submission('sub1', 'cw1', 'user123', state='RETURNED', assignedGrade=None)
+
+    def tearDown(self):
+        self.storage.close()
+        self.temp_dir.cleanup()
+
+    def _course_work(self, work_id, title='Test Assignment'):
+        return course_work(work_id, 'course456', title=title, maxPoints=100, creatorUserId='teacher1')
+
+    def _populate(self):
+        for item in (self.user, self.teacher):
+            self.storage.save_user(item)
+        self.storage.save_course(self.course)
+        self.storage.save_enrollment('course456', 'teacher1', 'TEACHER')
+        self.storage.save_enrollment('course456', 'user123', 'STUDENT')
+        self.storage.save_announcement(self.announcement)
+        self.storage.save_course_work(self._course_work('cw1'))
+        self.storage.save_student_submission(self.submission)
+        self.storage.commit()
+
+    def test_rows_saved(self):
+        """Tests that each kind of row is saved with its columns."""
+        self._populate()
+        self.assertEqual(self.storage.query("SELECT ID, NM, EML FROM USRS ORDER BY ID"),
+                         [('teacher1', 'Prof', 'teacher1@example.org'), ('user123', 'Test User', 'user123@example.org')])
+        self.assertEqual(self.storage.query("SELECT NM, SCTN, CRS_STT FROM CRSS"), [('Test Course', 'TC101', 'ACTIVE')])
+        self.assertEqual(self.storage.query("SELECT USR_ID, RL FROM ENRLLMNTS ORDER BY USR_ID"),
+                         [('teacher1', 'TEACHER'), ('user123', 'STUDENT')])
+        self.assertEqual(self.storage.query("SELECT TXT, CRTR_USR_ID FROM ANNCMNTS"), [('Hello', 'teacher1')])
+        self.assertEqual(self.storage.query("SELECT TTL, MX_PNTS FROM CRS_WRK"), [('Test Assignment', 100.0)])
+        self.assertEqual(self.storage.query("SELECT CRS_WRK_ID, STT, ASSGND_GRD FROM STDNT_SBMSSNS"),
+                         [('cw1', 'RETURNED', None)])
+
+    def test_views_created(self):
+        """Tests that the analytics views are created and give the same answers."""
+        self._populate()
+        self.storage.create_views()
+        self.assertEqual(self.storage.query("SELECT SBMSSN_STS FROM VW_ASSGNMNT_GRDS WHERE STNDT_NM = 'Test User'"),
+                         [('EXCSD',)])
+        self.assertEqual(self.storage.query("SELECT USR_NM, USR_RL FROM VW_ENRLLMNT_DTLS ORDER BY USR_NM"),
+                         [('Prof', 'TEACHER'), ('Test User', 'STUDENT')])
+        self.assertEqual(self.storage.query("SELECT ACTVTY_TYP, CRTR_NM FROM VW_CRS_ACTVTY_LG ORDER BY 1"),
+                         [('Announcement', 'Prof'), ('Assignment', 'Prof')])
+        self.assertEqual(self.storage.query("SELECT COUNT(*) FROM VW_SIS_ENRLLMNT_ROSTER"), [(2,)])
+
+    def test_unchanged_rows_skipped(self):
+        """Tests that re-saving identical content is counted as skipped and a change is written."""
+        self._populate()
+        self.storage.save_student_submission(self.submission)
+        self.storage.save_user(self.user)
+        self.storage.save_enrollment('course456', 'user123', 'STUDENT')
+        self.storage.commit()
+        self.storage.save_student_submission(dict(self.submission, assignedGrade=90))
+        self.storage.commit()
+
+        self.assertEqual(self.storage.query("SELECT ASSGND_GRD FROM STDNT_SBMSSNS"), [(90.0,)])
+        tables = self.metrics.summary()['tables']
+        self.assertEqual((tables['STDNT_SBMSSNS']['rows'], tables['STDNT_SBMSSNS']['skipped']), (2, 1))
+        self.assertEqual((tables['USRS']['rows'], tables['USRS']['skipped']), (2, 1))
+        self.assertEqual((tables['ENRLLMNTS']['rows'], tables['ENRLLMNTS']['skipped']), (2, 1))
+
+        self.storage.save_student_submission(dict(self.submission, assignedGrade=90))
+        self.storage.commit()
+        self.assertEqual(self.metrics.summary()['tables']['STDNT_SBMSSNS']['skipped'], 2)
+
+    def test_purge_unseen(self):
+        """Tests that rows missing from a complete listing are deleted, with their dependents."""
+        self._populate()
+        self.storage.save_course_work(self._course_work('cw2', 'Kept'))
+
+        self.storage.begin_seen_tracking()
+        self.storage.record_listing('CRS_WRK', 'course456', ['cw2'])
+        self.storage.record_listing('TEACHERS', 'course456', ['teacher1'])
+        deleted = self.storage.purge_unseen()
+
+        self.assertEqual(deleted['CRS_WRK'], 1)
+        self.assertEqual(sum(deleted.values()), 1)
+        self.assertEqual(self.storage.query("SELECT ID FROM CRS_WRK"), [('cw2',)])
+        # The submission for cw1 goes with it
+        self.assertEqual(self.storage.query("SELECT COUNT(*) FROM STDNT_SBMSSNS"), [(0,)])
+        # Students were not listed, so the student enrollment stays
+        self.assertEqual(self.storage.query("SELECT COUNT(*) FROM ENRLLMNTS"), [(2,)])
+
+    def test_page_saved_with_malformed_items_quarantined(self):
+        """Tests that a page is saved at once, its malformed items quarantined rather than failing it."""
+        self._populate()
+        page = [dict(self.submission, assignedGrade=80), dict(self.submission, id='sub2', userId='teacher1'),
+                {'id': 'sub3', 'courseWorkId': 'cw1'}, dict(self.submission, id='sub4', updateTime=None)]
+        self.assertEqual(self.storage.save_page('STDNT_SBMSSNS', page), ['sub1', 'sub2'])
+        self.storage.commit()
+
+        self.assertEqual(self.storage.query("SELECT ID, ASSGND_GRD FROM STDNT_SBMSSNS ORDER BY ID"),
+                         [('sub1', 80.0), ('sub2', None)])
+        self.assertEqual(self.storage.query("SELECT TBL, ITM_ID, RSN FROM QRNTN ORDER BY ITM_ID"), [
+            ('STDNT_SBMSSNS', 'sub3', 'missing required fields: userId, creationTime, updateTime'),
+            ('STDNT_SBMSSNS', 'sub4', 'missing required fields: updateTime'),
+        ])
+        tables = self.metrics.summary()['tables']
+        self.assertEqual(tables['STDNT_SBMSSNS']['rows'], 3)
+        # Quarantined items are counted as such, not as unchanged rows
+        self.assertEqual((tables['STDNT_SBMSSNS']['skipped'], tables['STDNT_SBMSSNS']['quarantined']), (0, 2))
+
+    def test_quarantined_item_told_from_unchanged(self):
+        """Tests that saving a malformed item returns None, and saving a valid one, changed or not, does not."""
+        self.assertIsNotNone(self.storage.save_course(self.course))
+        self.assertIsNotNone(self.storage.save_course(self.course))
+        self.assertIsNone(self.storage.save_course(course('bad', creationTime=None)))
+        self.storage.commit()
+        self.assertEqual(self.storage.query("SELECT TBL, ITM_ID FROM QRNTN"), [('CRSS', 'bad')])
+        self.assertEqual(self.metrics.summary()['tables']['CRSS']['quarantined'], 1)
+
+    def test_dead_letters(self):
+        """Tests that failed requests are recorded once each, counting attempts, until resolved."""
+        params = {'courseWorkId': 'cw1', 'courseId': 'course456'}
+        self.storage.record_dead_letters([
+            FailedRequest('courses.courseWork.studentSubmissions.list', params, 'token2', 503, 'unavailable'),
+            FailedRequest('courses.list', {}, None, 500, 'backend error'),
+        ])
+        self.storage.record_dead_letters([
+            FailedRequest('courses.courseWork.studentSubmissions.list', dict(reversed(params.items())),
+                          'token2', 429, 'rate limited'),
+        ])
+        self.storage.commit()
+
+        submissions, courses = self.storage.dead_letters()
+        self.assertEqual((submissions.params, submissions.page_token, submissions.status, submissions.attempts),
+                         (params, 'token2', 429, 2))
+        self.assertEqual((courses.endpoint, courses.page_token, courses.attempts), ('courses.list', None, 1))
+
+        self.storage.resolve_dead_letter(submissions.id)
+        self.storage.commit()
+        self.assertEqual([letter.id for letter in self.storage.dead_letters()], [courses.id])
+
+    def test_commit_is_durable(self):
+        """Tests that committed rows survive reopening and uncommitted ones are discarded."""
+        self._populate()
+        self.storage.save_course_work(self._course_work('cw2', 'Not committed'))
+        self.storage.close()
+
+        self.storage = self.open()
+        self.assertEqual(self.storage.query("SELECT ID FROM CRS_WRK"), [('cw1',)])
+
+
+class TestSQLiteBackend(BackendTests, unittest.TestCase):
+
+    def open(self, metrics=None):
+        return open_storage(os.path.join(self.temp_dir.name, 'classroom.sqlite3'), 'sqlite', metrics)
+
+    def test_backend_type(self):
+        """Tests that the default backend is SQLite."""
+        self.assertIsInstance(self.storage, SQLiteBackend)
+        self.assertIsInstance(self.storage.conn, sqlite3.Connection)
+
+
+@unittest.skipUnless(duckdb, "duckdb and pyarrow are not installed")
+class TestDuckDBBackend(BackendTests, unittest.TestCase):
+
+    def open(self, metrics=None):
+        return open_storage(os.path.join(self.temp_dir.name, 'classroom.duckdb'), 'duckdb', metrics)
+
+    def test_rows_appended_in_batches(self):
+        """Tests that rows are appended once a batch fills, and the last save of a row wins."""
+        self.storage.close()
+        self.storage = DuckDBBackend(os.path.join(self.temp_dir.name, 'batched.duckdb'), self.metrics, batch_rows=3)
+        self.storage.save_user(self.user)
+        self.storage.save_user(dict(self.user, name={'fullName': 'Renamed'}))
+        self.assertEqual(self.storage.conn.execute("SELECT COUNT(*) FROM USRS").fetchone(), (0,))
+
+        self.storage.save_user(self.teacher)
+        self.storage.save_user(user('u3', 'Third'))
+        # The batch of three distinct users was appended without a commit
+        self.assertEqual(self.storage.conn.execute("SELECT NM FROM USRS ORDER BY ID").fetchall(),
+                         [('Prof',), ('Third',), ('Renamed',)])
+
+    def test_rollups_recomputed_with_views(self):
+        """Tests that the rollups are recomputed from the saved rows when the views are created."""
+        self._populate()
+        self.storage.save_student_submission(dict(self.submission, id='sub2', courseWorkId='cw2', state='CREATED',
+                                                  late=True, updateTime='t9'))
+        self.storage.save_course_work(self._course_work('cw2'))
+        self.storage.create_views()
+        self.assertEqual(self.storage.query(
+            "SELECT CRS_ID, SBMSSN_CNT, MSSNG_CNT, RTRND_CNT, LT_CNT, ANNCMNT_CNT, LST_ACTVTY_TM FROM CRS_RLLPS"),
+            [('course456', 2, 1, 1, 1, 1, 't9')])
+        self.assertEqual(self.storage.query("SELECT USR_ID, SBMSSN_CNT, LST_ACTVTY_TM FROM STDNT_RLLPS"),
+                         [('user123', 2, 't9')])
+
+
+if __name__ == '__main__':
+    unittest.main()
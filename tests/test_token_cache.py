@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import MagicMock
+import datetime
+import os
+import tempfile
+import threading
+
+from src.token_cache import SharedTokenCache, SharedCacheCredentials
+
+class FakeCredentials:
+    """Stands in for delegated service account credentials."""
+
+    def __init__(self, lifetime=datetime.timedelta(hours=1)):
+        self.service_account_email = 'sa@project.iam.gserviceaccount.com'
+        self._subject = 'admin@example.com'
+        self._scopes = ['scope.b', 'scope.a']
+        self.lifetime = lifetime
+        self.refresh_count = 0
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        self.refresh_count += 1
+        self.token = f"token-{self.refresh_count}"
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+        self.expiry = now + self.lifetime
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a cache file in a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'tokens.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_token_shared_between_caches(self):
+        """Tests that a second consumer of the same file reuses the cached token."""
+        first, second = FakeCredentials(), FakeCredentials()
+
+        token1, _ = SharedTokenCache(self.path).get_token(first, MagicMock())
+        token2, expiry2 = SharedTokenCache(self.path).get_token(second, MagicMock())
+
+        self.assertEqual(token1, token2)
+        self.assertEqual(first.refresh_count, 1)
+        self.assertEqual(second.refresh_count, 0)
+        self.assertIsNotNone(expiry2)
+
+    def test_refresh_near_expiry(self):
+        """Tests that a token within the refresh margin is refreshed."""
+        short_lived = FakeCredentials(lifetime=datetime.timedelta(minutes=2))
+        cache = SharedTokenCache(self.path)
+        cache.get_token(short_lived, MagicMock())
+        cache.get_token(short_lived, MagicMock())
+        self.assertEqual(short_lived.refresh_count, 2)
+
+    def test_cache_file_permissions(self):
+        """Tests that the cache file is readable by its owner only."""
+        SharedTokenCache(self.path).get_token(FakeCredentials(), MagicMock())
+        if os.name == 'posix':
+            self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_concurrent_consumers_refresh_once(self):
+        """Tests that parallel workers cause a single refresh."""
+        wrapped = FakeCredentials()
+        tokens = []
+
+        def worker():
+            creds = SharedCacheCredentials(wrapped, SharedTokenCache(self.path))
+            creds.before_request(MagicMock(), 'GET', 'https://classroom.googleapis.com', {})
+            tokens.append(creds.token)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(wrapped.refresh_count, 1)
+        self.assertEqual(set(tokens), {'token-1'})
+
+    def test_credentials_apply_cached_token(self):
+        """Tests that the wrapper sets the authorization header from the cache."""
+        creds = SharedCacheCredentials(FakeCredentials(), SharedTokenCache(self.path))
+        headers = {}
+        creds.before_request(MagicMock(), 'GET', 'https://classroom.googleapis.com', headers)
+        self.assertEqual(headers['authorization'], 'Bearer token-1')
+        self.assertTrue(creds.valid)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import gzip
+import json
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build_from_document
+
+from src.auth import load_discovery_document
+from src.concurrency import ServicePool, fetch_concurrently
+from src.extractor import get_courses, iter_student_submission_pages
+from src.metrics import MetricsRecorder
+from src.transport import PooledHttp
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    Serves Classroom-like listings over keep-alive connections, gzip-encoded
+    when the client accepts it, and counts the connections opened.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+    connections = 0
+    gzipped = 0
+
+    def setup(self):
+        super().setup()
+        with type(self).lock:
+            type(self).connections += 1
+
+    def do_GET(self):
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+        if '/courseWork/' in self.path:
+            work_id = self.path.split('/')[-2]
+            body = {'studentSubmissions': [{'id': f'{work_id}-{i}', 'state': 'TURNED_IN'} for i in range(50)]}
+        else:
+            body = {'courses': [{'id': f'course{i}', 'name': f'Course {i}'} for i in range(50)]}
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content)
+            self.send_header('Content-Encoding', 'gzip')
+            with type(self).lock:
+                type(self).gzipped += 1
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+class TestPooledHttp(unittest.TestCase):
+
+    def setUp(self):
+        KeepAliveHandler.connections = KeepAliveHandler.gzipped = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.http = PooledHttp(AnonymousCredentials(), pool_size=4)
+
+    def tearDown(self):
+        self.http.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _service(self):
+        return build_from_document(load_discovery_document(), http=self.http,
+                                   client_options={'api_endpoint': self.url})
+
+    def test_request_decompressed(self):
+        """Tests that a gzip response comes back decompressed, with httplib2-style headers."""
+        resp, content = self.http.request(self.url + 'v1/courses')
+
+        self.assertEqual((resp.status, resp['status'], resp.reason), (200, '200', 'OK'))
+        self.assertEqual(len(json.loads(content)['courses']), 50)
+        self.assertEqual(resp['-content-encoding'], 'gzip')
+        self.assertNotIn('content-encoding', resp)
+        self.assertEqual(resp['content-length'], str(len(content)))
+
+    def test_connections_reused_by_services(self):
+        """Tests that services of concurrent workers share a few kept-alive connections."""
+        metrics = MetricsRecorder()
+        services = ServicePool(self._service)
+        self.assertEqual(len(get_courses(self._service(), metrics)), 50)
+
+        def submissions(work_id):
+            with services.lease() as service:
+                yield from iter_student_submission_pages(service, 'course1', work_id, metrics)
+
+        items = sum(len(page) for _, page in fetch_concurrently([f'w{i}' for i in range(40)], submissions, 4)
+                    if page is not None)
+
+        self.assertEqual(items, 40 * 50)
+        self.assertEqual(KeepAliveHandler.gzipped, 41)
+        # At most one connection per worker, however many requests and services
+        self.assertLessEqual(KeepAliveHandler.connections, 4)
+
+    def test_network_errors(self):
+        """Tests that timeouts and refused connections raise the errors the API client retries."""
+        http = PooledHttp(AnonymousCredentials(), read_timeout=0.1)
+        with self.assertRaises(TimeoutError):
+            http.request(self.url + 'slow')
+        http.close()
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        with self.assertRaises(ConnectionError):
+            self.http.request(f'http://127.0.0.1:{port}/')
+
+
+if __name__ == '__main__':
+    unittest.main()